@@ -1,24 +1,49 @@
+import functools
+import itertools
+import math
 from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
 from copy import deepcopy
 from pathlib import Path
-from typing import Any, Literal, Optional, Union
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Literal, Optional, Union
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 import torch
-from matplotlib.patches import Rectangle
-from scipy import constants
-from scipy.constants import physical_constants
 from torch import nn
-from torch.distributions import MultivariateNormal
 
-from cheetah.converters.dontbmad import convert_bmad_lattice
-from cheetah.converters.nxtables import read_nx_tables
+from cheetah import constants
 from cheetah.latticejson import load_cheetah_model, save_cheetah_model
-from cheetah.particles import Beam, ParameterBeam, ParticleBeam
-from cheetah.track_methods import base_rmatrix, misalignment_matrix, rotation_matrix
-from cheetah.utils import UniqueNameGenerator
+from cheetah.particles import Beam, CompactParticleBeam, ParameterBeam, ParticleBeam
+from cheetah.snapshot import load_cheetah_snapshot, save_cheetah_snapshot
+from cheetah.track_methods import (
+    assemble_generator,
+    assemble_second_order_tensor,
+    assemble_transfer_map,
+    base_generators,
+    base_rmatrix,
+    base_ttensor,
+    compute_relativistic_factors,
+    concatenate_second_order_maps,
+    integrated_green_function,
+    integrated_rmatrix,
+    misalignment_matrix,
+    rotation_matrix,
+    second_order_moments,
+    second_order_terms,
+    steady_state_csr_wake,
+    symplectic_map,
+)
+from cheetah.utils import (
+    UniqueNameGenerator,
+    is_tracing,
+    module_tensors,
+    needs_grad,
+    tensors_cache_key,
+)
+
+if TYPE_CHECKING:
+    import matplotlib.axes
+    import matplotlib.figure
 
 generate_unique_name = UniqueNameGenerator(prefix="unnamed_element")
 
@@ -27,11 +52,99 @@ rest_energy = torch.tensor(
     * constants.speed_of_light**2
     / constants.elementary_charge  # electron mass
 )
-electron_mass_eV = torch.tensor(
-    physical_constants["electron mass energy equivalent in MeV"][0] * 1e6
+electron_mass_eV = torch.tensor(constants.electron_mass_eV)
+
+TransferMapCacheInfo = namedtuple(
+    "TransferMapCacheInfo", ["hits", "misses", "maxsize", "currsize"]
 )
 
 
+def _energy_cache_key(energy: torch.Tensor) -> tuple:
+    """
+    Hashable key of `energy`. Like element parameters, energies are keyed by their
+    identity and version counter instead of their value, so that building the key
+    never reads the energy back from the device. Whoever stores the key must keep a
+    reference to `energy`, such that its identity cannot be reused.
+    """
+    return (id(energy), energy._version, energy.shape, energy.dtype, energy.device)
+
+
+def _module_list(modules: list[nn.Module]) -> nn.ModuleList:
+    """
+    Create an `nn.ModuleList` of `modules`, registering all of them at once instead of
+    one by one through `nn.Module.add_module`, which is slow for long lattices.
+    """
+    modules = list(modules)
+    for module in modules:
+        if not isinstance(module, nn.Module):
+            raise TypeError(f"{torch.typename(module)} is not a Module subclass")
+
+    module_list = nn.ModuleList()
+    module_list._modules.update(
+        (str(index), module) for index, module in enumerate(modules)
+    )
+    return module_list
+
+
+def _split_num_steps(
+    num_steps: int, length: torch.Tensor, total_length: torch.Tensor
+) -> int:
+    """
+    Number of integration steps of a slice of length `length` cut from an element of
+    length `total_length` that is integrated in `num_steps` steps, such that the slice
+    takes steps no longer than those of the element.
+    """
+    return max(1, int(torch.ceil(num_steps * length / total_length)))
+
+
+def _memoize_transfer_map(transfer_map):
+    """
+    Wrap an element's `transfer_map` method such that its results are looked up in the
+    element's transfer map cache, if that cache was enabled via
+    `Element.enable_transfer_map_cache`.
+
+    Entries are keyed by the identity and version counter of every tensor attribute of
+    the element and of the energy, and by the element's other transfer map settings.
+    Changing a parameter in place (e.g. in an optimiser step) increments its version
+    counter and assigning a new tensor changes its identity, so both invalidate the
+    entry. Each entry holds references to the tensors of its key, such that their
+    identities cannot be reused while it exists.
+    """
+
+    @functools.wraps(transfer_map)
+    def wrapper(self: "Element", energy: torch.Tensor) -> torch.Tensor:
+        cache = self.__dict__.get("_transfer_map_cache")
+        if cache is None or is_tracing():
+            return transfer_map(self, energy)
+
+        tensors = self._transfer_map_cache_tensors()
+
+        # A cached transfer map carries the autograd graph it was built with, which
+        # cannot be backpropagated through again. Build a fresh one in that case.
+        if needs_grad(tensors + [energy]):
+            return transfer_map(self, energy)
+
+        key = (
+            tensors_cache_key(tensors)
+            + self._transfer_map_settings()
+            + _energy_cache_key(energy)
+        )
+        if key in cache:
+            cache.move_to_end(key)
+            self._transfer_map_cache_hits += 1
+            return cache[key][0]
+
+        self._transfer_map_cache_misses += 1
+        tm = transfer_map(self, energy)
+        cache[key] = (tm, tensors + [energy])
+        if len(cache) > self._transfer_map_cache_maxsize:
+            cache.popitem(last=False)
+
+        return tm
+
+    return wrapper
+
+
 class Element(ABC, nn.Module):
     """
     Base class for elements of particle accelerators.
@@ -44,6 +157,18 @@ class Element(ABC, nn.Module):
 
         self.name = name if name is not None else generate_unique_name()
 
+        self._transfer_map_cache = None
+        self._transfer_map_cache_maxsize = 0
+        self._transfer_map_cache_hits = 0
+        self._transfer_map_cache_misses = 0
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+
+        # Every implementation of `transfer_map` goes through the (opt-in) cache
+        if "transfer_map" in cls.__dict__:
+            cls.transfer_map = _memoize_transfer_map(cls.__dict__["transfer_map"])
+
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
         r"""
         Generates the element's transfer map that describes how the beam and its
@@ -63,25 +188,64 @@ class Element(ABC, nn.Module):
         necessary. Through this seventh state, the addition of constants can be
         represented using a matrix multiplication.
 
+        All of the element's parameters as well as the `energy` may have leading batch
+        dimensions. These are broadcast against each other, such that the returned
+        transfer map has shape `(..., 7, 7)`.
+
         :param energy: Reference energy of the Beam. Read from the fed-in Cheetah Beam.
-        :return: A 7x7 Matrix for further calculations.
+        :return: A `(..., 7, 7)` tensor of transfer matrices for further calculations.
         """
         raise NotImplementedError
 
+    def second_order_map(
+        self, energy: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Generates the element's second-order map, which transforms the state vector `x`
+        of a particle into `R @ x + T[:, j, k] * x[j] * x[k]`, summed over `j` and `k`.
+        Elements whose second-order terms are not modelled return a zero `T`, i.e.
+        their second-order map equals their transfer map.
+
+        :param energy: Reference energy of the Beam. Read from the fed-in Cheetah Beam.
+        :return: Tuple of the `(..., 7, 7)` transfer map `R` and the `(..., 7, 7, 7)`
+            second-order tensor `T`.
+        """
+        tm = self.transfer_map(energy)
+        return tm, tm.new_zeros(7, 7, 7)
+
     def track(self, incoming: Beam) -> Beam:
         """
         Track particles through the element. The input can be a `ParameterBeam` or a
         `ParticleBeam`.
 
+        Batch dimensions of the element's transfer map and the incoming beam are
+        broadcast against each other, i.e. tracking an unbatched beam through an element
+        with batched parameters results in a batched outgoing beam.
+
         :param incoming: Beam of particles entering the element.
         :return: Beam of particles exiting the element.
         """
         if incoming is Beam.empty:
             return incoming
-        elif isinstance(incoming, ParameterBeam):
-            tm = self.transfer_map(incoming.energy)
-            mu = torch.matmul(tm, incoming._mu)
-            cov = torch.matmul(tm, torch.matmul(incoming._cov, tm.t()))
+        elif isinstance(incoming, (ParameterBeam, ParticleBeam)):
+            return self._apply_transfer_map(
+                self.transfer_map(incoming.energy), incoming
+            )
+        else:
+            raise TypeError(f"Parameter incoming is of invalid type {type(incoming)}")
+
+    @staticmethod
+    def _apply_transfer_map(tm: torch.Tensor, incoming: Beam) -> Beam:
+        """
+        Transform a `ParameterBeam` or `ParticleBeam` by the transfer map `tm`.
+
+        :param tm: Transfer map of shape `(..., 7, 7)`.
+        :param incoming: Beam to be transformed.
+        :return: Transformed beam.
+        """
+        if isinstance(incoming, ParameterBeam):
+            mu = torch.matmul(tm, incoming._mu.unsqueeze(-1)).squeeze(-1)
+            cov = torch.matmul(tm, torch.matmul(incoming._cov, tm.transpose(-2, -1)))
             return ParameterBeam(
                 mu,
                 cov,
@@ -90,23 +254,122 @@ class Element(ABC, nn.Module):
                 device=mu.device,
                 dtype=mu.dtype,
             )
-        elif isinstance(incoming, ParticleBeam):
-            tm = self.transfer_map(incoming.energy)
-            new_particles = torch.matmul(incoming.particles, tm.t())
+        elif isinstance(incoming, CompactParticleBeam):
+            return incoming.transformed_by(tm)
+        else:  # ParticleBeam
+            new_particles = torch.matmul(incoming.particles, tm.transpose(-2, -1))
             return ParticleBeam(
                 new_particles,
                 incoming.energy,
                 particle_charges=incoming.particle_charges,
                 device=new_particles.device,
                 dtype=new_particles.dtype,
+                survival_probabilities=incoming.survival_probabilities,
             )
-        else:
-            raise TypeError(f"Parameter incoming is of invalid type {type(incoming)}")
+
+    @staticmethod
+    def _apply_second_order_map(
+        tm: torch.Tensor, ttensor: torch.Tensor, incoming: Beam
+    ) -> Beam:
+        """
+        Transform a `ParameterBeam` or `ParticleBeam` by the second-order map with
+        transfer map `tm` and second-order tensor `ttensor`. The moments of a
+        `ParameterBeam` are propagated analytically, assuming a Gaussian beam.
+
+        :param tm: Transfer map of shape `(..., 7, 7)`.
+        :param ttensor: Second-order tensor of shape `(..., 7, 7, 7)`.
+        :param incoming: Beam to be transformed.
+        :return: Transformed beam.
+        """
+        if isinstance(incoming, ParameterBeam):
+            mu, cov = second_order_moments(tm, ttensor, incoming._mu, incoming._cov)
+            return ParameterBeam(
+                mu,
+                cov,
+                incoming.energy,
+                total_charge=incoming.total_charge,
+                device=mu.device,
+                dtype=mu.dtype,
+            )
+        elif not isinstance(incoming, ParticleBeam):
+            return Element._apply_transfer_map(tm, incoming)
+
+        particles = incoming.particles
+        new_particles = torch.matmul(
+            particles, tm.transpose(-2, -1)
+        ) + second_order_terms(ttensor, particles)
+        return incoming._with_particles(
+            new_particles,
+            incoming.energy,
+            incoming.particle_charges,
+            survival_probabilities=incoming.survival_probabilities,
+        )
 
     def forward(self, incoming: Beam) -> Beam:
         """Forward function required by `torch.nn.Module`. Simply calls `track`."""
         return self.track(incoming)
 
+    def enable_transfer_map_cache(self, maxsize: int = 8) -> None:
+        """
+        Enable a least-recently-used cache on the element's `transfer_map`, such that
+        the transfer map is only rebuilt when one of the element's tensors or the
+        energy has changed. This speeds up repeated tracking through a lattice, of
+        which only a few elements are changed between calls.
+
+        NOTE: Changes are detected by tensor identity and version counter. Modifying a
+        tensor's `.data` directly bypasses the version counter and is not detected. The
+        cache is bypassed when gradients are computed with respect to the element's
+        tensors or the energy.
+
+        :param maxsize: Maximum number of transfer maps kept in the cache.
+        """
+        self._transfer_map_cache = OrderedDict()
+        self._transfer_map_cache_maxsize = maxsize
+        self._transfer_map_cache_hits = 0
+        self._transfer_map_cache_misses = 0
+
+    def disable_transfer_map_cache(self) -> None:
+        """Disable the element's transfer map cache and drop all cached entries."""
+        self._transfer_map_cache = None
+        self._transfer_map_cache_maxsize = 0
+
+    def clear_transfer_map_cache(self) -> None:
+        """Drop all cached transfer maps and reset the hit and miss counters."""
+        if self._transfer_map_cache is not None:
+            self._transfer_map_cache.clear()
+        self._transfer_map_cache_hits = 0
+        self._transfer_map_cache_misses = 0
+
+    def transfer_map_cache_info(self) -> TransferMapCacheInfo:
+        """
+        Report hits, misses, maximum size and current size of the element's transfer
+        map cache, in the style of `functools.lru_cache`.
+        """
+        return TransferMapCacheInfo(
+            hits=self._transfer_map_cache_hits,
+            misses=self._transfer_map_cache_misses,
+            maxsize=self._transfer_map_cache_maxsize,
+            currsize=(
+                len(self._transfer_map_cache)
+                if self._transfer_map_cache is not None
+                else 0
+            ),
+        )
+
+    def _transfer_map_cache_tensors(self) -> list[torch.Tensor]:
+        """
+        Tensors the element's transfer map may depend on, i.e. all tensor attributes,
+        parameters and buffers of the element.
+        """
+        return module_tensors(self)
+
+    def _transfer_map_settings(self) -> tuple:
+        """
+        Hashable values of the non-tensor attributes the element's transfer map depends
+        on, e.g. the settings of its integrator.
+        """
+        return ()
+
     @property
     @abstractmethod
     def is_skippable(self) -> bool:
@@ -142,7 +405,7 @@ class Element(ABC, nn.Module):
         raise NotImplementedError
 
     @abstractmethod
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
         """
         Plot a representation of this element into a `matplotlib` Axes at position `s`.
 
@@ -157,13 +420,22 @@ class Element(ABC, nn.Module):
 
 class CustomTransferMap(Element):
     """
-    This element can represent any custom transfer map.
+    This element can represent any custom transfer map, optionally with second-order
+    terms.
+
+    :param transfer_map: Transfer map of shape `(..., 7, 7)`.
+    :param length: Length in meters.
+    :param second_order_tensor: Second-order tensor of shape `(..., 7, 7, 7)`, see
+        `Element.second_order_map`. If given, particle beams are tracked through the
+        second-order map.
+    :param name: Unique identifier of the element.
     """
 
     def __init__(
         self,
         transfer_map: Union[torch.Tensor, nn.Parameter],
         length: Optional[torch.Tensor] = None,
+        second_order_tensor: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -172,7 +444,12 @@ class CustomTransferMap(Element):
         super().__init__(name=name)
 
         assert isinstance(transfer_map, torch.Tensor)
-        assert transfer_map.shape == (7, 7)
+        assert transfer_map.shape[-2:] == (7, 7)
+        assert second_order_tensor is None or second_order_tensor.shape[-3:] == (
+            7,
+            7,
+            7,
+        )
 
         self._transfer_map = torch.as_tensor(transfer_map, **factory_kwargs)
         self.length = (
@@ -180,10 +457,15 @@ class CustomTransferMap(Element):
             if length is not None
             else torch.tensor(0.0, **factory_kwargs)
         )
+        self.second_order_tensor = (
+            torch.as_tensor(second_order_tensor, **factory_kwargs)
+            if second_order_tensor is not None
+            else None
+        )
 
     @classmethod
     def from_merging_elements(
-        cls, elements: list[Element], incoming_beam: Beam
+        cls, elements: list[Element], incoming_beam: Beam, order: int = 1
     ) -> "CustomTransferMap":
         """
         Combine the transfer maps of multiple successive elements into a single transfer
@@ -196,11 +478,30 @@ class CustomTransferMap(Element):
             this is required because the separate original transfer maps have to be
             computed before being combined and some of them may depend on the energy of
             the beam.
+        :param order: Order of the combined map. For `2`, the second-order maps of the
+            elements are concatenated, dropping terms of third and higher order.
         """
         assert all(element.is_skippable for element in elements), (
             "Combining the elements in a Segment that is not skippable will result in"
             " incorrect tracking results."
         )
+        assert order in (1, 2), f"Order {order} is not supported."
+
+        combined_length = sum(
+            element.length for element in elements if hasattr(element, "length")
+        )
+
+        if order == 2:
+            tm, ttensor = concatenate_second_order_maps(
+                [element.second_order_map(incoming_beam.energy) for element in elements]
+            )
+            return cls(
+                tm,
+                length=combined_length,
+                second_order_tensor=ttensor,
+                device=tm.device,
+                dtype=tm.dtype,
+            )
 
         device = elements[0].transfer_map(incoming_beam.energy).device
         dtype = elements[0].transfer_map(incoming_beam.energy).dtype
@@ -210,26 +511,41 @@ class CustomTransferMap(Element):
             tm = torch.matmul(element.transfer_map(incoming_beam.energy), tm)
             incoming_beam = element.track(incoming_beam)
 
-        combined_length = sum(
-            element.length for element in elements if hasattr(element, "length")
-        )
-
         return cls(tm, length=combined_length, device=device, dtype=dtype)
 
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
         return self._transfer_map
 
+    def second_order_map(
+        self, energy: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        if self.second_order_tensor is None:
+            return super().second_order_map(energy)
+        return self._transfer_map, self.second_order_tensor
+
+    def track(self, incoming: Beam) -> Beam:
+        if self.second_order_tensor is None or incoming is Beam.empty:
+            return super().track(incoming)
+        return self._apply_second_order_map(
+            self._transfer_map, self.second_order_tensor, incoming
+        )
+
     @property
     def is_skippable(self) -> bool:
         return True
 
+    @property
     def defining_features(self) -> list[str]:
-        return super().defining_features + ["transfer_map"]
+        return super().defining_features + [
+            "_transfer_map",
+            "length",
+            "second_order_tensor",
+        ]
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
         # TODO: At some point think of a nice way to indicate this in a lattice plot
         pass
 
@@ -261,20 +577,24 @@ class Drift(Element):
         device = self.length.device
         dtype = self.length.dtype
 
-        gamma = energy / rest_energy.to(device=device, dtype=dtype)
-        igamma2 = (
-            1 / gamma**2
-            if gamma != 0
-            else torch.tensor(0.0, device=device, dtype=dtype)
-        )
-        beta = torch.sqrt(1 - igamma2)
+        _, igamma2, beta = compute_relativistic_factors(energy)
 
-        tm = torch.eye(7, device=device, dtype=dtype)
-        tm[0, 1] = self.length
-        tm[2, 3] = self.length
-        tm[4, 5] = -self.length / beta**2 * igamma2
+        return assemble_transfer_map(
+            {
+                (0, 1): self.length,
+                (2, 3): self.length,
+                (4, 5): -self.length / beta**2 * igamma2,
+            },
+            device=device,
+            dtype=dtype,
+        )
 
-        return tm
+    def second_order_map(
+        self, energy: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        zero = torch.tensor(0.0, device=self.length.device, dtype=self.length.dtype)
+        T = base_ttensor(length=self.length, k1=zero, hx=zero, energy=energy)
+        return self.transfer_map(energy), T
 
     @property
     def is_skippable(self) -> bool:
@@ -282,14 +602,18 @@ class Drift(Element):
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         split_elements = []
-        remaining = self.length
+        remaining = self.length.clone()
         while remaining > 0:
-            element = Drift(torch.min(resolution, remaining))
+            element = Drift(
+                torch.min(resolution, remaining),
+                device=self.length.device,
+                dtype=self.length.dtype,
+            )
             split_elements.append(element)
             remaining -= resolution
         return split_elements
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
         pass
 
     @property
@@ -309,6 +633,12 @@ class Quadrupole(Element):
     :param misalignment: Misalignment vector of the quadrupole in x- and y-directions.
     :param tilt: Tilt angle of the quadrupole in x-y plane [rad]. pi/4 for
         skew-quadrupole.
+    :param num_steps: Number of steps of the symplectic integrator. Only used if
+        `tracking_method` is not `"cheetah"`.
+    :param tracking_method: Method used to compute the transfer map. `"cheetah"` uses
+        the exact linear map, `"drift_kick_drift"` and `"yoshida"` integrate it in
+        `num_steps` steps of drifts and thin kicks with a second-order or Yoshida's
+        fourth-order symplectic integrator, respectively.
     :param name: Unique identifier of the element.
     """
 
@@ -318,6 +648,8 @@ class Quadrupole(Element):
         k1: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         misalignment: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         tilt: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        num_steps: int = 1,
+        tracking_method: Literal["cheetah", "drift_kick_drift", "yoshida"] = "cheetah",
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -341,25 +673,52 @@ class Quadrupole(Element):
             if tilt is not None
             else torch.tensor(0.0, **factory_kwargs)
         )
+        self.num_steps = int(num_steps)
+        self.tracking_method = tracking_method
 
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
         device = self.length.device
         dtype = self.length.dtype
 
+        if self.tracking_method == "cheetah":
+            R = base_rmatrix(
+                length=self.length,
+                k1=self.k1,
+                hx=torch.tensor(0.0, device=device, dtype=dtype),
+                tilt=self.tilt,
+                energy=energy,
+            )
+        else:
+            R = integrated_rmatrix(
+                length=self.length,
+                k1=self.k1,
+                hx=torch.tensor(0.0, device=device, dtype=dtype),
+                tilt=self.tilt,
+                energy=energy,
+                num_steps=self.num_steps,
+                method=self.tracking_method,
+            )
+
+        # Shifting by a zero misalignment is an identity, which is cheaper than a
+        # data-dependent branch that synchronises with the device
+        R_exit, R_entry = misalignment_matrix(self.misalignment)
+        R = torch.matmul(R_exit, torch.matmul(R, R_entry))
+        return R
+
+    def second_order_map(
+        self, energy: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        zero = torch.tensor(0.0, device=self.length.device, dtype=self.length.dtype)
         R = base_rmatrix(
-            length=self.length,
-            k1=self.k1,
-            hx=torch.tensor(0.0, device=device, dtype=dtype),
-            tilt=self.tilt,
-            energy=energy,
+            length=self.length, k1=self.k1, hx=zero, tilt=self.tilt, energy=energy
+        )
+        T = base_ttensor(
+            length=self.length, k1=self.k1, hx=zero, tilt=self.tilt, energy=energy
         )
 
-        if self.misalignment[0] == 0 and self.misalignment[1] == 0:
-            return R
-        else:
-            R_exit, R_entry = misalignment_matrix(self.misalignment)
-            R = torch.matmul(R_exit, torch.matmul(R, R_entry))
-            return R
+        # Misalignments feed the second-order terms down to linear and constant ones
+        R_exit, R_entry = misalignment_matrix(self.misalignment)
+        return concatenate_second_order_maps([(R_entry, None), (R, T), (R_exit, None)])
 
     @property
     def is_skippable(self) -> bool:
@@ -367,22 +726,33 @@ class Quadrupole(Element):
 
     @property
     def is_active(self) -> bool:
-        return self.k1 != 0
+        return torch.any(self.k1 != 0)
+
+    def _transfer_map_settings(self) -> tuple:
+        return (self.num_steps, self.tracking_method)
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         split_elements = []
-        remaining = self.length
+        remaining = self.length.clone()
         while remaining > 0:
+            length = torch.min(resolution, remaining)
             element = Quadrupole(
-                torch.min(resolution, remaining),
+                length,
                 self.k1,
                 misalignment=self.misalignment,
+                tilt=self.tilt,
+                num_steps=_split_num_steps(self.num_steps, length, self.length),
+                tracking_method=self.tracking_method,
+                device=self.length.device,
+                dtype=self.length.dtype,
             )
             split_elements.append(element)
             remaining -= resolution
         return split_elements
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         height = 0.8 * (np.sign(self.k1) if self.is_active else 1)
         patch = Rectangle(
@@ -392,7 +762,14 @@ class Quadrupole(Element):
 
     @property
     def defining_features(self) -> list[str]:
-        return super().defining_features + ["length", "k1", "misalignment", "tilt"]
+        return super().defining_features + [
+            "length",
+            "k1",
+            "misalignment",
+            "tilt",
+            "num_steps",
+            "tracking_method",
+        ]
 
     def __repr__(self) -> None:
         return (
@@ -400,6 +777,8 @@ class Quadrupole(Element):
             + f"k1={repr(self.k1)}, "
             + f"misalignment={repr(self.misalignment)}, "
             + f"tilt={repr(self.tilt)}, "
+            + f"num_steps={repr(self.num_steps)}, "
+            + f"tracking_method={repr(self.tracking_method)}, "
             + f"name={repr(self.name)})"
         )
 
@@ -417,6 +796,18 @@ class Dipole(Element):
     :param fringe_integral_exit: (only set if different from `fint`) Fringe field
         integral of the exit face.
     :param gap: The magnet gap [m], NOTE in MAD and ELEGANT: HGAP = gap/2
+    :param num_steps: Number of steps of the symplectic integrator. Only used if
+        `tracking_method` is not `"cheetah"`.
+    :param tracking_method: Method used to compute the body's transfer map. `"cheetah"`
+        uses the exact linear map, `"drift_kick_drift"` and `"yoshida"` integrate it in
+        `num_steps` steps of drifts and thin kicks with a second-order or Yoshida's
+        fourth-order symplectic integrator, respectively.
+    :param csr: If `True`, `ParticleBeam`s are tracked through the dipole in
+        `csr_num_slices` slices, after each of which the particles are kicked by the
+        steady-state coherent synchrotron radiation (CSR) wake of the bunch.
+    :param csr_num_slices: Number of slices in which the CSR wake is updated.
+    :param csr_num_bins: Number of bins of the line charge density from which the CSR
+        wake is computed.
     :param name: Unique identifier of the element.
     """
 
@@ -430,6 +821,11 @@ class Dipole(Element):
         fringe_integral: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         fringe_integral_exit: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         gap: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        num_steps: int = 1,
+        tracking_method: Literal["cheetah", "drift_kick_drift", "yoshida"] = "cheetah",
+        csr: bool = False,
+        csr_num_slices: int = 10,
+        csr_num_bins: int = 100,
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -475,42 +871,32 @@ class Dipole(Element):
             if e2 is not None
             else torch.tensor(0.0, **factory_kwargs)
         )
+        self.num_steps = int(num_steps)
+        self.tracking_method = tracking_method
+        self.csr = csr
+        self.csr_num_slices = int(csr_num_slices)
+        self.csr_num_bins = int(csr_num_bins)
 
     @property
     def hx(self) -> torch.Tensor:
-        if self.length == 0.0:
-            return torch.tensor(0.0, device=self.length.device, dtype=self.length.dtype)
-        else:
-            return self.angle / self.length
+        is_thin = self.length == 0.0
+        safe_length = torch.where(is_thin, torch.ones_like(self.length), self.length)
+        return torch.where(
+            is_thin, torch.zeros_like(self.angle), self.angle / safe_length
+        )
 
     @property
     def is_skippable(self) -> bool:
-        return True
+        return not self.csr
 
     @property
     def is_active(self):
-        return self.angle != 0
+        return torch.any(self.angle != 0)
 
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
-        device = self.length.device
-        dtype = self.length.dtype
-
         R_enter = self._transfer_map_enter()
         R_exit = self._transfer_map_exit()
-
-        if self.length != 0.0:  # Bending magnet with finite length
-            R = base_rmatrix(
-                length=self.length,
-                k1=torch.tensor(0.0, device=device, dtype=dtype),
-                hx=self.hx,
-                tilt=torch.tensor(0.0, device=device, dtype=dtype),
-                energy=energy,
-            )
-        else:  # Reduce to Thin-Corrector
-            R = torch.eye(7, device=device, dtype=dtype)
-            R[0, 1] = self.length
-            R[2, 6] = self.angle
-            R[2, 3] = self.length
+        R = self._transfer_map_body(energy)
 
         # Apply fringe fields
         R = torch.matmul(R_exit, torch.matmul(R, R_enter))
@@ -521,6 +907,108 @@ class Dipole(Element):
 
         return R
 
+    def track(self, incoming: Beam) -> Beam:
+        if not (self.csr and isinstance(incoming, ParticleBeam)):
+            return super().track(incoming)
+
+        slice_length = self.length / self.csr_num_slices
+        for dipole_slice in self._slices([slice_length] * self.csr_num_slices):
+            incoming = self._apply_csr_kick(dipole_slice.track(incoming), slice_length)
+
+        return incoming
+
+    def _apply_csr_kick(
+        self, incoming: ParticleBeam, length: torch.Tensor
+    ) -> ParticleBeam:
+        """
+        Change the energies of the particles of `incoming` by the steady-state CSR wake
+        of the bunch integrated over `length`.
+        """
+        particles = incoming.particles
+        # The CSR wake is the same for particles of either sign of charge, as they all
+        # radiate in phase
+        charges = (
+            incoming.particle_charges.abs() * incoming.survival_probabilities
+            if incoming.survival_probabilities is not None
+            else incoming.particle_charges.abs()
+        )
+        _, _, beta = compute_relativistic_factors(incoming.energy)
+
+        num_particles = particles.shape[-2]
+        batch_shape = torch.broadcast_shapes(
+            particles.shape[:-2], charges.shape[:-1], beta.shape, self.hx.shape
+        )
+        positions = -beta.unsqueeze(-1) * particles[..., 4]
+        wake = steady_state_csr_wake(
+            positions.expand(*batch_shape, num_particles),
+            charges.expand(*batch_shape, num_particles),
+            self.hx.expand(batch_shape),
+            self.csr_num_bins,
+        )
+
+        outgoing_particles = particles.expand(*batch_shape, num_particles, 7).clone()
+        outgoing_particles[..., 5] = outgoing_particles[..., 5] + wake * (
+            length / (beta * incoming.energy)
+        ).unsqueeze(-1)
+
+        return incoming._with_particles(
+            outgoing_particles,
+            incoming.energy,
+            particle_charges=incoming.particle_charges,
+            survival_probabilities=incoming.survival_probabilities,
+        )
+
+    def second_order_map(
+        self, energy: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        zero = torch.tensor(0.0, device=self.length.device, dtype=self.length.dtype)
+
+        # The second-order terms of a thin dipole vanish, as its curvature is zero
+        T = base_ttensor(length=self.length, k1=zero, hx=self.hx, energy=energy)
+
+        return concatenate_second_order_maps(
+            [
+                (rotation_matrix(self.tilt), None),
+                (self._transfer_map_enter(), self._second_order_tensor_enter()),
+                (self._transfer_map_body(energy), T),
+                (self._transfer_map_exit(), self._second_order_tensor_exit()),
+                (rotation_matrix(-self.tilt), None),
+            ]
+        )
+
+    def _transfer_map_body(self, energy: torch.Tensor) -> torch.Tensor:
+        """Linear transfer map of the dipole magnet without its faces."""
+        device = self.length.device
+        dtype = self.length.dtype
+
+        # Bending magnet with finite length
+        if self.tracking_method == "cheetah":
+            R_thick = base_rmatrix(
+                length=self.length,
+                k1=torch.tensor(0.0, device=device, dtype=dtype),
+                hx=self.hx,
+                tilt=torch.tensor(0.0, device=device, dtype=dtype),
+                energy=energy,
+            )
+        else:
+            R_thick = integrated_rmatrix(
+                length=self.length,
+                k1=torch.tensor(0.0, device=device, dtype=dtype),
+                hx=self.hx,
+                energy=energy,
+                num_steps=self.num_steps,
+                method=self.tracking_method,
+            )
+        # Reduce to Thin-Corrector
+        R_thin = assemble_transfer_map(
+            {(0, 1): self.length, (2, 6): self.angle, (2, 3): self.length},
+            device=device,
+            dtype=dtype,
+        )
+
+        is_thin = (self.length == 0.0).unsqueeze(-1).unsqueeze(-1)
+        return torch.where(is_thin, R_thin, R_thick)
+
     def _transfer_map_enter(self) -> torch.Tensor:
         """Linear transfer map for the entrance face of the dipole magnet."""
         device = self.length.device
@@ -535,9 +1023,14 @@ class Dipole(Element):
             * (1 + torch.sin(self.e1) ** 2)
         )
 
-        tm = torch.eye(7, device=device, dtype=dtype)
-        tm[1, 0] = self.hx * torch.tan(self.e1)
-        tm[3, 2] = -self.hx * torch.tan(self.e1 - phi)
+        tm = assemble_transfer_map(
+            {
+                (1, 0): self.hx * torch.tan(self.e1),
+                (3, 2): -self.hx * torch.tan(self.e1 - phi),
+            },
+            device=device,
+            dtype=dtype,
+        )
 
         return tm
 
@@ -555,16 +1048,111 @@ class Dipole(Element):
             * (1 + torch.sin(self.e2) ** 2)
         )
 
-        tm = torch.eye(7, device=device, dtype=dtype)
-        tm[1, 0] = self.hx * torch.tan(self.e2)
-        tm[3, 2] = -self.hx * torch.tan(self.e2 - phi)
+        tm = assemble_transfer_map(
+            {
+                (1, 0): self.hx * torch.tan(self.e2),
+                (3, 2): -self.hx * torch.tan(self.e2 - phi),
+            },
+            device=device,
+            dtype=dtype,
+        )
 
         return tm
 
+    def _second_order_tensor_enter(self) -> torch.Tensor:
+        """
+        Second-order tensor for the entrance face of the dipole magnet, following the
+        MAD variant of Ocelot for a flat pole face.
+        """
+        tan_e = torch.tan(self.e1)
+        tan_e2 = tan_e**2
+        sec_e2 = 1.0 / torch.cos(self.e1) ** 2
+        h = self.hx
+
+        return assemble_second_order_tensor(
+            {
+                (0, 0, 0): -h / 2 * tan_e2,
+                (0, 2, 2): h / 2 * sec_e2,
+                (1, 0, 1): h * tan_e2,
+                (1, 2, 2): h**2 / 2 * (1 + h**2 * sec_e2) * tan_e,
+                (1, 2, 3): -h * tan_e2,
+                (2, 0, 2): h * tan_e2,
+                (3, 0, 3): -h * tan_e2,
+                (3, 1, 2): -h * sec_e2,
+            },
+            device=self.length.device,
+            dtype=self.length.dtype,
+        )
+
+    def _second_order_tensor_exit(self) -> torch.Tensor:
+        """
+        Second-order tensor for the exit face of the dipole magnet, following the MAD
+        variant of Ocelot for a flat pole face.
+        """
+        tan_e = torch.tan(self.e2)
+        tan_e2 = tan_e**2
+        sec_e2 = 1.0 / torch.cos(self.e2) ** 2
+        h = self.hx
+
+        return assemble_second_order_tensor(
+            {
+                (0, 0, 0): h / 2 * tan_e2,
+                (0, 2, 2): -h / 2 * sec_e2,
+                (1, 0, 0): -(h**2) / 2 * tan_e2 * tan_e,
+                (1, 0, 1): -h * tan_e2,
+                (1, 2, 2): -(h**2) / 2 * tan_e2 * tan_e,
+                (1, 2, 3): h * tan_e2,
+                (2, 0, 2): -h * tan_e2,
+                (3, 0, 2): h**2 * sec_e2 * tan_e,
+                (3, 0, 3): h * tan_e2,
+                (3, 1, 2): h * sec_e2,
+            },
+            device=self.length.device,
+            dtype=self.length.dtype,
+        )
+
+    def _transfer_map_settings(self) -> tuple:
+        return (self.num_steps, self.tracking_method)
+
     def split(self, resolution: torch.Tensor) -> list[Element]:
-        # TODO: Implement splitting for dipole properly, for now just returns the
-        # element itself
-        return [self]
+        lengths = []
+        remaining = self.length.clone()
+        while remaining > 0:
+            lengths.append(torch.min(resolution, remaining))
+            remaining -= resolution
+        return self._slices(lengths, csr=self.csr)
+
+    def _slices(self, lengths: list[torch.Tensor], csr: bool = False) -> list["Dipole"]:
+        """
+        Slice the dipole into dipoles of the given `lengths`. The faces of the dipole
+        are kept on its first and last slice, and the slices in between meet at faces
+        without edge focusing.
+        """
+        zero = torch.zeros_like(self.e1)
+        return [
+            Dipole(
+                length,
+                angle=self.angle * length / self.length,
+                e1=self.e1 if i == 0 else zero,
+                e2=self.e2 if i == len(lengths) - 1 else zero,
+                tilt=self.tilt,
+                fringe_integral=self.fringe_integral if i == 0 else zero,
+                fringe_integral_exit=(
+                    self.fringe_integral_exit if i == len(lengths) - 1 else zero
+                ),
+                gap=self.gap,
+                num_steps=_split_num_steps(self.num_steps, length, self.length),
+                tracking_method=self.tracking_method,
+                csr=csr,
+                csr_num_slices=_split_num_steps(
+                    self.csr_num_slices, length, self.length
+                ),
+                csr_num_bins=self.csr_num_bins,
+                device=self.length.device,
+                dtype=self.length.dtype,
+            )
+            for i, length in enumerate(lengths)
+        ]
 
     def __repr__(self):
         return (
@@ -576,6 +1164,11 @@ class Dipole(Element):
             + f"fringe_integral={repr(self.fringe_integral)},"
             + f"fringe_integral_exit={repr(self.fringe_integral_exit)},"
             + f"gap={repr(self.gap)},"
+            + f"num_steps={repr(self.num_steps)},"
+            + f"tracking_method={repr(self.tracking_method)},"
+            + f"csr={repr(self.csr)},"
+            + f"csr_num_slices={repr(self.csr_num_slices)},"
+            + f"csr_num_bins={repr(self.csr_num_bins)},"
             + f"name={repr(self.name)})"
         )
 
@@ -590,9 +1183,16 @@ class Dipole(Element):
             "fringe_integral",
             "fringe_integral_exit",
             "gap",
+            "num_steps",
+            "tracking_method",
+            "csr",
+            "csr_num_slices",
+            "csr_num_bins",
         ]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         height = 0.8 * (np.sign(self.angle) if self.is_active else 1)
 
@@ -615,6 +1215,18 @@ class RBend(Dipole):
     :param fringe_integral_exit: (only set if different from `fint`) Fringe field
         integral of the exit face.
     :param gap: The magnet gap [m], NOTE in MAD and ELEGANT: HGAP = gap/2
+    :param num_steps: Number of steps of the symplectic integrator. Only used if
+        `tracking_method` is not `"cheetah"`.
+    :param tracking_method: Method used to compute the body's transfer map. `"cheetah"`
+        uses the exact linear map, `"drift_kick_drift"` and `"yoshida"` integrate it in
+        `num_steps` steps of drifts and thin kicks with a second-order or Yoshida's
+        fourth-order symplectic integrator, respectively.
+    :param csr: If `True`, `ParticleBeam`s are tracked through the dipole in
+        `csr_num_slices` slices, after each of which the particles are kicked by the
+        steady-state coherent synchrotron radiation (CSR) wake of the bunch.
+    :param csr_num_slices: Number of slices in which the CSR wake is updated.
+    :param csr_num_bins: Number of bins of the line charge density from which the CSR
+        wake is computed.
     :param name: Unique identifier of the element.
     """
 
@@ -628,6 +1240,11 @@ class RBend(Dipole):
         fringe_integral: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         fringe_integral_exit: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         gap: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        num_steps: int = 1,
+        tracking_method: Literal["cheetah", "drift_kick_drift", "yoshida"] = "cheetah",
+        csr: bool = False,
+        csr_num_slices: int = 10,
+        csr_num_bins: int = 100,
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -654,6 +1271,11 @@ class RBend(Dipole):
             fringe_integral=fringe_integral,
             fringe_integral_exit=fringe_integral_exit,
             gap=gap,
+            num_steps=num_steps,
+            tracking_method=tracking_method,
+            csr=csr,
+            csr_num_slices=csr_num_slices,
+            csr_num_bins=csr_num_bins,
             name=name,
             device=device,
             dtype=dtype,
@@ -693,21 +1315,18 @@ class HorizontalCorrector(Element):
         device = self.length.device
         dtype = self.length.dtype
 
-        gamma = energy / rest_energy.to(device=device, dtype=dtype)
-        igamma2 = (
-            1 / gamma**2
-            if gamma != 0
-            else torch.tensor(0.0, device=device, dtype=dtype)
-        )
-        beta = torch.sqrt(1 - igamma2)
-
-        tm = torch.eye(7, device=device, dtype=dtype)
-        tm[0, 1] = self.length
-        tm[1, 6] = self.angle
-        tm[2, 3] = self.length
-        tm[4, 5] = -self.length / beta**2 * igamma2
+        _, igamma2, beta = compute_relativistic_factors(energy)
 
-        return tm
+        return assemble_transfer_map(
+            {
+                (0, 1): self.length,
+                (1, 6): self.angle,
+                (2, 3): self.length,
+                (4, 5): -self.length / beta**2 * igamma2,
+            },
+            device=device,
+            dtype=dtype,
+        )
 
     @property
     def is_skippable(self) -> bool:
@@ -715,11 +1334,11 @@ class HorizontalCorrector(Element):
 
     @property
     def is_active(self) -> bool:
-        return self.angle != 0
+        return torch.any(self.angle != 0)
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         split_elements = []
-        remaining = self.length
+        remaining = self.length.clone()
         while remaining > 0:
             length = torch.min(resolution, remaining)
             element = HorizontalCorrector(length, self.angle * length / self.length)
@@ -727,7 +1346,9 @@ class HorizontalCorrector(Element):
             remaining -= resolution
         return split_elements
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         height = 0.8 * (np.sign(self.angle) if self.is_active else 1)
 
@@ -781,20 +1402,18 @@ class VerticalCorrector(Element):
         device = self.length.device
         dtype = self.length.dtype
 
-        gamma = energy / rest_energy.to(device=device, dtype=dtype)
-        igamma2 = (
-            1 / gamma**2
-            if gamma != 0
-            else torch.tensor(0.0, device=device, dtype=dtype)
-        )
-        beta = torch.sqrt(1 - igamma2)
+        _, igamma2, beta = compute_relativistic_factors(energy)
 
-        tm = torch.eye(7, device=device, dtype=dtype)
-        tm[0, 1] = self.length
-        tm[2, 3] = self.length
-        tm[3, 6] = self.angle
-        tm[4, 5] = -self.length / beta**2 * igamma2
-        return tm
+        return assemble_transfer_map(
+            {
+                (0, 1): self.length,
+                (2, 3): self.length,
+                (3, 6): self.angle,
+                (4, 5): -self.length / beta**2 * igamma2,
+            },
+            device=device,
+            dtype=dtype,
+        )
 
     @property
     def is_skippable(self) -> bool:
@@ -802,11 +1421,11 @@ class VerticalCorrector(Element):
 
     @property
     def is_active(self) -> bool:
-        return self.angle != 0
+        return torch.any(self.angle != 0)
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         split_elements = []
-        remaining = self.length
+        remaining = self.length.clone()
         while remaining > 0:
             length = torch.min(resolution, remaining)
             element = VerticalCorrector(length, self.angle * length / self.length)
@@ -814,7 +1433,9 @@ class VerticalCorrector(Element):
             remaining -= resolution
         return split_elements
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         height = 0.8 * (np.sign(self.angle) if self.is_active else 1)
 
@@ -843,6 +1464,15 @@ class Cavity(Element):
     :param voltage: Voltage of the cavity in volts.
     :param phase: Phase of the cavity in degrees.
     :param frequency: Frequency of the cavity in Hz.
+    :param num_steps: Number of steps of the symplectic integrator. Only used if
+        `tracking_method` is not `"cheetah"`.
+    :param tracking_method: Method used to compute the transverse transfer map of the
+        cavity body. `"cheetah"` uses the exact linear map, `"drift_kick_drift"` and
+        `"yoshida"` integrate it in `num_steps` steps of drifts and thin kicks with a
+        second-order or Yoshida's fourth-order symplectic integrator, respectively. The
+        steps are equally spaced in the logarithm of the energy.
+    :param wakefield: Optional `Wakefield` of the cavity, which is applied to the beam
+        at the exit of the cavity.
     :param name: Unique identifier of the element.
     """
 
@@ -852,6 +1482,9 @@ class Cavity(Element):
         voltage: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         phase: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         frequency: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        num_steps: int = 1,
+        tracking_method: Literal["cheetah", "drift_kick_drift", "yoshida"] = "cheetah",
+        wakefield: Optional["Wakefield"] = None,
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -875,32 +1508,69 @@ class Cavity(Element):
             if frequency is not None
             else torch.tensor(0.0, **factory_kwargs)
         )
+        self.num_steps = int(num_steps)
+        self.tracking_method = tracking_method
+        self.wakefield = wakefield
+
+        self._outgoing_energy_cache = None
 
     @property
     def is_active(self) -> bool:
-        return self.voltage != 0
+        return torch.any(self.voltage != 0)
+
+    def _outgoing_energy(self, energy: torch.Tensor) -> torch.Tensor:
+        """
+        Energy of the beam leaving the cavity. As long as the incoming energy and the
+        cavity are unchanged, the same tensor is returned, so that caches of the
+        elements after the cavity, which key energies by their identity, stay valid.
+        """
+        tensors = [self.voltage, self.phase, energy]
+        if is_tracing() or needs_grad(tensors):
+            return energy + self.voltage * torch.cos(torch.deg2rad(self.phase))
+
+        key = tensors_cache_key(tensors)
+        cached = self._outgoing_energy_cache
+        if cached is not None and cached[0] == key and cached[2] == cached[1]._version:
+            return cached[1]
+
+        outgoing_energy = energy + self.voltage * torch.cos(torch.deg2rad(self.phase))
+        # The tensors are kept, such that the identities in the key cannot be reused
+        self._outgoing_energy_cache = (
+            key,
+            outgoing_energy,
+            outgoing_energy._version,
+            tensors,
+        )
+        return outgoing_energy
 
     @property
     def is_skippable(self) -> bool:
-        return not self.is_active
+        return not self.is_active and self.wakefield is None
 
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
         device = self.length.device
         dtype = self.length.dtype
 
-        if self.voltage > 0:
-            return self._cavity_rmatrix(energy)
-        else:
-            return base_rmatrix(
-                length=self.length,
-                k1=torch.tensor(0.0, device=device, dtype=dtype),
-                hx=torch.tensor(0.0, device=device, dtype=dtype),
-                tilt=torch.tensor(0.0, device=device, dtype=dtype),
-                energy=energy,
-            )
-
-    def track(self, incoming: Beam) -> Beam:
-        """
+        drift_rmatrix = base_rmatrix(
+            length=self.length,
+            k1=torch.tensor(0.0, device=device, dtype=dtype),
+            hx=torch.tensor(0.0, device=device, dtype=dtype),
+            tilt=torch.tensor(0.0, device=device, dtype=dtype),
+            energy=energy,
+        )
+        is_on = self.voltage > 0
+        # The R-matrix of the cavity is singular for zero voltage. Where the cavity is
+        # off, it is computed with a voltage equal to the beam energy instead, so that
+        # no NaNs leak into gradients through the entries that are not selected.
+        voltage = torch.where(is_on, self.voltage, energy)
+        return torch.where(
+            is_on.unsqueeze(-1).unsqueeze(-1),
+            self._cavity_rmatrix(energy, voltage),
+            drift_rmatrix,
+        )
+
+    def track(self, incoming: Beam) -> Beam:
+        """
         Track particles through the cavity. The input can be a `ParameterBeam` or a
         `ParticleBeam`. For a cavity, this does a little more than just the transfer map
         multiplication done by most elements.
@@ -911,126 +1581,155 @@ class Cavity(Element):
         if incoming is Beam.empty:
             return incoming
         elif isinstance(incoming, (ParameterBeam, ParticleBeam)):
-            return self._track_beam(incoming)
+            outgoing = self._track_beam(incoming)
+            if self.wakefield is not None:
+                outgoing = self.wakefield.track(outgoing)
+            return outgoing
         else:
             raise TypeError(f"Parameter incoming is of invalid type {type(incoming)}")
 
-    def _track_beam(self, incoming: ParticleBeam) -> ParticleBeam:
+    def _track_beam(self, incoming: Beam) -> Beam:
         device = self.length.device
         dtype = self.length.dtype
 
-        beta0 = torch.tensor(1.0, device=device, dtype=dtype)
-        igamma2 = torch.tensor(0.0, device=device, dtype=dtype)
-        g0 = torch.tensor(1e10, device=device, dtype=dtype)
-        if incoming.energy != 0:
-            g0 = incoming.energy / electron_mass_eV.to(device=device, dtype=dtype)
-            igamma2 = 1 / g0**2
-            beta0 = torch.sqrt(1 - igamma2)
+        is_nonzero_energy = incoming.energy != 0
+        g0 = torch.where(
+            is_nonzero_energy,
+            incoming.energy / electron_mass_eV.to(device=device, dtype=dtype),
+            torch.full_like(incoming.energy, 1e10),
+        )
+        igamma2 = torch.where(is_nonzero_energy, 1 / g0**2, torch.zeros_like(g0))
+        beta0 = torch.where(
+            is_nonzero_energy, torch.sqrt(1 - igamma2), torch.ones_like(g0)
+        )
 
         phi = torch.deg2rad(self.phase)
 
-        tm = self.transfer_map(incoming.energy)
-        if isinstance(incoming, ParameterBeam):
-            outgoing_mu = torch.matmul(tm, incoming._mu)
-            outgoing_cov = torch.matmul(tm, torch.matmul(incoming._cov, tm.t()))
-        else:  # ParticleBeam
-            outgoing_particles = torch.matmul(incoming.particles, tm.t())
+        # Expand the transfer map to the full batch shape of the cavity, so that the
+        # non-linear corrections below can be written into the tracked result in-place
+        batch_shape = torch.broadcast_shapes(
+            self.length.shape,
+            self.voltage.shape,
+            self.phase.shape,
+            self.frequency.shape,
+            incoming.energy.shape,
+        )
+        tm = self.transfer_map(incoming.energy).expand(*batch_shape, 7, 7)
+        if isinstance(incoming, ParticleBeam):
+            outgoing_particles = torch.matmul(incoming.particles, tm.transpose(-2, -1))
         delta_energy = self.voltage * torch.cos(phi)
 
         T566 = 1.5 * self.length * igamma2 / beta0**3
-        T556 = 0
-        T555 = 0
-
-        if incoming.energy + delta_energy > 0:
-            k = 2 * torch.pi * self.frequency / constants.speed_of_light
-            outgoing_energy = incoming.energy + delta_energy
-            g1 = outgoing_energy / electron_mass_eV
-            beta1 = torch.sqrt(1 - 1 / g1**2)
-
-            if isinstance(incoming, ParameterBeam):
-                outgoing_mu[5] = incoming._mu[5] * incoming.energy * beta0 / (
-                    outgoing_energy * beta1
-                ) + self.voltage * beta0 / (outgoing_energy * beta1) * (
-                    torch.cos(-incoming._mu[4] * beta0 * k + phi) - torch.cos(phi)
-                )
-                outgoing_cov[5, 5] = incoming._cov[5, 5]
-
-            else:  # ParticleBeam
-                outgoing_particles[:, 5] = incoming.particles[
-                    :, 5
-                ] * incoming.energy * beta0 / (
-                    outgoing_energy * beta1
-                ) + self.voltage * beta0 / (
-                    outgoing_energy * beta1
-                ) * (
-                    torch.cos(-incoming.particles[:, 4] * beta0 * k + phi)
-                    - torch.cos(phi)
-                )
-
-            dgamma = self.voltage / electron_mass_eV
-            if delta_energy > 0:
-                T566 = (
-                    self.length
-                    * (beta0**3 * g0**3 - beta1**3 * g1**3)
-                    / (2 * beta0 * beta1**3 * g0 * (g0 - g1) * g1**3)
-                )
-                T556 = (
-                    beta0
-                    * k
-                    * self.length
-                    * dgamma
-                    * g0
-                    * (beta1**3 * g1**3 + beta0 * (g0 - g1**3))
-                    * torch.sin(phi)
-                    / (beta1**3 * g1**3 * (g0 - g1) ** 2)
-                )
-                T555 = (
-                    beta0**2
-                    * k**2
-                    * self.length
-                    * dgamma
-                    / 2.0
-                    * (
-                        dgamma
-                        * (
-                            2 * g0 * g1**3 * (beta0 * beta1**3 - 1)
-                            + g0**2
-                            + 3 * g1**2
-                            - 2
-                        )
-                        / (beta1**3 * g1**3 * (g0 - g1) ** 3)
-                        * torch.sin(phi) ** 2
-                        - (g1 * g0 * (beta1 * beta0 - 1) + 1)
-                        / (beta1 * g1 * (g0 - g1) ** 2)
-                        * torch.cos(phi)
-                    )
-                )
+        T556 = torch.zeros_like(T566)
+        T555 = torch.zeros_like(T566)
+
+        k = 2 * torch.pi * self.frequency / constants.speed_of_light
+        outgoing_energy = self._outgoing_energy(incoming.energy)
+        g1 = outgoing_energy / electron_mass_eV
+        beta1 = torch.sqrt(1 - 1 / g1**2)
+
+        if isinstance(incoming, ParticleBeam):
+            outgoing_particles[..., 5] = incoming.ps * (
+                incoming.energy * beta0 / (outgoing_energy * beta1)
+            ).unsqueeze(-1) + (
+                self.voltage * beta0 / (outgoing_energy * beta1)
+            ).unsqueeze(
+                -1
+            ) * (
+                torch.cos(-incoming.ss * (beta0 * k).unsqueeze(-1) + phi.unsqueeze(-1))
+                - torch.cos(phi).unsqueeze(-1)
+            )
 
-            if isinstance(incoming, ParameterBeam):
-                outgoing_mu[4] = outgoing_mu[4] + (
-                    T566 * incoming._mu[5] ** 2
-                    + T556 * incoming._mu[4] * incoming._mu[5]
-                    + T555 * incoming._mu[4] ** 2
-                )
-                outgoing_cov[4, 4] = (
-                    T566 * incoming._cov[5, 5] ** 2
-                    + T556 * incoming._cov[4, 5] * incoming._cov[5, 5]
-                    + T555 * incoming._cov[4, 4] ** 2
-                )
-                outgoing_cov[4, 5] = (
-                    T566 * incoming._cov[5, 5] ** 2
-                    + T556 * incoming._cov[4, 5] * incoming._cov[5, 5]
-                    + T555 * incoming._cov[4, 4] ** 2
+        dgamma = self.voltage / electron_mass_eV
+        is_accelerating = delta_energy > 0
+        # The second-order terms are singular where the cavity does not accelerate. They
+        # are computed with a larger outgoing energy there, so that no NaNs leak into
+        # gradients through the entries that are not selected.
+        g1_accelerating = torch.where(is_accelerating, g1, g0 + 1)
+        beta1_accelerating = torch.sqrt(1 - 1 / g1_accelerating**2)
+        T566 = torch.where(
+            is_accelerating,
+            self.length
+            * (beta0**3 * g0**3 - beta1_accelerating**3 * g1_accelerating**3)
+            / (
+                2
+                * beta0
+                * beta1_accelerating**3
+                * g0
+                * (g0 - g1_accelerating)
+                * g1_accelerating**3
+            ),
+            T566,
+        )
+        T556 = torch.where(
+            is_accelerating,
+            beta0
+            * k
+            * self.length
+            * dgamma
+            * g0
+            * (
+                beta1_accelerating**3 * g1_accelerating**3
+                + beta0 * (g0 - g1_accelerating**3)
+            )
+            * torch.sin(phi)
+            / (
+                beta1_accelerating**3 * g1_accelerating**3 * (g0 - g1_accelerating) ** 2
+            ),
+            T556,
+        )
+        T555 = torch.where(
+            is_accelerating,
+            beta0**2
+            * k**2
+            * self.length
+            * dgamma
+            / 2.0
+            * (
+                dgamma
+                * (
+                    2 * g0 * g1_accelerating**3 * (beta0 * beta1_accelerating**3 - 1)
+                    + g0**2
+                    + 3 * g1_accelerating**2
+                    - 2
                 )
-                outgoing_cov[5, 4] = outgoing_cov[4, 5]
-            else:  # ParticleBeam
-                outgoing_particles[:, 4] = outgoing_particles[:, 4] + (
-                    T566 * incoming.particles[:, 5] ** 2
-                    + T556 * incoming.particles[:, 4] * incoming.particles[:, 5]
-                    + T555 * incoming.particles[:, 4] ** 2
+                / (
+                    beta1_accelerating**3
+                    * g1_accelerating**3
+                    * (g0 - g1_accelerating) ** 3
                 )
+                * torch.sin(phi) ** 2
+                - (g1_accelerating * g0 * (beta1_accelerating * beta0 - 1) + 1)
+                / (beta1_accelerating * g1_accelerating * (g0 - g1_accelerating) ** 2)
+                * torch.cos(phi)
+            ),
+            T555,
+        )
 
         if isinstance(incoming, ParameterBeam):
+            # Expand the energy deviation, which the particles pick up from the cosine
+            # of their phase, to second order in tau and propagate the moments through
+            # the resulting second-order map
+            energy_ratio = incoming.energy * beta0 / (outgoing_energy * beta1)
+            voltage_ratio = self.voltage * beta0 / (outgoing_energy * beta1)
+            R = tm.clone()
+            R[..., 5, :] = 0.0
+            R[..., 5, 4] = voltage_ratio * beta0 * k * torch.sin(phi)
+            R[..., 5, 5] = energy_ratio
+            T = assemble_second_order_tensor(
+                {
+                    (4, 5, 5): T566,
+                    (4, 4, 5): T556,
+                    (4, 4, 4): T555,
+                    (5, 4, 4): -0.5 * voltage_ratio * (beta0 * k) ** 2 * torch.cos(phi),
+                },
+                device=device,
+                dtype=dtype,
+            )
+            outgoing_mu, outgoing_cov = second_order_moments(
+                R, T, incoming._mu, incoming._cov
+            )
+
             outgoing = ParameterBeam(
                 outgoing_mu,
                 outgoing_cov,
@@ -1041,106 +1740,213 @@ class Cavity(Element):
             )
             return outgoing
         else:  # ParticleBeam
-            outgoing = ParticleBeam(
+            outgoing_particles[..., 4] = outgoing_particles[..., 4] + (
+                T566.unsqueeze(-1) * incoming.ps**2
+                + T556.unsqueeze(-1) * incoming.ss * incoming.ps
+                + T555.unsqueeze(-1) * incoming.ss**2
+            )
+
+            outgoing = incoming._with_particles(
                 outgoing_particles,
                 outgoing_energy,
                 particle_charges=incoming.particle_charges,
-                device=outgoing_particles.device,
-                dtype=outgoing_particles.dtype,
+                survival_probabilities=incoming.survival_probabilities,
             )
             return outgoing
 
-    def _cavity_rmatrix(self, energy: torch.Tensor) -> torch.Tensor:
-        """Produces an R-matrix for a cavity when it is on, i.e. voltage > 0.0."""
+    def _cavity_rmatrix(
+        self, energy: torch.Tensor, voltage: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Produces an R-matrix for a cavity when it is on, i.e. voltage > 0.0.
+
+        :param energy: Energy of the incoming beam in eV.
+        :param voltage: Voltage of the cavity in eV, which must be positive.
+        :return: R-matrix of the cavity.
+        """
         device = self.length.device
         dtype = self.length.dtype
 
         phi = torch.deg2rad(self.phase)
-        delta_energy = self.voltage * torch.cos(phi)
+        delta_energy = voltage * torch.cos(phi)
         # Comment from Ocelot: Pure pi-standing-wave case
         eta = torch.tensor(1.0, device=device, dtype=dtype)
         Ei = energy / electron_mass_eV
         Ef = (energy + delta_energy) / electron_mass_eV
         Ep = (Ef - Ei) / self.length  # Derivative of the energy
-        assert Ei > 0, "Initial energy must be larger than 0"
-
-        alpha = torch.sqrt(eta / 8) / torch.cos(phi) * torch.log(Ef / Ei)
-
-        r11 = torch.cos(alpha) - torch.sqrt(2 / eta) * torch.cos(phi) * torch.sin(alpha)
+        if not is_tracing():
+            assert torch.all(Ei > 0), "Initial energy must be larger than 0"
 
-        # In Ocelot r12 is defined as below only if abs(Ep) > 10, and self.length
-        # otherwise. This is implemented differently here in order to achieve results
-        # closer to Bmad.
-        r12 = torch.sqrt(8 / eta) * Ei / Ep * torch.cos(phi) * torch.sin(alpha)
+        if self.tracking_method == "cheetah":
+            alpha = torch.sqrt(eta / 8) / torch.cos(phi) * torch.log(Ef / Ei)
 
-        r21 = (
-            -Ep
-            / Ef
-            * (
-                torch.cos(phi) / torch.sqrt(2 * eta)
-                + torch.sqrt(eta / 8) / torch.cos(phi)
+            r11 = torch.cos(alpha) - torch.sqrt(2 / eta) * torch.cos(phi) * torch.sin(
+                alpha
             )
-            * torch.sin(alpha)
-        )
 
-        r22 = (
-            Ei
-            / Ef
-            * (
-                torch.cos(alpha)
-                + torch.sqrt(2 / eta) * torch.cos(phi) * torch.sin(alpha)
+            # In Ocelot r12 is defined as below only if abs(Ep) > 10, and self.length
+            # otherwise. This is implemented differently here in order to achieve
+            # results closer to Bmad.
+            r12 = torch.sqrt(8 / eta) * Ei / Ep * torch.cos(phi) * torch.sin(alpha)
+
+            r21 = (
+                -Ep
+                / Ef
+                * (
+                    torch.cos(phi) / torch.sqrt(2 * eta)
+                    + torch.sqrt(eta / 8) / torch.cos(phi)
+                )
+                * torch.sin(alpha)
             )
-        )
 
-        r56 = torch.tensor(0.0)
-        beta0 = torch.tensor(1.0)
-        beta1 = torch.tensor(1.0)
+            r22 = (
+                Ei
+                / Ef
+                * (
+                    torch.cos(alpha)
+                    + torch.sqrt(2 / eta) * torch.cos(phi) * torch.sin(alpha)
+                )
+            )
+        else:
+            r11, r12, r21, r22 = self._integrated_transverse_rmatrix(
+                Ei, Ef, Ep, phi, eta
+            )
 
         k = 2 * torch.pi * self.frequency / torch.tensor(constants.speed_of_light)
-        r55_cor = 0
-        if self.voltage != 0 and energy != 0:  # TODO: Do we need this if?
-            beta0 = torch.sqrt(1 - 1 / Ei**2)
-            beta1 = torch.sqrt(1 - 1 / Ef**2)
-
-            r56 = -self.length / (Ef**2 * Ei * beta1) * (Ef + Ei) / (beta1 + beta0)
-            g0 = Ei
-            g1 = Ef
-            r55_cor = (
-                k
-                * self.length
-                * beta0
-                * self.voltage
-                / electron_mass_eV
-                * torch.sin(phi)
-                * (g0 * g1 * (beta0 * beta1 - 1) + 1)
-                / (beta1 * g1 * (g0 - g1) ** 2)
-            )
+
+        # TODO: Do we need this condition?
+        is_valid = torch.logical_and(voltage != 0, energy != 0)
+        beta0 = torch.where(is_valid, torch.sqrt(1 - 1 / Ei**2), torch.ones_like(Ei))
+        beta1 = torch.where(is_valid, torch.sqrt(1 - 1 / Ef**2), torch.ones_like(Ef))
+
+        r56 = torch.where(
+            is_valid,
+            -self.length / (Ef**2 * Ei * beta1) * (Ef + Ei) / (beta1 + beta0),
+            torch.zeros_like(Ef),
+        )
+        g0 = Ei
+        g1 = Ef
+        r55_cor = torch.where(
+            is_valid,
+            k
+            * self.length
+            * beta0
+            * voltage
+            / electron_mass_eV
+            * torch.sin(phi)
+            * (g0 * g1 * (beta0 * beta1 - 1) + 1)
+            / (beta1 * g1 * (g0 - g1) ** 2),
+            torch.zeros_like(Ef),
+        )
 
         r66 = Ei / Ef * beta0 / beta1
-        r65 = k * torch.sin(phi) * self.voltage / (Ef * beta1 * electron_mass_eV)
-
-        R = torch.eye(7, device=device, dtype=dtype)
-        R[0, 0] = r11
-        R[0, 1] = r12
-        R[1, 0] = r21
-        R[1, 1] = r22
-        R[2, 2] = r11
-        R[2, 3] = r12
-        R[3, 2] = r21
-        R[3, 3] = r22
-        R[4, 4] = 1 + r55_cor
-        R[4, 5] = r56
-        R[5, 4] = r65
-        R[5, 5] = r66
+        r65 = k * torch.sin(phi) * voltage / (Ef * beta1 * electron_mass_eV)
+
+        R = assemble_transfer_map(
+            {
+                (0, 0): r11,
+                (0, 1): r12,
+                (1, 0): r21,
+                (1, 1): r22,
+                (2, 2): r11,
+                (2, 3): r12,
+                (3, 2): r21,
+                (3, 3): r22,
+                (4, 4): 1 + r55_cor,
+                (4, 5): r56,
+                (5, 4): r65,
+                (5, 5): r66,
+            },
+            device=device,
+            dtype=dtype,
+        )
 
         return R
 
+    def _integrated_transverse_rmatrix(
+        self,
+        Ei: torch.Tensor,
+        Ef: torch.Tensor,
+        Ep: torch.Tensor,
+        phi: torch.Tensor,
+        eta: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Entries of the transverse transfer map of a cavity that is on, with the body
+        integrated in `num_steps` steps of drifts and kicks.
+
+        In the logarithm `u` of the energy, the cavity body is a drift of the position
+        `x` with the slope `q = gamma * xp / gamma'` and a constant ponderomotive
+        focusing kick on `q`. The entrance and exit of the cavity are thin lenses.
+
+        :param Ei: Energy at the entrance in units of the electron rest energy.
+        :param Ef: Energy at the exit in units of the electron rest energy.
+        :param Ep: Derivative of the energy along the cavity.
+        :param phi: Phase of the cavity in rad.
+        :param eta: Ratio of the amplitudes of the standing wave harmonics.
+        :return: Tuple of `r11`, `r12`, `r21` and `r22` of the transfer map.
+        """
+        one = torch.ones_like(phi)
+        drift = assemble_generator(
+            {(0, 1): one}, device=self.length.device, dtype=self.length.dtype
+        )
+        kick = assemble_generator(
+            {(1, 0): -eta / (8 * torch.cos(phi) ** 2)},
+            device=self.length.device,
+            dtype=self.length.dtype,
+        )
+        M = symplectic_map(
+            drift,
+            kick,
+            torch.log(Ef / Ei),
+            num_steps=self.num_steps,
+            method=self.tracking_method,
+        )
+
+        # Transform from `(x, q)` back to `(x, xp)` and add the lenses at the faces
+        b11 = M[..., 0, 0]
+        b12 = M[..., 0, 1] * Ei / Ep
+        b21 = M[..., 1, 0] * Ep / Ef
+        b22 = M[..., 1, 1] * Ei / Ef
+        entrance = -Ep / (2 * Ei)
+        exit = Ep / (2 * Ef)
+
+        r11 = b11 + entrance * b12
+        r12 = b12
+        r21 = b21 + entrance * b22 + exit * r11
+        r22 = b22 + exit * b12
+        return r11, r12, r21, r22
+
+    def _transfer_map_settings(self) -> tuple:
+        return (self.num_steps, self.tracking_method)
+
     def split(self, resolution: torch.Tensor) -> list[Element]:
-        # TODO: Implement splitting for cavity properly, for now just returns the
-        # element itself
-        return [self]
+        # Slices of equal gradient compose to the transverse map of the whole cavity,
+        # as the lenses at the faces between them cancel. The wakefield of the cavity
+        # is kept as a separate element at its exit.
+        split_elements = []
+        remaining = self.length.clone()
+        while remaining > 0:
+            length = torch.min(resolution, remaining)
+            element = Cavity(
+                length,
+                voltage=self.voltage * length / self.length,
+                phase=self.phase,
+                frequency=self.frequency,
+                num_steps=_split_num_steps(self.num_steps, length, self.length),
+                tracking_method=self.tracking_method,
+                device=self.length.device,
+                dtype=self.length.dtype,
+            )
+            split_elements.append(element)
+            remaining -= resolution
+        if self.wakefield is not None:
+            split_elements.append(self.wakefield)
+        return split_elements
+
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
         alpha = 1 if self.is_active else 0.2
         height = 0.4
 
@@ -1151,7 +1957,15 @@ class Cavity(Element):
 
     @property
     def defining_features(self) -> list[str]:
-        return super().defining_features + ["length", "voltage", "phase", "frequency"]
+        return super().defining_features + [
+            "length",
+            "voltage",
+            "phase",
+            "frequency",
+            "num_steps",
+            "tracking_method",
+            "wakefield",
+        ]
 
     def __repr__(self) -> str:
         return (
@@ -1159,6 +1973,391 @@ class Cavity(Element):
             + f"voltage={repr(self.voltage)}, "
             + f"phase={repr(self.phase)}, "
             + f"frequency={repr(self.frequency)}, "
+            + f"num_steps={repr(self.num_steps)}, "
+            + f"tracking_method={repr(self.tracking_method)}, "
+            + f"wakefield={repr(self.wakefield)}, "
+            + f"name={repr(self.name)})"
+        )
+
+
+class Wakefield(Element):
+    """
+    Short-range wakefields of a structure, e.g. of a cavity, applied to a beam as a
+    thin kick. The wake functions are tabulated at distances behind the source
+    particle, linearly interpolated in between and zero beyond the last distance.
+
+    The wake potentials of a `ParticleBeam` are computed by binning its charge and
+    dipole moments along the bunch with cloud-in-cell weights and convolving them with
+    the wake functions by FFTs. The bins have a fixed width, such that the spectra of
+    the sampled wake functions only depend on the number of bins and are cached.
+
+    For a `ParameterBeam`, the wake potentials of a Gaussian bunch are integrated
+    analytically over the piecewise linear wake functions. Their mean and their slope
+    along the bunch are applied to the beam's mean and covariance, and their
+    remaining variance is added to the spread of the kicked momenta.
+
+    :param wake_positions: Distances behind the source particle at which the wake
+        functions are tabulated in meters, increasing from zero.
+    :param longitudinal_wake: Longitudinal wake function in V/C, positive for an energy
+        loss. Defaults to no longitudinal wake.
+    :param transverse_wake: Transverse dipole wake function in V/(C m), positive for a
+        kick away from the axis. Defaults to no transverse wake.
+    :param bin_width: Width of the bins along the bunch in meters, used for tracking
+        `ParticleBeam`s.
+    :param name: Unique identifier of the element.
+    """
+
+    def __init__(
+        self,
+        wake_positions: Union[torch.Tensor, nn.Parameter],
+        longitudinal_wake: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        transverse_wake: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        bin_width: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        name: Optional[str] = None,
+        device=None,
+        dtype=torch.float32,
+    ) -> None:
+        factory_kwargs = {"device": device, "dtype": dtype}
+        super().__init__(name=name)
+
+        self.wake_positions = torch.as_tensor(wake_positions, **factory_kwargs)
+        self.longitudinal_wake = (
+            torch.as_tensor(longitudinal_wake, **factory_kwargs)
+            if longitudinal_wake is not None
+            else torch.zeros_like(self.wake_positions)
+        )
+        self.transverse_wake = (
+            torch.as_tensor(transverse_wake, **factory_kwargs)
+            if transverse_wake is not None
+            else torch.zeros_like(self.wake_positions)
+        )
+        self.bin_width = (
+            torch.as_tensor(bin_width, **factory_kwargs)
+            if bin_width is not None
+            else torch.tensor(1e-5, **factory_kwargs)
+        )
+
+        self._wake_spectrum_cache = OrderedDict()
+
+    @classmethod
+    def from_functions(
+        cls,
+        max_distance: Union[torch.Tensor, float],
+        longitudinal_wake: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+        transverse_wake: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+        num_points: int = 1_000,
+        **kwargs,
+    ) -> "Wakefield":
+        """
+        Create a wakefield from analytic wake functions by tabulating them at
+        `num_points` equally spaced distances from zero to `max_distance`.
+
+        :param max_distance: Distance in meters beyond which the wakes are neglected.
+        :param longitudinal_wake: Function of the distance in meters returning the
+            longitudinal wake in V/C.
+        :param transverse_wake: Function of the distance in meters returning the
+            transverse dipole wake in V/(C m).
+        :param num_points: Number of distances at which the functions are tabulated.
+        :param kwargs: Further arguments passed to the constructor, e.g. `bin_width`.
+        :return: Wakefield with the tabulated wake functions.
+        """
+        dtype = kwargs.get("dtype", torch.float32)
+        wake_positions = torch.linspace(
+            0.0,
+            float(max_distance),
+            num_points,
+            device=kwargs.get("device"),
+            dtype=dtype,
+        )
+        return cls(
+            wake_positions,
+            longitudinal_wake=(
+                longitudinal_wake(wake_positions)
+                if longitudinal_wake is not None
+                else None
+            ),
+            transverse_wake=(
+                transverse_wake(wake_positions) if transverse_wake is not None else None
+            ),
+            **kwargs,
+        )
+
+    @property
+    def is_skippable(self) -> bool:
+        return False
+
+    def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
+        return torch.eye(7, device=energy.device, dtype=energy.dtype)
+
+    def track(self, incoming: Beam) -> Beam:
+        if incoming is Beam.empty:
+            return incoming
+        elif isinstance(incoming, ParticleBeam):
+            return self._track_particle_beam(incoming)
+        elif isinstance(incoming, ParameterBeam):
+            return self._track_parameter_beam(incoming)
+        else:
+            raise TypeError(f"Parameter incoming is of invalid type {type(incoming)}")
+
+    def _interpolated_wakes(self, distances: torch.Tensor) -> torch.Tensor:
+        """
+        Longitudinal and transverse wakes linearly interpolated at `distances` behind
+        the source particle, stacked along a new first dimension.
+        """
+        wakes = torch.stack([self.longitudinal_wake, self.transverse_wake])
+        upper = torch.searchsorted(self.wake_positions, distances, right=True).clamp(
+            1, len(self.wake_positions) - 1
+        )
+        lower_position = self.wake_positions[upper - 1]
+        fraction = (distances - lower_position) / (
+            self.wake_positions[upper] - lower_position
+        )
+        interpolated = wakes[:, upper - 1] + fraction * (
+            wakes[:, upper] - wakes[:, upper - 1]
+        )
+        is_inside = (distances >= 0) & (distances <= self.wake_positions[-1])
+        return torch.where(is_inside, interpolated, 0.0)
+
+    def _wake_spectra(self, num_bins: int) -> torch.Tensor:
+        """
+        Spectra of the longitudinal and transverse wakes sampled at the distances of
+        `num_bins` bins behind the source particle, zero-padded to twice the number of
+        bins for a causal convolution. Spectra are cached until the wakes or the bin
+        width change, unless they require grad.
+        """
+        tensors = [
+            self.wake_positions,
+            self.longitudinal_wake,
+            self.transverse_wake,
+            self.bin_width,
+        ]
+        key = tensors_cache_key(tensors) + (num_bins,)
+        is_cacheable = not (needs_grad(tensors) or is_tracing())
+        if is_cacheable and key in self._wake_spectrum_cache:
+            self._wake_spectrum_cache.move_to_end(key)
+            return self._wake_spectrum_cache[key][0]
+
+        distances = self.bin_width * torch.arange(
+            num_bins, device=self.bin_width.device, dtype=self.bin_width.dtype
+        )
+        wakes = self._interpolated_wakes(distances)
+        # By the fundamental theorem of beam loading, particles see half of their own
+        # longitudinal wake
+        wakes = torch.cat(
+            [wakes[:, :1] * wakes.new_tensor([[0.5], [1.0]]), wakes[:, 1:]], dim=1
+        )
+        spectra = torch.fft.rfft(wakes, n=2 * num_bins)
+
+        if is_cacheable:
+            self._wake_spectrum_cache[key] = (spectra, tensors)
+            if len(self._wake_spectrum_cache) > 8:
+                self._wake_spectrum_cache.popitem(last=False)
+        return spectra
+
+    def _track_particle_beam(self, incoming: ParticleBeam) -> ParticleBeam:
+        particles = incoming.particles
+        charges = (
+            incoming.particle_charges.abs() * incoming.survival_probabilities
+            if incoming.survival_probabilities is not None
+            else incoming.particle_charges.abs()
+        )
+        _, _, beta = compute_relativistic_factors(incoming.energy)
+
+        num_particles = particles.shape[-2]
+        batch_shape = torch.broadcast_shapes(
+            particles.shape[:-2], charges.shape[:-1], beta.shape
+        )
+        particles = particles.expand(*batch_shape, num_particles, 7)
+
+        # Distances along the bunch increase towards its tail, so that the wakes of the
+        # particles in a bin act on the particles in the bins after it
+        distances = (beta.unsqueeze(-1) * particles[..., 4]).reshape(-1, num_particles)
+        bin_width = self.bin_width.to(distances.dtype)
+        bins = (distances - distances.min(dim=-1, keepdim=True).values) / bin_width
+        # The number of bins is rounded up to a power of two to reuse cached spectra
+        num_bins = 2 ** math.ceil(math.log2(float(bins.max()) + 2))
+        index = torch.floor(bins)
+        fraction = bins - index
+        index = index.long()
+
+        sources = torch.stack(
+            [
+                charges.expand(*batch_shape, num_particles),
+                charges * particles[..., 0],
+                charges * particles[..., 2],
+            ],
+            dim=-2,
+        ).reshape(-1, 3, num_particles)
+        binned = torch.zeros(
+            (sources.shape[0], 3, num_bins),
+            device=distances.device,
+            dtype=distances.dtype,
+        )
+        expanded_index = index.unsqueeze(-2).expand(-1, 3, -1)
+        binned = binned.scatter_add(
+            -1, expanded_index, (1 - fraction).unsqueeze(-2) * sources
+        )
+        binned = binned.scatter_add(
+            -1, expanded_index + 1, fraction.unsqueeze(-2) * sources
+        )
+
+        spectra = self._wake_spectra(num_bins)[[0, 1, 1]]
+        potentials = torch.fft.irfft(
+            torch.fft.rfft(binned, n=2 * num_bins) * spectra, n=2 * num_bins
+        )[..., :num_bins]
+        particle_potentials = (1 - fraction).unsqueeze(-2) * potentials.gather(
+            -1, expanded_index
+        ) + fraction.unsqueeze(-2) * potentials.gather(-1, expanded_index + 1)
+        particle_potentials = particle_potentials.view(*batch_shape, 3, num_particles)
+
+        momentum = (beta * incoming.energy).unsqueeze(-1)
+        zeros = torch.zeros_like(particle_potentials[..., 0, :])
+        kicks = torch.stack(
+            [
+                zeros,
+                particle_potentials[..., 1, :] / momentum,
+                zeros,
+                particle_potentials[..., 2, :] / momentum,
+                zeros,
+                -particle_potentials[..., 0, :] / momentum,
+                zeros,
+            ],
+            dim=-1,
+        )
+
+        return incoming._with_particles(
+            particles + kicks,
+            incoming.energy,
+            particle_charges=incoming.particle_charges,
+            survival_probabilities=incoming.survival_probabilities,
+        )
+
+    def _gaussian_wake_potentials(
+        self, offsets: torch.Tensor, sigma: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Wake potentials per unit charge of a Gaussian bunch, integrated analytically
+        over the piecewise linear wake functions.
+
+        :param offsets: Positions along the bunch relative to its centre of shape
+            `(..., K)` in meters, increasing towards the tail.
+        :param sigma: Length of the bunch of shape `(...)` in meters.
+        :return: Longitudinal and transverse wake potentials of shape `(..., 2, K)` in
+            V/C and V/(C m).
+        """
+        # The source particles at a distance `s` ahead of a position are distributed
+        # normally in `s` around the position's offset from the bunch centre
+        a = self.wake_positions[:-1]
+        b = self.wake_positions[1:]
+        wakes = torch.stack([self.longitudinal_wake, self.transverse_wake])
+        slopes = (wakes[:, 1:] - wakes[:, :-1]) / (b - a)
+        intercepts = wakes[:, :-1] - slopes * a
+
+        centre = offsets.unsqueeze(-1).unsqueeze(-3)
+        sigma = sigma[..., None, None, None]
+        normal = torch.distributions.Normal(0.0, 1.0)
+        upper = (b - centre) / sigma
+        lower = (a - centre) / sigma
+        probabilities = normal.cdf(upper) - normal.cdf(lower)
+        densities = (
+            (torch.exp(-0.5 * lower**2) - torch.exp(-0.5 * upper**2))
+            * sigma
+            / math.sqrt(2 * math.pi)
+        )
+
+        return (
+            (intercepts.unsqueeze(-2) + slopes.unsqueeze(-2) * centre) * probabilities
+            + slopes.unsqueeze(-2) * densities
+        ).sum(dim=-1)
+
+    def _track_parameter_beam(self, incoming: ParameterBeam) -> ParameterBeam:
+        mu = incoming._mu
+        cov = incoming._cov
+        _, _, beta = compute_relativistic_factors(incoming.energy)
+        mu_tau = mu[..., 4]
+        sigma = beta * torch.sqrt(cov[..., 4, 4])
+
+        # Gauss-Hermite quadrature over the normally distributed particles of the bunch
+        nodes, weights = np.polynomial.hermite_e.hermegauss(32)
+        nodes = torch.as_tensor(nodes, device=mu.device, dtype=mu.dtype)
+        weights = torch.as_tensor(
+            weights / math.sqrt(2 * math.pi), device=mu.device, dtype=mu.dtype
+        )
+        potentials = self._gaussian_wake_potentials(sigma.unsqueeze(-1) * nodes, sigma)
+
+        # Kicks of xp, yp and delta at the nodes, and their linear fit along the bunch
+        scale = (incoming.total_charge.abs() / (beta * incoming.energy)).unsqueeze(-1)
+        kicks = torch.stack(
+            [
+                scale * mu[..., 0:1] * potentials[..., 1, :],
+                scale * mu[..., 2:3] * potentials[..., 1, :],
+                -scale * potentials[..., 0, :],
+            ],
+            dim=-2,
+        )
+        mean_kicks = (weights * kicks).sum(dim=-1)
+        slopes = (weights * nodes * kicks).sum(dim=-1) / sigma.unsqueeze(-1)
+        residuals = (
+            kicks
+            - mean_kicks.unsqueeze(-1)
+            - slopes.unsqueeze(-1) * sigma[..., None, None] * nodes
+        )
+        residual_cov = torch.einsum(
+            "...ik,...jk,k->...ij", residuals, residuals, weights
+        )
+
+        # The slopes along the bunch are slopes in tau scaled by beta
+        tm = assemble_transfer_map(
+            {
+                (1, 4): beta * slopes[..., 0],
+                (1, 6): mean_kicks[..., 0] - beta * slopes[..., 0] * mu_tau,
+                (3, 4): beta * slopes[..., 1],
+                (3, 6): mean_kicks[..., 1] - beta * slopes[..., 1] * mu_tau,
+                (5, 4): beta * slopes[..., 2],
+                (5, 6): mean_kicks[..., 2] - beta * slopes[..., 2] * mu_tau,
+            },
+            device=mu.device,
+            dtype=mu.dtype,
+        )
+        outgoing = self._apply_transfer_map(tm, incoming)
+
+        # Embed the covariance of the residual kicks into the rows and columns of the
+        # momenta
+        embedding = torch.zeros(7, 3, device=mu.device, dtype=mu.dtype)
+        embedding[[1, 3, 5], [0, 1, 2]] = 1.0
+        return ParameterBeam(
+            outgoing._mu,
+            outgoing._cov + embedding @ residual_cov @ embedding.T,
+            outgoing.energy,
+            total_charge=outgoing.total_charge,
+            device=mu.device,
+            dtype=mu.dtype,
+        )
+
+    def split(self, resolution: torch.Tensor) -> list[Element]:
+        return [self]
+
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
+        patch = Rectangle((s, 0), 0, 0.4, color="tab:brown", zorder=2)
+        ax.add_patch(patch)
+
+    @property
+    def defining_features(self) -> list[str]:
+        return super().defining_features + [
+            "wake_positions",
+            "longitudinal_wake",
+            "transverse_wake",
+            "bin_width",
+        ]
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(wake_positions={repr(self.wake_positions)}, "
+            + f"longitudinal_wake={repr(self.longitudinal_wake)}, "
+            + f"transverse_wake={repr(self.transverse_wake)}, "
+            + f"bin_width={repr(self.bin_width)}, "
             + f"name={repr(self.name)})"
         )
 
@@ -1189,18 +2388,20 @@ class BPM(Element):
         if incoming is Beam.empty:
             self.reading = None
         elif isinstance(incoming, ParameterBeam):
-            self.reading = torch.stack([incoming.mu_x, incoming.mu_y])
+            self.reading = torch.stack([incoming.mu_x, incoming.mu_y], dim=-1)
         elif isinstance(incoming, ParticleBeam):
-            self.reading = torch.stack([incoming.mu_x, incoming.mu_y])
+            self.reading = torch.stack([incoming.mu_x, incoming.mu_y], dim=-1)
         else:
             raise TypeError(f"Parameter incoming is of invalid type {type(incoming)}")
 
-        return deepcopy(incoming)
+        return incoming
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         patch = Rectangle(
             (s, -0.3), 0, 0.3 * 2, color="darkkhaki", alpha=alpha, zorder=2
@@ -1220,37 +2421,73 @@ class Marker(Element):
     General Marker / Monitor element
 
     :param name: Unique identifier of the element.
+    :param openpmd_file: If set, the marker is active and writes every `ParticleBeam`
+        tracked through it to this openPMD file as a new iteration, e.g. to checkpoint
+        long tracking runs. Writing requires h5py.
     """
 
-    def __init__(self, name: Optional[str] = None) -> None:
+    def __init__(
+        self, name: Optional[str] = None, openpmd_file: Optional[str] = None
+    ) -> None:
         super().__init__(name=name)
 
+        self.openpmd_file = str(openpmd_file) if openpmd_file is not None else None
+
+    @property
+    def is_active(self) -> bool:
+        return self.openpmd_file is not None
+
     def transfer_map(self, energy):
         return torch.eye(7, device=energy.device, dtype=energy.dtype)
 
     def track(self, incoming):
-        # TODO: At some point Markers should be able to be active or inactive. Active
-        # Markers would be able to record the beam tracked through them.
+        if self.is_active:
+            self._write_beam(incoming)
         return incoming
 
+    def _write_beam(self, beam: Beam, iteration: Optional[int] = None) -> Optional[int]:
+        """
+        Write a `ParticleBeam` to the openPMD file of the marker as a new iteration, or
+        append its particles to an existing `iteration`.
+
+        :return: Iteration the beam was written to, or `None` if it was not written.
+        """
+        if not isinstance(beam, ParticleBeam):
+            return None
+
+        from cheetah.converters.openpmd import write_openpmd
+
+        return write_openpmd(
+            self.openpmd_file,
+            beam.particles,
+            beam.energy,
+            beam.particle_charges,
+            survival_probabilities=beam.survival_probabilities,
+            iteration=iteration,
+            attributes={"elementName": self.name},
+        )
+
     @property
     def is_skippable(self) -> bool:
-        return True
+        return not self.is_active
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
         # Do nothing on purpose. Maybe later we decide markers should be shown, but for
         # now they are invisible.
         pass
 
     @property
     def defining_features(self) -> list[str]:
-        return super().defining_features
+        return super().defining_features + ["openpmd_file"]
 
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}(name={repr(self.name)})"
+        return (
+            f"{self.__class__.__name__}(openpmd_file={repr(self.openpmd_file)}, "
+            + f"name={repr(self.name)})"
+        )
 
 
 class Screen(Element):
@@ -1267,9 +2504,20 @@ class Screen(Element):
     :param is_active: If `True` the screen is active and will record the beam's
         distribution. If `False` the screen is inactive and will not record the beam's
         distribution.
+    :param method: Method used to deposit the particles of a `ParticleBeam` onto the
+        pixels of the screen. `"ngp"` (nearest grid point) counts the particles in each
+        pixel like a histogram. `"cic"` (cloud in cell) distributes each particle
+        bilinearly onto the four nearest pixel centres and `"gaussian"` spreads it with
+        a Gaussian kernel of width `kernel_width`. Unlike `"ngp"`, the latter two are
+        differentiable with respect to the particle positions.
+    :param kernel_width: Standard deviation of the Gaussian kernel in (binned) pixels,
+        used when `method` is `"gaussian"`.
     :param name: Unique identifier of the element.
     """
 
+    # Order of the expansion in the x-y correlation when rendering a `ParameterBeam`
+    GAUSSIAN_COUPLING_ORDER = 32
+
     def __init__(
         self,
         resolution: Optional[Union[torch.Tensor, nn.Parameter]] = None,
@@ -1277,6 +2525,8 @@ class Screen(Element):
         binning: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         misalignment: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         is_active: bool = False,
+        method: Literal["ngp", "cic", "gaussian"] = "ngp",
+        kernel_width: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -1305,9 +2555,16 @@ class Screen(Element):
             else torch.tensor((0.0, 0.0), **factory_kwargs)
         )
         self.is_active = is_active
+        self.method = method
+        self.kernel_width = (
+            torch.as_tensor(kernel_width, **factory_kwargs)
+            if kernel_width is not None
+            else torch.tensor(1.0, **factory_kwargs)
+        )
 
         self.set_read_beam(None)
         self.cached_reading = None
+        self._pixel_geometry_cache = None
 
     @property
     def is_skippable(self) -> bool:
@@ -1347,6 +2604,31 @@ class Screen(Element):
             ),
         )
 
+    @property
+    def pixel_geometry(self) -> tuple[torch.Tensor, torch.Tensor, int, int, int]:
+        """
+        Geometry of the (binned) pixel grid as a tuple of the position of its lower left
+        corner `(x, y)`, the size of a binned pixel `(width, height)`, the number of
+        binned pixels in x and y, and the radius of the Gaussian deposition kernel in
+        pixels.
+
+        The geometry is computed once and reused until the resolution, pixel size,
+        binning or kernel width are changed, so that reading the screen does not need
+        to synchronise with the device to size the image.
+        """
+        tensors = [self.resolution, self.pixel_size, self.binning, self.kernel_width]
+        key = tensors_cache_key(tensors)
+        if self._pixel_geometry_cache is None or self._pixel_geometry_cache[0] != key:
+            corner = self.extent[[0, 2]]
+            step = self.effective_pixel_size
+            num_x, num_y = (int(n) for n in self.effective_resolution)
+            kernel_radius = int(torch.ceil(3 * self.kernel_width).max())
+            geometry = (corner, step, num_x, num_y, kernel_radius)
+            # Keeping the tensors alive keeps the identities in the key valid
+            self._pixel_geometry_cache = (key, tensors, geometry)
+
+        return self._pixel_geometry_cache[2]
+
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
         device = self.misalignment.device
         dtype = self.misalignment.dtype
@@ -1355,14 +2637,36 @@ class Screen(Element):
 
     def track(self, incoming: Beam) -> Beam:
         if self.is_active:
-            copy_of_incoming = deepcopy(incoming)
+            # Offset of the beam in the screen's coordinate system
+            offset = torch.zeros(
+                (*self.misalignment.shape[:-1], 7),
+                device=self.misalignment.device,
+                dtype=self.misalignment.dtype,
+            )
+            offset[..., 0] = self.misalignment[..., 0]
+            offset[..., 2] = self.misalignment[..., 1]
 
             if isinstance(incoming, ParameterBeam):
-                copy_of_incoming._mu[0] -= self.misalignment[0]
-                copy_of_incoming._mu[2] -= self.misalignment[1]
+                copy_of_incoming = ParameterBeam(
+                    incoming._mu - offset,
+                    incoming._cov.clone(),
+                    incoming.energy.clone(),
+                    total_charge=incoming.total_charge.clone(),
+                    device=incoming._mu.device,
+                    dtype=incoming._mu.dtype,
+                )
             elif isinstance(incoming, ParticleBeam):
-                copy_of_incoming.particles[:, 0] -= self.misalignment[0]
-                copy_of_incoming.particles[:, 1] -= self.misalignment[1]
+                incoming_particles = incoming.particles
+                copy_of_incoming = ParticleBeam(
+                    incoming_particles - offset.unsqueeze(-2),
+                    incoming.energy.clone(),
+                    particle_charges=incoming.particle_charges.clone(),
+                    device=incoming_particles.device,
+                    dtype=incoming_particles.dtype,
+                    survival_probabilities=incoming.survival_probabilities,
+                )
+            else:
+                copy_of_incoming = deepcopy(incoming)
 
             self.set_read_beam(copy_of_incoming)
 
@@ -1377,48 +2681,182 @@ class Screen(Element):
 
         read_beam = self.get_read_beam()
         if read_beam is Beam.empty or read_beam is None:
-            image = torch.zeros(
-                (int(self.effective_resolution[1]), int(self.effective_resolution[0]))
-            )
+            _, _, num_x, num_y, _ = self.pixel_geometry
+            image = torch.zeros((num_y, num_x))
         elif isinstance(read_beam, ParameterBeam):
-            transverse_mu = torch.stack([read_beam._mu[0], read_beam._mu[2]])
-            transverse_cov = torch.stack(
-                [
-                    torch.stack([read_beam._cov[0, 0], read_beam._cov[0, 2]]),
-                    torch.stack([read_beam._cov[2, 0], read_beam._cov[2, 2]]),
-                ]
-            )
-            dist = MultivariateNormal(
-                loc=transverse_mu.cpu(), covariance_matrix=transverse_cov.cpu()
-            )
-
-            left = self.extent[0]
-            right = self.extent[1]
-            hstep = self.pixel_size[0] * self.binning
-            bottom = self.extent[2]
-            top = self.extent[3]
-            vstep = self.pixel_size[1] * self.binning
-            x, y = torch.meshgrid(
-                torch.arange(left, right, hstep),
-                torch.arange(bottom, top, vstep),
-                indexing="ij",
+            image = self._render_gaussian(
+                read_beam._mu[..., [0, 2]], read_beam._cov[..., [0, 2], :][..., [0, 2]]
             )
-            pos = torch.dstack((x, y))
-            image = dist.log_prob(pos).exp()
-            image = torch.flipud(image.T)
         elif isinstance(read_beam, ParticleBeam):
-            image, _ = torch.histogramdd(
-                torch.stack((read_beam.xs, read_beam.ys)).T.cpu(),
-                bins=self.pixel_bin_edges,
+            image = self._deposit_particles(
+                read_beam.xs, read_beam.ys, read_beam.survival_probabilities
             )
-            image = torch.flipud(image.T)
-            image = image.cpu()
         else:
             raise TypeError(f"Read beam is of invalid type {type(read_beam)}")
 
         self.cached_reading = image
         return image
 
+    def _render_gaussian(self, mu: torch.Tensor, cov: torch.Tensor) -> torch.Tensor:
+        """
+        Render the mean density of a bivariate Gaussian distribution in each pixel on
+        the distribution's device.
+
+        The probability in a pixel is integrated analytically with differences of the
+        error function along each axis. Correlation between x and y is taken into
+        account by a truncated Mehler expansion of the density in terms of the
+        correlation coefficient `rho`, such that the image is a sum of outer products of
+        vectors along x and y instead of an evaluation on the full pixel grid. The
+        expansion converges like `rho ** GAUSSIAN_COUPLING_ORDER`. Its relative error is
+        below 1e-3 for `|rho| <= 0.8`, but grows for almost fully coupled beams.
+
+        :param mu: Mean of the transverse positions `(x, y)` of shape `(..., 2)`.
+        :param cov: Covariance of the transverse positions of shape `(..., 2, 2)`.
+        :return: Image of shape `(..., num_y, num_x)`, with the first row at the top.
+        """
+        corner, step, num_x, num_y, _ = self.pixel_geometry
+        corner = corner.to(device=mu.device, dtype=mu.dtype)
+        step = step.to(device=mu.device, dtype=mu.dtype)
+
+        sigma_x = torch.sqrt(cov[..., 0, 0])
+        sigma_y = torch.sqrt(cov[..., 1, 1])
+        rho = cov[..., 0, 1] / (sigma_x * sigma_y)
+
+        def axis_factors(
+            num: int, corner: torch.Tensor, step: torch.Tensor, mu, sigma
+        ) -> torch.Tensor:
+            """
+            Factors of the expansion along one axis of shape `(..., order + 1, num)`.
+            """
+            edges = corner + step * torch.arange(num + 1, device=mu.device)
+            # Pixel edges in units of standard deviations from the mean
+            ts = (edges - mu.unsqueeze(-1)) / sigma.unsqueeze(-1)
+            pdf = torch.exp(-0.5 * ts**2) / np.sqrt(2 * np.pi)
+            cdf = 0.5 * (1 + torch.erf(ts / np.sqrt(2)))
+
+            # The integral of He_n * pdf over a pixel is -He_{n-1} * pdf between its
+            # edges, where He_n are the probabilists' Hermite polynomials. These are
+            # carried as He_n * pdf / sqrt(n!), which neither overflows nor underflows
+            # to NaN in the tails of the distribution.
+            factors = [cdf[..., 1:] - cdf[..., :-1]]
+            previous, current = torch.zeros_like(ts), pdf
+            for n in range(1, self.GAUSSIAN_COUPLING_ORDER + 1):
+                factors.append(current[..., :-1] - current[..., 1:])
+                previous, current = (
+                    current,
+                    (ts * current - np.sqrt(n - 1) * previous) / np.sqrt(n),
+                )
+            return torch.stack(factors, dim=-2)
+
+        factors_x = axis_factors(num_x, corner[0], step[0], mu[..., 0], sigma_x)
+        factors_y = axis_factors(num_y, corner[1], step[1], mu[..., 1], sigma_y)
+
+        # Coefficients rho^n / n! of the Mehler expansion, of which (n - 1)! is absorbed
+        # by the normalisation of the factors
+        orders = torch.arange(
+            self.GAUSSIAN_COUPLING_ORDER + 1, device=mu.device, dtype=mu.dtype
+        )
+        coefficients = rho.unsqueeze(-1) ** orders / orders.clamp(min=1)
+        probabilities = torch.einsum(
+            "...n,...ny,...nx->...yx", coefficients, factors_y, factors_x
+        )
+
+        image = probabilities / (step[0] * step[1])
+        return torch.flip(image, dims=(-2,))
+
+    def _deposit_particles(
+        self,
+        xs: torch.Tensor,
+        ys: torch.Tensor,
+        survival_probabilities: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """
+        Deposit particles onto the pixel grid with scatter-adds on the particles'
+        device, using the weighting selected by `method`.
+
+        :param xs: Horizontal particle positions of shape `(..., num_particles)`.
+        :param ys: Vertical particle positions of shape `(..., num_particles)`.
+        :param survival_probabilities: Survival probabilities of the particles of shape
+            `(..., num_particles)`, by which their deposits are weighted. `None` if all
+            particles have survived.
+        :return: Image of shape `(..., num_y, num_x)`, with the first row at the top.
+        """
+        if survival_probabilities is not None:
+            xs, ys, survival_probabilities = torch.broadcast_tensors(
+                xs, ys, survival_probabilities
+            )
+
+        corner, step, num_x, num_y, kernel_radius = self.pixel_geometry
+        corner = corner.to(device=xs.device, dtype=xs.dtype)
+        step = step.to(device=xs.device, dtype=xs.dtype)
+
+        batch_shape = xs.shape[:-1]
+        # Positions in units of pixels relative to the lower left corner of the grid
+        us = ((xs - corner[0]) / step[0]).reshape(-1, xs.shape[-1])
+        vs = ((ys - corner[1]) / step[1]).reshape(-1, ys.shape[-1])
+
+        if self.method == "ngp":
+            # Like a histogram, the last pixel includes its outer edge
+            ix = torch.where(us == num_x, num_x - 1, torch.floor(us))
+            iy = torch.where(vs == num_y, num_y - 1, torch.floor(vs))
+            deposits = [(ix, iy, torch.ones_like(us))]
+        elif self.method == "cic":
+            # Pixel centres lie at half-integer positions
+            ix = torch.floor(us - 0.5)
+            iy = torch.floor(vs - 0.5)
+            fx = us - 0.5 - ix
+            fy = vs - 0.5 - iy
+            deposits = [
+                (ix, iy, (1 - fx) * (1 - fy)),
+                (ix + 1, iy, fx * (1 - fy)),
+                (ix, iy + 1, (1 - fx) * fy),
+                (ix + 1, iy + 1, fx * fy),
+            ]
+        elif self.method == "gaussian":
+            offsets = torch.arange(
+                -kernel_radius, kernel_radius + 1, device=xs.device, dtype=xs.dtype
+            )
+            width = self.kernel_width.to(device=xs.device, dtype=xs.dtype)
+            ix = torch.floor(us).unsqueeze(-1) + offsets
+            iy = torch.floor(vs).unsqueeze(-1) + offsets
+            # The separable kernel is normalised per particle, so that every particle
+            # contributes a total weight of one
+            wx = torch.exp(-0.5 * ((ix + 0.5 - us.unsqueeze(-1)) / width) ** 2)
+            wy = torch.exp(-0.5 * ((iy + 0.5 - vs.unsqueeze(-1)) / width) ** 2)
+            wx = wx / wx.sum(dim=-1, keepdim=True)
+            wy = wy / wy.sum(dim=-1, keepdim=True)
+            deposits = [
+                (
+                    ix.unsqueeze(-1).expand(*ix.shape, len(offsets)),
+                    iy.unsqueeze(-2).expand(*iy.shape[:-1], len(offsets), -1),
+                    wx.unsqueeze(-1) * wy.unsqueeze(-2),
+                )
+            ]
+        else:
+            raise ValueError(f"Invalid deposition method {self.method}")
+
+        image = torch.zeros(
+            (us.shape[0], num_y * num_x), device=xs.device, dtype=xs.dtype
+        )
+        for ix, iy, weights in deposits:
+            if survival_probabilities is not None:
+                particle_weights = survival_probabilities.reshape(us.shape)
+                weights = weights * particle_weights.view(
+                    *us.shape, *[1] * (weights.dim() - 2)
+                )
+            # Particles outside of the screen deposit zero weight onto the first pixel
+            is_inside = (ix >= 0) & (ix < num_x) & (iy >= 0) & (iy < num_y)
+            index = torch.where(is_inside, iy * num_x + ix, 0).long()
+            weights = torch.where(is_inside, weights, 0.0)
+            image = image.scatter_add(
+                -1,
+                index.reshape(index.shape[0], -1),
+                weights.reshape(weights.shape[0], -1),
+            )
+
+        image = image.view(*batch_shape, num_y, num_x)
+        return torch.flip(image, dims=(-2,))
+
     def get_read_beam(self) -> Beam:
         # Using these get and set methods instead of Python's property decorator to
         # prevent `nn.Module` from intercepting the read beam, which is itself an
@@ -1435,7 +2873,9 @@ class Screen(Element):
     def split(self, resolution: torch.Tensor) -> list[Element]:
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         patch = Rectangle(
             (s, -0.6), 0, 0.6 * 2, color="tab:green", alpha=alpha, zorder=2
@@ -1450,6 +2890,8 @@ class Screen(Element):
             "binning",
             "misalignment",
             "is_active",
+            "method",
+            "kernel_width",
         ]
 
     def __repr__(self) -> str:
@@ -1459,6 +2901,8 @@ class Screen(Element):
             + f"binning={repr(self.binning)}, "
             + f"misalignment={repr(self.misalignment)}, "
             + f"is_active={repr(self.is_active)}, "
+            + f"method={repr(self.method)}, "
+            + f"kernel_width={repr(self.kernel_width)}, "
             + f"name={repr(self.name)})"
         )
 
@@ -1471,6 +2915,17 @@ class Aperture(Element):
     :param y_max: half size vertical offset in [m]
     :param shape: Shape of the aperture. Can be "rectangular" or "elliptical".
     :param is_active: If the aperture actually blocks particles.
+    :param loss_model: How particles blocked by the aperture are lost. With
+        `"remove"`, they are removed from the beam and collected in `lost_particles`.
+        With `"mask"`, all particles are kept, but the survival probabilities of the
+        blocked ones are set to zero. Unlike removing particles, this keeps the shape of
+        the beam static, so that apertures work with batched beams and apertures, under
+        `torch.compile` and in CUDA graphs.
+    :param edge_width: Width of a soft edge of the aperture in meters, over which the
+        survival probabilities fall off smoothly with a sigmoid, when `loss_model` is
+        `"mask"`. This makes the survival probabilities differentiable with respect to
+        the particle positions and the aperture size. An edge width of zero results in
+        a hard edge.
     :param name: Unique identifier of the element.
     """
 
@@ -1480,6 +2935,8 @@ class Aperture(Element):
         y_max: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         shape: Literal["rectangular", "elliptical"] = "rectangular",
         is_active: bool = True,
+        loss_model: Literal["remove", "mask"] = "remove",
+        edge_width: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -1499,6 +2956,12 @@ class Aperture(Element):
         )
         self.shape = shape
         self.is_active = is_active
+        self.loss_model = loss_model
+        self.edge_width = (
+            torch.as_tensor(edge_width, **factory_kwargs)
+            if edge_width is not None
+            else torch.tensor(0.0, **factory_kwargs)
+        )
 
         self.lost_particles = None
 
@@ -1517,48 +2980,122 @@ class Aperture(Element):
         if not (isinstance(incoming, ParticleBeam) and self.is_active):
             return incoming
 
-        assert self.x_max >= 0 and self.y_max >= 0
         assert self.shape in [
             "rectangular",
             "elliptical",
         ], f"Unknown aperture shape {self.shape}"
 
-        if self.shape == "rectangular":
-            survived_mask = torch.logical_and(
-                torch.logical_and(incoming.xs > -self.x_max, incoming.xs < self.x_max),
-                torch.logical_and(incoming.ys > -self.y_max, incoming.ys < self.y_max),
+        if self.loss_model == "mask":
+            return self._track_mask(incoming)
+        elif self.loss_model != "remove":
+            raise ValueError(f"Unknown loss model {self.loss_model}")
+
+        incoming_particles = incoming.particles
+        if incoming_particles.dim() > 2 or self.x_max.dim() > 0 or self.y_max.dim() > 0:
+            raise NotImplementedError(
+                "Tracking batched beams or apertures is not supported by `Aperture` "
+                'with `loss_model="remove"`, because removing lost particles results '
+                'in differently sized beams. Use `loss_model="mask"` instead.'
             )
-        elif self.shape == "elliptical":
-            survived_mask = (
-                incoming.xs**2 / self.x_max**2 + incoming.ys**2 / self.y_max**2
-            ) <= 1.0
-        outgoing_particles = incoming.particles[survived_mask]
+
+        assert self.x_max >= 0 and self.y_max >= 0
+
+        survived_mask = self._survived_mask(incoming.xs, incoming.ys)
+        outgoing_particles = incoming_particles[survived_mask]
 
         outgoing_particle_charges = incoming.particle_charges[survived_mask]
+        outgoing_survival_probabilities = (
+            incoming.survival_probabilities[survived_mask]
+            if incoming.survival_probabilities is not None
+            else None
+        )
 
-        self.lost_particles = incoming.particles[torch.logical_not(survived_mask)]
+        self.lost_particles = incoming_particles[torch.logical_not(survived_mask)]
 
         self.lost_particle_charges = incoming.particle_charges[
             torch.logical_not(survived_mask)
         ]
 
         return (
-            ParticleBeam(
+            incoming._with_particles(
                 outgoing_particles,
                 incoming.energy,
                 particle_charges=outgoing_particle_charges,
-                device=outgoing_particles.device,
-                dtype=outgoing_particles.dtype,
+                survival_probabilities=outgoing_survival_probabilities,
             )
             if outgoing_particles.shape[0] > 0
             else ParticleBeam.empty
         )
 
+    def _survived_mask(self, xs: torch.Tensor, ys: torch.Tensor) -> torch.Tensor:
+        """Mask of the particles at positions `xs` and `ys` that pass the aperture."""
+        x_max = self.x_max.unsqueeze(-1)
+        y_max = self.y_max.unsqueeze(-1)
+
+        if self.shape == "rectangular":
+            return torch.logical_and(
+                torch.logical_and(xs > -x_max, xs < x_max),
+                torch.logical_and(ys > -y_max, ys < y_max),
+            )
+        elif self.shape == "elliptical":
+            return (xs**2 / x_max**2 + ys**2 / y_max**2) <= 1.0
+
+    def _track_mask(self, incoming: ParticleBeam) -> ParticleBeam:
+        """
+        Track a beam through the aperture by multiplying the survival probabilities of
+        its particles with their probability to pass the aperture.
+        """
+        if not is_tracing():
+            assert torch.all(self.x_max >= 0) and torch.all(self.y_max >= 0)
+
+        xs = incoming.xs
+        ys = incoming.ys
+        x_max = self.x_max.unsqueeze(-1)
+        y_max = self.y_max.unsqueeze(-1)
+        edge_width = self.edge_width.unsqueeze(-1)
+
+        # Soft edges are sigmoids of the distance to the edge, where the distance to
+        # the edge of an ellipse is approximated by scaling its normalised radius
+        is_soft = edge_width > 0
+        safe_edge_width = torch.where(is_soft, edge_width, 1.0)
+        if self.shape == "rectangular":
+            soft_probabilities = torch.sigmoid(
+                (x_max - torch.abs(xs)) / safe_edge_width
+            ) * torch.sigmoid((y_max - torch.abs(ys)) / safe_edge_width)
+        elif self.shape == "elliptical":
+            # The gradient of the square root is infinite for particles at the centre
+            # of the aperture, which would also leak into hard edges as NaN
+            radius = torch.sqrt(
+                (xs**2 / x_max**2 + ys**2 / y_max**2).clamp_min(
+                    torch.finfo(xs.dtype).tiny
+                )
+            )
+            soft_probabilities = torch.sigmoid(
+                (1 - radius) * torch.minimum(x_max, y_max) / safe_edge_width
+            )
+        hard_probabilities = self._survived_mask(xs, ys).to(xs.dtype)
+        probabilities = torch.where(is_soft, soft_probabilities, hard_probabilities)
+
+        survival_probabilities = (
+            incoming.survival_probabilities * probabilities
+            if incoming.survival_probabilities is not None
+            else probabilities
+        )
+
+        return incoming._with_particles(
+            incoming.particles,
+            incoming.energy,
+            particle_charges=incoming.particle_charges,
+            survival_probabilities=survival_probabilities,
+        )
+
     def split(self, resolution: torch.Tensor) -> list[Element]:
         # TODO: Implement splitting for aperture properly, for now just return self
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         height = 0.4
 
@@ -1576,6 +3113,8 @@ class Aperture(Element):
             "y_max",
             "shape",
             "is_active",
+            "loss_model",
+            "edge_width",
         ]
 
     def __repr__(self) -> str:
@@ -1584,6 +3123,8 @@ class Aperture(Element):
             + f"y_max={repr(self.y_max)}, "
             + f"shape={repr(self.shape)}, "
             + f"is_active={repr(self.is_active)}, "
+            + f"loss_model={repr(self.loss_model)}, "
+            + f"edge_width={repr(self.edge_width)}, "
             + f"name={repr(self.name)})"
         )
 
@@ -1618,19 +3159,17 @@ class Undulator(Element):
         device = self.length.device
         dtype = self.length.dtype
 
-        gamma = energy / rest_energy.to(device=device, dtype=dtype)
-        igamma2 = (
-            1 / gamma**2
-            if gamma != 0
-            else torch.tensor(0.0, device=device, dtype=dtype)
-        )
-
-        tm = torch.eye(7, device=device, dtype=dtype)
-        tm[0, 1] = self.length
-        tm[2, 3] = self.length
-        tm[4, 5] = self.length * igamma2
+        _, igamma2, _ = compute_relativistic_factors(energy)
 
-        return tm
+        return assemble_transfer_map(
+            {
+                (0, 1): self.length,
+                (2, 3): self.length,
+                (4, 5): self.length * igamma2,
+            },
+            device=device,
+            dtype=dtype,
+        )
 
     @property
     def is_skippable(self) -> bool:
@@ -1640,7 +3179,9 @@ class Undulator(Element):
         # TODO: Implement splitting for undulator properly, for now just return self
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
         alpha = 1 if self.is_active else 0.2
         height = 0.4
 
@@ -1672,6 +3213,12 @@ class Solenoid(Element):
         inside the solenoid, Brho is the momentum of central trajectory.
     :param misalignment: Misalignment vector of the solenoid magnet in x- and
         y-directions.
+    :param num_steps: Number of steps of the symplectic integrator. Only used if
+        `tracking_method` is not `"cheetah"`.
+    :param tracking_method: Method used to compute the transfer map. `"cheetah"` uses
+        the exact linear map, `"drift_kick_drift"` and `"yoshida"` integrate it in
+        `num_steps` steps of drifts and thin kicks with a second-order or Yoshida's
+        fourth-order symplectic integrator, respectively.
     :param name: Unique identifier of the element.
     """
 
@@ -1680,6 +3227,8 @@ class Solenoid(Element):
         length: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         k: Optional[Union[torch.Tensor, nn.Parameter]] = None,
         misalignment: Optional[Union[torch.Tensor, nn.Parameter]] = None,
+        num_steps: int = 1,
+        tracking_method: Literal["cheetah", "drift_kick_drift", "yoshida"] = "cheetah",
         name: Optional[str] = None,
         device=None,
         dtype=torch.float32,
@@ -1702,81 +3251,436 @@ class Solenoid(Element):
             if misalignment is not None
             else torch.tensor((0.0, 0.0), **factory_kwargs)
         )
+        self.num_steps = int(num_steps)
+        self.tracking_method = tracking_method
 
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
+        R = (
+            self._transfer_map_body(energy)
+            if self.tracking_method == "cheetah"
+            else self._integrated_transfer_map_body(energy)
+        )
+
+        # Shifting by a zero misalignment is an identity, which is cheaper than a
+        # data-dependent branch that synchronises with the device
+        R_exit, R_entry = misalignment_matrix(self.misalignment)
+        R = torch.matmul(R_exit, torch.matmul(R, R_entry))
+        return R
+
+    def _transfer_map_body(self, energy: torch.Tensor) -> torch.Tensor:
+        """Linear transfer map of the solenoid in its own frame."""
+        device = self.length.device
+        dtype = self.length.dtype
+
+        _, igamma2, beta = compute_relativistic_factors(energy)
+        c = torch.cos(self.length * self.k)
+        s = torch.sin(self.length * self.k)
+        safe_k = torch.where(self.k == 0, torch.ones_like(self.k), self.k)
+        s_k = torch.where(self.k == 0, self.length, s / safe_k)
+        r56 = -self.length / beta**2 * igamma2
+
+        return assemble_transfer_map(
+            {
+                (0, 0): c**2,
+                (0, 1): c * s_k,
+                (0, 2): s * c,
+                (0, 3): s * s_k,
+                (1, 0): -self.k * s * c,
+                (1, 1): c**2,
+                (1, 2): -self.k * s**2,
+                (1, 3): s * c,
+                (2, 0): -s * c,
+                (2, 1): -s * s_k,
+                (2, 2): c**2,
+                (2, 3): c * s_k,
+                (3, 0): self.k * s**2,
+                (3, 1): -s * c,
+                (3, 2): -self.k * s * c,
+                (3, 3): c**2,
+                (4, 5): r56,
+            },
+            device=device,
+            dtype=dtype,
+        )
+
+    def _integrated_transfer_map_body(self, energy: torch.Tensor) -> torch.Tensor:
+        """
+        Transfer map of the solenoid in its own frame, integrated with drifts and kicks
+        that rotate and focus the particles in the field of the solenoid.
+        """
+        zero = torch.zeros_like(self.k)
+        drift, _ = base_generators(zero, zero, energy)
+        kick = assemble_generator(
+            {
+                (0, 2): self.k,
+                (1, 0): -(self.k**2),
+                (1, 3): self.k,
+                (2, 0): -self.k,
+                (3, 1): -self.k,
+                (3, 2): -(self.k**2),
+            },
+            device=self.length.device,
+            dtype=self.length.dtype,
+        )
+        return symplectic_map(
+            drift,
+            kick,
+            self.length,
+            num_steps=self.num_steps,
+            method=self.tracking_method,
+        )
+
+    def second_order_map(
+        self, energy: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
         device = self.length.device
         dtype = self.length.dtype
 
-        gamma = energy / rest_energy.to(device=device, dtype=dtype)
-        c = torch.cos(self.length * self.k)
-        s = torch.sin(self.length * self.k)
-        if self.k == 0:
-            s_k = self.length
-        else:
-            s_k = s / self.k
-        r56 = torch.tensor(0.0, device=device, dtype=dtype)
-        if gamma != 0:
-            gamma2 = gamma * gamma
-            beta = torch.sqrt(1.0 - 1.0 / gamma2)
-            r56 -= self.length / (beta * beta * gamma2)
-
-        R = torch.eye(7, device=device, dtype=dtype)
-        R[0, 0] = c**2
-        R[0, 1] = c * s_k
-        R[0, 2] = s * c
-        R[0, 3] = s * s_k
-        R[1, 0] = -self.k * s * c
-        R[1, 1] = c**2
-        R[1, 2] = -self.k * s**2
-        R[1, 3] = s * c
-        R[2, 0] = -s * c
-        R[2, 1] = -s * s_k
-        R[2, 2] = c**2
-        R[2, 3] = c * s_k
-        R[3, 0] = self.k * s**2
-        R[3, 1] = -s * c
-        R[3, 2] = -self.k * s * c
-        R[3, 3] = c**2
-        R[4, 5] = r56
-
-        R = R.real
-
-        if self.misalignment[0] == 0 and self.misalignment[1] == 0:
-            return R
-        else:
-            R_exit, R_entry = misalignment_matrix(self.misalignment)
-            R = torch.matmul(R_exit, torch.matmul(R, R_entry))
-            return R
+        _, igamma2, beta = compute_relativistic_factors(energy)
+        k = self.k
+        c2 = torch.cos(2 * self.length * k)
+        s2 = torch.sin(2 * self.length * k)
+
+        # In canonical coordinates, the map of a particle with relative momentum
+        # deviation delta is that of a solenoid of length L / (1 + delta). The
+        # chromatic terms are therefore -L / beta times the derivative by the length.
+        chromatic = -self.length / beta
+        # The path length grows with the square of the kinetic transverse momentum,
+        # which is conserved in the solenoid body
+        path_length = self.length / (2 * beta)
+
+        T = assemble_second_order_tensor(
+            {
+                (0, 0, 5): chromatic * -k * s2,
+                (0, 1, 5): chromatic * c2,
+                (0, 2, 5): chromatic * k * c2,
+                (0, 3, 5): chromatic * s2,
+                (1, 0, 5): chromatic * -(k**2) * c2,
+                (1, 1, 5): chromatic * -k * s2,
+                (1, 2, 5): chromatic * -(k**2) * s2,
+                (1, 3, 5): chromatic * k * c2,
+                (2, 0, 5): chromatic * -k * c2,
+                (2, 1, 5): chromatic * -s2,
+                (2, 2, 5): chromatic * -k * s2,
+                (2, 3, 5): chromatic * c2,
+                (3, 0, 5): chromatic * k**2 * s2,
+                (3, 1, 5): chromatic * -k * c2,
+                (3, 2, 5): chromatic * -(k**2) * c2,
+                (3, 3, 5): chromatic * -k * s2,
+                (4, 0, 0): path_length * k**2,
+                (4, 0, 3): -2 * path_length * k,
+                (4, 1, 1): path_length,
+                (4, 1, 2): 2 * path_length * k,
+                (4, 2, 2): path_length * k**2,
+                (4, 3, 3): path_length,
+                (4, 5, 5): 1.5 * self.length * igamma2 / beta**3,
+            },
+            device=device,
+            dtype=dtype,
+        )
+
+        R_exit, R_entry = misalignment_matrix(self.misalignment)
+        return concatenate_second_order_maps(
+            [(R_entry, None), (self._transfer_map_body(energy), T), (R_exit, None)]
+        )
+
+    @property
+    def is_active(self) -> bool:
+        return torch.any(self.k != 0)
+
+    def is_skippable(self) -> bool:
+        return True
+
+    def _transfer_map_settings(self) -> tuple:
+        return (self.num_steps, self.tracking_method)
+
+    def split(self, resolution: torch.Tensor) -> list[Element]:
+        split_elements = []
+        remaining = self.length.clone()
+        while remaining > 0:
+            length = torch.min(resolution, remaining)
+            element = Solenoid(
+                length,
+                self.k,
+                misalignment=self.misalignment,
+                num_steps=_split_num_steps(self.num_steps, length, self.length),
+                tracking_method=self.tracking_method,
+                device=self.length.device,
+                dtype=self.length.dtype,
+            )
+            split_elements.append(element)
+            remaining -= resolution
+        return split_elements
+
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
+
+        alpha = 1 if self.is_active else 0.2
+        height = 0.8
+
+        patch = Rectangle(
+            (s, 0), self.length, height, color="tab:orange", alpha=alpha, zorder=2
+        )
+        ax.add_patch(patch)
+
+    @property
+    def defining_features(self) -> list[str]:
+        return super().defining_features + [
+            "length",
+            "k",
+            "misalignment",
+            "num_steps",
+            "tracking_method",
+        ]
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(length={repr(self.length)}, "
+            + f"k={repr(self.k)}, "
+            + f"misalignment={repr(self.misalignment)}, "
+            + f"name={repr(self.name)})"
+        )
+
+
+class SpaceChargeKick(Element):
+    """
+    Kick applied to the particles of a `ParticleBeam` by the space charge fields of the
+    beam itself, integrated over a length `effect_length` of the lattice.
+
+    The charge of the beam is deposited onto a regular grid around the beam in its rest
+    frame with cloud-in-cell weights. The electrostatic potential is the convolution of
+    the charge with the integrated Green's function of the grid, computed with FFTs on a
+    zero-padded grid of twice the size. The electric field is obtained from finite
+    differences of the potential, interpolated back to the particles with the same
+    weights and transformed to the lab frame to kick the particles' momenta. All steps
+    are differentiable with respect to the particles and their charges.
+
+    The grid spans a multiple of the beam size in every direction. Particles outside of
+    the grid neither contribute to nor feel the space charge fields. Parameter beams
+    pass the kick unchanged.
+
+    Space charge kicks are usually inserted between the slices of a lattice with
+    `Segment.with_space_charge_kicks`, where the resolution of the slices sets the
+    interval at which the fields are updated.
+
+    :param effect_length: Length of the lattice over which the space charge forces are
+        integrated in meters.
+    :param num_grid_points_x: Number of grid points in horizontal direction.
+    :param num_grid_points_y: Number of grid points in vertical direction.
+    :param num_grid_points_tau: Number of grid points in longitudinal direction.
+    :param grid_extent_x: Half width of the grid in horizontal direction in multiples
+        of the horizontal beam size.
+    :param grid_extent_y: Half width of the grid in vertical direction in multiples of
+        the vertical beam size.
+    :param grid_extent_tau: Half width of the grid in longitudinal direction in
+        multiples of the longitudinal beam size.
+    :param name: Unique identifier of the element.
+    """
+
+    def __init__(
+        self,
+        effect_length: Union[torch.Tensor, nn.Parameter],
+        num_grid_points_x: int = 32,
+        num_grid_points_y: int = 32,
+        num_grid_points_tau: int = 32,
+        grid_extent_x: float = 3.0,
+        grid_extent_y: float = 3.0,
+        grid_extent_tau: float = 3.0,
+        name: Optional[str] = None,
+        device=None,
+        dtype=torch.float32,
+    ) -> None:
+        factory_kwargs = {"device": device, "dtype": dtype}
+        super().__init__(name=name)
+
+        self.effect_length = torch.as_tensor(effect_length, **factory_kwargs)
+        self.num_grid_points_x = int(num_grid_points_x)
+        self.num_grid_points_y = int(num_grid_points_y)
+        self.num_grid_points_tau = int(num_grid_points_tau)
+        self.grid_extent_x = float(grid_extent_x)
+        self.grid_extent_y = float(grid_extent_y)
+        self.grid_extent_tau = float(grid_extent_tau)
+
+    @property
+    def is_skippable(self) -> bool:
+        return False
+
+    def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
+        return torch.eye(7, device=energy.device, dtype=energy.dtype)
+
+    def track(self, incoming: Beam) -> Beam:
+        if not isinstance(incoming, ParticleBeam):
+            return incoming
+
+        particles = incoming.particles
+        # All particles are of the same species, so they repel each other regardless
+        # of the sign with which their charges are stored
+        source_charges = (
+            incoming.particle_charges.abs() * incoming.survival_probabilities
+            if incoming.survival_probabilities is not None
+            else incoming.particle_charges.abs()
+        )
+        gamma, _, beta = compute_relativistic_factors(incoming.energy)
+
+        num_particles = particles.shape[-2]
+        batch_shape = torch.broadcast_shapes(
+            particles.shape[:-2],
+            source_charges.shape[:-1],
+            gamma.shape,
+            self.effect_length.shape,
+        )
+
+        # Positions in the rest frame of the beam, in which the bunch is longer by a
+        # factor of gamma than in the lab frame
+        positions = torch.stack(
+            torch.broadcast_tensors(
+                particles[..., 0],
+                particles[..., 2],
+                -(beta * gamma).unsqueeze(-1) * particles[..., 4],
+            ),
+            dim=-1,
+        )
+        fields = self._electric_fields(
+            positions.expand(*batch_shape, num_particles, 3).reshape(
+                -1, num_particles, 3
+            ),
+            source_charges.expand(*batch_shape, num_particles).reshape(
+                -1, num_particles
+            ),
+        ).view(*batch_shape, num_particles, 3)
+
+        # In the lab frame, the magnetic field of the beam cancels all but 1 / gamma**2
+        # of the transverse electric force, which is gamma times the one in the rest
+        # frame. The longitudinal force is the same in both frames. Fields in V/m times
+        # lengths in m are the energies in eV gained by a particle of unit charge.
+        kick_factor = (self.effect_length / (beta * incoming.energy)).unsqueeze(-1)
+        transverse_factor = kick_factor / (gamma * beta).unsqueeze(-1)
+        zeros = torch.zeros_like(kick_factor * fields[..., 0])
+        kicks = torch.stack(
+            [
+                zeros,
+                transverse_factor * fields[..., 0],
+                zeros,
+                transverse_factor * fields[..., 1],
+                zeros,
+                kick_factor * fields[..., 2],
+                zeros,
+            ],
+            dim=-1,
+        )
+
+        return incoming._with_particles(
+            particles + kicks,
+            incoming.energy,
+            particle_charges=incoming.particle_charges,
+            survival_probabilities=incoming.survival_probabilities,
+        )
+
+    def _electric_fields(
+        self, positions: torch.Tensor, charges: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Compute the electric space charge fields at the positions of the particles in
+        the rest frame of the beam.
+
+        :param positions: Particle positions of shape `(batch, num_particles, 3)` in
+            meters.
+        :param charges: Particle charges of shape `(batch, num_particles)` in C.
+        :return: Electric fields at the particles of shape `(batch, num_particles, 3)`
+            in V/m.
+        """
+        num_grid_points = (
+            self.num_grid_points_x,
+            self.num_grid_points_y,
+            self.num_grid_points_tau,
+        )
+        factory_kwargs = {"device": positions.device, "dtype": positions.dtype}
+        grid_shape = torch.tensor(num_grid_points, **factory_kwargs)
+        grid_extent = torch.tensor(
+            [self.grid_extent_x, self.grid_extent_y, self.grid_extent_tau],
+            **factory_kwargs,
+        )
+
+        # The grid points span the given multiples of the beam size around its centre
+        half_width = grid_extent * positions.std(dim=-2)
+        cell_size = 2 * half_width / (grid_shape - 1)
+        corner = positions.mean(dim=-2) - half_width
+        cells = (positions - corner.unsqueeze(-2)) / cell_size.unsqueeze(-2)
+        lower = torch.floor(cells)
+        fractions = cells - lower
+
+        # Cloud-in-cell weights of the eight grid points around every particle, which
+        # are used both for deposition and for interpolation
+        strides = torch.tensor(
+            [num_grid_points[1] * num_grid_points[2], num_grid_points[2], 1],
+            **factory_kwargs,
+        )
+        neighbours = []
+        for offset in itertools.product((0.0, 1.0), repeat=3):
+            offset = torch.tensor(offset, **factory_kwargs)
+            index = lower + offset
+            weights = torch.where(offset > 0, fractions, 1 - fractions).prod(dim=-1)
+            is_inside = ((index >= 0) & (index < grid_shape)).all(dim=-1)
+            flat_index = torch.where(is_inside, (index * strides).sum(dim=-1), 0)
+            neighbours.append((flat_index.long(), torch.where(is_inside, weights, 0.0)))
+
+        grid_charges = torch.zeros(
+            (positions.shape[0], math.prod(num_grid_points)), **factory_kwargs
+        )
+        for flat_index, weights in neighbours:
+            grid_charges = grid_charges.scatter_add(-1, flat_index, weights * charges)
+
+        padded_shape = tuple(2 * n for n in num_grid_points)
+        green_function = integrated_green_function(num_grid_points, cell_size)
+        potential = torch.fft.irfftn(
+            torch.fft.rfftn(grid_charges.view(-1, *num_grid_points), s=padded_shape)
+            * torch.fft.rfftn(green_function, s=padded_shape),
+            s=padded_shape,
+        )[..., : num_grid_points[0], : num_grid_points[1], : num_grid_points[2]] / (
+            4 * torch.pi * constants.epsilon_0
+        )
 
-    @property
-    def is_active(self) -> bool:
-        return self.k != 0
+        grid_fields = -torch.stack(
+            torch.gradient(potential, dim=(-3, -2, -1)), dim=-1
+        ) / cell_size.view(-1, 1, 1, 1, 3)
+        grid_fields = grid_fields.view(positions.shape[0], -1, 3)
 
-    def is_skippable(self) -> bool:
-        return True
+        return sum(
+            weights.unsqueeze(-1)
+            * grid_fields.gather(-2, flat_index.unsqueeze(-1).expand(-1, -1, 3))
+            for flat_index, weights in neighbours
+        )
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
-        # TODO: Implement splitting for solenoid properly, for now just return self
         return [self]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
-        alpha = 1 if self.is_active else 0.2
-        height = 0.8
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
+        from matplotlib.patches import Rectangle
 
-        patch = Rectangle(
-            (s, 0), self.length, height, color="tab:orange", alpha=alpha, zorder=2
-        )
+        patch = Rectangle((s, 0), 0, 0.4, color="tab:purple", zorder=2)
         ax.add_patch(patch)
 
     @property
     def defining_features(self) -> list[str]:
-        return super().defining_features + ["length", "k", "misalignment"]
+        return super().defining_features + [
+            "effect_length",
+            "num_grid_points_x",
+            "num_grid_points_y",
+            "num_grid_points_tau",
+            "grid_extent_x",
+            "grid_extent_y",
+            "grid_extent_tau",
+        ]
 
     def __repr__(self) -> str:
         return (
-            f"{self.__class__.__name__}(length={repr(self.length)}, "
-            + f"k={repr(self.k)}, "
-            + f"misalignment={repr(self.misalignment)}, "
+            f"{self.__class__.__name__}(effect_length={repr(self.effect_length)}, "
+            + f"num_grid_points_x={repr(self.num_grid_points_x)}, "
+            + f"num_grid_points_y={repr(self.num_grid_points_y)}, "
+            + f"num_grid_points_tau={repr(self.num_grid_points_tau)}, "
+            + f"grid_extent_x={repr(self.grid_extent_x)}, "
+            + f"grid_extent_y={repr(self.grid_extent_y)}, "
+            + f"grid_extent_tau={repr(self.grid_extent_tau)}, "
             + f"name={repr(self.name)})"
         )
 
@@ -1792,32 +3696,60 @@ class Segment(Element):
     def __init__(self, elements: list[Element], name: str = "unnamed") -> None:
         super().__init__(name=name)
 
-        self.elements = nn.ModuleList(elements)
+        self.elements = _module_list(elements)
+        self._build_name_index()
 
-        for element in self.elements:
+        elements = list(self.elements._modules.values())
+        for element_name, indices in self._name_index.items():
             # Make elements accessible via .name attribute. If multiple elements have
             # the same name, they are accessible via a list.
-            if element.name in self.__dict__:
-                if isinstance(self.__dict__[element.name], list):
-                    self.__dict__[element.name].append(element)
-                else:  # Is instance of cheetah.Element
-                    self.__dict__[element.name] = [self.__dict__[element.name], element]
-            else:
-                self.__dict__[element.name] = element
+            self.__dict__[element_name] = (
+                elements[indices[0]]
+                if len(indices) == 1
+                else [elements[index] for index in indices]
+            )
+
+    def _build_name_index(self) -> None:
+        """
+        Build the map from the names of the segment's elements to the indices at which
+        they occur in `elements`, in order of occurrence.
+        """
+        self._name_index = {}
+        for index, element in enumerate(self.elements._modules.values()):
+            self._name_index.setdefault(element.name, []).append(index)
+
+    def _first_index(self, name: str) -> Optional[int]:
+        """
+        Index of the first element called `name`, or `None` if there is no such element.
+        The name index is rebuilt if it is found to be out of date with `elements`.
+        """
+        indices = self._name_index.get(name)
+        if (
+            indices is None
+            or indices[0] >= len(self.elements)
+            or self.elements[indices[0]].name != name
+        ):
+            self._build_name_index()
+            indices = self._name_index.get(name)
+        return indices[0] if indices is not None else None
 
     def subcell(self, start: str, end: str) -> "Segment":
-        """Extract a subcell `[start, end]` from an this segment."""
-        subcell = []
-        is_in_subcell = False
-        for element in self.elements:
-            if element.name == start:
-                is_in_subcell = True
-            if is_in_subcell:
-                subcell.append(element)
-            if element.name == end:
-                break
+        """
+        Extract a subcell `[start, end]` from an this segment. The subcell is a
+        `SegmentView`, which shares the element objects of this segment.
+        """
+        start_index = self._first_index(start)
+        end_index = self._first_index(end)
+
+        elements = list(self.elements._modules.values())
+        if start_index is None or (end_index is not None and end_index < start_index):
+            subcell = []
+        elif end_index is None:
+            subcell = elements[start_index:]
+        else:
+            subcell = elements[start_index : end_index + 1]
 
-        return self.__class__(subcell)
+        return SegmentView(subcell)
 
     def flattened(self) -> "Segment":
         """
@@ -1890,14 +3822,10 @@ class Segment(Element):
         Return a segment where all inactive markers are removed. This can be used to
         speed up tracking through the segment.
 
-        NOTE: `is_active` has not yet been implemented for Markers. Therefore, this
-        function currently removes all markers.
-
         :param except_for: List of names of elements that should not be removed despite
             being inactive.
         :return: Segment without inactive markers.
         """
-        # TODO: Add check for is_active once that has been implemented for Markers
         if except_for is None:
             except_for = []
 
@@ -1905,7 +3833,9 @@ class Segment(Element):
             elements=[
                 element
                 for element in self.elements
-                if not isinstance(element, Marker) or element.name in except_for
+                if not isinstance(element, Marker)
+                or element.is_active
+                or element.name in except_for
             ],
             name=self.name,
         )
@@ -1931,7 +3861,7 @@ class Segment(Element):
             elements=[
                 element
                 for element in self.elements
-                if (hasattr(element, "length") and element.length > 0.0)
+                if (hasattr(element, "length") and torch.any(element.length > 0.0))
                 or (hasattr(element, "is_active") and element.is_active)
                 or element.name in except_for
             ],
@@ -1969,6 +3899,34 @@ class Segment(Element):
             name=self.name,
         )
 
+    def with_space_charge_kicks(self, resolution: torch.Tensor, **kwargs) -> "Segment":
+        """
+        Return a segment where the elements are split into slices no longer than
+        `resolution`, with a `SpaceChargeKick` before the first slice, between all
+        slices and after the last one. Each kick integrates the space charge forces over
+        half of the slices on either side of it, such that the kicks act at the centres
+        of the intervals they stand for.
+
+        :param resolution: Longest distance between two space charge kicks in meters.
+            Shorter distances update the space charge fields more often, which is more
+            accurate but slower.
+        :param kwargs: Further arguments passed to every `SpaceChargeKick`, e.g. to
+            configure its grid.
+        :return: Segment of slices with space charge kicks in between.
+        """
+        elements = []
+        half_length = 0.0
+        for element in self.split(resolution):
+            if hasattr(element, "length") and torch.any(element.length > 0.0):
+                elements.append(
+                    SpaceChargeKick(half_length + element.length / 2, **kwargs)
+                )
+                half_length = element.length / 2
+            elements.append(element)
+        elements.append(SpaceChargeKick(half_length, **kwargs))
+
+        return Segment(elements=elements, name=self.name)
+
     @classmethod
     def from_lattice_json(cls, filepath: str) -> "Segment":
         """
@@ -1997,6 +3955,27 @@ class Segment(Element):
         """
         save_cheetah_model(self, filepath, title, info)
 
+    @classmethod
+    def from_snapshot(cls, filepath: Union[Path, str]) -> "Segment":
+        """
+        Load a Cheetah model from a binary lattice snapshot. The snapshot is
+        memory-mapped, and the parameters of the loaded elements are views into it.
+
+        :param filepath: Name/path of the file to load the lattice from.
+        :return: Loaded Cheetah `Segment`.
+        """
+        return load_cheetah_snapshot(filepath)
+
+    def to_snapshot(self, filepath: Union[Path, str]) -> None:
+        """
+        Save a Cheetah model to a binary lattice snapshot, which holds the structure of
+        the lattice and a single contiguous blob of all parameter tensors. Snapshots
+        keep the dtypes of all tensors and load much faster than LatticeJSON.
+
+        :param filepath: Name/path of the file to save the lattice to.
+        """
+        save_cheetah_snapshot(self, filepath)
+
     @classmethod
     def from_ocelot(
         cls,
@@ -2032,7 +4011,10 @@ class Segment(Element):
 
     @classmethod
     def from_bmad(
-        cls, bmad_lattice_file_path: str, environment_variables: Optional[dict] = None
+        cls,
+        bmad_lattice_file_path: str,
+        environment_variables: Optional[dict] = None,
+        cache_dir: Optional[Union[Path, str]] = None,
     ) -> "Segment":
         """
         Read a Cheetah segment from a Bmad lattice file.
@@ -2045,10 +4027,19 @@ class Segment(Element):
         :param bmad_lattice_file_path: Path to the Bmad lattice file.
         :param environment_variables: Dictionary of environment variables to use when
             parsing the lattice file.
+        :param cache_dir: Optional directory in which to cache the parsed lattice. If
+            the lattice file and all files it calls are unchanged, the lattice is loaded
+            from the cache instead of being parsed again.
         :return: Cheetah `Segment` representing the Bmad lattice.
         """
+        from cheetah.converters.dontbmad import convert_bmad_lattice
+
         bmad_lattice_file_path = Path(bmad_lattice_file_path)
-        return convert_bmad_lattice(bmad_lattice_file_path, environment_variables)
+        return convert_bmad_lattice(
+            bmad_lattice_file_path,
+            environment_variables,
+            cache_dir=Path(cache_dir) if cache_dir is not None else None,
+        )
 
     @classmethod
     def from_nx_tables(cls, filepath: Union[Path, str]) -> "Element":
@@ -2064,6 +4055,8 @@ class Segment(Element):
         if isinstance(filepath, str):
             filepath = Path(filepath)
 
+        from cheetah.converters.nxtables import read_nx_tables
+
         return read_nx_tables(filepath)
 
     @property
@@ -2072,10 +4065,40 @@ class Segment(Element):
 
     @property
     def length(self) -> torch.Tensor:
-        lengths = torch.stack(
-            [element.length for element in self.elements if hasattr(element, "length")]
+        lengths = torch.broadcast_tensors(
+            *[element.length for element in self.elements if hasattr(element, "length")]
+        )
+        return torch.sum(torch.stack(lengths), dim=0)
+
+    def enable_transfer_map_cache(self, maxsize: int = 8) -> None:
+        """
+        Enable the transfer map cache on all elements of the segment. The segment's own
+        transfer map is not cached, as it is composed from the (cached) transfer maps
+        of its elements.
+
+        :param maxsize: Maximum number of transfer maps kept in the cache of each
+            element.
+        """
+        for element in self.elements:
+            element.enable_transfer_map_cache(maxsize=maxsize)
+
+    def disable_transfer_map_cache(self) -> None:
+        for element in self.elements:
+            element.disable_transfer_map_cache()
+
+    def clear_transfer_map_cache(self) -> None:
+        for element in self.elements:
+            element.clear_transfer_map_cache()
+
+    def transfer_map_cache_info(self) -> TransferMapCacheInfo:
+        """Report the transfer map cache statistics summed over all elements."""
+        infos = [element.transfer_map_cache_info() for element in self.elements]
+        return TransferMapCacheInfo(
+            hits=sum(info.hits for info in infos),
+            misses=sum(info.misses for info in infos),
+            maxsize=sum(info.maxsize for info in infos),
+            currsize=sum(info.currsize for info in infos),
         )
-        return torch.sum(lengths)
 
     def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
         if self.is_skippable:
@@ -2104,6 +4127,227 @@ class Segment(Element):
 
             return incoming
 
+    def track_chunked(
+        self,
+        incoming: Union[ParticleBeam, Iterable[ParticleBeam]],
+        chunk_size: Optional[int] = None,
+        device=None,
+        pin_memory: bool = False,
+    ) -> Beam:
+        """
+        Track a `ParticleBeam` through the segment in chunks of particles, such that
+        only one chunk at a time needs to be resident on the tracking device. This
+        allows tracking beams with more particles than fit into device memory.
+
+        Instead of a single beam, an iterable of beams that are chunks of one beam can
+        be passed, e.g. from `ParticleBeam.chunks_from_astra`, such that the whole
+        incoming beam never needs to be held in memory either.
+
+        Each chunk is pushed through the entire segment before the next one is
+        started. Active `BPM`s and `Screen`s accumulate their readings across chunks,
+        and active `Aperture`s collect the particles lost from all chunks, such that
+        after tracking they hold the same results as after tracking the whole beam at
+        once. Likewise, active `Marker`s write all chunks to the same iteration of
+        their openPMD file.
+
+        :param incoming: Beam of particles entering the segment, or iterable of chunks
+            of that beam. Its particles may reside in host memory.
+        :param chunk_size: Maximum number of particles per chunk. Required if
+            `incoming` is a single beam.
+        :param device: Device to track the chunks on. Defaults to the device of
+            `incoming`.
+        :param pin_memory: If `True` and tracking on CUDA, chunks are copied from
+            page-locked host memory on a separate stream, overlapping the transfer of
+            the next chunk with tracking of the current one. Only used if `incoming`
+            is a single beam.
+        :return: Outgoing beam on the device of `incoming`, or `Beam.empty` if no
+            particles left the segment.
+        """
+        if isinstance(incoming, ParticleBeam):
+            if chunk_size is None:
+                raise ValueError(
+                    "A `chunk_size` is required to track a single beam in chunks."
+                )
+            template = incoming
+            host_device = incoming.particles.device
+            device = torch.device(device) if device is not None else host_device
+            chunks = (
+                incoming._with_particles(
+                    chunk_particles,
+                    incoming.energy.to(device),
+                    particle_charges=chunk_charges,
+                    survival_probabilities=chunk_survival_probabilities,
+                )
+                for (
+                    chunk_particles,
+                    chunk_charges,
+                    chunk_survival_probabilities,
+                ) in _particle_chunks(
+                    incoming.particles,
+                    incoming.particle_charges,
+                    chunk_size,
+                    device,
+                    pin_memory,
+                    survival_probabilities=incoming.survival_probabilities,
+                )
+            )
+        else:
+            incoming = iter(incoming)
+            template = next(incoming, None)
+            if template is None:
+                return Beam.empty
+            host_device = template.particles.device
+            device = torch.device(device) if device is not None else host_device
+            chunks = (
+                chunk._with_particles(
+                    chunk.particles.to(device),
+                    chunk.energy.to(device),
+                    particle_charges=chunk.particle_charges.to(device),
+                    survival_probabilities=(
+                        chunk.survival_probabilities.to(device)
+                        if chunk.survival_probabilities is not None
+                        else None
+                    ),
+                )
+                for chunk in itertools.chain([template], incoming)
+            )
+
+        plan = self.compile()
+        if any(isinstance(element, SpaceChargeKick) for element in plan.elements):
+            raise NotImplementedError(
+                "Tracking in chunks is not supported for segments with "
+                "`SpaceChargeKick`s, because the space charge fields depend on all "
+                "particles of the beam at once."
+            )
+        plan._regroup([element.is_skippable for element in plan.elements])
+
+        reading_sums = {}
+        particle_counts = {}
+        lost_particles = {}
+        lost_particle_charges = {}
+        marker_iterations = {}
+        outgoing_particles = []
+        outgoing_particle_charges = []
+        outgoing_survival_probabilities = []
+        outgoing_energy = None
+
+        for beam in chunks:
+            for step in plan._steps:
+                if isinstance(step, BPM) and step.is_active and beam is not Beam.empty:
+                    # The reading of each chunk is weighted by its surviving particles
+                    num_particles = (
+                        beam.survival_probabilities.sum(dim=-1, keepdim=True)
+                        if beam.survival_probabilities is not None
+                        else beam.num_particles
+                    )
+                    beam = step.track(beam)
+                    reading_sums[step] = (
+                        reading_sums.get(step, 0) + step.reading * num_particles
+                    )
+                    particle_counts[step] = particle_counts.get(step, 0) + num_particles
+                elif isinstance(step, Screen) and step.is_active:
+                    beam = step.track(beam)
+                    reading_sums[step] = reading_sums.get(step, 0) + step.reading
+                elif (
+                    isinstance(step, Aperture)
+                    and step.is_active
+                    and step.loss_model == "remove"
+                    and beam is not Beam.empty
+                ):
+                    beam = step.track(beam)
+                    lost_particles.setdefault(step, []).append(
+                        step.lost_particles.to(host_device)
+                    )
+                    lost_particle_charges.setdefault(step, []).append(
+                        step.lost_particle_charges.to(host_device)
+                    )
+                elif isinstance(step, Marker) and step.is_active:
+                    # The chunks are appended to the same iteration of the file
+                    iteration = step._write_beam(
+                        beam, iteration=marker_iterations.get(step)
+                    )
+                    if iteration is not None:
+                        marker_iterations[step] = iteration
+                else:
+                    beam = step.track(beam)
+
+            if beam is not Beam.empty:
+                outgoing_particles.append(beam.particles.to(host_device))
+                outgoing_particle_charges.append(beam.particle_charges.to(host_device))
+                if beam.survival_probabilities is not None:
+                    outgoing_survival_probabilities.append(
+                        beam.survival_probabilities.to(host_device)
+                    )
+                outgoing_energy = beam.energy.to(host_device)
+
+        for element, reading_sum in reading_sums.items():
+            if isinstance(element, BPM):
+                element.reading = reading_sum / particle_counts[element]
+            else:  # Screen, whose image is a histogram that is summed over chunks
+                element.cached_reading = reading_sum
+        for element in lost_particles:
+            element.lost_particles = torch.cat(lost_particles[element], dim=-2)
+            element.lost_particle_charges = torch.cat(lost_particle_charges[element])
+
+        if not outgoing_particles:
+            return Beam.empty
+        return template._with_particles(
+            torch.cat(outgoing_particles, dim=-2),
+            outgoing_energy,
+            particle_charges=torch.cat(outgoing_particle_charges),
+            survival_probabilities=(
+                torch.cat(outgoing_survival_probabilities, dim=-1)
+                if outgoing_survival_probabilities
+                else None
+            ),
+        )
+
+    def compile(self, inplace: bool = False, order: int = 1) -> "TrackingPlan":
+        """
+        Compile the segment into a reusable `TrackingPlan`. The plan flattens nested
+        segments and groups consecutive skippable elements once, such that repeated
+        tracking through the segment executes a straight-line sequence of fused
+        transfer maps and non-skippable elements without rebuilding that schedule.
+
+        NOTE: The plan holds references to the segment's elements, so changes to their
+        parameters are picked up. Elements added to or removed from the segment after
+        compilation are not, in which case the segment needs to be compiled again.
+
+        :param inplace: If `True`, the plan tracks particle beams without autograd
+            through preallocated, double-buffered workspaces instead of allocating new
+            particle tensors for every group of elements. See `TrackingPlan`.
+        :param order: Order of the maps that particle beams are tracked through. For
+            `2`, the second-order maps of consecutive skippable elements are
+            concatenated into a single second-order map. See `TrackingPlan`.
+        :return: Tracking plan that can be called with an incoming beam.
+        """
+        return TrackingPlan(self, inplace=inplace, order=order)
+
+    def capture(self, incoming: Beam, backend: str = "inductor") -> "CapturedTracking":
+        """
+        Capture tracking through the segment for a fixed lattice topology. On CUDA, the
+        tracking is recorded into a CUDA graph that is replayed on every call. On other
+        devices, it is compiled with `torch.compile` into a single graph.
+
+        :param incoming: Example beam. Beams passed to the captured tracking later must
+            have the same type, shapes, dtype and device.
+        :param backend: Backend passed to `torch.compile` when not running on CUDA.
+        :return: Captured tracking that can be called with an incoming beam.
+        """
+        return CapturedTracking(self, incoming, backend=backend)
+
+    def checkpointed(self, stride: int = 1) -> "CheckpointedTracking":
+        """
+        Create a tracker that caches the beam at element boundaries, such that repeated
+        tracking only re-tracks from the nearest checkpoint upstream of the first
+        element whose defining features have changed since the last call.
+
+        :param stride: Number of elements between checkpoints. Larger strides save
+            memory, but on average resume tracking further upstream.
+        :return: Checkpointed tracker that can be called with an incoming beam.
+        """
+        return CheckpointedTracking(self, stride=stride)
+
     def split(self, resolution: torch.Tensor) -> list[Element]:
         return [
             split_element
@@ -2111,7 +4355,7 @@ class Segment(Element):
             for split_element in element.split(resolution)
         ]
 
-    def plot(self, ax: matplotlib.axes.Axes, s: float) -> None:
+    def plot(self, ax: "matplotlib.axes.Axes", s: float) -> None:
         element_lengths = [
             element.length if hasattr(element, "length") else 0.0
             for element in self.elements
@@ -2132,8 +4376,8 @@ class Segment(Element):
 
     def plot_reference_particle_traces(
         self,
-        axx: matplotlib.axes.Axes,
-        axy: matplotlib.axes.Axes,
+        axx: "matplotlib.axes.Axes",
+        axy: "matplotlib.axes.Axes",
         beam: Optional[Beam] = None,
         num_particles: int = 10,
         resolution: float = 0.01,
@@ -2208,7 +4452,7 @@ class Segment(Element):
 
     def plot_overview(
         self,
-        fig: Optional[matplotlib.figure.Figure] = None,
+        fig: Optional["matplotlib.figure.Figure"] = None,
         beam: Optional[Beam] = None,
         n: int = 10,
         resolution: float = 0.01,
@@ -2223,6 +4467,8 @@ class Segment(Element):
         :param resolution: Minimum resolution of the tracking of the reference particles
             in the plot.
         """
+        import matplotlib.pyplot as plt
+
         if fig is None:
             fig = plt.figure()
         gs = fig.add_gridspec(3, hspace=0, height_ratios=[2, 2, 1])
@@ -2237,6 +4483,8 @@ class Segment(Element):
 
     def plot_twiss(self, beam: Beam, ax: Optional[Any] = None) -> None:
         """Plot twiss parameters along the segment."""
+        import matplotlib.pyplot as plt
+
         longitudinal_beams = [beam]
         s_positions = [0.0]
         for element in self.elements:
@@ -2271,6 +4519,8 @@ class Segment(Element):
 
     def plot_twiss_over_lattice(self, beam: Beam, figsize=(8, 4)) -> None:
         """Plot twiss parameters in a plot over a plot of the lattice."""
+        import matplotlib.pyplot as plt
+
         fig = plt.figure(figsize=figsize)
         gs = fig.add_gridspec(2, hspace=0, height_ratios=[3, 1])
         axs = gs.subplots(sharex=True)
@@ -2285,3 +4535,597 @@ class Segment(Element):
             f"{self.__class__.__name__}(elements={repr(self.elements)}, "
             + f"name={repr(self.name)})"
         )
+
+
+def _particle_chunks(
+    particles: torch.Tensor,
+    particle_charges: torch.Tensor,
+    chunk_size: int,
+    device: torch.device,
+    pin_memory: bool,
+    survival_probabilities: Optional[torch.Tensor] = None,
+):
+    """
+    Generate chunks of at most `chunk_size` particles, their charges and their survival
+    probabilities (`None` if not given) on `device`. When copying to CUDA from pinned
+    memory, the next chunk is copied on a separate stream while the current one is
+    being processed.
+    """
+    num_particles = particles.shape[-2]
+    starts = range(0, num_particles, chunk_size)
+
+    def host_chunk(start: int) -> tuple[Optional[torch.Tensor], ...]:
+        return (
+            particles[..., start : start + chunk_size, :],
+            particle_charges[start : start + chunk_size],
+            (
+                survival_probabilities[..., start : start + chunk_size]
+                if survival_probabilities is not None
+                else None
+            ),
+        )
+
+    if not (pin_memory and device.type == "cuda"):
+        for start in starts:
+            yield tuple(
+                tensor.to(device) if tensor is not None else None
+                for tensor in host_chunk(start)
+            )
+        return
+
+    copy_stream = torch.cuda.Stream(device=device)
+
+    def prefetch(start: int):
+        with torch.cuda.stream(copy_stream):
+            chunk = tuple(
+                (
+                    tensor.pin_memory().to(device, non_blocking=True)
+                    if tensor is not None
+                    else None
+                )
+                for tensor in host_chunk(start)
+            )
+            copied = torch.cuda.Event()
+            copied.record(copy_stream)
+        return chunk, copied
+
+    next_chunk = prefetch(starts[0])
+    for i in range(len(starts)):
+        chunk, copied = next_chunk
+        torch.cuda.current_stream(device).wait_event(copied)
+        for tensor in chunk:
+            if tensor is not None:
+                # Tensors allocated on the copy stream are used on the current stream
+                tensor.record_stream(torch.cuda.current_stream(device))
+        if i + 1 < len(starts):
+            next_chunk = prefetch(starts[i + 1])
+        yield chunk
+
+
+class SegmentView(Segment):
+    """
+    Lightweight view of a sequence of elements of another segment, as returned by
+    `Segment.subcell`. It behaves like a `Segment` and shares its element objects with
+    the segment it was taken from, but does not register the names of all elements on
+    creation. Instead, elements are looked up by name lazily, on first access.
+
+    :param elements: Elements of the view.
+    :param name: Unique identifier of the element.
+    """
+
+    def __init__(self, elements: list[Element], name: str = "unnamed") -> None:
+        Element.__init__(self, name=name)
+
+        self.elements = _module_list(elements)
+        self._name_index = None
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            # Private attributes are never element names. Checking for them also avoids
+            # infinite recursion while the view is not fully initialised, e.g. when
+            # unpickling.
+            if name.startswith("_") or "_modules" not in self.__dict__:
+                raise
+
+            if self.__dict__.get("_name_index") is None:
+                self._build_name_index()
+            indices = self._name_index.get(name)
+            if indices is None:
+                raise
+
+            return (
+                self.elements[indices[0]]
+                if len(indices) == 1
+                else [self.elements[index] for index in indices]
+            )
+
+    def _first_index(self, name: str) -> Optional[int]:
+        if self._name_index is None:
+            self._build_name_index()
+        return super()._first_index(name)
+
+
+class TrackingPlan:
+    """
+    Precompiled schedule for tracking through a `Segment`, created by
+    `Segment.compile`. Calling the plan with an incoming beam gives the same result as
+    `Segment.track`.
+
+    Consecutive skippable elements are fused into a single `CustomTransferMap`. A
+    fused transfer map is reused as long as none of the tensors of its elements and
+    the energy of the incoming beam have changed, so that after changing a few
+    elements only the groups containing them are fused again. If the skippability of
+    any element changes, e.g. because a screen was activated, the elements are
+    regrouped.
+
+    In in-place mode, which runs without autograd, fused groups write the particles
+    of a `ParticleBeam` into one of two preallocated workspace buffers in turn, and
+    update a single beam object instead of constructing a new one. This avoids
+    allocations and `nn.Module` construction when tracking large beams. The returned
+    beam then shares its particles with the workspace, which is overwritten by the
+    next call. Clone it if it needs to be kept.
+
+    In second-order mode, consecutive skippable elements are instead fused into a
+    single second-order map (see `Element.second_order_map`), truncated after the
+    second order, through which particle beams are tracked. Parameter beams are
+    tracked through its linear part. Non-skippable elements, like an active `Cavity`,
+    are tracked as usual.
+
+    :param segment: Segment to compile the plan for.
+    :param inplace: If `True`, track particle beams in place through preallocated
+        workspace buffers.
+    :param order: Order of the fused maps, either `1` or `2`.
+    """
+
+    def __init__(self, segment: Segment, inplace: bool = False, order: int = 1) -> None:
+        assert order in (1, 2), f"Order {order} is not supported."
+
+        self.segment = segment
+        self.elements = self._flatten(segment)
+        self.inplace = inplace
+        self.order = order
+
+        self._skippable = None
+        self._steps = []
+        self._workspace = []
+        self._workspace_beam = None
+
+    @property
+    def steps(self) -> list[Element]:
+        """
+        Sequence of elements executed by the plan, where fused groups are represented by
+        the `CustomTransferMap` they were last fused into (`None` if not fused yet).
+        """
+        return [
+            step.fused if isinstance(step, _FusedGroup) else step
+            for step in self._steps
+        ]
+
+    def __call__(self, incoming: Beam) -> Beam:
+        skippable = [element.is_skippable for element in self.elements]
+        if skippable != self._skippable:
+            self._regroup(skippable)
+
+        if self.inplace and type(incoming) is ParticleBeam:
+            with torch.no_grad():
+                return self._track_inplace(incoming)
+
+        for step in self._steps:
+            incoming = step.track(incoming)
+
+        return incoming
+
+    def _track_inplace(self, incoming: ParticleBeam) -> Beam:
+        """
+        Track a `ParticleBeam` through the plan, writing the results of fused groups
+        into alternating workspace buffers.
+        """
+        particles = incoming.particles
+        if not self._workspace or not all(
+            buffer.shape == particles.shape
+            and buffer.dtype == particles.dtype
+            and buffer.device == particles.device
+            for buffer in self._workspace
+        ):
+            self._workspace = [torch.empty_like(particles) for _ in range(2)]
+            self._workspace_beam = None
+
+        beam = incoming
+        for step in self._steps:
+            if beam is Beam.empty or not isinstance(step, _FusedGroup):
+                beam = step.track(beam)
+                continue
+
+            tm = step.fused_for(beam.energy)._transfer_map
+            # Write into the buffer that does not hold the current particles
+            out = (
+                self._workspace[1]
+                if beam.particles is self._workspace[0]
+                else self._workspace[0]
+            )
+            out_shape = (
+                torch.broadcast_shapes(beam.particles.shape[:-2], tm.shape[:-2])
+                + beam.particles.shape[-2:]
+            )
+            if type(beam) is not ParticleBeam or out_shape != out.shape:
+                # The layout or size has changed, e.g. by an aperture or batching
+                beam = step.track(beam)
+                continue
+            torch.matmul(beam.particles, tm.transpose(-2, -1), out=out)
+            if step.fused.second_order_tensor is not None:
+                out += second_order_terms(
+                    step.fused.second_order_tensor, beam.particles
+                )
+
+            if self._workspace_beam is None:
+                self._workspace_beam = ParticleBeam(
+                    out,
+                    beam.energy,
+                    particle_charges=beam.particle_charges,
+                    device=out.device,
+                    dtype=out.dtype,
+                )
+            workspace_beam = self._workspace_beam
+            workspace_beam.particles = out
+            workspace_beam.energy = beam.energy
+            workspace_beam.particle_charges = beam.particle_charges
+            workspace_beam.survival_probabilities = beam.survival_probabilities
+            beam = workspace_beam
+
+        return beam
+
+    def _regroup(self, skippable: list[bool]) -> None:
+        """Group runs of consecutive skippable elements into fused groups."""
+        steps = []
+        for element, is_skippable in zip(self.elements, skippable):
+            if not is_skippable:
+                steps.append(element)
+            elif steps and isinstance(steps[-1], _FusedGroup):
+                steps[-1].elements.append(element)
+            else:
+                steps.append(_FusedGroup([element], order=self.order))
+
+        self._skippable = skippable
+        self._steps = steps
+
+    @staticmethod
+    def _flatten(segment: Segment) -> list[Element]:
+        flattened_elements = []
+        for element in segment.elements:
+            if isinstance(element, Segment):
+                flattened_elements += TrackingPlan._flatten(element)
+            else:
+                flattened_elements.append(element)
+        return flattened_elements
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(segment={repr(self.segment.name)})"
+
+
+class _FusedGroup:
+    """
+    Run of consecutive skippable elements in a `TrackingPlan`, whose transfer maps are
+    fused into a single `CustomTransferMap` and re-fused only when necessary.
+
+    :param elements: Consecutive skippable elements.
+    :param order: Order of the fused map, either `1` or `2`.
+    """
+
+    def __init__(self, elements: list[Element], order: int = 1) -> None:
+        self.elements = elements
+        self.order = order
+        self.fused = None
+        self._key = None
+        self._key_tensors = None
+
+    def track(self, incoming: Beam) -> Beam:
+        if incoming is Beam.empty:
+            return incoming
+
+        return self.fused_for(incoming.energy).track(incoming)
+
+    def fused_for(self, energy: torch.Tensor) -> CustomTransferMap:
+        """
+        Fused element of the group for the given energy. It is only re-fused if one of
+        the group's elements or the energy has changed since the last call.
+        """
+        tensors = [
+            tensor
+            for element in self.elements
+            for tensor in element._transfer_map_cache_tensors()
+        ]
+        settings = tuple(element._transfer_map_settings() for element in self.elements)
+        key = tensors_cache_key(tensors) + settings + _energy_cache_key(energy)
+
+        # A fused transfer map carrying an autograd graph cannot be backpropagated
+        # through twice, so it is only reused when no gradients are needed
+        requires_grad = needs_grad(tensors + [energy])
+        if requires_grad or key != self._key:
+            self.fused = self._fuse(energy)
+            self._key = key if not requires_grad else None
+            # Keeps the identities in the key valid
+            self._key_tensors = tensors + [energy]
+
+        return self.fused
+
+    def transfer_map(self, energy: torch.Tensor) -> torch.Tensor:
+        """Product of the transfer maps of all elements in the group."""
+        tm = self.elements[0].transfer_map(energy)
+        for element in self.elements[1:]:
+            tm = torch.matmul(element.transfer_map(energy), tm)
+        return tm
+
+    def _fuse(self, energy: torch.Tensor) -> CustomTransferMap:
+        combined_length = sum(
+            element.length for element in self.elements if hasattr(element, "length")
+        )
+
+        if self.order == 2:
+            tm, ttensor = concatenate_second_order_maps(
+                [element.second_order_map(energy) for element in self.elements]
+            )
+            return CustomTransferMap(
+                tm,
+                length=combined_length,
+                second_order_tensor=ttensor,
+                device=tm.device,
+                dtype=tm.dtype,
+            )
+
+        tm = self.transfer_map(energy)
+        return CustomTransferMap(
+            tm, length=combined_length, device=tm.device, dtype=tm.dtype
+        )
+
+
+class CapturedTracking:
+    """
+    Tracking through a `Segment` captured for a fixed lattice topology, created by
+    `Segment.capture`. Calling it with an incoming beam gives the same result as
+    `Segment.track`, but without any Python overhead on CUDA, where the tracking is
+    replayed from a CUDA graph, and with a single compiled graph on other devices.
+
+    The grouping of skippable elements is fixed at capture time, so elements must not
+    change their skippability afterwards (e.g. by activating a screen or switching a
+    cavity on or off). Element parameters may be changed freely, either in place or by
+    assigning a new tensor of the same shape. In the latter case the new value is
+    copied into the tensor that was captured, which is then assigned back to the
+    element.
+
+    NOTE: Captured tracking is intended for inference and runs without autograd. The
+    outgoing beam returned on CUDA is a static buffer, that is overwritten by the next
+    call. Clone it if it needs to be kept. Apertures that remove lost particles are not
+    supported, because the number of surviving particles is not known in advance. Use
+    apertures with `loss_model="mask"` instead.
+
+    :param segment: Segment to capture tracking through.
+    :param incoming: Example beam. Beams passed to the captured tracking later must
+        have the same type, shapes, dtype and device.
+    :param backend: Backend passed to `torch.compile` when not running on CUDA.
+    """
+
+    def __init__(
+        self, segment: Segment, incoming: Beam, backend: str = "inductor"
+    ) -> None:
+        self.plan = TrackingPlan(segment)
+
+        if any(
+            isinstance(element, Aperture)
+            and element.is_active
+            and element.loss_model == "remove"
+            for element in self.plan.elements
+        ):
+            raise NotImplementedError(
+                "Capturing active apertures is only supported with "
+                '`loss_model="mask"`.'
+            )
+
+        self.plan._regroup([element.is_skippable for element in self.plan.elements])
+        self._captured_tensors = [
+            (element, name, value)
+            for element in self.plan.elements
+            for name, value in element.__dict__.items()
+            if isinstance(value, torch.Tensor)
+        ]
+
+        self._graph = None
+        self._compiled = None
+        self._static_incoming = None
+        self._static_outgoing = None
+
+        if incoming.energy.device.type == "cuda":
+            self._capture_cuda_graph(incoming)
+        else:
+            self._compiled = torch.compile(self._track, fullgraph=True, backend=backend)
+
+    def __call__(self, incoming: Beam) -> Beam:
+        self._sync_parameters()
+
+        with torch.no_grad():
+            if self._graph is not None:
+                self._copy_beam(incoming, self._static_incoming)
+                self._graph.replay()
+                return self._static_outgoing
+            else:
+                return self._compiled(incoming)
+
+    def _track(self, incoming: Beam) -> Beam:
+        """Straight-line tracking through the plan's steps without any caching."""
+        for step in self.plan._steps:
+            if isinstance(step, _FusedGroup) and incoming is not Beam.empty:
+                incoming = Element._apply_transfer_map(
+                    step.transfer_map(incoming.energy), incoming
+                )
+            elif not isinstance(step, _FusedGroup):
+                incoming = step.track(incoming)
+        return incoming
+
+    def _sync_parameters(self) -> None:
+        """
+        Copy the values of tensors that were reassigned on an element since capture into
+        the captured tensors and restore those on the element.
+        """
+        for element, name, captured in self._captured_tensors:
+            current = element.__dict__[name]
+            if current is not captured:
+                with torch.no_grad():
+                    captured.copy_(current)
+                element.__dict__[name] = captured
+
+    def _capture_cuda_graph(self, incoming: Beam) -> None:
+        self._static_incoming = deepcopy(incoming)
+
+        with torch.no_grad():
+            # Warm up on a side stream as required for CUDA graph capture
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    self._track(self._static_incoming)
+            torch.cuda.current_stream().wait_stream(stream)
+
+            self._graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self._graph):
+                self._static_outgoing = self._track(self._static_incoming)
+
+    @staticmethod
+    def _copy_beam(source: Beam, destination: Beam) -> None:
+        """Copy the tensors of `source` into the tensors of `destination` in place."""
+        for name, value in destination.__dict__.items():
+            if isinstance(value, torch.Tensor):
+                value.copy_(getattr(source, name))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(segment={repr(self.plan.segment.name)})"
+
+
+class CheckpointedTracking:
+    """
+    Incremental tracking through a `Segment`, created by `Segment.checkpointed`. Calling
+    it with an incoming beam gives the same result as `Segment.track`.
+
+    The beam entering every `stride`-th element is cached as a checkpoint. On each call,
+    the first element whose defining features have changed since the previous call is
+    detected, and tracking resumes from the nearest checkpoint upstream of it. If the
+    incoming beam is a different beam or has been modified, the whole segment is
+    tracked again. Elements upstream of the resumed checkpoint are not tracked, so
+    their readings are the ones from the call in which they were last tracked.
+
+    NOTE: Checkpoints are only kept when no gradients need to be computed, since a
+    cached beam carrying an autograd graph cannot be backpropagated through twice.
+    Elements added to or removed from the segment afterwards are not picked up.
+
+    :param segment: Segment to track through.
+    :param stride: Number of elements between checkpoints.
+    """
+
+    def __init__(self, segment: Segment, stride: int = 1) -> None:
+        assert stride >= 1, "The stride between checkpoints must be at least 1."
+
+        self.segment = segment
+        self.elements = TrackingPlan._flatten(segment)
+        self.stride = stride
+
+        self.resumed_from = 0
+        self._reset()
+
+    def __call__(self, incoming: Beam) -> Beam:
+        incoming_tensors = (
+            module_tensors(incoming) if isinstance(incoming, nn.Module) else []
+        )
+        incoming_key = (id(incoming), tensors_cache_key(incoming_tensors))
+        element_keys = [self._features_key(element) for element in self.elements]
+
+        element_tensors = [
+            tensor
+            for element in self.elements
+            for tensor in element._transfer_map_cache_tensors()
+        ]
+        if needs_grad(incoming_tensors + element_tensors):
+            self._reset()
+            self.resumed_from = 0
+            return self._track_from(0, incoming, store=False)
+
+        if incoming_key != self._incoming_key:
+            first_changed = 0
+        else:
+            first_changed = next(
+                (
+                    i
+                    for i, (key, previous_key) in enumerate(
+                        zip(element_keys, self._element_keys)
+                    )
+                    if key != previous_key
+                ),
+                len(self.elements),
+            )
+
+        self._incoming_key = incoming_key
+        self._element_keys = element_keys
+        # Keeps the identities in the keys valid
+        self._key_tensors = incoming_tensors + element_tensors
+
+        if first_changed == 0:
+            self._checkpoints = {0: incoming}
+        if first_changed == len(self.elements) and self._outgoing is not None:
+            self.resumed_from = len(self.elements)
+            return self._outgoing
+
+        start = max(index for index in self._checkpoints if index <= first_changed)
+        self._checkpoints = {
+            index: beam for index, beam in self._checkpoints.items() if index <= start
+        }
+        self.resumed_from = start
+        self._outgoing = self._track_from(start, self._checkpoints[start], store=True)
+
+        return self._outgoing
+
+    def _track_from(self, start: int, incoming: Beam, store: bool) -> Beam:
+        """
+        Track `incoming` from the element at index `start` to the end of the segment,
+        optionally storing checkpoints along the way.
+        """
+        for index in range(start, len(self.elements)):
+            incoming = self.elements[index].track(incoming)
+            if store and (index + 1) % self.stride == 0:
+                self._checkpoints[index + 1] = incoming
+        return incoming
+
+    def _reset(self) -> None:
+        self._incoming_key = None
+        self._element_keys = []
+        self._key_tensors = []
+        self._checkpoints = {}
+        self._outgoing = None
+
+    @staticmethod
+    def _features_key(element: Element) -> tuple:
+        """
+        Key that changes when any of the defining features of `element` is replaced or,
+        in the case of tensors and of modules attached to the element, like the
+        wakefield of a cavity, modified in place.
+        """
+
+        def value_key(value: Any) -> Any:
+            if isinstance(value, torch.Tensor):
+                return (id(value), value._version)
+            elif isinstance(value, nn.Module):
+                key = (id(value),) + tensors_cache_key(module_tensors(value))
+                if isinstance(value, Element):
+                    key += CheckpointedTracking._features_key(value)
+                return key
+            else:
+                return value
+
+        return (id(element),) + tuple(
+            value_key(getattr(element, feature))
+            for feature in element.defining_features
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(segment={repr(self.segment.name)}, "
+            + f"stride={repr(self.stride)})"
+        )
@@ -0,0 +1,9 @@
+# Physical constants (CODATA 2022) used by Cheetah. They are defined here instead of
+# being imported from `scipy.constants`, because importing SciPy takes a considerable
+# fraction of the time it takes to import Cheetah.
+
+speed_of_light = 299792458.0  # m/s
+elementary_charge = 1.602176634e-19  # C
+electron_mass = 9.1093837139e-31  # kg
+epsilon_0 = 8.8541878188e-12  # F/m
+electron_mass_eV = 0.51099895069e6  # eV
@@ -1,2 +1,15 @@
-# flake8: noqa
-from cheetah.converters import astralavista, dontbmad, nocelot, nxtables
+import importlib
+
+# Converters are only imported when they are first used, because some of them import
+# heavy dependencies like SciPy
+_CONVERTERS = ["astralavista", "dontbmad", "nocelot", "nxtables", "openpmd"]
+
+
+def __getattr__(name: str):
+    if name in _CONVERTERS:
+        return importlib.import_module(f"cheetah.converters.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + _CONVERTERS)
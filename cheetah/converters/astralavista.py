@@ -1,11 +1,178 @@
+import os
+import warnings
+import zipfile
+from typing import Iterator, Optional
+
 import numpy as np
-from scipy.constants import physical_constants
+
+from cheetah import constants
 
 # Electron mass in eV
-electron_mass_eV = physical_constants["electron mass energy equivalent in MeV"][0] * 1e6
+electron_mass_eV = constants.electron_mass_eV
+
+# Version of the binary cache format. Caches of other versions are ignored.
+CACHE_VERSION = 1
+
+
+def convert_astra_particles(
+    rows: np.ndarray, reference_momentum: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert particles of an ASTRA beam distribution to Cheetah's phase space
+    coordinates.
+
+    :param rows: Rows of an ASTRA beam distribution, with positions and momenta given
+        relative to the reference particle.
+    :param reference_momentum: Longitudinal momentum of the reference particle in eV/c.
+    :return: (particles, q_array)
+        Particle 6D phase space information and the charge array of the particles.
+    """
+    reference_gamma = np.sqrt((reference_momentum / electron_mass_eV) ** 2 + 1)
+    reference_beta = np.sqrt(1 - reference_gamma**-2)
+
+    px = rows[:, 3]
+    py = rows[:, 4]
+    pz = rows[:, 5] + reference_momentum
+    momentum = np.sqrt(px**2 + py**2 + pz**2)
+    gamma = np.sqrt(1 + (momentum / electron_mass_eV) ** 2)
+    beta = np.sqrt(1 - gamma**-2)
+
+    # Particles are drifted to the longitudinal position of the reference particle
+    particles = np.empty((rows.shape[0], 6))
+    particles[:, 0] = rows[:, 0] - rows[:, 2] * px / pz
+    particles[:, 1] = px / reference_momentum
+    particles[:, 2] = rows[:, 1] - rows[:, 2] * py / pz
+    particles[:, 3] = py / reference_momentum
+    particles[:, 4] = -rows[:, 2] * momentum / (beta * pz)
+    particles[:, 5] = (gamma / reference_gamma - 1) / reference_beta
+
+    q_array = np.abs(rows[:, 7]) * 1e-9  # convert charge array from nC to C
+
+    return particles, q_array
+
+
+def cache_path(path: str) -> str:
+    """Path of the binary cache of an ASTRA beam distribution file."""
+    return f"{path}.cheetah.npz"
+
+
+def load_cache(path: str) -> Optional[tuple[np.ndarray, float, np.ndarray]]:
+    """
+    Load an ASTRA beam distribution from its binary cache, if the cache was written
+    for the current version of the file, as identified by its modification time and
+    size.
+
+    :param path: Path to the ASTRA beam distribution file.
+    :return: (particles, energy, q_array) or `None` if there is no valid cache.
+    """
+    try:
+        with np.load(cache_path(path)) as cached:
+            stat = os.stat(path)
+            if (
+                cached["version"] != CACHE_VERSION
+                or cached["source_mtime_ns"] != stat.st_mtime_ns
+                or cached["source_size"] != stat.st_size
+            ):
+                return None
+            return (
+                cached["particles"],
+                float(cached["energy"]),
+                cached["q_array"],
+            )
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def save_cache(
+    path: str, particles: np.ndarray, energy: float, q_array: np.ndarray
+) -> None:
+    """
+    Save an ASTRA beam distribution to its binary cache.
 
+    :param path: Path to the ASTRA beam distribution file.
+    :param particles: Particle 6D phase space information.
+    :param energy: Mean energy of the particle beam.
+    :param q_array: Charge array of the particle beam.
+    """
+    stat = os.stat(path)
+    # Write to a temporary file first, so that concurrent readers never see a
+    # partially written cache
+    temporary_path = f"{cache_path(path)}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        np.savez(
+            f,
+            version=CACHE_VERSION,
+            source_mtime_ns=stat.st_mtime_ns,
+            source_size=stat.st_size,
+            particles=particles,
+            energy=energy,
+            q_array=q_array,
+        )
+    os.replace(temporary_path, cache_path(path))
+
+
+def iter_astrabeam(
+    path: str, chunk_size: int = 2**17, cache: bool = False
+) -> Iterator[tuple[np.ndarray, float, np.ndarray]]:
+    """
+    Read an ASTRA beam distribution in chunks of particles, and prepare each chunk for
+    conversion to a Cheetah ParticleBeam. Only one chunk of the file is held in memory
+    at a time.
 
-def from_astrabeam(path: str) -> tuple[np.ndarray, float, np.ndarray]:
+    :param path: Path to the ASTRA beam distribution file.
+    :param chunk_size: Maximum number of particles per chunk. Chunks may hold fewer
+        particles, as lost particles are removed.
+    :param cache: If `True` and a valid binary cache of the file exists, the chunks
+        are read from the cache instead of the file.
+    :return: Iterator of (particles, energy, q_array) of each chunk.
+    """
+    cached = load_cache(path) if cache else None
+    if cached is not None:
+        particles, energy, q_array = cached
+        for start in range(0, particles.shape[0], chunk_size):
+            yield (
+                particles[start : start + chunk_size],
+                energy,
+                q_array[start : start + chunk_size],
+            )
+        return
+
+    reference_momentum = None
+    with open(path, "rb") as f:
+        while f.peek(1):
+            # Blank lines at the end of the file are skipped with a warning, and are
+            # all that is left after the last chunk if the number of particles is a
+            # multiple of the chunk size
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                rows = np.loadtxt(f, max_rows=chunk_size, ndmin=2)
+            if rows.size == 0:
+                break
+
+            # remove lost particles
+            rows = rows[rows[:, 9] > 0]
+            if rows.shape[0] == 0:
+                continue
+
+            # The first particle is the reference particle, whose longitudinal position
+            # and momentum are absolute instead of relative to itself
+            if reference_momentum is None:
+                reference_momentum = rows[0, 5]
+                rows[0, 2] = 0.0
+                rows[0, 5] = 0.0
+                reference_gamma = np.sqrt(
+                    (reference_momentum / electron_mass_eV) ** 2 + 1
+                )
+                # energy in eV: E = gamma * m_e
+                energy = reference_gamma * electron_mass_eV
+
+            particles, q_array = convert_astra_particles(rows, reference_momentum)
+            yield particles, energy, q_array
+
+
+def from_astrabeam(
+    path: str, cache: bool = False
+) -> tuple[np.ndarray, float, np.ndarray]:
     """
     Read from a ASTRA beam distribution, and prepare for conversion to a Cheetah
     ParticleBeam or ParameterBeam.
@@ -14,49 +181,22 @@ def from_astrabeam(path: str) -> tuple[np.ndarray, float, np.ndarray]:
     https://github.com/ocelot-collab/ocelot/blob/master/ocelot/adaptors/astra2ocelot.py
 
     :param path: Path to the ASTRA beam distribution file.
+    :param cache: If `True`, the converted distribution is saved to a binary cache
+        next to the file, from which it is loaded as long as the file is unchanged.
     :return: (particles, energy, q_array)
         Particle 6D phase space information, mean energy,
         and the charge array of the particle beam.
     """
-    P0 = np.loadtxt(path)
-
-    # remove lost particles
-    inds = np.argwhere(P0[:, 9] > 0)
-    inds = inds.reshape(inds.shape[0])
-
-    P0 = P0[inds, :]
-    n_particles = P0.shape[0]
-
-    # s_ref = P0[0, 2]
-    Pref = P0[0, 5]
-
-    xp = P0[:, :6]
-    xp[0, 2] = 0.0
-    xp[0, 5] = 0.0
-
-    gamref = np.sqrt((Pref / electron_mass_eV) ** 2 + 1)
-    # energy in eV: E = gamma * m_e
-    energy = gamref * electron_mass_eV
-
-    n_particles = xp.shape[0]
-    particles = np.zeros((n_particles, 6))
-
-    u = np.c_[xp[:, 3], xp[:, 4], xp[:, 5] + Pref]
-    gamma = np.sqrt(1 + np.sum(u * u, 1) / electron_mass_eV**2)
-    beta = np.sqrt(1 - gamma**-2)
-    betaref = np.sqrt(1 - gamref**-2)
-
-    p0 = np.linalg.norm(u, 2, 1).reshape((n_particles, 1))
+    cached = load_cache(path) if cache else None
+    if cached is not None:
+        return cached
 
-    u = u / p0
-    cdt = -xp[:, 2] / (beta * u[:, 2])
-    particles[:, 0] = xp[:, 0] + beta * u[:, 0] * cdt
-    particles[:, 2] = xp[:, 1] + beta * u[:, 1] * cdt
-    particles[:, 4] = cdt
-    particles[:, 1] = xp[:, 3] / Pref
-    particles[:, 3] = xp[:, 4] / Pref
-    particles[:, 5] = (gamma / gamref - 1) / betaref
+    chunks = list(iter_astrabeam(path))
+    particles = np.concatenate([chunk[0] for chunk in chunks])
+    energy = chunks[0][1]
+    q_array = np.concatenate([chunk[2] for chunk in chunks])
 
-    q_array = abs(P0[:, 7]) * 1e-9  # convert charge array from nC to C
+    if cache:
+        save_cache(path, particles, energy, q_array)
 
     return particles, energy, q_array
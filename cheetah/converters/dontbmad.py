@@ -1,7 +1,10 @@
+import hashlib
 import math
 import os
+import pickle
 import re
 from copy import deepcopy
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Optional
 
@@ -12,23 +15,79 @@ from scipy.constants import physical_constants
 
 import cheetah
 
+# Version of the parsed context format. Parse caches of other versions are ignored.
+PARSE_CACHE_VERSION = 1
+
+_BRACKETED_PROPERTY_PATTERN = re.compile(r"\[([a-z0-9_%]+)\]")
+_PROPERTY_ASSIGNMENT_PATTERN = re.compile(r"([a-z0-9_\*:]+)\[([a-z0-9_%]+)\]\s*=(.*)")
+_VARIABLE_ASSIGNMENT_PATTERN = re.compile(r"([a-z0-9_]+)\s*=(.*)")
+_ELEMENT_DEFINITION_PATTERN = re.compile(r"([a-z0-9_]+)\s*\:\s*([a-z0-9_]+)(\,(.*))?")
+_ELEMENT_PROPERTY_PATTERN = re.compile(
+    r"([a-z0-9_]+\s*\=\s*\"[^\"]+\"|[a-z0-9_]+\s*\=\s*[^\=\,\"]+)"
+)
+_LINE_DEFINITION_PATTERN = re.compile(r"([a-z0-9_]+)\s*\:\s*line\s*=\s*\((.*)\)")
+_KNOT_BASED_OVERLAY_PATTERN = re.compile(
+    r"([a-z0-9_]+)\s*\:\s*overlay\s*=\s*\{(.*)\}\s*\,\s*var\s*=\s*\{\s*([a-z0-9_]+)\s*\}\s*\,\s*x_knot\s*=\s*\{(.*)\}"  # noqa: E501
+)
+_EXPRESSION_BASED_OVERLAY_PATTERN = re.compile(
+    r"([a-z0-9_]+)\s*\:\s*overlay\s*=\s*\{(.*)\}\s*\,\s*var\s*=\s*\{(.*)\}\s*(\,.*)*"  # noqa: E501
+)
+_USE_LINE_PATTERN = re.compile(r"use\s*\,\s*([a-z0-9_]+)")
+
+# Classifies a statement by the first of these alternatives that matches it in full
+_STATEMENT_PATTERN = re.compile(
+    r"(?P<property_assignment>[a-z0-9_\*:]+\[[a-z0-9_%]+\]\s*=.*)"
+    r"|(?P<variable_assignment>[a-z0-9_]+\s*=.*)"
+    r"|(?P<line_definition>[a-z0-9_]+\s*\:\s*line\s*=\s*\(.*\))"
+    r"|(?P<overlay_definition>[a-z0-9_]+\s*\:\s*overlay\s*=\s*\{.*)"
+    r"|(?P<element_definition>[a-z0-9_]+\s*\:\s*[a-z0-9_]+.*)"
+    r"|(?P<use_line>use\s*\,\s*[a-z0-9_]+)"
+)
+
+
+def resolve_environment_variables(
+    path: Path, dependencies: Optional[dict] = None
+) -> Path:
+    """
+    Replace all parts of a path starting with `$` by the value of the environment
+    variable of that name.
 
-def read_clean_lines(lattice_file_path: Path) -> list[str]:
+    :param path: Path to resolve.
+    :param dependencies: Optional dictionary, to which the values of the used
+        environment variables are added with their `$`-prefixed names as keys.
+    :return: Path with all environment variables replaced.
+    """
+    resolved_parts = []
+    for part in path.parts:
+        if part.startswith("$"):
+            resolved_parts.append(os.environ[part[1:]])
+            if dependencies is not None:
+                dependencies[part] = os.environ[part[1:]]
+        else:
+            resolved_parts.append(part)
+    return Path(*resolved_parts)
+
+
+def read_clean_lines(
+    lattice_file_path: Path, dependencies: Optional[dict] = None
+) -> list[str]:
     """
     Recursevely read lines from Bmad lattice files, removing comments and empty lines,
     and replacing lines calling external files with the lines of the external file.
 
     :param lattice_file_path: Path to the root Bmad lattice file.
+    :param dependencies: Optional dictionary, to which the SHA-256 hashes of the
+        contents of all read lattice files are added with their paths as keys, as well
+        as the values of all environment variables used to resolve their paths.
     :return: List of lines from the root Bmad lattice file and all external files.
     """
-    with open(lattice_file_path) as f:
-        lines = f.readlines()
+    with open(lattice_file_path, "rb") as f:
+        content = f.read()
+    if dependencies is not None:
+        dependencies[str(lattice_file_path)] = hashlib.sha256(content).hexdigest()
 
-    # Remove comments and empty lines
-    lines = [line.strip() for line in lines]
-    # Remove comments (i.e. all characters after a '!')
-    lines = [re.sub(r"!.*", "", line) for line in lines]
-    # Remove empty lines
+    # Remove comments (i.e. all characters after a '!') and empty lines
+    lines = [line.partition("!")[0].strip() for line in content.decode().splitlines()]
     lines = [line for line in lines if line]
 
     # Replace lines calling external files with the lines of the external file
@@ -36,29 +95,23 @@ def read_clean_lines(lattice_file_path: Path) -> list[str]:
     for line in lines:
         if line.startswith("call, file ="):
             external_file_path = Path(line.split("=")[1].strip())
-            resolved_external_file_path = Path(
-                *[
-                    os.environ[part[1:]] if part.startswith("$") else part
-                    for part in external_file_path.parts
-                ]
+            resolved_external_file_path = resolve_environment_variables(
+                external_file_path, dependencies
             )
             if not resolved_external_file_path.is_absolute():
                 resolved_external_file_path = (
                     lattice_file_path.parent / resolved_external_file_path
                 )
-            external_file_lines = read_clean_lines(resolved_external_file_path)
+            external_file_lines = read_clean_lines(
+                resolved_external_file_path, dependencies
+            )
             replaced_lines += external_file_lines
         else:
             replaced_lines.append(line)
 
     # Make lines all lower case (done late because environment variables are case
-    # sensitive)
-    replaced_lines = [line.lower() for line in replaced_lines]
-
-    # Finally remove spaces again, because some may now have appeared
-    replaced_lines = [line.strip() for line in replaced_lines]
-
-    return replaced_lines
+    # sensitive) and remove spaces again, because some may now have appeared
+    return [line.lower().strip() for line in replaced_lines]
 
 
 def merge_delimiter_continued_lines(
@@ -72,75 +125,84 @@ def merge_delimiter_continued_lines(
     :param remove_delimitter: Whether to remove the delimitter from the merged line.
     :return: List of lines with ampersand-continued lines merged.
     """
-    merged_lines = deepcopy(lines)
-    for i in range(len(merged_lines) - 1):
-        if merged_lines[i] is not None and merged_lines[i].endswith(delimiter):
-            num_added_lines = 1
-            while merged_lines[i].endswith(delimiter):
-                if remove_delimiter:
-                    merged_lines[i] = (
-                        merged_lines[i][:-1] + merged_lines[i + num_added_lines]
-                    )
-                else:
-                    merged_lines[i] = (
-                        merged_lines[i] + merged_lines[i + num_added_lines]
-                    )
-                merged_lines[i + num_added_lines] = None
-                num_added_lines += 1
-
-    # Prune None lines
-    merged_lines = [line for line in merged_lines if line is not None]
+    merged_lines = []
+    is_continued = False
+    for line in lines:
+        if is_continued:
+            previous_line = merged_lines[-1]
+            if remove_delimiter:
+                previous_line = previous_line[:-1]
+            merged_lines[-1] = previous_line + line
+        else:
+            merged_lines.append(line)
+        is_continued = merged_lines[-1].endswith(delimiter)
 
     # Remove spaces again, because some may now have appeared
-    merged_lines = [line.strip() for line in merged_lines]
-
-    return merged_lines
+    return [line.strip() for line in merged_lines]
 
 
-def evaluate_expression(expression: str, context: dict) -> Any:
+@lru_cache(maxsize=None)
+def compile_expression(expression: str) -> tuple[bool, Any]:
     """
-    Evaluate an expression in the context of a dictionary of variables.
+    Compile an expression once, so that it can be evaluated repeatedly in different
+    contexts without being parsed again.
 
-    :param expression: Expression to evaluate.
-    :param context: Dictionary of variables to evaluate the expression in the context
-        of.
-    :return: Result of evaluating the expression.
+    :param expression: Expression to compile.
+    :return: Tuple of whether the expression is a literal and either the value of the
+        literal or the code object of the expression. The code object is `None` if the
+        expression is not a valid mathematical expression.
     """
-
     # Try reading the expression as an integer
     try:
-        return int(expression)
+        return True, int(expression)
     except ValueError:
         pass
 
     # Try reading the expression as a float
     try:
-        return float(expression)
+        return True, float(expression)
     except ValueError:
         pass
 
     # Check against allowed keywords
     if expression in ["open", "electron", "t", "f", "traveling_wave", "full"]:
-        return expression
+        return True, expression
 
-    # Check against previously defined variables
-    if expression in context:
-        return context[expression]
-
-    # Evaluate as a mathematical expression
+    # Compile as a mathematical expression
     try:
         # Surround expressions in bracks with quotes
-        expression = re.sub(r"\[([a-z0-9_%]+)\]", r"['\1']", expression)
+        python_expression = _BRACKETED_PROPERTY_PATTERN.sub(r"['\1']", expression)
         # Replace power operator with python equivalent
-        expression = re.sub(r"\^", r"**", expression)
+        python_expression = python_expression.replace("^", "**")
         # Replace abs with abs_func when it is followed by a (
         # NOTE: This is a hacky fix to deal with abs being overwritten in the LCLS
         # lattice file. I'm not sure this replacement will lead to the intended
         # behaviour.
-        expression = re.sub(r"abs\(", r"abs_func(", expression)
+        python_expression = python_expression.replace("abs(", "abs_func(")
 
-        return eval(expression, context)
+        return False, compile(python_expression, "<bmad>", "eval")
     except SyntaxError:
+        return False, None
+
+
+def evaluate_expression(expression: str, context: dict) -> Any:
+    """
+    Evaluate an expression in the context of a dictionary of variables.
+
+    :param expression: Expression to evaluate.
+    :param context: Dictionary of variables to evaluate the expression in the context
+        of.
+    :return: Result of evaluating the expression.
+    """
+    is_literal, compiled = compile_expression(expression)
+    if is_literal:
+        return compiled
+
+    # Check against previously defined variables
+    if expression in context:
+        return context[expression]
+
+    if compiled is None:
         if not (
             len(expression.split(":")) == 3 or len(expression.split(":")) == 4
         ):  # It's probably an alias
@@ -148,6 +210,9 @@ def evaluate_expression(expression: str, context: dict) -> Any:
                 f"DEBUG: Evaluating expression {expression}. Assuming it is a string."
             )
         return expression
+
+    try:
+        return eval(compiled, context)
     except Exception as e:
         print(expression)
         raise e
@@ -186,8 +251,7 @@ def assign_property(line: str, context: dict) -> dict:
         read variables.
     :return: Updated context.
     """
-    pattern = r"([a-z0-9_\*:]+)\[([a-z0-9_%]+)\]\s*=(.*)"
-    match = re.fullmatch(pattern, line)
+    match = _PROPERTY_ASSIGNMENT_PATTERN.fullmatch(line)
 
     object_name = match.group(1).strip()
     property_name = match.group(2).strip()
@@ -217,8 +281,7 @@ def assign_variable(line: str, context: dict) -> dict:
         read variables.
     :return: Updated context.
     """
-    pattern = r"([a-z0-9_]+)\s*=(.*)"
-    match = re.fullmatch(pattern, line)
+    match = _VARIABLE_ASSIGNMENT_PATTERN.fullmatch(line)
 
     variable_name = match.group(1).strip()
     variable_expression = match.group(2).strip()
@@ -237,8 +300,7 @@ def define_element(line: str, context: dict) -> dict:
         read variables.
     :return: Updated context.
     """
-    pattern = r"([a-z0-9_]+)\s*\:\s*([a-z0-9_]+)(\,(.*))?"
-    match = re.fullmatch(pattern, line)
+    match = _ELEMENT_DEFINITION_PATTERN.fullmatch(line)
 
     element_name = match.group(1).strip()
     element_type = match.group(2).strip()
@@ -251,10 +313,7 @@ def define_element(line: str, context: dict) -> dict:
     if match.group(3) is not None:
         element_properties_string = match.group(4).strip()
 
-        property_pattern = (
-            r"([a-z0-9_]+\s*\=\s*\"[^\"]+\"|[a-z0-9_]+\s*\=\s*[^\=\,\"]+)"
-        )
-        property_matches = re.findall(property_pattern, element_properties_string)
+        property_matches = _ELEMENT_PROPERTY_PATTERN.findall(element_properties_string)
 
         for property_string in property_matches:
             property_string = property_string.strip()
@@ -281,8 +340,7 @@ def define_line(line: str, context: dict) -> dict:
         to read variables.
     :return: Updated context.
     """
-    pattern = r"([a-z0-9_]+)\s*\:\s*line\s*=\s*\((.*)\)"
-    match = re.fullmatch(pattern, line)
+    match = _LINE_DEFINITION_PATTERN.fullmatch(line)
 
     line_name = match.group(1).strip()
     line_elements_string = match.group(2).strip()
@@ -307,11 +365,8 @@ def define_overlay(line: str, context: dict) -> dict:
         read variables.
     :return: Updated context.
     """
-    knot_based_pattern = r"([a-z0-9_]+)\s*\:\s*overlay\s*=\s*\{(.*)\}\s*\,\s*var\s*=\s*\{\s*([a-z0-9_]+)\s*\}\s*\,\s*x_knot\s*=\s*\{(.*)\}"  # noqa: E501
-    expression_based_pattern = r"([a-z0-9_]+)\s*\:\s*overlay\s*=\s*\{(.*)\}\s*\,\s*var\s*=\s*\{(.*)\}\s*(\,.*)*"  # noqa: E501
-
-    expression_match = re.fullmatch(expression_based_pattern, line)
-    knot_match = re.fullmatch(knot_based_pattern, line)
+    expression_match = _EXPRESSION_BASED_OVERLAY_PATTERN.fullmatch(line)
+    knot_match = _KNOT_BASED_OVERLAY_PATTERN.fullmatch(line)
 
     if knot_match:
         overlay_name = knot_match.group(1).strip()
@@ -353,8 +408,7 @@ def parse_use_line(line: str, context: dict) -> dict:
         read variables.
     :return: Updated context.
     """
-    pattern = r"use\s*\,\s*([a-z0-9_]+)"
-    match = re.fullmatch(pattern, line)
+    match = _USE_LINE_PATTERN.fullmatch(line)
 
     use_line_name = match.group(1).strip()
     context["__use__"] = use_line_name
@@ -362,22 +416,13 @@ def parse_use_line(line: str, context: dict) -> dict:
     return context
 
 
-def parse_lines(lines: str) -> dict:
+def default_context() -> dict:
     """
-    Parse a list of lines from a Bmad lattice file. They should be cleaned and merged
-    before being passed to this function.
+    Create the context of constants and functions available in every Bmad lattice file.
 
-    :param lines: List of lines to parse.
-    :return: Dictionary of variables defined in the lattice file.
+    :return: Dictionary of predefined variables.
     """
-    property_assignment_pattern = r"[a-z0-9_\*:]+\[[a-z0-9_%]+\]\s*=.*"
-    variable_assignment_pattern = r"[a-z0-9_]+\s*=.*"
-    element_definition_pattern = r"[a-z0-9_]+\s*\:\s*[a-z0-9_]+.*"
-    line_definition_pattern = r"[a-z0-9_]+\s*\:\s*line\s*=\s*\(.*\)"
-    overlay_definition_pattern = r"[a-z0-9_]+\s*\:\s*overlay\s*=\s*\{.*"
-    use_line_pattern = r"use\s*\,\s*[a-z0-9_]+"
-
-    context = {
+    return {
         "pi": scipy.constants.pi,
         "twopi": 2 * scipy.constants.pi,
         "c_light": scipy.constants.c,
@@ -393,23 +438,131 @@ def parse_lines(lines: str) -> dict:
         "raddeg": scipy.constants.degree,
     }
 
+
+def parse_lines(lines: str) -> dict:
+    """
+    Parse a list of lines from a Bmad lattice file. They should be cleaned and merged
+    before being passed to this function.
+
+    :param lines: List of lines to parse.
+    :return: Dictionary of variables defined in the lattice file.
+    """
+    statement_parsers = {
+        "property_assignment": assign_property,
+        "variable_assignment": assign_variable,
+        "line_definition": define_line,
+        "overlay_definition": define_overlay,
+        "element_definition": define_element,
+        "use_line": parse_use_line,
+    }
+
+    context = default_context()
+
     for line in lines:
-        if re.fullmatch(property_assignment_pattern, line):
-            context = assign_property(line, context)
-        elif re.fullmatch(variable_assignment_pattern, line):
-            context = assign_variable(line, context)
-        elif re.fullmatch(line_definition_pattern, line):
-            context = define_line(line, context)
-        elif re.fullmatch(overlay_definition_pattern, line):
-            context = define_overlay(line, context)
-        elif re.fullmatch(element_definition_pattern, line):
-            context = define_element(line, context)
-        elif re.fullmatch(use_line_pattern, line):
-            context = parse_use_line(line, context)
+        match = _STATEMENT_PATTERN.fullmatch(line)
+        if match is not None:
+            context = statement_parsers[match.lastgroup](line, context)
 
     return context
 
 
+def parse_cache_path(lattice_file_path: Path, cache_dir: Path) -> Path:
+    """
+    Path of the file in which the parsed context of a Bmad lattice file is cached.
+
+    :param lattice_file_path: Path to the root Bmad lattice file.
+    :param cache_dir: Directory holding the parse caches.
+    :return: Path of the parse cache file of the lattice file.
+    """
+    key = hashlib.sha256(str(lattice_file_path.resolve()).encode()).hexdigest()
+    return cache_dir / f"{key}.pkl"
+
+
+def dependencies_unchanged(dependencies: dict) -> bool:
+    """
+    Check whether the files and environment variables a lattice was parsed from are
+    still the same.
+
+    :param dependencies: Dictionary of content hashes of lattice files and values of
+        environment variables, as collected by `read_clean_lines`.
+    :return: `True` if all files still have the same contents and all environment
+        variables still have the same values, `False` otherwise.
+    """
+    for key, value in dependencies.items():
+        if key.startswith("$"):
+            if os.environ.get(key[1:]) != value:
+                return False
+        else:
+            try:
+                with open(key, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() != value:
+                        return False
+            except OSError:
+                return False
+    return True
+
+
+def load_cached_context(lattice_file_path: Path, cache_dir: Path) -> Optional[dict]:
+    """
+    Load the parsed context of a Bmad lattice file from the parse cache, if the lattice
+    file and all files it calls are unchanged since it was cached.
+
+    :param lattice_file_path: Path to the root Bmad lattice file.
+    :param cache_dir: Directory holding the parse caches.
+    :return: Parsed context or `None` if there is no valid cached context.
+    """
+    try:
+        with open(parse_cache_path(lattice_file_path, cache_dir), "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    if cached.get("version") != PARSE_CACHE_VERSION or not dependencies_unchanged(
+        cached["dependencies"]
+    ):
+        return None
+
+    return {**default_context(), **cached["context"]}
+
+
+def save_cached_context(
+    lattice_file_path: Path, cache_dir: Path, context: dict, dependencies: dict
+) -> None:
+    """
+    Save the parsed context of a Bmad lattice file to the parse cache.
+
+    :param lattice_file_path: Path to the root Bmad lattice file.
+    :param cache_dir: Directory holding the parse caches.
+    :param context: Parsed context of the lattice file.
+    :param dependencies: Dictionary of content hashes of lattice files and values of
+        environment variables, as collected by `read_clean_lines`.
+    """
+    # Predefined constants and functions are recreated when loading the context
+    defaults = default_context()
+    parsed_context = {
+        key: value
+        for key, value in context.items()
+        if key != "__builtins__" and not (key in defaults and defaults[key] == value)
+    }
+
+    cache_path = parse_cache_path(lattice_file_path, cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first, so that concurrent readers never see a
+    # partially written cache
+    temporary_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as f:
+        pickle.dump(
+            {
+                "version": PARSE_CACHE_VERSION,
+                "dependencies": dependencies,
+                "context": parsed_context,
+            },
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(temporary_path, cache_path)
+
+
 def validate_understood_properties(understood: list[str], properties: dict) -> None:
     """
     Validate that all properties are understood. This function primarily ensures that
@@ -643,7 +796,9 @@ def convert_element(name: str, context: dict) -> "cheetah.Element":
 
 
 def convert_bmad_lattice(
-    bmad_lattice_file_path: Path, environment_variables: Optional[dict] = None
+    bmad_lattice_file_path: Path,
+    environment_variables: Optional[dict] = None,
+    cache_dir: Optional[Path] = None,
 ) -> "cheetah.Element":
     """
     Convert a Bmad lattice file to a Cheetah `Segment`.
@@ -656,6 +811,9 @@ def convert_bmad_lattice(
     :param bmad_lattice_file_path: Path to the Bmad lattice file.
     :param environment_variables: Dictionary of environment variables to use when
         parsing the lattice file.
+    :param cache_dir: Optional directory in which to cache the parsed lattice. If the
+        lattice file and all files it calls are unchanged, the lattice is loaded from
+        the cache instead of being parsed again.
     :return: Cheetah `Segment` representing the Bmad lattice.
     """
 
@@ -665,32 +823,40 @@ def convert_bmad_lattice(
             os.environ[key] = value
 
     # Replace environment variables in the lattice file path
-    resolved_lattice_file_path = Path(
-        *[
-            os.environ[part[1:]] if part.startswith("$") else part
-            for part in bmad_lattice_file_path.parts
-        ]
+    dependencies = {}
+    resolved_lattice_file_path = resolve_environment_variables(
+        bmad_lattice_file_path, dependencies
     )
 
-    # Read and clean the lattice file(s)
-    lines = read_clean_lines(resolved_lattice_file_path)
+    context = None
+    if cache_dir is not None:
+        context = load_cached_context(resolved_lattice_file_path, Path(cache_dir))
 
-    # Merge multi-line statements
-    merged_lines = merge_delimiter_continued_lines(
-        lines, delimiter="&", remove_delimiter=True
-    )
-    merged_lines = merge_delimiter_continued_lines(
-        merged_lines, delimiter=",", remove_delimiter=False
-    )
-    merged_lines = merge_delimiter_continued_lines(
-        merged_lines, delimiter="{", remove_delimiter=False
-    )
-    assert len(merged_lines) <= len(
-        lines
-    ), "Merging lines should never produce more lines than there were before."
+    if context is None:
+        # Read and clean the lattice file(s)
+        lines = read_clean_lines(resolved_lattice_file_path, dependencies)
 
-    # Parse the lattice file(s), i.e. basically execute them
-    context = parse_lines(merged_lines)
+        # Merge multi-line statements
+        merged_lines = merge_delimiter_continued_lines(
+            lines, delimiter="&", remove_delimiter=True
+        )
+        merged_lines = merge_delimiter_continued_lines(
+            merged_lines, delimiter=",", remove_delimiter=False
+        )
+        merged_lines = merge_delimiter_continued_lines(
+            merged_lines, delimiter="{", remove_delimiter=False
+        )
+        assert len(merged_lines) <= len(
+            lines
+        ), "Merging lines should never produce more lines than there were before."
+
+        # Parse the lattice file(s), i.e. basically execute them
+        context = parse_lines(merged_lines)
+
+        if cache_dir is not None:
+            save_cached_context(
+                resolved_lattice_file_path, Path(cache_dir), context, dependencies
+            )
 
     # Convert the parsed lattice info to Cheetah elements
     return convert_element(context["__use__"], context)
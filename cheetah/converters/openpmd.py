@@ -0,0 +1,393 @@
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import torch
+
+from cheetah import constants
+
+# Version of the openPMD standard that written files follow
+OPENPMD_VERSION = "1.1.0"
+
+# Momenta are written in eV/c, which is their factor to SI units of kg m / s
+MOMENTUM_UNIT_SI = constants.elementary_charge / constants.speed_of_light
+
+# Powers of length, mass, time, current, temperature, amount of substance and luminous
+# intensity making up the units of each record
+UNIT_DIMENSIONS = {
+    "position": (1, 0, 0, 0, 0, 0, 0),
+    "positionOffset": (1, 0, 0, 0, 0, 0, 0),
+    "momentum": (1, 1, -1, 0, 0, 0, 0),
+    "time": (0, 0, 1, 0, 0, 0, 0),
+    "weighting": (0, 0, 0, 0, 0, 0, 0),
+    "charge": (0, 0, 1, 1, 0, 0, 0),
+    "mass": (0, 1, 0, 0, 0, 0, 0),
+    "survivalProbability": (0, 0, 0, 0, 0, 0, 0),
+}
+
+# Number of particles converted at a time, which bounds the memory needed for
+# temporary arrays when writing large beams
+BLOCK_SIZE = 2**17
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError(
+            """To read and write openPMD files, h5py must be first installed, see
+        https://docs.h5py.org"""
+        )
+    return h5py
+
+
+def _is_constant(component) -> bool:
+    """Check if a record component is a constant record component."""
+    return "value" in component.attrs
+
+
+def _read_component(component, selection: slice) -> np.ndarray:
+    """Read the selected particles of a record component in SI units."""
+    if _is_constant(component):
+        num_particles = len(range(*selection.indices(int(component.attrs["shape"][0]))))
+        values = np.full(num_particles, component.attrs["value"], dtype=np.float64)
+    else:
+        values = component[selection].astype(np.float64)
+    return values * component.attrs.get("unitSI", 1.0)
+
+
+def _mean_of_component(component) -> float:
+    """Mean of all particles of a record component in SI units."""
+    if _is_constant(component):
+        return component.attrs["value"] * component.attrs.get("unitSI", 1.0)
+    return float(np.mean(_read_component(component, slice(None))))
+
+
+def _set_record_attributes(record, name: str, weighting_power: float) -> None:
+    record.attrs["unitDimension"] = np.array(UNIT_DIMENSIONS[name], dtype=np.float64)
+    record.attrs["timeOffset"] = np.float32(0.0)
+    record.attrs["macroWeighted"] = np.uint32(name == "weighting")
+    record.attrs["weightingPower"] = np.float64(weighting_power)
+
+
+def _create_dataset(
+    group, name: str, chunk_size: Optional[int], compression: Optional[str]
+):
+    """Create an empty, resizable record component for float64 values."""
+    dataset = group.create_dataset(
+        name,
+        shape=(0,),
+        maxshape=(None,),
+        dtype=np.float64,
+        chunks=(chunk_size,) if chunk_size is not None else True,
+        compression=compression,
+    )
+    dataset.attrs["unitSI"] = np.float64(1.0)
+    return dataset
+
+
+def _create_constant(group, name: str, value: float) -> None:
+    """Create a constant record component, holding the same value for all particles."""
+    component = group.create_group(name)
+    component.attrs["value"] = np.float64(value)
+    component.attrs["shape"] = np.array([0], dtype=np.uint64)
+    component.attrs["unitSI"] = np.float64(1.0)
+
+
+def _create_species(
+    particles_group,
+    species: str,
+    energy: float,
+    chunk_size: Optional[int],
+    compression: Optional[str],
+):
+    """Create the (empty) records of a species of particles."""
+    group = particles_group.create_group(species)
+    group.attrs["referenceEnergy"] = np.float64(energy)
+    group.attrs["referenceTime"] = np.float64(0.0)
+
+    position = group.create_group("position")
+    _set_record_attributes(position, "position", 0.0)
+    _create_dataset(position, "x", chunk_size, compression)
+    _create_dataset(position, "y", chunk_size, compression)
+    # Particles are written at the same longitudinal position
+    _create_constant(position, "z", 0.0)
+
+    position_offset = group.create_group("positionOffset")
+    _set_record_attributes(position_offset, "positionOffset", 0.0)
+    for axis in ("x", "y", "z"):
+        _create_constant(position_offset, axis, 0.0)
+
+    momentum = group.create_group("momentum")
+    _set_record_attributes(momentum, "momentum", 1.0)
+    for axis in ("x", "y", "z"):
+        _create_dataset(momentum, axis, chunk_size, compression)
+        momentum[axis].attrs["unitSI"] = np.float64(MOMENTUM_UNIT_SI)
+
+    _set_record_attributes(
+        _create_dataset(group, "time", chunk_size, compression), "time", 0.0
+    )
+    _set_record_attributes(
+        _create_dataset(group, "weighting", chunk_size, compression), "weighting", 1.0
+    )
+    _create_constant(group, "charge", -constants.elementary_charge)
+    _set_record_attributes(group["charge"], "charge", 1.0)
+    _create_constant(group, "mass", constants.electron_mass)
+    _set_record_attributes(group["mass"], "mass", 1.0)
+
+    return group
+
+
+def _components(group) -> list:
+    """All record components of a species."""
+    components = []
+    for record in group.values():
+        if hasattr(record, "shape") or _is_constant(record):
+            components.append(record)
+        else:
+            components.extend(record.values())
+    return components
+
+
+def write_openpmd(
+    path: Union[str, Path],
+    particles: torch.Tensor,
+    energy: torch.Tensor,
+    particle_charges: torch.Tensor,
+    survival_probabilities: Optional[torch.Tensor] = None,
+    species: str = "electrons",
+    chunk_size: Optional[int] = None,
+    compression: Optional[str] = None,
+    iteration: Optional[int] = None,
+    attributes: Optional[dict] = None,
+) -> int:
+    """
+    Write particles to an openPMD file in HDF5 format.
+
+    The particles are written as electrons at the same longitudinal position with
+    their positions, momenta in eV/c, times relative to the reference particle and
+    weightings. The energy of the reference particle is saved in the
+    `referenceEnergy` attribute of the species.
+
+    :param path: Path to the openPMD file. The file is created if it does not exist.
+    :param particles: Particles of shape `(N, 7)` in Cheetah's phase space coordinates.
+    :param energy: Reference energy of the particles in eV.
+    :param particle_charges: Charges of the macroparticles in C.
+    :param survival_probabilities: Optional survival probabilities of the particles.
+    :param species: Name of the particle species in the file.
+    :param chunk_size: Number of particles per chunk of the HDF5 datasets. If `None`,
+        h5py chooses the chunk size.
+    :param compression: Compression filter of the HDF5 datasets, e.g. `"gzip"` or
+        `"lzf"`, or `None` for no compression.
+    :param iteration: Iteration to write the particles to. If it already exists, the
+        particles are appended to its particles, e.g. to write a beam in chunks. If
+        `None`, the particles are written to a new iteration after the last one.
+    :param attributes: Additional attributes of the iteration, if it is created.
+    :return: Index of the iteration the particles were written to.
+    """
+    h5py = _import_h5py()
+
+    if particles.dim() != 2:
+        raise ValueError("Only unbatched beams can be written to openPMD files.")
+
+    num_particles = particles.shape[0]
+    energy = energy.item()
+    mass = constants.electron_mass_eV
+    reference_momentum = np.sqrt(energy**2 - mass**2)
+
+    with h5py.File(path, "a") as f:
+        if "openPMD" not in f.attrs:
+            f.attrs["openPMD"] = OPENPMD_VERSION
+            f.attrs["openPMDextension"] = np.uint32(0)
+            f.attrs["basePath"] = "/data/%T/"
+            f.attrs["particlesPath"] = "particles/"
+            f.attrs["iterationEncoding"] = "groupBased"
+            f.attrs["iterationFormat"] = "/data/%T/"
+            f.attrs["software"] = "Cheetah"
+
+        data = f.require_group("data")
+        if iteration is None:
+            iteration = max((int(key) for key in data), default=-1) + 1
+        if f"{iteration}/particles/{species}" in data:
+            group = data[f"{iteration}/particles/{species}"]
+        else:
+            iteration_group = data.require_group(str(iteration))
+            iteration_group.attrs["time"] = np.float64(0.0)
+            iteration_group.attrs["dt"] = np.float64(0.0)
+            iteration_group.attrs["timeUnitSI"] = np.float64(1.0)
+            for key, value in (attributes or {}).items():
+                iteration_group.attrs[key] = value
+            group = _create_species(
+                iteration_group.require_group("particles"),
+                species,
+                energy,
+                chunk_size,
+                compression,
+            )
+
+        offset = int(group["position/x"].shape[0])
+        if survival_probabilities is not None and "survivalProbability" not in group:
+            dataset = _create_dataset(
+                group, "survivalProbability", chunk_size, compression
+            )
+            _set_record_attributes(dataset, "survivalProbability", 0.0)
+            # Particles written before without survival probabilities have survived
+            dataset.resize((offset,))
+            dataset[:] = 1.0
+        total = offset + num_particles
+        for component in _components(group):
+            if _is_constant(component):
+                component.attrs["shape"] = np.array([total], dtype=np.uint64)
+            else:
+                component.resize((total,))
+
+        for start in range(0, num_particles, BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, num_particles)
+            block = particles[start:stop].detach().to("cpu", torch.float64).numpy()
+            selection = slice(offset + start, offset + stop)
+
+            particle_energy = energy + block[:, 5] * reference_momentum
+            momentum = np.sqrt(particle_energy**2 - mass**2)
+            px = block[:, 1] * reference_momentum
+            py = block[:, 3] * reference_momentum
+
+            group["position/x"][selection] = block[:, 0]
+            group["position/y"][selection] = block[:, 2]
+            group["momentum/x"][selection] = px
+            group["momentum/y"][selection] = py
+            group["momentum/z"][selection] = np.sqrt(momentum**2 - px**2 - py**2)
+            group["time"][selection] = block[:, 4] / constants.speed_of_light
+            group["weighting"][selection] = (
+                particle_charges[start:stop].detach().to("cpu", torch.float64).numpy()
+                / constants.elementary_charge
+            )
+            if "survivalProbability" in group:
+                group["survivalProbability"][selection] = (
+                    survival_probabilities[start:stop]
+                    .detach()
+                    .to("cpu", torch.float64)
+                    .numpy()
+                    if survival_probabilities is not None
+                    else 1.0
+                )
+
+    return iteration
+
+
+def read_openpmd(
+    path: Union[str, Path],
+    iteration: Optional[int] = None,
+    species: str = "electrons",
+    particle_slice: Optional[slice] = None,
+) -> tuple[np.ndarray, float, np.ndarray, Optional[np.ndarray]]:
+    """
+    Read particles from an openPMD file in HDF5 format, and prepare them for conversion
+    to a Cheetah ParticleBeam.
+
+    Particles at different longitudinal positions are drifted to their mean position.
+    If the file does not define the `referenceEnergy` and `referenceTime` of the
+    species, as files not written by Cheetah generally do not, the mean energy and time
+    of all particles are used as the reference.
+
+    :param path: Path to the openPMD file.
+    :param iteration: Iteration to read. Defaults to the last iteration in the file.
+    :param species: Name of the particle species to read.
+    :param particle_slice: Slice of the particles to read, e.g. `slice(0, 1000)`. Only
+        the selected particles are read from the file. Defaults to all particles.
+    :return: (particles, energy, particle_charges, survival_probabilities)
+        Particle 6D phase space information, reference energy, the charge array of the
+        particles and their survival probabilities if the file holds them.
+    """
+    h5py = _import_h5py()
+
+    selection = particle_slice if particle_slice is not None else slice(None)
+    mass = constants.electron_mass_eV
+    # Factor from momenta in kg m / s to eV/c
+    to_eV = constants.speed_of_light / constants.elementary_charge
+
+    with h5py.File(path, "r") as f:
+        base_path = f.attrs["basePath"]
+        base_path = base_path.decode() if isinstance(base_path, bytes) else base_path
+        particles_path = f.attrs["particlesPath"]
+        particles_path = (
+            particles_path.decode()
+            if isinstance(particles_path, bytes)
+            else particles_path
+        )
+        if iteration is None:
+            iteration = max(int(key) for key in f[base_path.split("%T")[0]])
+        group = f[base_path.replace("%T", str(iteration)) + particles_path + species]
+
+        def position(axis: str, selection: slice) -> np.ndarray:
+            values = _read_component(group["position"][axis], selection)
+            if "positionOffset" in group:
+                values += _read_component(group["positionOffset"][axis], selection)
+            return values
+
+        x = position("x", selection)
+        y = position("y", selection)
+        z = position("z", selection)
+        px, py, pz = (
+            _read_component(group["momentum"][axis], selection) * to_eV
+            for axis in ("x", "y", "z")
+        )
+        t = (
+            _read_component(group["time"], selection)
+            if "time" in group
+            else np.zeros_like(x)
+        )
+        weighting = (
+            _read_component(group["weighting"], selection)
+            if "weighting" in group
+            else np.ones_like(x)
+        )
+        charge = (
+            _read_component(group["charge"], selection)
+            if "charge" in group
+            else np.full_like(x, -constants.elementary_charge)
+        )
+        survival_probabilities = (
+            _read_component(group["survivalProbability"], selection)
+            if "survivalProbability" in group
+            else None
+        )
+
+        # The reference is determined from all particles, so that it is the same for
+        # every slice of the particles
+        reference_position = _mean_of_component(group["position"]["z"])
+        if "positionOffset" in group:
+            reference_position += _mean_of_component(group["positionOffset"]["z"])
+        if "referenceEnergy" in group.attrs:
+            energy = float(group.attrs["referenceEnergy"])
+        else:
+            momentum_squared = sum(
+                (_read_component(group["momentum"][axis], slice(None)) * to_eV) ** 2
+                for axis in ("x", "y", "z")
+            )
+            energy = float(np.mean(np.sqrt(momentum_squared + mass**2)))
+        if "referenceTime" in group.attrs:
+            reference_time = float(group.attrs["referenceTime"])
+        elif "time" in group:
+            reference_time = _mean_of_component(group["time"])
+        else:
+            reference_time = 0.0
+
+    reference_momentum = np.sqrt(energy**2 - mass**2)
+    momentum = np.sqrt(px**2 + py**2 + pz**2)
+    particle_energy = np.sqrt(momentum**2 + mass**2)
+    beta = momentum / particle_energy
+
+    # Particles are drifted to the longitudinal position of the reference particle
+    particles = np.empty((x.shape[0], 6))
+    particles[:, 0] = x - (z - reference_position) * px / pz
+    particles[:, 1] = px / reference_momentum
+    particles[:, 2] = y - (z - reference_position) * py / pz
+    particles[:, 3] = py / reference_momentum
+    particles[:, 4] = constants.speed_of_light * (t - reference_time) - (
+        z - reference_position
+    ) * momentum / (beta * pz)
+    particles[:, 5] = (particle_energy - energy) / reference_momentum
+
+    particle_charges = np.abs(weighting * charge)
+
+    return particles, energy, particle_charges, survival_probabilities
@@ -1,5 +1,7 @@
+import inspect
 import json
-from typing import Any, Optional, Tuple
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple
 
 import torch
 
@@ -14,8 +16,13 @@ def feature2nontorch(value: Any) -> Any:
     :param value: Value of the feature that might be in some kind of PyTorch format,
         such as `torch.Tensor` or `torch.nn.Parameter`.
     :return: Value of the feature if it is not in a PyTorch format, otherwise the
-        value converted to a non-PyTorch format.
+        value converted to a non-PyTorch format. Elements attached to other elements,
+        like the wakefield of a cavity, are converted to a dictionary of their name,
+        class and parameters.
     """
+    if isinstance(value, cheetah.Element):
+        name, element_class, params = convert_element(value)
+        return {"name": name, "class": element_class, "params": params}
     return (
         value.tolist()
         if isinstance(value, (torch.Tensor, torch.nn.Parameter))
@@ -23,27 +30,38 @@ def feature2nontorch(value: Any) -> Any:
     )
 
 
-def convert_element(element: "cheetah.Element"):
+def convert_element(
+    element: "cheetah.Element", convert_value: Callable[[Any], Any] = feature2nontorch
+):
     """
     Deconstruct an element into its name, class and parameters for saving to JSON.
+    Features stored in private attributes, like the transfer map of a
+    `CustomTransferMap`, are saved under the name of their constructor argument, i.e.
+    without the leading underscore.
 
     :param element: Cheetah element
+    :param convert_value: Function converting the value of each feature to a value
+        that can be saved.
     :return: Tuple of element name, element class, and element parameters
     """
     params = {
-        feauture: feature2nontorch(getattr(element, feauture))
+        feauture.removeprefix("_"): convert_value(getattr(element, feauture))
         for feauture in element.defining_features
     }
 
     return element.name, element.__class__.__name__, params
 
 
-def convert_segment(segment: "cheetah.Segment") -> Tuple[dict, dict]:
+def convert_segment(
+    segment: "cheetah.Segment", convert_value: Callable[[Any], Any] = feature2nontorch
+) -> Tuple[dict, dict]:
     """
     Deconstruct a segment into its name, a list of its elements and a dictionary of
     its element parameters for saving to JSON.
 
     :param segment: Cheetah segment.
+    :param convert_value: Function converting the value of each feature to a value
+        that can be saved.
     :return: Tuple of elments and lattices dictionaries found in segment, including
         the segment itself.
     """
@@ -54,12 +72,15 @@ def convert_segment(segment: "cheetah.Segment") -> Tuple[dict, dict]:
 
     for element in segment.elements:
         if isinstance(element, cheetah.Segment):
-            segment_elements, segment_lattices = convert_segment(element)
+            segment_elements, segment_lattices = convert_segment(element, convert_value)
 
             elements.update(segment_elements)
             lattices.update(segment_lattices)
+            element_name = element.name
         else:
-            element_name, element_class, element_params = convert_element(element)
+            element_name, element_class, element_params = convert_element(
+                element, convert_value
+            )
 
             elements[element_name] = [element_class, element_params]
 
@@ -133,44 +154,97 @@ class CompactJSONEncoder(json.JSONEncoder):
 def nontorch2feature(value: Any) -> Any:
     """
     Convert a value like a `float`, `int`, etc. to a `torch.Tensor` if necessary.
-    Values of type `str` and `bool` are not converted, because all currently existing
-    `cheetah.Element` subclasses expect these values to not be of type `torch.Tensor`.
+    Values of type `str` and `bool` and `None` are not converted, because all currently
+    existing `cheetah.Element` subclasses expect these values to not be of type
+    `torch.Tensor`. Dictionaries of attached elements are parsed back into elements.
 
     :param value: Value to convert to a `torch.Tensor` if necessary.
     :return: Value converted to a `torch.Tensor` if necessary.
     """
-    return value if isinstance(value, (str, bool)) else torch.tensor(value)
+    if isinstance(value, dict):
+        params = {
+            key: nontorch2feature(param) for key, param in value["params"].items()
+        }
+        return construct_element(
+            getattr(cheetah, value["class"]), value["name"], params
+        )
+    return (
+        value
+        if value is None or isinstance(value, (str, bool))
+        else torch.tensor(value)
+    )
+
+
+@lru_cache(maxsize=None)
+def accepts_dtype(element_class: type) -> bool:
+    """Check whether the constructor of an element class has a `dtype` argument."""
+    return "dtype" in inspect.signature(element_class).parameters
+
+
+def construct_element(
+    element_class: type, name: str, params: dict
+) -> "cheetah.Element":
+    """
+    Construct an element from its converted parameters. If all floating point tensors
+    among the parameters have the same dtype, the element is constructed with that
+    dtype, so that the tensors are used as they are.
+
+    :param element_class: Class of the element to construct.
+    :param name: Name of the element.
+    :param params: Converted parameters of the element.
+    :return: Constructed element.
+    """
+    dtypes = {
+        value.dtype
+        for value in params.values()
+        if isinstance(value, torch.Tensor) and value.is_floating_point()
+    }
+    if len(dtypes) == 1 and accepts_dtype(element_class):
+        return element_class(name=name, dtype=dtypes.pop(), **params)
+    return element_class(name=name, **params)
 
 
-def parse_element(name: str, lattice_dict: dict) -> "cheetah.Element":
+def parse_element(
+    name: str,
+    lattice_dict: dict,
+    convert_value: Callable[[Any], Any] = nontorch2feature,
+) -> "cheetah.Element":
     """
     Parse an `Element` named `name` from a `lattice_dict`.
 
     :param name: Name of the `Element` to parse.
     :param lattice_dict: Dictionary containing the lattice information.
+    :param convert_value: Function converting each saved parameter value back to the
+        value of the feature.
     """
     element_class = getattr(cheetah, lattice_dict["elements"][name][0])
     params = lattice_dict["elements"][name][1]
 
-    converted_params = {key: nontorch2feature(value) for key, value in params.items()}
+    converted_params = {key: convert_value(value) for key, value in params.items()}
 
-    return element_class(name=name, **converted_params)
+    return construct_element(element_class, name, converted_params)
 
 
-def parse_segment(name: str, lattice_dict: dict) -> "cheetah.Segment":
+def parse_segment(
+    name: str,
+    lattice_dict: dict,
+    convert_value: Callable[[Any], Any] = nontorch2feature,
+) -> "cheetah.Segment":
     """
     Parse a `Segment` named `name` from a `lattice_dict`.
 
     :param name: Name of the `Segment` to parse.
     :param lattice_dict: Dictionary containing the lattice information.
+    :param convert_value: Function converting each saved parameter value back to the
+        value of the feature.
     """
     elements = []
     for element_name in lattice_dict["lattices"][name]:
         # Construct new element
         if element_name in lattice_dict["lattices"]:
-            new_element = parse_segment(element_name, lattice_dict)
+            new_element = parse_segment(element_name, lattice_dict, convert_value)
         else:
-            new_element = parse_element(element_name, lattice_dict)
+            new_element = parse_element(element_name, lattice_dict, convert_value)
 
         # Append the element to the list of elements
         elements.append(new_element)
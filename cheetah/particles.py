@@ -1,14 +1,14 @@
-from typing import Optional
+from typing import Iterator, Optional
 
 import numpy as np
 import torch
-from scipy.constants import physical_constants
 from torch import nn
 from torch.distributions import MultivariateNormal
 
-electron_mass_eV = torch.tensor(
-    physical_constants["electron mass energy equivalent in MeV"][0] * 1e6
-)
+from cheetah import constants
+from cheetah.utils import is_tracing, module_tensors, needs_grad, tensors_cache_key
+
+electron_mass_eV = torch.tensor(constants.electron_mass_eV)
 
 
 class Beam(nn.Module):
@@ -221,10 +221,10 @@ class Beam(nn.Module):
 
     @property
     def relativistic_beta(self) -> torch.Tensor:
-        relativistic_beta = (
-            torch.sqrt(1 - 1 / (self.relativistic_gamma**2))
-            if torch.abs(self.relativistic_gamma) > 0
-            else torch.tensor(1.0)
+        relativistic_beta = torch.where(
+            torch.abs(self.relativistic_gamma) > 0,
+            torch.sqrt(1 - 1 / (self.relativistic_gamma**2)),
+            torch.ones_like(self.relativistic_gamma),
         )
         return relativistic_beta
 
@@ -292,8 +292,9 @@ class ParameterBeam(Beam):
     """
     Beam of charged particles, where each particle is simulated.
 
-    :param mu: Mu vector of the beam.
-    :param cov: Covariance matrix of the beam.
+    :param mu: Mu vector of the beam of shape `(..., 7)`, where `...` are optional batch
+        dimensions.
+    :param cov: Covariance matrix of the beam of shape `(..., 7, 7)`.
     :param energy: Energy of the beam in eV.
     :param total_charge: Total charge of the beam in C.
     :param device: Device to use for the beam. If "auto", use CUDA if available.
@@ -360,34 +361,70 @@ class ParameterBeam(Beam):
         energy = energy if energy is not None else torch.tensor(1e8)
         total_charge = total_charge if total_charge is not None else torch.tensor(0.0)
 
+        (
+            mu_x,
+            mu_xp,
+            mu_y,
+            mu_yp,
+            sigma_x,
+            sigma_xp,
+            sigma_y,
+            sigma_yp,
+            sigma_s,
+            sigma_p,
+            cor_x,
+            cor_y,
+            cor_s,
+        ) = torch.broadcast_tensors(
+            mu_x,
+            mu_xp,
+            mu_y,
+            mu_yp,
+            sigma_x,
+            sigma_xp,
+            sigma_y,
+            sigma_yp,
+            sigma_s,
+            sigma_p,
+            cor_x,
+            cor_y,
+            cor_s,
+        )
+
         mu = torch.stack(
             [
                 mu_x,
                 mu_xp,
                 mu_y,
                 mu_yp,
-                torch.tensor(0.0),
-                torch.tensor(0.0),
-                torch.tensor(1.0),
-            ]
+                torch.zeros_like(mu_x),
+                torch.zeros_like(mu_x),
+                torch.ones_like(mu_x),
+            ],
+            dim=-1,
         )
 
-        cov = torch.zeros(7, 7)
-        cov[0, 0] = sigma_x**2
-        cov[0, 1] = cor_x
-        cov[1, 0] = cor_x
-        cov[1, 1] = sigma_xp**2
-        cov[2, 2] = sigma_y**2
-        cov[2, 3] = cor_y
-        cov[3, 2] = cor_y
-        cov[3, 3] = sigma_yp**2
-        cov[4, 4] = sigma_s**2
-        cov[4, 5] = cor_s
-        cov[5, 4] = cor_s
-        cov[5, 5] = sigma_p**2
+        cov = torch.zeros(*sigma_x.shape, 7, 7)
+        cov[..., 0, 0] = sigma_x**2
+        cov[..., 0, 1] = cor_x
+        cov[..., 1, 0] = cor_x
+        cov[..., 1, 1] = sigma_xp**2
+        cov[..., 2, 2] = sigma_y**2
+        cov[..., 2, 3] = cor_y
+        cov[..., 3, 2] = cor_y
+        cov[..., 3, 3] = sigma_yp**2
+        cov[..., 4, 4] = sigma_s**2
+        cov[..., 4, 5] = cor_s
+        cov[..., 5, 4] = cor_s
+        cov[..., 5, 5] = sigma_p**2
 
         return cls(
-            mu=mu, cov=cov, energy=energy, total_charge=total_charge, device=device
+            mu=mu,
+            cov=cov,
+            energy=energy,
+            total_charge=total_charge,
+            device=device,
+            dtype=dtype,
         )
 
     @classmethod
@@ -463,11 +500,22 @@ class ParameterBeam(Beam):
         )
 
     @classmethod
-    def from_astra(cls, path: str, device=None, dtype=torch.float32) -> "ParameterBeam":
-        """Load an Astra particle distribution as a Cheetah Beam."""
+    def from_astra(
+        cls, path: str, device=None, dtype=torch.float32, cache: bool = False
+    ) -> "ParameterBeam":
+        """
+        Load an Astra particle distribution as a Cheetah Beam.
+
+        :param path: Path to the ASTRA beam distribution file.
+        :param device: Device to create the beam on.
+        :param dtype: Data type of the beam.
+        :param cache: If `True`, the converted distribution is cached in a binary file
+            next to the ASTRA file, from which it is loaded as long as the ASTRA file
+            is unchanged.
+        """
         from cheetah.converters.astralavista import from_astrabeam
 
-        particles, energy, particle_charges = from_astrabeam(path)
+        particles, energy, particle_charges = from_astrabeam(path, cache=cache)
         mu = torch.ones(7)
         mu[:6] = torch.tensor(particles.mean(axis=0))
 
@@ -554,59 +602,59 @@ class ParameterBeam(Beam):
 
     @property
     def mu_x(self) -> torch.Tensor:
-        return self._mu[0]
+        return self._mu[..., 0]
 
     @property
     def sigma_x(self) -> torch.Tensor:
-        return torch.sqrt(self._cov[0, 0])
+        return torch.sqrt(self._cov[..., 0, 0])
 
     @property
     def mu_xp(self) -> torch.Tensor:
-        return self._mu[1]
+        return self._mu[..., 1]
 
     @property
     def sigma_xp(self) -> torch.Tensor:
-        return torch.sqrt(self._cov[1, 1])
+        return torch.sqrt(self._cov[..., 1, 1])
 
     @property
     def mu_y(self) -> torch.Tensor:
-        return self._mu[2]
+        return self._mu[..., 2]
 
     @property
     def sigma_y(self) -> torch.Tensor:
-        return torch.sqrt(self._cov[2, 2])
+        return torch.sqrt(self._cov[..., 2, 2])
 
     @property
     def mu_yp(self) -> torch.Tensor:
-        return self._mu[3]
+        return self._mu[..., 3]
 
     @property
     def sigma_yp(self) -> torch.Tensor:
-        return torch.sqrt(self._cov[3, 3])
+        return torch.sqrt(self._cov[..., 3, 3])
 
     @property
     def mu_s(self) -> torch.Tensor:
-        return self._mu[4]
+        return self._mu[..., 4]
 
     @property
     def sigma_s(self) -> torch.Tensor:
-        return torch.sqrt(self._cov[4, 4])
+        return torch.sqrt(self._cov[..., 4, 4])
 
     @property
     def mu_p(self) -> torch.Tensor:
-        return self._mu[5]
+        return self._mu[..., 5]
 
     @property
     def sigma_p(self) -> torch.Tensor:
-        return torch.sqrt(self._cov[5, 5])
+        return torch.sqrt(self._cov[..., 5, 5])
 
     @property
     def sigma_xxp(self) -> torch.Tensor:
-        return self._cov[0, 1]
+        return self._cov[..., 0, 1]
 
     @property
     def sigma_yyp(self) -> torch.Tensor:
-        return self._cov[2, 3]
+        return self._cov[..., 2, 3]
 
     def __repr__(self) -> str:
         return (
@@ -624,11 +672,16 @@ class ParticleBeam(Beam):
     """
     Beam of charged particles, where each particle is simulated.
 
-    :param particles: List of 7-dimensional particle vectors.
+    :param particles: List of 7-dimensional particle vectors of shape `(..., N, 7)`,
+        where `...` are optional batch dimensions.
     :param energy: Energy of the beam in eV.
     :param total_charge: Total charge of the beam in C.
     :param device: Device to move the beam's particle array to. If set to `"auto"` a
         CUDA GPU is selected if available. The CPU is used otherwise.
+    :param survival_probabilities: Probabilities of the particles to have survived
+        their way through the lattice so far, of shape `(..., N)`. They are reduced by
+        apertures with `loss_model="mask"`, and statistics of the beam are weighted by
+        them. `None` means that all particles have survived.
     """
 
     def __init__(
@@ -638,22 +691,28 @@ class ParticleBeam(Beam):
         particle_charges: Optional[torch.Tensor] = None,
         device=None,
         dtype=torch.float32,
+        survival_probabilities: Optional[torch.Tensor] = None,
     ) -> None:
         super().__init__()
         factory_kwargs = {"device": device, "dtype": dtype}
 
         assert (
-            len(particles) > 0 and particles.shape[1] == 7
+            particles.shape[-2] > 0 and particles.shape[-1] == 7
         ), "Particle vectors must be 7-dimensional."
 
         self.particles = particles.to(**factory_kwargs)
-        num_particles = len(self.particles)
+        num_particles = self.particles.shape[-2]
         self.particle_charges = (
             particle_charges.to(**factory_kwargs)
             if particle_charges is not None
             else torch.zeros(num_particles, **factory_kwargs)
         )
         self.energy = energy.to(**factory_kwargs)
+        self.survival_probabilities = (
+            survival_probabilities.to(**factory_kwargs)
+            if survival_probabilities is not None
+            else None
+        )
 
     @classmethod
     def from_parameters(
@@ -720,31 +779,71 @@ class ParticleBeam(Beam):
         total_charge = total_charge if total_charge is not None else torch.tensor(0.0)
         particle_charges = (
             torch.ones(num_particles, device=device, dtype=dtype)
-            * total_charge
+            * total_charge.unsqueeze(-1)
             / num_particles
         )
 
-        mean = torch.stack(
-            [mu_x, mu_xp, mu_y, mu_yp, torch.tensor(0.0), torch.tensor(0.0)]
+        (
+            mu_x,
+            mu_xp,
+            mu_y,
+            mu_yp,
+            sigma_x,
+            sigma_xp,
+            sigma_y,
+            sigma_yp,
+            sigma_s,
+            sigma_p,
+            cor_x,
+            cor_y,
+            cor_s,
+        ) = torch.broadcast_tensors(
+            mu_x,
+            mu_xp,
+            mu_y,
+            mu_yp,
+            sigma_x,
+            sigma_xp,
+            sigma_y,
+            sigma_yp,
+            sigma_s,
+            sigma_p,
+            cor_x,
+            cor_y,
+            cor_s,
         )
 
-        cov = torch.zeros(6, 6)
-        cov[0, 0] = sigma_x**2
-        cov[0, 1] = cor_x
-        cov[1, 0] = cor_x
-        cov[1, 1] = sigma_xp**2
-        cov[2, 2] = sigma_y**2
-        cov[2, 3] = cor_y
-        cov[3, 2] = cor_y
-        cov[3, 3] = sigma_yp**2
-        cov[4, 4] = sigma_s**2
-        cov[4, 5] = cor_s
-        cov[5, 4] = cor_s
-        cov[5, 5] = sigma_p**2
+        mean = torch.stack(
+            [
+                mu_x,
+                mu_xp,
+                mu_y,
+                mu_yp,
+                torch.zeros_like(mu_x),
+                torch.zeros_like(mu_x),
+            ],
+            dim=-1,
+        )
 
-        particles = torch.ones((num_particles, 7))
+        cov = torch.zeros(*sigma_x.shape, 6, 6)
+        cov[..., 0, 0] = sigma_x**2
+        cov[..., 0, 1] = cor_x
+        cov[..., 1, 0] = cor_x
+        cov[..., 1, 1] = sigma_xp**2
+        cov[..., 2, 2] = sigma_y**2
+        cov[..., 2, 3] = cor_y
+        cov[..., 3, 2] = cor_y
+        cov[..., 3, 3] = sigma_yp**2
+        cov[..., 4, 4] = sigma_s**2
+        cov[..., 4, 5] = cor_s
+        cov[..., 5, 4] = cor_s
+        cov[..., 5, 5] = sigma_p**2
+
+        particles = torch.ones((*sigma_x.shape, num_particles, 7))
         distribution = MultivariateNormal(mean, covariance_matrix=cov)
-        particles[:, :6] = distribution.sample((num_particles,))
+        # Samples are drawn with the particles as leading dimension, in front of the
+        # batch dimensions of the distribution
+        particles[..., :6] = distribution.sample((num_particles,)).movedim(0, -2)
 
         return cls(
             particles,
@@ -871,22 +970,44 @@ class ParticleBeam(Beam):
 
         particle_charges = (
             torch.ones(num_particles, dtype=torch.float32)
-            * total_charge
+            * total_charge.unsqueeze(-1)
             / num_particles
         )
 
-        particles = torch.ones((num_particles, 7))
-
-        particles[:, 0] = torch.linspace(mu_x - sigma_x, mu_x + sigma_x, num_particles)
-        particles[:, 1] = torch.linspace(
-            mu_xp - sigma_xp, mu_xp + sigma_xp, num_particles
+        (
+            mu_x,
+            mu_xp,
+            mu_y,
+            mu_yp,
+            sigma_x,
+            sigma_xp,
+            sigma_y,
+            sigma_yp,
+            sigma_s,
+            sigma_p,
+        ) = torch.broadcast_tensors(
+            mu_x,
+            mu_xp,
+            mu_y,
+            mu_yp,
+            sigma_x,
+            sigma_xp,
+            sigma_y,
+            sigma_yp,
+            sigma_s,
+            sigma_p,
         )
-        particles[:, 2] = torch.linspace(mu_y - sigma_y, mu_y + sigma_y, num_particles)
-        particles[:, 3] = torch.linspace(
-            mu_yp - sigma_yp, mu_yp + sigma_yp, num_particles
-        )
-        particles[:, 4] = torch.linspace(-sigma_s, sigma_s, num_particles)
-        particles[:, 5] = torch.linspace(-sigma_p, sigma_p, num_particles)
+
+        # Particles are spaced linearly between -sigma and +sigma around the centre,
+        # which may differ along the batch dimensions
+        steps = torch.linspace(-1.0, 1.0, num_particles)
+        particles = torch.ones((*mu_x.shape, num_particles, 7))
+        particles[..., 0] = mu_x.unsqueeze(-1) + sigma_x.unsqueeze(-1) * steps
+        particles[..., 1] = mu_xp.unsqueeze(-1) + sigma_xp.unsqueeze(-1) * steps
+        particles[..., 2] = mu_y.unsqueeze(-1) + sigma_y.unsqueeze(-1) * steps
+        particles[..., 3] = mu_yp.unsqueeze(-1) + sigma_yp.unsqueeze(-1) * steps
+        particles[..., 4] = sigma_s.unsqueeze(-1) * steps
+        particles[..., 5] = sigma_p.unsqueeze(-1) * steps
 
         return cls(
             particles=particles,
@@ -915,11 +1036,147 @@ class ParticleBeam(Beam):
         )
 
     @classmethod
-    def from_astra(cls, path: str, device=None, dtype=torch.float32) -> "ParticleBeam":
-        """Load an Astra particle distribution as a Cheetah Beam."""
+    def from_astra(
+        cls, path: str, device=None, dtype=torch.float32, cache: bool = False
+    ) -> "ParticleBeam":
+        """
+        Load an Astra particle distribution as a Cheetah Beam.
+
+        :param path: Path to the ASTRA beam distribution file.
+        :param device: Device to create the beam on.
+        :param dtype: Data type of the beam.
+        :param cache: If `True`, the converted distribution is cached in a binary file
+            next to the ASTRA file, from which it is loaded as long as the ASTRA file
+            is unchanged.
+        """
         from cheetah.converters.astralavista import from_astrabeam
 
-        particles, energy, particle_charges = from_astrabeam(path)
+        particles, energy, particle_charges = from_astrabeam(path, cache=cache)
+        return cls._from_astra_particles(
+            particles, energy, particle_charges, device=device, dtype=dtype
+        )
+
+    @classmethod
+    def chunks_from_astra(
+        cls,
+        path: str,
+        chunk_size: int,
+        device=None,
+        dtype=torch.float32,
+        cache: bool = False,
+    ) -> Iterator["ParticleBeam"]:
+        """
+        Load an Astra particle distribution as a sequence of Cheetah Beams of at most
+        `chunk_size` particles each, without reading the whole file into memory. The
+        chunks can be tracked with `Segment.track_chunked`.
+
+        :param path: Path to the ASTRA beam distribution file.
+        :param chunk_size: Maximum number of particles per chunk.
+        :param device: Device to create the beams on.
+        :param dtype: Data type of the beams.
+        :param cache: If `True` and a binary cache of the ASTRA file was written by
+            `from_astra`, the chunks are read from the cache.
+        """
+        from cheetah.converters.astralavista import iter_astrabeam
+
+        for particles, energy, particle_charges in iter_astrabeam(
+            path, chunk_size=chunk_size, cache=cache
+        ):
+            yield cls._from_astra_particles(
+                particles, energy, particle_charges, device=device, dtype=dtype
+            )
+
+    @classmethod
+    def from_openpmd(
+        cls,
+        path: str,
+        iteration: Optional[int] = None,
+        species: str = "electrons",
+        particle_slice: Optional[slice] = None,
+        device=None,
+        dtype=torch.float32,
+    ) -> "ParticleBeam":
+        """
+        Load a particle beam from an openPMD file in HDF5 format. Requires h5py.
+
+        :param path: Path to the openPMD file.
+        :param iteration: Iteration to load. Defaults to the last iteration in the
+            file.
+        :param species: Name of the particle species to load.
+        :param particle_slice: Slice of the particles to load, e.g. `slice(0, 1000)`.
+            Only the selected particles are read from the file, so that large beams
+            can be loaded in parts. Defaults to all particles.
+        :param device: Device to create the beam on.
+        :param dtype: Data type of the beam.
+        """
+        from cheetah.converters.openpmd import read_openpmd
+
+        particles, energy, particle_charges, survival_probabilities = read_openpmd(
+            path, iteration=iteration, species=species, particle_slice=particle_slice
+        )
+        particles_7d = torch.ones((particles.shape[0], 7), dtype=torch.float64)
+        particles_7d[:, :6] = torch.from_numpy(particles)
+        return cls(
+            particles=particles_7d,
+            energy=torch.tensor(energy),
+            particle_charges=torch.from_numpy(particle_charges),
+            survival_probabilities=(
+                torch.from_numpy(survival_probabilities)
+                if survival_probabilities is not None
+                else None
+            ),
+            device=device,
+            dtype=dtype,
+        )
+
+    def to_openpmd(
+        self,
+        path: str,
+        species: str = "electrons",
+        chunk_size: Optional[int] = None,
+        compression: Optional[str] = None,
+        iteration: Optional[int] = None,
+    ) -> int:
+        """
+        Save the beam to an openPMD file in HDF5 format. Requires h5py.
+
+        :param path: Path to the openPMD file. The file is created if it does not
+            exist.
+        :param species: Name of the particle species in the file.
+        :param chunk_size: Number of particles per chunk of the HDF5 datasets. If
+            `None`, h5py chooses the chunk size.
+        :param compression: Compression filter of the HDF5 datasets, e.g. `"gzip"` or
+            `"lzf"`, or `None` for no compression.
+        :param iteration: Iteration to save the beam to. If it already exists, the
+            particles of the beam are appended to its particles, e.g. to save a beam
+            that was tracked in chunks. If `None`, the beam is saved to a new iteration
+            after the last one.
+        :return: Index of the iteration the beam was saved to.
+        """
+        from cheetah.converters.openpmd import write_openpmd
+
+        return write_openpmd(
+            path,
+            self.particles,
+            self.energy,
+            self.particle_charges,
+            survival_probabilities=self.survival_probabilities,
+            species=species,
+            chunk_size=chunk_size,
+            compression=compression,
+            iteration=iteration,
+        )
+
+    @classmethod
+    def _from_astra_particles(
+        cls,
+        particles: np.ndarray,
+        energy: float,
+        particle_charges: np.ndarray,
+        device=None,
+        dtype=torch.float32,
+    ) -> "ParticleBeam":
+        """Create a beam from particles converted from an ASTRA distribution."""
         particles_7d = torch.ones((particles.shape[0], 7))
         particles_7d[:, :6] = torch.from_numpy(particles)
         particle_charges = torch.from_numpy(particle_charges)
@@ -991,19 +1248,24 @@ class ParticleBeam(Beam):
         else:
             particle_charges = (
                 torch.ones(
-                    len(self.particles),
+                    self.num_particles,
                     device=total_charge.device,
                     dtype=total_charge.dtype,
                 )
                 * total_charge
-                / len(self.particles)
+                / self.num_particles
             )
 
+        mu_x, mu_xp, mu_y, mu_yp = torch.broadcast_tensors(mu_x, mu_xp, mu_y, mu_yp)
         new_mu = torch.stack(
-            [mu_x, mu_xp, mu_y, mu_yp, torch.tensor(0.0), torch.tensor(0.0)]
+            [mu_x, mu_xp, mu_y, mu_yp, torch.zeros_like(mu_x), torch.zeros_like(mu_x)],
+            dim=-1,
         )
         new_sigma = torch.stack(
-            [sigma_x, sigma_xp, sigma_y, sigma_yp, sigma_s, sigma_p]
+            torch.broadcast_tensors(
+                sigma_x, sigma_xp, sigma_y, sigma_yp, sigma_s, sigma_p
+            ),
+            dim=-1,
         )
 
         old_mu = torch.stack(
@@ -1012,9 +1274,10 @@ class ParticleBeam(Beam):
                 self.mu_xp,
                 self.mu_y,
                 self.mu_yp,
-                torch.tensor(0.0),
-                torch.tensor(0.0),
-            ]
+                torch.zeros_like(self.mu_x),
+                torch.zeros_like(self.mu_x),
+            ],
+            dim=-1,
         )
         old_sigma = torch.stack(
             [
@@ -1024,14 +1287,21 @@ class ParticleBeam(Beam):
                 self.sigma_yp,
                 self.sigma_s,
                 self.sigma_p,
-            ]
+            ],
+            dim=-1,
         )
 
-        phase_space = self.particles[:, :6]
-        phase_space = (phase_space - old_mu) / old_sigma * new_sigma + new_mu
+        phase_space = self.particles[..., :6]
+        phase_space = (phase_space - old_mu.unsqueeze(-2)) / old_sigma.unsqueeze(
+            -2
+        ) * new_sigma.unsqueeze(-2) + new_mu.unsqueeze(-2)
 
-        particles = torch.ones_like(self.particles)
-        particles[:, :6] = phase_space
+        particles = torch.ones(
+            (*phase_space.shape[:-1], 7),
+            device=phase_space.device,
+            dtype=phase_space.dtype,
+        )
+        particles[..., :6] = phase_space
 
         return self.__class__(
             particles=particles,
@@ -1046,115 +1316,221 @@ class ParticleBeam(Beam):
 
     @property
     def total_charge(self) -> torch.Tensor:
-        return torch.sum(self.particle_charges)
+        if self.survival_probabilities is None:
+            return torch.sum(self.particle_charges, dim=-1)
+        return torch.sum(self.particle_charges * self.survival_probabilities, dim=-1)
 
     @property
-    def num_particles(self) -> torch.Tensor:
-        return len(self.particles)
+    def num_particles(self) -> int:
+        return self.particles.shape[-2]
+
+    def _with_particles(
+        self,
+        particles: torch.Tensor,
+        energy: torch.Tensor,
+        particle_charges: torch.Tensor,
+        survival_probabilities: Optional[torch.Tensor] = None,
+    ) -> "ParticleBeam":
+        """
+        Create a beam with the same storage layout as this one from new particles of
+        shape `(..., N, 7)`.
+        """
+        return ParticleBeam(
+            particles,
+            energy,
+            particle_charges=particle_charges,
+            device=particles.device,
+            dtype=particles.dtype,
+            survival_probabilities=survival_probabilities,
+        )
+
+    def moments(self) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        First and second moments of the beam's distribution in phase space, i.e. the
+        mean of shape `(..., 6)` and the covariance matrix of shape `(..., 6, 6)` of the
+        coordinates `(x, xp, y, yp, s, p)`.
+
+        Particles are weighted by their survival probabilities and, if any of them is
+        charged, by the magnitude of their charges. All moments are computed together
+        in a single weighted reduction over the particles and cached on the beam, until
+        its particles, charges or survival probabilities are replaced or modified in
+        place. All statistical properties of the beam, like `mu_x`, `sigma_x` or
+        `emittance_x`, are derived from them. Like `torch.std`, the covariance is
+        corrected for the bias of estimating it from a sample, using the correction for
+        reliability weights.
+
+        :return: Tuple of the mean and the covariance matrix.
+        """
+        tensors = module_tensors(self)
+        key = tensors_cache_key(tensors)
+        # Cached moments carrying an autograd graph could not be backpropagated through
+        # twice, and caching has no effect in traced graphs
+        use_cache = not (is_tracing() or needs_grad(tensors))
+
+        cache = getattr(self, "_moments_cache", None)
+        if use_cache and cache is not None and cache[0] == key:
+            return cache[2]
+
+        moments = self._compute_moments()
+        if use_cache:
+            # Keeping the tensors alive keeps the identities in the key valid
+            self._moments_cache = (key, tensors, moments)
+        return moments
+
+    def _compute_moments(self) -> tuple[torch.Tensor, torch.Tensor]:
+        coordinates = self._phase_space_coordinates()
+
+        charges = torch.abs(self.particle_charges)
+        weights = torch.where(
+            torch.sum(charges, dim=-1, keepdim=True) > 0, charges, 1.0
+        ).to(coordinates.dtype)
+        if self.survival_probabilities is not None:
+            weights = weights * self.survival_probabilities
+        probabilities = weights / torch.sum(weights, dim=-1, keepdim=True)
+
+        # Moments are accumulated relative to the first particle, which avoids
+        # cancellation when the beam's offset is large compared to its size
+        shift = coordinates[..., :1, :]
+        deviations = coordinates - shift
+        weighted_deviations = deviations * probabilities.unsqueeze(-1)
+        first_moment = torch.sum(weighted_deviations, dim=-2)
+        second_moment = torch.matmul(weighted_deviations.transpose(-2, -1), deviations)
+
+        mean = shift.squeeze(-2) + first_moment
+        bessel_correction = 1 - torch.sum(probabilities**2, dim=-1)
+        cov = (
+            second_moment - first_moment.unsqueeze(-1) * first_moment.unsqueeze(-2)
+        ) / bessel_correction[..., None, None]
+
+        return mean, cov
+
+    def _phase_space_coordinates(self) -> torch.Tensor:
+        """Phase space coordinates of all particles of shape `(..., N, 6)`."""
+        return self.particles[..., :6]
+
+    def _get_coordinate(self, index: int) -> torch.Tensor:
+        """Values of the phase space coordinate `index` of all particles."""
+        return self.particles[..., index]
+
+    def _set_coordinate(self, index: int, value: torch.Tensor) -> None:
+        """Set the phase space coordinate `index` of all particles to `value`."""
+        self.particles[..., index] = value
 
     @property
     def xs(self) -> Optional[torch.Tensor]:
-        return self.particles[:, 0] if self is not Beam.empty else None
+        return self._get_coordinate(0) if self is not Beam.empty else None
 
     @xs.setter
     def xs(self, value: torch.Tensor) -> None:
-        self.particles[:, 0] = value
+        self._set_coordinate(0, value)
 
     @property
     def mu_x(self) -> Optional[torch.Tensor]:
-        return self.xs.mean() if self is not Beam.empty else None
+        return self.moments()[0][..., 0] if self is not Beam.empty else None
 
     @property
     def sigma_x(self) -> Optional[torch.Tensor]:
-        return self.xs.std() if self is not Beam.empty else None
+        return (
+            torch.sqrt(self.moments()[1][..., 0, 0]) if self is not Beam.empty else None
+        )
 
     @property
     def xps(self) -> Optional[torch.Tensor]:
-        return self.particles[:, 1] if self is not Beam.empty else None
+        return self._get_coordinate(1) if self is not Beam.empty else None
 
     @xps.setter
     def xps(self, value: torch.Tensor) -> None:
-        self.particles[:, 1] = value
+        self._set_coordinate(1, value)
 
     @property
     def mu_xp(self) -> Optional[torch.Tensor]:
-        return self.xps.mean() if self is not Beam.empty else None
+        return self.moments()[0][..., 1] if self is not Beam.empty else None
 
     @property
     def sigma_xp(self) -> Optional[torch.Tensor]:
-        return self.xps.std() if self is not Beam.empty else None
+        return (
+            torch.sqrt(self.moments()[1][..., 1, 1]) if self is not Beam.empty else None
+        )
 
     @property
     def ys(self) -> Optional[torch.Tensor]:
-        return self.particles[:, 2] if self is not Beam.empty else None
+        return self._get_coordinate(2) if self is not Beam.empty else None
 
     @ys.setter
     def ys(self, value: torch.Tensor) -> None:
-        self.particles[:, 2] = value
+        self._set_coordinate(2, value)
 
     @property
     def mu_y(self) -> Optional[float]:
-        return self.ys.mean() if self is not Beam.empty else None
+        return self.moments()[0][..., 2] if self is not Beam.empty else None
 
     @property
     def sigma_y(self) -> Optional[torch.Tensor]:
-        return self.ys.std() if self is not Beam.empty else None
+        return (
+            torch.sqrt(self.moments()[1][..., 2, 2]) if self is not Beam.empty else None
+        )
 
     @property
     def yps(self) -> Optional[torch.Tensor]:
-        return self.particles[:, 3] if self is not Beam.empty else None
+        return self._get_coordinate(3) if self is not Beam.empty else None
 
     @yps.setter
     def yps(self, value: torch.Tensor) -> None:
-        self.particles[:, 3] = value
+        self._set_coordinate(3, value)
 
     @property
     def mu_yp(self) -> Optional[torch.Tensor]:
-        return self.yps.mean() if self is not Beam.empty else None
+        return self.moments()[0][..., 3] if self is not Beam.empty else None
 
     @property
     def sigma_yp(self) -> Optional[torch.Tensor]:
-        return self.yps.std() if self is not Beam.empty else None
+        return (
+            torch.sqrt(self.moments()[1][..., 3, 3]) if self is not Beam.empty else None
+        )
 
     @property
     def ss(self) -> Optional[torch.Tensor]:
-        return self.particles[:, 4] if self is not Beam.empty else None
+        return self._get_coordinate(4) if self is not Beam.empty else None
 
     @ss.setter
     def ss(self, value: torch.Tensor) -> None:
-        self.particles[:, 4] = value
+        self._set_coordinate(4, value)
 
     @property
     def mu_s(self) -> Optional[torch.Tensor]:
-        return self.ss.mean() if self is not Beam.empty else None
+        return self.moments()[0][..., 4] if self is not Beam.empty else None
 
     @property
     def sigma_s(self) -> Optional[torch.Tensor]:
-        return self.ss.std() if self is not Beam.empty else None
+        return (
+            torch.sqrt(self.moments()[1][..., 4, 4]) if self is not Beam.empty else None
+        )
 
     @property
     def ps(self) -> Optional[torch.Tensor]:
-        return self.particles[:, 5] if self is not Beam.empty else None
+        return self._get_coordinate(5) if self is not Beam.empty else None
 
     @ps.setter
     def ps(self, value: torch.Tensor) -> None:
-        self.particles[:, 5] = value
+        self._set_coordinate(5, value)
 
     @property
     def mu_p(self) -> Optional[torch.Tensor]:
-        return self.ps.mean() if self is not Beam.empty else None
+        return self.moments()[0][..., 5] if self is not Beam.empty else None
 
     @property
     def sigma_p(self) -> Optional[torch.Tensor]:
-        return self.ps.std() if self is not Beam.empty else None
+        return (
+            torch.sqrt(self.moments()[1][..., 5, 5]) if self is not Beam.empty else None
+        )
 
     @property
     def sigma_xxp(self) -> torch.Tensor:
-        return torch.mean((self.xs - self.mu_x) * (self.xps - self.mu_xp))
+        return self.moments()[1][..., 0, 1]
 
     @property
     def sigma_yyp(self) -> torch.Tensor:
-        return torch.mean((self.ys - self.mu_y) * (self.yps - self.mu_yp))
+        return self.moments()[1][..., 2, 3]
 
     def __repr__(self) -> str:
         return (
@@ -1167,3 +1543,189 @@ class ParticleBeam(Beam):
             f" energy={repr(self.energy)})"
             f" total_charge={repr(self.total_charge)})"
         )
+
+
+class CompactParticleBeam(ParticleBeam):
+    """
+    Beam of charged particles, where each particle is simulated, that stores its
+    particles in a compact structure-of-arrays layout. Instead of `(..., N, 7)` particle
+    vectors, one contiguous array of shape `(..., 6, N)` holds all phase space
+    coordinates. The constant seventh coordinate is not stored. Instead, the affine part
+    of transfer maps is applied as a separate offset.
+
+    Optionally, the coordinates can be stored in reduced precision (e.g.
+    `torch.float16` or `torch.bfloat16`), while all computations on them are carried out
+    in `dtype`. For very large beams this reduces the memory footprint and the memory
+    traffic of tracking. Reduced precision storage pays off on GPUs, where tracking
+    large beams is memory-bandwidth bound. On CPUs the conversions usually cost more
+    than they save.
+
+    Accessing `particles` materialises the conventional `(..., N, 7)` representation in
+    `dtype`, so that the beam can be used wherever a `ParticleBeam` is expected.
+
+    :param particles: List of 7-dimensional particle vectors of shape `(..., N, 7)`,
+        where `...` are optional batch dimensions.
+    :param energy: Energy of the beam in eV.
+    :param particle_charges: Charges of the individual particles in C.
+    :param device: Device to move the beam's particle array to. If set to `"auto"` a
+        CUDA GPU is selected if available. The CPU is used otherwise.
+    :param dtype: Data type in which computations on the beam are carried out.
+    :param storage_dtype: Data type in which the coordinates are stored. Defaults to
+        `dtype`.
+    :param survival_probabilities: Probabilities of the particles to have survived
+        their way through the lattice so far, of shape `(..., N)`. `None` means that
+        all particles have survived.
+    """
+
+    def __init__(
+        self,
+        particles: torch.Tensor,
+        energy: torch.Tensor,
+        particle_charges: Optional[torch.Tensor] = None,
+        device=None,
+        dtype=torch.float32,
+        storage_dtype: Optional[torch.dtype] = None,
+        survival_probabilities: Optional[torch.Tensor] = None,
+    ) -> None:
+        # `ParticleBeam.__init__` is skipped, as it stores the particles as they are
+        Beam.__init__(self)
+        factory_kwargs = {"device": device, "dtype": dtype}
+
+        assert (
+            particles.shape[-2] > 0 and particles.shape[-1] == 7
+        ), "Particle vectors must be 7-dimensional."
+
+        self.storage_dtype = storage_dtype if storage_dtype is not None else dtype
+        self.energy = energy.to(**factory_kwargs)
+        self.particles = particles.to(device=device)
+        self.particle_charges = (
+            particle_charges.to(**factory_kwargs)
+            if particle_charges is not None
+            else torch.zeros(self.num_particles, **factory_kwargs)
+        )
+        self.survival_probabilities = (
+            survival_probabilities.to(**factory_kwargs)
+            if survival_probabilities is not None
+            else None
+        )
+
+    @classmethod
+    def from_particle_beam(
+        cls, beam: ParticleBeam, storage_dtype: Optional[torch.dtype] = None
+    ) -> "CompactParticleBeam":
+        """
+        Convert a `ParticleBeam` to a `CompactParticleBeam`.
+
+        :param beam: Beam to convert.
+        :param storage_dtype: Data type in which the coordinates are stored. Defaults to
+            the data type of `beam`.
+        :return: Compact version of `beam`.
+        """
+        return cls(
+            beam.particles,
+            beam.energy,
+            particle_charges=beam.particle_charges,
+            device=beam.particles.device,
+            dtype=beam.particles.dtype,
+            storage_dtype=storage_dtype,
+            survival_probabilities=beam.survival_probabilities,
+        )
+
+    @classmethod
+    def from_coordinates(
+        cls,
+        coordinates: torch.Tensor,
+        energy: torch.Tensor,
+        particle_charges: torch.Tensor,
+        storage_dtype: Optional[torch.dtype] = None,
+        survival_probabilities: Optional[torch.Tensor] = None,
+    ) -> "CompactParticleBeam":
+        """
+        Create a beam directly from an array of coordinates, without going through the
+        `(..., N, 7)` representation.
+
+        :param coordinates: Phase space coordinates of shape `(..., 6, N)`.
+        :param energy: Energy of the beam in eV. Its data type determines the data type
+            of computations on the beam.
+        :param particle_charges: Charges of the individual particles in C.
+        :param storage_dtype: Data type in which the coordinates are stored. Defaults to
+            the data type of `energy`.
+        :param survival_probabilities: Survival probabilities of the particles of shape
+            `(..., N)`, or `None` if all particles have survived.
+        :return: Beam with the given coordinates.
+        """
+        beam = cls.__new__(cls)
+        Beam.__init__(beam)
+
+        beam.storage_dtype = (
+            storage_dtype if storage_dtype is not None else energy.dtype
+        )
+        beam.energy = energy
+        beam.coordinates = coordinates.to(dtype=beam.storage_dtype)
+        beam.particle_charges = particle_charges
+        beam.survival_probabilities = survival_probabilities
+
+        return beam
+
+    @property
+    def particles(self) -> torch.Tensor:
+        coordinates = self.coordinates.to(self.energy.dtype).transpose(-2, -1)
+        return torch.cat([coordinates, torch.ones_like(coordinates[..., :1])], dim=-1)
+
+    @particles.setter
+    def particles(self, value: torch.Tensor) -> None:
+        self.coordinates = (
+            value[..., :6].transpose(-2, -1).to(self.storage_dtype).contiguous()
+        )
+
+    @property
+    def num_particles(self) -> int:
+        return self.coordinates.shape[-1]
+
+    def _with_particles(
+        self,
+        particles: torch.Tensor,
+        energy: torch.Tensor,
+        particle_charges: torch.Tensor,
+        survival_probabilities: Optional[torch.Tensor] = None,
+    ) -> "CompactParticleBeam":
+        return CompactParticleBeam(
+            particles,
+            energy,
+            particle_charges=particle_charges,
+            device=particles.device,
+            dtype=particles.dtype,
+            storage_dtype=self.storage_dtype,
+            survival_probabilities=survival_probabilities,
+        )
+
+    def _phase_space_coordinates(self) -> torch.Tensor:
+        return self.coordinates.to(self.energy.dtype).transpose(-2, -1)
+
+    def _get_coordinate(self, index: int) -> torch.Tensor:
+        return self.coordinates[..., index, :].to(self.energy.dtype)
+
+    def _set_coordinate(self, index: int, value: torch.Tensor) -> None:
+        self.coordinates[..., index, :] = value
+
+    def transformed_by(self, tm: torch.Tensor) -> "CompactParticleBeam":
+        """
+        Transform the beam by a transfer map. The linear part of the transfer map is
+        applied to the coordinates, and its affine part added as a separate offset.
+
+        :param tm: Transfer map of shape `(..., 7, 7)`.
+        :return: Transformed beam.
+        """
+        coordinates = self.coordinates.to(tm.dtype)
+        if tm.dim() == 2 and coordinates.dim() == 2:
+            # Fuses the matrix product and the offset into a single kernel
+            coordinates = torch.addmm(tm[:6, 6:], tm[:6, :6], coordinates)
+        else:
+            coordinates = torch.matmul(tm[..., :6, :6], coordinates) + tm[..., :6, 6:]
+        return self.from_coordinates(
+            coordinates,
+            self.energy,
+            self.particle_charges,
+            storage_dtype=self.storage_dtype,
+            survival_probabilities=self.survival_probabilities,
+        )
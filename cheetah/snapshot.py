@@ -0,0 +1,189 @@
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Any, Union
+
+import torch
+
+import cheetah
+from cheetah.latticejson import (
+    construct_element,
+    convert_element,
+    convert_segment,
+    parse_segment,
+)
+
+SNAPSHOT_VERSION = "cheetah-snapshot-1"
+
+# Alignment in bytes of the regions of the blob
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    """Round an offset up to the next multiple of `ALIGNMENT`."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _contiguous_strides(shape: list[int]) -> tuple[int, ...]:
+    """Strides of a contiguous tensor of the given shape."""
+    strides = []
+    stride = 1
+    for size in reversed(shape):
+        strides.append(stride)
+        stride *= size
+    return tuple(reversed(strides))
+
+
+def save_cheetah_snapshot(
+    segment: "cheetah.Segment", filename: Union[str, Path]
+) -> None:
+    """
+    Save a Cheetah model to a binary lattice snapshot.
+
+    The snapshot starts with the length of a JSON header as an unsigned 64-bit little
+    endian integer, followed by the header and a blob holding the raw data of all
+    tensors. The header describes the lattice in the same way as LatticeJSON, except
+    that tensors are referenced by their index in the list of tensors of the header,
+    which holds their dtype and their index in the region of the blob for that dtype.
+    Each region holds the scalar tensors of its dtype followed by all other tensors of
+    its dtype, whose shapes are saved in the header. Tensors shared between elements
+    are only saved once.
+
+    :param segment: Cheetah `Segment` to save.
+    :param filename: Name/path of the file to save the snapshot to.
+    """
+    tensors = []
+    tensor_indices = {}
+
+    def feature2reference(value: Any) -> Any:
+        if isinstance(value, cheetah.Element):
+            name, element_class, params = convert_element(value, feature2reference)
+            return {"name": name, "class": element_class, "params": params}
+        elif isinstance(value, torch.Tensor):
+            if id(value) not in tensor_indices:
+                tensor_indices[id(value)] = len(tensors)
+                tensors.append(value)
+            return {"tensor": tensor_indices[id(value)]}
+        else:
+            return value
+
+    elements, lattices = convert_segment(segment, feature2reference)
+
+    # Tensors of the same dtype are packed into one region of the blob, so that they
+    # can all be viewed from a single typed tensor when loading. Scalars, which most
+    # parameters are, are packed first, so that they can all be viewed at once.
+    regions = {}
+    for tensor in tensors:
+        dtype = str(tensor.dtype).removeprefix("torch.")
+        scalars, others = regions.setdefault(dtype, ([], []))
+        (scalars if tensor.dim() == 0 else others).append(tensor)
+    positions = {}
+    for dtype, (scalars, others) in regions.items():
+        for index, tensor in enumerate(scalars + others):
+            positions[id(tensor)] = [dtype, index]
+
+    region_entries = {}
+    region_data = []
+    offset = 0
+    for dtype, (scalars, others) in regions.items():
+        data = torch.cat(
+            [tensor.detach().cpu().reshape(-1) for tensor in scalars + others]
+        )
+        data = data.view(torch.uint8).numpy()
+        offset = _aligned(offset)
+        region_entries[dtype] = {
+            "offset": offset,
+            "num_scalars": len(scalars),
+            "shapes": [list(tensor.shape) for tensor in others],
+        }
+        region_data.append((offset, data))
+        offset += data.nbytes
+
+    header = json.dumps(
+        {
+            "version": SNAPSHOT_VERSION,
+            "root": segment.name if segment.name is not None else "cell",
+            "elements": elements,
+            "lattices": lattices,
+            "regions": region_entries,
+            "tensors": [positions[id(tensor)] for tensor in tensors],
+        }
+    ).encode()
+    # Pad the header with spaces, so that the blob starts aligned
+    header += b" " * (_aligned(8 + len(header)) - 8 - len(header))
+
+    with open(filename, "wb") as f:
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        blob_start = f.tell()
+        for offset, data in region_data:
+            f.seek(blob_start + offset)
+            f.write(data.tobytes())
+
+
+def load_cheetah_snapshot(filename: Union[str, Path]) -> "cheetah.Segment":
+    """
+    Load a Cheetah model from a binary lattice snapshot.
+
+    The snapshot is memory-mapped and the parameters of all elements point into the
+    mapped file, so that loading does not copy any parameter data, and processes
+    loading the same snapshot share its pages. Changes to the parameters are not
+    written back to the file. Unlike views, every parameter has its own version
+    counter, so that changing one parameter in place does not look like a change of
+    all others to caches keyed by version counters.
+
+    :param filename: Name/path of the file to load the snapshot from.
+    :return: Loaded Cheetah `Segment`.
+    """
+    with open(filename, "rb") as f:
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length))
+
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported lattice snapshot version {header.get('version')} in "
+            f"{filename}."
+        )
+
+    blob_start = 8 + header_length
+    mapped = torch.from_file(
+        str(filename), shared=False, size=os.path.getsize(filename), dtype=torch.uint8
+    )
+    storage = mapped.untyped_storage()
+    regions = {}
+    for dtype_name, region in header["regions"].items():
+        dtype = getattr(torch, dtype_name)
+        # Offsets into the storage are counted in elements of the dtype
+        offset = (blob_start + region["offset"]) // torch.empty(
+            0, dtype=dtype
+        ).element_size()
+        tensors = [
+            torch.empty(0, dtype=dtype).set_(storage, offset + index, (), ())
+            for index in range(region["num_scalars"])
+        ]
+        offset += region["num_scalars"]
+        for shape in region["shapes"]:
+            tensors.append(
+                torch.empty(0, dtype=dtype).set_(
+                    storage, offset, shape, _contiguous_strides(shape)
+                )
+            )
+            offset += torch.Size(shape).numel()
+        regions[dtype_name] = tensors
+    tensors = [regions[dtype_name][index] for dtype_name, index in header["tensors"]]
+
+    def reference2feature(value: Any) -> Any:
+        if isinstance(value, dict) and "tensor" in value:
+            return tensors[value["tensor"]]
+        elif isinstance(value, dict):
+            params = {
+                key: reference2feature(param) for key, param in value["params"].items()
+            }
+            return construct_element(
+                getattr(cheetah, value["class"]), value["name"], params
+            )
+        else:
+            return value
+
+    return parse_segment(header["root"], header, convert_value=reference2feature)
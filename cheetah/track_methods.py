@@ -1,36 +1,330 @@
 """Utility functions for creating transfer maps for the elements."""
 
+from functools import lru_cache
 from typing import Optional
 
 import torch
-from scipy import constants
+
+from cheetah import constants
+from cheetah.utils import is_tracing
 
 REST_ENERGY = torch.tensor(
     constants.electron_mass * constants.speed_of_light**2 / constants.elementary_charge
 )  # Electron mass
 
 
+@lru_cache(maxsize=None)
+def _flat_indices(positions: tuple[tuple[int, int], ...], device) -> torch.Tensor:
+    """Cached flat indices into a 7x7 matrix for the given `(row, column)` tuples."""
+    return torch.tensor([7 * i + j for i, j in positions], device=device)
+
+
+@lru_cache(maxsize=None)
+def _flat_identity(device, dtype) -> torch.Tensor:
+    """Cached flattened 7x7 identity matrix. Must not be modified in place."""
+    return torch.eye(7, device=device, dtype=dtype).view(49)
+
+
+def assemble_transfer_map(
+    entries: dict[tuple[int, int], torch.Tensor],
+    device=None,
+    dtype=torch.float32,
+) -> torch.Tensor:
+    """
+    Assemble a transfer map from an identity matrix and the given non-trivial entries.
+
+    Instead of assigning each entry to a matrix individually, all entries are stacked
+    and scattered into a preallocated identity buffer in one operation. This keeps the
+    construction differentiable, free of Python control flow and fast on GPUs.
+
+    :param entries: Mapping from `(row, column)` of a matrix entry to its value tensor.
+        Values may have arbitrary batch dimensions, which are broadcast against each
+        other.
+    :param device: Device of the returned transfer map.
+    :param dtype: Data type of the returned transfer map.
+    :return: Transfer map of shape `(..., 7, 7)`.
+    """
+    values = torch.stack(torch.broadcast_tensors(*entries.values()), dim=-1).to(
+        device=device, dtype=dtype
+    )
+    batch_shape = values.shape[:-1]
+
+    # The caches only save work in eager mode, traced graphs hold the results anyway
+    flat_indices = _flat_indices.__wrapped__ if is_tracing() else _flat_indices
+    flat_identity = _flat_identity.__wrapped__ if is_tracing() else _flat_identity
+    indices = flat_indices(tuple(entries.keys()), values.device)
+    identity = flat_identity(values.device, values.dtype)
+
+    tm = torch.scatter(
+        identity.expand(*batch_shape, 49),
+        dim=-1,
+        index=indices.expand(*batch_shape, len(entries)),
+        src=values,
+    )
+    return tm.view(*batch_shape, 7, 7)
+
+
+@lru_cache(maxsize=None)
+def _flat_tensor_indices(
+    positions: tuple[tuple[int, int, int], ...], device
+) -> torch.Tensor:
+    """Cached flat indices into a 7x7x7 tensor for the given `(i, j, k)` tuples."""
+    return torch.tensor([49 * i + 7 * j + k for i, j, k in positions], device=device)
+
+
+@lru_cache(maxsize=None)
+def _monomial_indices(device, dtype) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Cached row and column indices of the 21 distinct quadratic monomials of the six
+    phase space coordinates, and whether each of them is off the diagonal.
+    """
+    rows, columns = torch.triu_indices(6, 6, device=device)
+    return rows, columns, (rows != columns).to(dtype)
+
+
+def assemble_second_order_tensor(
+    entries: dict[tuple[int, int, int], torch.Tensor],
+    device=None,
+    dtype=torch.float32,
+) -> torch.Tensor:
+    """
+    Assemble a second-order transfer tensor `T` from the given non-zero entries, such
+    that coordinate `i` picks up `T[i, j, k] * x[j] * x[k]`, summed over `j` and `k`.
+
+    :param entries: Mapping from `(i, j, k)` of a tensor entry to its value tensor.
+        Values may have arbitrary batch dimensions, which are broadcast against each
+        other.
+    :param device: Device of the returned tensor.
+    :param dtype: Data type of the returned tensor.
+    :return: Second-order transfer tensor of shape `(..., 7, 7, 7)`.
+    """
+    values = torch.stack(torch.broadcast_tensors(*entries.values()), dim=-1).to(
+        device=device, dtype=dtype
+    )
+    batch_shape = values.shape[:-1]
+
+    flat_indices = (
+        _flat_tensor_indices.__wrapped__ if is_tracing() else _flat_tensor_indices
+    )
+    indices = flat_indices(tuple(entries.keys()), values.device)
+
+    T = torch.scatter(
+        values.new_zeros(*batch_shape, 343),
+        dim=-1,
+        index=indices.expand(*batch_shape, len(entries)),
+        src=values,
+    )
+    return T.view(*batch_shape, 7, 7, 7)
+
+
+def _canonical_second_order_map(
+    R: torch.Tensor, T: torch.Tensor
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Move all terms of `T` that involve the constant seventh coordinate into `R`, such
+    that `T` only holds terms that are quadratic in the six phase space coordinates.
+    """
+    is_coordinate = torch.ones(7, device=T.device, dtype=T.dtype)
+    is_coordinate[6] = 0.0
+
+    linear = T[..., :, :, 6] + T[..., :, 6, :] * is_coordinate
+    quadratic = T * is_coordinate.unsqueeze(-1) * is_coordinate
+    return R + linear, quadratic
+
+
+def concatenate_second_order_maps(
+    maps: list[tuple[torch.Tensor, Optional[torch.Tensor]]],
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Concatenate consecutive second-order maps into a single second-order map, dropping
+    all terms of third and fourth order.
+
+    Constant offsets in the linear maps, e.g. from misalignments, are taken into
+    account exactly, i.e. the terms of the downstream map that feed down to linear
+    and constant order are moved into the resulting linear map.
+
+    :param maps: Sequence of `(R, T)` tuples in order of tracking, with transfer maps
+        `R` of shape `(..., 7, 7)` and second-order tensors `T` of shape
+        `(..., 7, 7, 7)`, or `None` for linear maps.
+    :return: Transfer map and second-order tensor of the concatenated map.
+    """
+    R, T = maps[0]
+    R, T = (
+        _canonical_second_order_map(R, T)
+        if T is not None
+        else (R, R.new_zeros(7, 7, 7))
+    )
+    for R_next, T_next in maps[1:]:
+        if T_next is None:
+            T = torch.einsum("...il,...ljk->...ijk", R_next, T)
+            R = torch.matmul(R_next, R)
+            continue
+
+        # The constant part of the coordinates entering the next map
+        offset = R[..., :, 6]
+        T_offset = torch.einsum("...ilm,...l->...im", T_next, offset) + torch.einsum(
+            "...iml,...l->...im", T_next, offset
+        )
+        T = torch.einsum("...il,...ljk->...ijk", R_next + T_offset, T) + torch.einsum(
+            "...ilm,...lj,...mk->...ijk", T_next, R, R
+        )
+        R, T = _canonical_second_order_map(torch.matmul(R_next, R), T)
+
+    return R, T
+
+
+def second_order_terms(T: torch.Tensor, particles: torch.Tensor) -> torch.Tensor:
+    """
+    Evaluate the second-order terms `T[i, j, k] * x[j] * x[k]` of a second-order map
+    for all particles. The 21 distinct quadratic monomials of the phase space
+    coordinates are contracted with the symmetrised tensor in a single batched matrix
+    product.
+
+    :param T: Second-order tensor of shape `(..., 7, 7, 7)` without terms involving the
+        constant coordinate.
+    :param particles: Particles of shape `(..., num_particles, 7)`.
+    :return: Second-order terms of shape `(..., num_particles, 7)`.
+    """
+    monomial_indices = (
+        _monomial_indices.__wrapped__ if is_tracing() else _monomial_indices
+    )
+    rows, columns, is_off_diagonal = monomial_indices(particles.device, T.dtype)
+
+    coefficients = T[..., :, rows, columns] + T[..., :, columns, rows] * is_off_diagonal
+
+    # Products of contiguous rows of coordinates are several times faster than
+    # gathering columns of the particles
+    coordinates = particles[..., :6].transpose(-2, -1).contiguous()
+    monomials = torch.cat(
+        [coordinates[..., j : j + 1, :] * coordinates[..., j:, :] for j in range(6)],
+        dim=-2,
+    )
+
+    return torch.matmul(coefficients, monomials).transpose(-2, -1)
+
+
+def second_order_moments(
+    R: torch.Tensor, T: torch.Tensor, mu: torch.Tensor, cov: torch.Tensor
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Propagate the mean and covariance of a Gaussian beam through the second-order map
+    `(R, T)`. The fourth moments that enter the outgoing covariance are closed by
+    assuming that the incoming beam is Gaussian, for which they are determined by its
+    covariance. The result is exact for a Gaussian beam tracked through the truncated
+    map.
+
+    :param R: Transfer map of shape `(..., 7, 7)`.
+    :param T: Second-order tensor of shape `(..., 7, 7, 7)`.
+    :param mu: Mean of the incoming beam of shape `(..., 7)`.
+    :param cov: Covariance of the incoming beam of shape `(..., 7, 7)`, vanishing in the
+        constant coordinate.
+    :return: Tuple of the outgoing mean of shape `(..., 7)` and the outgoing covariance
+        of shape `(..., 7, 7)`.
+    """
+    S = 0.5 * (T + T.transpose(-2, -1))
+    S_mu = torch.matmul(S, mu.unsqueeze(-2).unsqueeze(-1)).squeeze(-1)
+    S_cov = torch.matmul(S, cov.unsqueeze(-3))
+
+    # Each coordinate picks up the quadratic form at the mean and its expected value
+    # over the fluctuations, which is the trace of `S[i] @ cov`
+    outgoing_mu = (
+        torch.matmul(R, mu.unsqueeze(-1)).squeeze(-1)
+        + torch.matmul(S_mu, mu.unsqueeze(-1)).squeeze(-1)
+        + S_cov.diagonal(dim1=-2, dim2=-1).sum(dim=-1)
+    )
+
+    # Fluctuations are transformed linearly by the Jacobian at the mean. The remaining
+    # quadratic fluctuations are uncorrelated with the linear ones and, by Isserlis'
+    # theorem, have the covariance `2 * trace(S[i] @ cov @ S[j] @ cov)`.
+    jacobian = R + 2 * S_mu
+    outgoing_cov = torch.matmul(
+        jacobian, torch.matmul(cov, jacobian.transpose(-2, -1))
+    ) + 2 * torch.einsum("...iab,...jba->...ij", S_cov, S_cov)
+
+    return outgoing_mu, outgoing_cov
+
+
+def compute_relativistic_factors(
+    energy: torch.Tensor,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Compute the relativistic factors of a beam with the given energy. An energy of zero
+    is treated like an ultrarelativistic beam, i.e. `igamma2 = 0` and `beta = 1`.
+
+    :param energy: Energy of the beam in eV.
+    :return: Tuple of relativistic gamma, 1 / gamma**2 and relativistic beta.
+    """
+    gamma = energy / REST_ENERGY.to(device=energy.device, dtype=energy.dtype)
+    is_zero = gamma == 0
+    igamma2 = torch.where(is_zero, 0.0, 1 / torch.where(is_zero, 1.0, gamma) ** 2)
+    beta = torch.sqrt(1 - igamma2)
+
+    return gamma, igamma2, beta
+
+
+def focusing_functions(
+    k: torch.Tensor, length: torch.Tensor
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Compute the principal trajectory functions of a plane with focusing strength `k`,
+    i.e. `C = cos(sqrt(k) * L)`, `S = sin(sqrt(k) * L) / sqrt(k)`, `(1 - C) / k` and
+    `(L - S) / k`.
+
+    These are evaluated in real arithmetic for focusing (`k > 0`) and defocusing
+    (`k < 0`) planes. A vanishing `k` is shifted by a tiny amount, at which the closed
+    forms already equal their drift limit, so that no data-dependent branch is needed
+    and gradients with respect to `k` stay finite at `k = 0`.
+
+    :param k: Focusing strength in 1/m^2.
+    :param length: Length in meters.
+    :return: Tuple of `C`, `S`, `(1 - C) / k` and `(L - S) / k`.
+    """
+    k = torch.where(k == 0, k + 1e-12, k)
+    sqrt_k = torch.sqrt(torch.abs(k))
+    phase = sqrt_k * length
+    is_focusing = k > 0
+
+    cos = torch.where(is_focusing, torch.cos(phase), torch.cosh(phase))
+    sin = torch.where(is_focusing, torch.sin(phase), torch.sinh(phase)) / sqrt_k
+    # Writing 1 - C as 2 * sin(phase / 2)**2 avoids cancellation for small phases
+    half_phase = phase / 2
+    one_minus_cos = (
+        2
+        * torch.where(
+            is_focusing, torch.sin(half_phase) ** 2, -torch.sinh(half_phase) ** 2
+        )
+        / k
+    )
+    length_minus_sin = (length - sin) / k
+
+    return cos, sin, one_minus_cos, length_minus_sin
+
+
 def rotation_matrix(angle: torch.Tensor) -> torch.Tensor:
     """Rotate the transfer map in x-y plane
 
     :param angle: Rotation angle in rad, for example `angle = np.pi/2` for vertical =
-        dipole.
-    :return: Rotation matrix to be multiplied to the element's transfer matrix.
+        dipole. May have arbitrary leading batch dimensions.
+    :return: Rotation matrix to be multiplied to the element's transfer matrix of shape
+        `(..., 7, 7)`.
     """
     cs = torch.cos(angle)
     sn = torch.sin(angle)
 
-    tm = torch.eye(7, dtype=angle.dtype, device=angle.device)
-    tm[0, 0] = cs
-    tm[0, 2] = sn
-    tm[1, 1] = cs
-    tm[1, 3] = sn
-    tm[2, 0] = -sn
-    tm[2, 2] = cs
-    tm[3, 1] = -sn
-    tm[3, 3] = cs
-
-    return tm
+    return assemble_transfer_map(
+        {
+            (0, 0): cs,
+            (0, 2): sn,
+            (1, 1): cs,
+            (1, 3): sn,
+            (2, 0): -sn,
+            (2, 2): cs,
+            (3, 1): -sn,
+            (3, 3): cs,
+        },
+        device=angle.device,
+        dtype=angle.dtype,
+    )
 
 
 def base_rmatrix(
@@ -43,12 +337,15 @@ def base_rmatrix(
     """
     Create a universal transfer matrix for a beamline element.
 
+    All parameters may have leading batch dimensions, which are broadcast against each
+    other.
+
     :param length: Length of the element in m.
     :param k1: Quadrupole strength in 1/m**2.
     :param hx: Curvature (1/radius) of the element in 1/m**2.
     :param tilt: Roation of the element relative to the longitudinal axis in rad.
     :param energy: Beam energy in eV.
-    :return: Transfer matrix for the element.
+    :return: Transfer matrix for the element of shape `(..., 7, 7)`.
     """
     device = length.device
     dtype = length.dtype
@@ -58,65 +355,577 @@ def base_rmatrix(
         energy if energy is not None else torch.tensor(0.0, device=device, dtype=dtype)
     )
 
-    gamma = energy / REST_ENERGY.to(device=device, dtype=dtype)
-    igamma2 = (
-        1 / gamma**2 if gamma != 0 else torch.tensor(0.0, device=device, dtype=dtype)
-    )
+    _, igamma2, beta = compute_relativistic_factors(energy)
 
-    beta = torch.sqrt(1 - igamma2)
-
-    if k1 == 0:
-        k1 = k1 + torch.tensor(
-            1e-12, device=device, dtype=dtype
-        )  # Avoid division by zero
     kx2 = k1 + hx**2
     ky2 = -k1
-    kx = torch.sqrt(torch.complex(kx2, torch.tensor(0.0, device=device, dtype=dtype)))
-    ky = torch.sqrt(torch.complex(ky2, torch.tensor(0.0, device=device, dtype=dtype)))
-    cx = torch.cos(kx * length).real
-    cy = torch.cos(ky * length).real
-    sy = (torch.sin(ky * length) / ky).real if ky != 0 else length
-
-    sx = (torch.sin(kx * length) / kx).real
-    dx = hx / kx2 * (1.0 - cx)
-    r56 = hx**2 * (length - sx) / kx2 / beta**2
-
-    r56 = r56 - length / beta**2 * igamma2
-
-    R = torch.eye(7, dtype=dtype, device=device)
-    R[0, 0] = cx
-    R[0, 1] = sx
-    R[0, 5] = dx / beta
-    R[1, 0] = -kx2 * sx
-    R[1, 1] = cx
-    R[1, 5] = sx * hx / beta
-    R[2, 2] = cy
-    R[2, 3] = sy
-    R[3, 2] = -ky2 * sy
-    R[3, 3] = cy
-    R[4, 0] = sx * hx / beta
-    R[4, 1] = dx / beta
-    R[4, 5] = r56
-
-    # Rotate the R matrix for skew / vertical magnets
-    if tilt != 0:
-        R = torch.matmul(torch.matmul(rotation_matrix(-tilt), R), rotation_matrix(tilt))
+    cx, sx, one_minus_cx_over_kx2, length_minus_sx_over_kx2 = focusing_functions(
+        kx2, length
+    )
+    cy, sy, _, _ = focusing_functions(ky2, length)
+
+    dx = hx * one_minus_cx_over_kx2
+    r56 = hx**2 * length_minus_sx_over_kx2 / beta**2 - length / beta**2 * igamma2
+
+    R = assemble_transfer_map(
+        {
+            (0, 0): cx,
+            (0, 1): sx,
+            (0, 5): dx / beta,
+            (1, 0): -kx2 * sx,
+            (1, 1): cx,
+            (1, 5): sx * hx / beta,
+            (2, 2): cy,
+            (2, 3): sy,
+            (3, 2): -ky2 * sy,
+            (3, 3): cy,
+            (4, 0): sx * hx / beta,
+            (4, 1): dx / beta,
+            (4, 5): r56,
+        },
+        device=device,
+        dtype=dtype,
+    )
+
+    # Rotate the R matrix for skew / vertical magnets. For untilted magnets, the
+    # rotation matrices are identities, which is cheaper than a data-dependent branch.
+    rotation_out, rotation_in = rotation_matrix(torch.stack([-tilt, tilt])).unbind(0)
+    R = torch.matmul(torch.matmul(rotation_out, R), rotation_in)
     return R
 
 
+# Fractions of a step taken by the drifts and kicks of the symplectic integrators, in
+# the order in which they are applied. Yoshida's fourth-order scheme is composed of
+# three drift-kick-drift steps.
+_YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+_YOSHIDA_W0 = 1 - 2 * _YOSHIDA_W1
+INTEGRATOR_COEFFICIENTS = {
+    "drift_kick_drift": ((0.5, 0.5), (1.0,)),
+    "yoshida": (
+        (
+            _YOSHIDA_W1 / 2,
+            (_YOSHIDA_W0 + _YOSHIDA_W1) / 2,
+            (_YOSHIDA_W0 + _YOSHIDA_W1) / 2,
+            _YOSHIDA_W1 / 2,
+        ),
+        (_YOSHIDA_W1, _YOSHIDA_W0, _YOSHIDA_W1),
+    ),
+}
+
+
+def assemble_generator(
+    entries: dict[tuple[int, int], torch.Tensor],
+    device=None,
+    dtype=torch.float32,
+) -> torch.Tensor:
+    """
+    Assemble the generator `A` of a linear map `exp(s * A)` along the longitudinal
+    position `s` from the given non-zero entries.
+
+    :param entries: Mapping from `(row, column)` of a matrix entry to its value tensor.
+        Values may have arbitrary batch dimensions, which are broadcast against each
+        other.
+    :param device: Device of the returned generator.
+    :param dtype: Data type of the returned generator.
+    :return: Generator of shape `(..., 7, 7)`.
+    """
+    tm = assemble_transfer_map(entries, device=device, dtype=dtype)
+    return tm - torch.eye(7, device=tm.device, dtype=tm.dtype)
+
+
+def symplectic_map(
+    drift_generator: torch.Tensor,
+    kick_generator: torch.Tensor,
+    length: torch.Tensor,
+    num_steps: int = 1,
+    method: str = "drift_kick_drift",
+) -> torch.Tensor:
+    """
+    Transfer map of a thick element, whose generator is split into a drift and a kick
+    part, integrated with a symplectic splitting scheme.
+
+    The element is divided into `num_steps` equal steps, each of which alternates
+    drifts and thin kicks according to `method`, either `"drift_kick_drift"` (second
+    order) or `"yoshida"` (fourth order). The drifts and kicks of one step are
+    multiplied into a single map once, and all steps are fused by repeated squaring,
+    such that the cost is logarithmic in `num_steps` and independent of the number of
+    particles.
+
+    :param drift_generator: Generator of the drift of shape `(..., 7, 7)`.
+    :param kick_generator: Generator of the kicks of shape `(..., 7, 7)`.
+    :param length: Length of the element in m.
+    :param num_steps: Number of integration steps.
+    :param method: Splitting scheme of each step.
+    :return: Transfer map of shape `(..., 7, 7)`.
+    """
+    if method not in INTEGRATOR_COEFFICIENTS:
+        raise ValueError(f"Invalid integration method {method}")
+    drift_fractions, kick_fractions = INTEGRATOR_COEFFICIENTS[method]
+
+    step_length = (length / num_steps).unsqueeze(-1).unsqueeze(-1).unsqueeze(-1)
+    drifts = torch.linalg.matrix_exp(
+        drift_generator.unsqueeze(-3)
+        * step_length
+        * length.new_tensor(drift_fractions).view(-1, 1, 1)
+    )
+    kicks = torch.linalg.matrix_exp(
+        kick_generator.unsqueeze(-3)
+        * step_length
+        * length.new_tensor(kick_fractions).view(-1, 1, 1)
+    )
+
+    step = drifts[..., 0, :, :]
+    for i in range(len(kick_fractions)):
+        step = torch.matmul(
+            drifts[..., i + 1, :, :], torch.matmul(kicks[..., i, :, :], step)
+        )
+
+    return torch.linalg.matrix_power(step, num_steps)
+
+
+def base_generators(
+    k1: torch.Tensor, hx: torch.Tensor, energy: Optional[torch.Tensor] = None
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Generators of the drift and the kicks of an element with quadrupole strength `k1`
+    and curvature `hx`, such that `exp(length * (drift + kick))` equals the transfer
+    map from `base_rmatrix` without tilt. The kicks only change the transverse momenta
+    and the longitudinal position by amounts that depend on the transverse positions
+    and the energy deviation, so they are exact thin lenses.
+
+    :param k1: Quadrupole strength in 1/m**2.
+    :param hx: Curvature (1/radius) of the element in 1/m**2.
+    :param energy: Beam energy in eV.
+    :return: Tuple of the drift and kick generators of shape `(..., 7, 7)`.
+    """
+    device = k1.device
+    dtype = k1.dtype
+
+    energy = (
+        energy if energy is not None else torch.tensor(0.0, device=device, dtype=dtype)
+    )
+    _, igamma2, beta = compute_relativistic_factors(energy)
+
+    one = torch.ones_like(igamma2)
+    drift = assemble_generator(
+        {(0, 1): one, (2, 3): one, (4, 5): -igamma2 / beta**2},
+        device=device,
+        dtype=dtype,
+    )
+    kick = assemble_generator(
+        {
+            (1, 0): -(k1 + hx**2),
+            (1, 5): hx / beta,
+            (3, 2): k1,
+            (4, 0): hx / beta,
+        },
+        device=device,
+        dtype=dtype,
+    )
+    return drift, kick
+
+
+def integrated_rmatrix(
+    length: torch.Tensor,
+    k1: torch.Tensor,
+    hx: torch.Tensor,
+    tilt: Optional[torch.Tensor] = None,
+    energy: Optional[torch.Tensor] = None,
+    num_steps: int = 1,
+    method: str = "drift_kick_drift",
+) -> torch.Tensor:
+    """
+    Create the transfer matrix of a beamline element like `base_rmatrix`, but
+    integrated with a symplectic splitting scheme in `num_steps` steps of drifts and
+    thin kicks. See `symplectic_map`.
+
+    :param length: Length of the element in m.
+    :param k1: Quadrupole strength in 1/m**2.
+    :param hx: Curvature (1/radius) of the element in 1/m**2.
+    :param tilt: Roation of the element relative to the longitudinal axis in rad.
+    :param energy: Beam energy in eV.
+    :param num_steps: Number of integration steps.
+    :param method: Splitting scheme of each step, either `"drift_kick_drift"` or
+        `"yoshida"`.
+    :return: Transfer matrix for the element of shape `(..., 7, 7)`.
+    """
+    tilt = tilt if tilt is not None else torch.zeros_like(length)
+
+    drift, kick = base_generators(k1, hx, energy)
+    R = symplectic_map(drift, kick, length, num_steps=num_steps, method=method)
+
+    rotation_out, rotation_in = rotation_matrix(torch.stack([-tilt, tilt])).unbind(0)
+    return torch.matmul(torch.matmul(rotation_out, R), rotation_in)
+
+
+def _second_order_integrals(
+    k: torch.Tensor,
+    length: torch.Tensor,
+    cos: torch.Tensor,
+    sin: torch.Tensor,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Compute the integrals `J2` and `J3` of the principal trajectory functions that
+    enter the second-order map of a combined-function magnet. Their closed forms
+    cancel catastrophically for weak focusing, where their Taylor series are used
+    instead.
+
+    :param k: Focusing strength in 1/m^2.
+    :param length: Length in meters.
+    :param cos: Principal trajectory function `C` of `k` and `length`.
+    :param sin: Principal trajectory function `S` of `k` and `length`.
+    :return: Tuple of `J2` and `J3`.
+    """
+    is_weak = torch.abs(k) * length**2 < 0.1
+    safe_k = torch.where(is_weak, torch.ones_like(k), k)
+
+    j2_closed = (3 * length - 4 * sin + sin * cos) / (2 * safe_k**2)
+    j3_closed = (15 * length - 22 * sin + 9 * sin * cos - 2 * sin * cos**2) / (
+        6 * safe_k**3
+    )
+    j2_series = length**5 / 20 - k * length**7 / 168 + k**2 * length**9 / 2880
+    j3_series = length**7 / 56 - k * length**9 / 288 + 7 * k**2 * length**11 / 21120
+
+    return (
+        torch.where(is_weak, j2_series, j2_closed),
+        torch.where(is_weak, j3_series, j3_closed),
+    )
+
+
+def base_ttensor(
+    length: torch.Tensor,
+    k1: torch.Tensor,
+    hx: torch.Tensor,
+    tilt: Optional[torch.Tensor] = None,
+    energy: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """
+    Create the second-order transfer tensor of a beamline element, matching the
+    universal first-order transfer matrix of `base_rmatrix`. The terms follow the
+    second-order map of MAD for a combined-function magnet without sextupole
+    component, as implemented in Ocelot.
+
+    All parameters may have leading batch dimensions, which are broadcast against each
+    other.
+
+    :param length: Length of the element in m.
+    :param k1: Quadrupole strength in 1/m**2.
+    :param hx: Curvature (1/radius) of the element in 1/m**2.
+    :param tilt: Roation of the element relative to the longitudinal axis in rad.
+    :param energy: Beam energy in eV.
+    :return: Second-order transfer tensor for the element of shape `(..., 7, 7, 7)`.
+    """
+    device = length.device
+    dtype = length.dtype
+
+    tilt = tilt if tilt is not None else torch.tensor(0.0, device=device, dtype=dtype)
+    energy = (
+        energy if energy is not None else torch.tensor(0.0, device=device, dtype=dtype)
+    )
+
+    _, igamma2, beta = compute_relativistic_factors(energy)
+    beta2 = beta**2
+    beta3 = beta2 * beta
+
+    h = hx
+    h2 = h**2
+    h3 = h2 * h
+    kx2 = k1 + h2
+    ky2 = -k1
+    cx, sx, dx, j1 = focusing_functions(kx2, length)
+    cy, sy, _, _ = focusing_functions(ky2, length)
+    j2, j3 = _second_order_integrals(kx2, length, cx, sx)
+    sx2 = sx**2
+    dx2 = dx**2
+    khk = 2 * h * k1
+
+    t111 = -1 / 6 * khk * (sx2 + dx) - 0.5 * h * kx2 * sx2
+    t112 = -1 / 6 * khk * sx * dx + 0.5 * h * sx * cx
+    t122 = -1 / 6 * khk * dx2 + 0.5 * h * dx * cx
+    t116 = (
+        -h / 12 / beta * khk * (3 * sx * j1 - dx2)
+        + 0.5 * h2 / beta * sx2
+        + 0.25 / beta * k1 * length * sx
+    )
+    t126 = (
+        -h / 12 / beta * khk * (sx * dx2 - 2 * cx * j2)
+        + 0.25 * h2 / beta * (sx * dx + cx * j1)
+        - 0.25 / beta * (sx + length * cx)
+    )
+    t166 = (
+        -h2 / 6 / beta2 * khk * (dx2 * dx - 2 * sx * j2)
+        + 0.5 * h3 / beta2 * sx * j1
+        - 0.5 * h / beta2 * length * sx
+        - 0.5 * h / beta2 * igamma2 * dx
+    )
+    t133 = 0.5 * h * k1 * dx
+    t144 = -0.5 * h * dx
+
+    t211 = -1 / 6 * khk * sx * (1 + 2 * cx)
+    t212 = -1 / 6 * khk * dx * (1 + 2 * cx)
+    t222 = -1 / 3 * khk * sx * dx - 0.5 * h * sx
+    t216 = -h / 12 / beta * khk * (3 * cx * j1 + sx * dx) - 0.25 / beta * k1 * (
+        sx - length * cx
+    )
+    t226 = -h / 12 / beta * khk * (3 * sx * j1 + dx2) + 0.25 / beta * k1 * length * sx
+    t266 = (
+        -h2 / 6 / beta2 * khk * (sx * dx2 - 2 * cx * j2)
+        - 0.5 * h / beta2 * k1 * (cx * j1 - sx * dx)
+        - 0.5 * h / beta2 * igamma2 * sx
+    )
+    t233 = 0.5 * h * k1 * sx
+    t244 = -0.5 * h * sx
+
+    t313 = 0.5 * h * k1 * sx * sy
+    t314 = 0.5 * h * sx * cy
+    t323 = 0.5 * h * k1 * dx * sy
+    t324 = 0.5 * h * dx * cy
+    t336 = 0.5 * h2 / beta * k1 * j1 * sy - 0.25 / beta * k1 * length * sy
+    t346 = 0.5 * h2 / beta * j1 * cy - 0.25 / beta * (sy + length * cy)
+
+    t413 = 0.5 * h * k1 * sx * cy
+    t414 = 0.5 * h * k1 * sx * sy
+    t423 = 0.5 * h * k1 * dx * cy
+    t424 = 0.5 * h * k1 * dx * sy
+    t436 = 0.5 * h2 / beta * k1 * j1 * cy + 0.25 / beta * k1 * (sy - length * cy)
+    t446 = 0.5 * h2 / beta * k1 * j1 * sy - 0.25 / beta * k1 * length * sy
+
+    t511 = h / 12 / beta * khk * (sx * dx + 3 * j1) - 0.25 / beta * k1 * (
+        length - sx * cx
+    )
+    t512 = h / 12 / beta * khk * dx2 + 0.25 / beta * k1 * sx2
+    t522 = h / 6 / beta * khk * j2 - 0.5 / beta * sx - 0.25 / beta * k1 * (j1 - sx * dx)
+    t516 = (
+        h2 / 12 / beta2 * khk * (3 * dx * j1 - 4 * j2)
+        + 0.25 * h / beta2 * k1 * j1 * (1 + cx)
+        + 0.5 * h / beta2 * igamma2 * sx
+    )
+    t526 = (
+        h2 / 12 / beta2 * khk * (dx * dx2 - 2 * sx * j2)
+        + 0.25 * h / beta2 * k1 * sx * j1
+        + 0.5 * h / beta2 * igamma2 * dx
+    )
+    t566 = (
+        h3 / 6 / beta3 * khk * (3 * j3 - 2 * dx * j2)
+        + h2 / 6 / beta3 * k1 * (sx * dx2 - j2 * (1 + 2 * cx))
+        + 1.5 / beta3 * igamma2 * (h2 * j1 - length)
+    )
+    t533 = -0.5 * h2 / beta * k1 * j1 + 0.25 / beta * k1 * (length - cy * sy)
+    t534 = -0.25 / beta * k1 * sy**2
+    t544 = 0.5 * h2 / beta * j1 - 0.25 / beta * (length + cy * sy)
+
+    # Mixed terms are stored once, with the factor of two of the symmetric sum
+    T = assemble_second_order_tensor(
+        {
+            (0, 0, 0): t111,
+            (0, 0, 1): 2 * t112,
+            (0, 1, 1): t122,
+            (0, 0, 5): 2 * t116,
+            (0, 1, 5): 2 * t126,
+            (0, 5, 5): t166,
+            (0, 2, 2): t133,
+            (0, 3, 3): t144,
+            (1, 0, 0): t211,
+            (1, 0, 1): 2 * t212,
+            (1, 1, 1): t222,
+            (1, 0, 5): 2 * t216,
+            (1, 1, 5): 2 * t226,
+            (1, 5, 5): t266,
+            (1, 2, 2): t233,
+            (1, 3, 3): t244,
+            (2, 0, 2): 2 * t313,
+            (2, 0, 3): 2 * t314,
+            (2, 1, 2): 2 * t323,
+            (2, 1, 3): 2 * t324,
+            (2, 2, 5): 2 * t336,
+            (2, 3, 5): 2 * t346,
+            (3, 0, 2): 2 * t413,
+            (3, 0, 3): 2 * t414,
+            (3, 1, 2): 2 * t423,
+            (3, 1, 3): 2 * t424,
+            (3, 2, 5): 2 * t436,
+            (3, 3, 5): 2 * t446,
+            (4, 0, 0): -t511,
+            (4, 0, 1): -2 * t512,
+            (4, 1, 1): -t522,
+            (4, 0, 5): -2 * t516,
+            (4, 1, 5): -2 * t526,
+            (4, 5, 5): -t566,
+            (4, 2, 2): -t533,
+            (4, 2, 3): -2 * t534,
+            (4, 3, 3): -t544,
+        },
+        device=device,
+        dtype=dtype,
+    )
+
+    # Rotate the T tensor for skew / vertical magnets
+    rotation_out, rotation_in = rotation_matrix(torch.stack([-tilt, tilt])).unbind(0)
+    T = torch.einsum(
+        "...il,...lmn,...mj,...nk->...ijk", rotation_out, T, rotation_in, rotation_in
+    )
+    return T
+
+
 def misalignment_matrix(
     misalignment: torch.Tensor,
 ) -> tuple[torch.Tensor, torch.Tensor]:
-    """Shift the beam for tracking beam through misaligned elements"""
+    """
+    Shift the beam for tracking beam through misaligned elements.
+
+    :param misalignment: Misalignment in x and y of shape `(..., 2)`.
+    :return: Exit and entry transfer maps of shape `(..., 7, 7)`.
+    """
     device = misalignment.device
     dtype = misalignment.dtype
 
-    R_exit = torch.eye(7, device=device, dtype=dtype)
-    R_exit[0, 6] = misalignment[0]
-    R_exit[2, 6] = misalignment[1]
-
-    R_entry = torch.eye(7, device=device, dtype=dtype)
-    R_entry[0, 6] = -misalignment[0]
-    R_entry[2, 6] = -misalignment[1]
+    R_exit = assemble_transfer_map(
+        {(0, 6): misalignment[..., 0], (2, 6): misalignment[..., 1]},
+        device=device,
+        dtype=dtype,
+    )
+    R_entry = assemble_transfer_map(
+        {(0, 6): -misalignment[..., 0], (2, 6): -misalignment[..., 1]},
+        device=device,
+        dtype=dtype,
+    )
 
     return R_exit, R_entry  # TODO: This order is confusing, should be entry, exit
+
+
+def _coulomb_antiderivative(
+    x: torch.Tensor, y: torch.Tensor, z: torch.Tensor
+) -> torch.Tensor:
+    """
+    Antiderivative of `1 / sqrt(x**2 + y**2 + z**2)` with respect to `x`, `y` and `z`.
+    Not defined on the coordinate planes.
+    """
+    r = torch.sqrt(x**2 + y**2 + z**2)
+    return (
+        -0.5 * x**2 * torch.atan(y * z / (x * r))
+        - 0.5 * y**2 * torch.atan(x * z / (y * r))
+        - 0.5 * z**2 * torch.atan(x * y / (z * r))
+        + y * z * torch.log(x + r)
+        + x * z * torch.log(y + r)
+        + x * y * torch.log(z + r)
+    )
+
+
+def integrated_green_function(
+    num_grid_points: tuple[int, int, int], cell_size: torch.Tensor
+) -> torch.Tensor:
+    """
+    Integrated Green's function of the Poisson equation on a regular grid, i.e. the
+    Coulomb potential `1 / r` averaged over a grid cell, for all offsets between two
+    grid points. The function is laid out on a grid of twice the size for a cyclic
+    convolution with a zero-padded charge distribution via FFTs, with negative offsets
+    wrapped around to the end of each dimension.
+
+    Averaging over the cells instead of sampling `1 / r` at the grid points removes the
+    singularity at zero offset and stays accurate for grid cells with large aspect
+    ratios, as they occur for long bunches in their rest frame.
+
+    :param num_grid_points: Number of grid points in x, y and z.
+    :param cell_size: Size of the grid cells in x, y and z of shape `(..., 3)` in
+        meters.
+    :return: Green's function of shape `(..., 2 * nx, 2 * ny, 2 * nz)` in 1/m.
+    """
+    # Evaluated in double precision, because the antiderivative is differenced over
+    # cells that are small compared to their distance from the origin
+    cell_size_64 = cell_size.to(torch.float64)
+    offsets = [
+        torch.fft.fftfreq(2 * n, 1 / (2 * n), device=cell_size.device).to(torch.float64)
+        for n in num_grid_points
+    ]
+    centres = [
+        offset * size[..., None]
+        for offset, size in zip(offsets, cell_size_64.unbind(-1))
+    ]
+    x = centres[0][..., :, None, None]
+    y = centres[1][..., None, :, None]
+    z = centres[2][..., None, None, :]
+    hx, hy, hz = (0.5 * size[..., None, None, None] for size in cell_size_64.unbind(-1))
+
+    integral = sum(
+        sx * sy * sz * _coulomb_antiderivative(x + sx * hx, y + sy * hy, z + sz * hz)
+        for sx in (-1, 1)
+        for sy in (-1, 1)
+        for sz in (-1, 1)
+    )
+    volume = cell_size_64.prod(dim=-1)[..., None, None, None]
+
+    return (integral / volume).to(cell_size.dtype)
+
+
+@lru_cache(maxsize=None)
+def _csr_kernel_spectrum(num_bins: int, device, dtype) -> torch.Tensor:
+    """
+    Cached spectrum of the steady-state CSR kernel `u**(-1/3)` integrated over bins of
+    unit width at offsets `0` to `num_bins - 1` behind a particle, zero-padded to twice
+    the number of bins for a causal convolution. Must not be modified in place.
+    """
+    offsets = torch.arange(2 * num_bins, device=device, dtype=dtype)
+    kernel = 1.5 * (
+        (offsets + 0.5) ** (2 / 3) - torch.clamp(offsets - 0.5, min=0.0) ** (2 / 3)
+    )
+    kernel[num_bins:] = 0.0
+    return torch.fft.rfft(kernel)
+
+
+def steady_state_csr_wake(
+    positions: torch.Tensor,
+    charges: torch.Tensor,
+    curvature: torch.Tensor,
+    num_bins: int,
+) -> torch.Tensor:
+    """
+    Longitudinal steady-state coherent synchrotron radiation (CSR) wake of a bunch in a
+    bending magnet, following the 1D model of Saldin et al.,
+    Nucl. Instrum. Methods A 398 (1997) 373. The line charge density is binned with
+    cloud-in-cell weights and its derivative is convolved with the kernel `u**(-1/3)`,
+    where `u` is the distance to the particles behind, by FFTs.
+
+    :param positions: Longitudinal particle positions in the bunch of shape
+        `(..., num_particles)` in meters, increasing towards the head of the bunch.
+    :param charges: Magnitudes of the particle charges of shape `(..., num_particles)`
+        in C.
+    :param curvature: Curvature of the reference orbit of shape `(...)` in 1/m.
+    :param num_bins: Number of bins of the line charge density.
+    :return: Energy change per unit length of a particle of unit charge at the
+        positions of the particles of shape `(..., num_particles)` in eV/m.
+    """
+    factory_kwargs = {"device": positions.device, "dtype": positions.dtype}
+    batch_shape = positions.shape[:-1]
+    positions = positions.reshape(-1, positions.shape[-1])
+    charges = charges.reshape(-1, charges.shape[-1])
+
+    # The bins span all particles with room for their cloud-in-cell weights
+    lower = positions.min(dim=-1, keepdim=True).values
+    upper = positions.max(dim=-1, keepdim=True).values
+    bin_width = (upper - lower) / (num_bins - 3)
+    bins = (positions - lower) / bin_width + 1
+    index = torch.floor(bins)
+    fraction = bins - index
+    index = index.long()
+
+    line_charges = torch.zeros((positions.shape[0], num_bins), **factory_kwargs)
+    line_charges = line_charges.scatter_add(-1, index, (1 - fraction) * charges)
+    line_charges = line_charges.scatter_add(-1, index + 1, fraction * charges)
+    density_derivative = torch.gradient(line_charges, dim=-1)[0] / bin_width**2
+
+    convolution = torch.fft.irfft(
+        torch.fft.rfft(density_derivative, n=2 * num_bins)
+        * _csr_kernel_spectrum(num_bins, positions.device, positions.dtype),
+        n=2 * num_bins,
+    )[..., :num_bins] * bin_width ** (2 / 3)
+    wake = (
+        -2
+        * torch.abs(curvature).reshape(-1, 1) ** (2 / 3)
+        / (4 * torch.pi * constants.epsilon_0 * 3 ** (1 / 3))
+        * convolution
+    )
+
+    particle_wake = (1 - fraction) * wake.gather(-1, index) + fraction * wake.gather(
+        -1, index + 1
+    )
+    return particle_wake.view(*batch_shape, -1)
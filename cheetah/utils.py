@@ -1,3 +1,7 @@
+import torch
+from torch import nn
+
+
 class UniqueNameGenerator:
     """Generates a unique name given a prefix."""
 
@@ -9,3 +13,37 @@ class UniqueNameGenerator:
         name = f"{self._prefix}_{self._counter}"
         self._counter += 1
         return name
+
+
+def is_tracing() -> bool:
+    """
+    Whether the current code is being traced by `torch.compile` or captured into a CUDA
+    graph. Checks that read tensor values on the host must be skipped in that case, as
+    they would cause a graph break or fail the capture.
+    """
+    return torch.compiler.is_compiling() or (
+        torch.cuda.is_available() and torch.cuda.is_current_stream_capturing()
+    )
+
+
+def tensors_cache_key(tensors: list[torch.Tensor]) -> tuple:
+    """Hashable key that changes when any of `tensors` is replaced or modified."""
+    return tuple((id(tensor), tensor._version) for tensor in tensors)
+
+
+def module_tensors(module: nn.Module) -> list[torch.Tensor]:
+    """All tensor attributes, parameters and buffers of `module`."""
+    return [
+        value
+        for value in (
+            *module.__dict__.values(),
+            *module._parameters.values(),
+            *module._buffers.values(),
+        )
+        if isinstance(value, torch.Tensor)
+    ]
+
+
+def needs_grad(tensors: list[torch.Tensor]) -> bool:
+    """Whether autograd needs to record operations on any of `tensors`."""
+    return torch.is_grad_enabled() and any(tensor.requires_grad for tensor in tensors)
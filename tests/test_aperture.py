@@ -0,0 +1,127 @@
+import pytest
+import torch
+
+import cheetah
+
+
+@pytest.mark.parametrize("shape", ["rectangular", "elliptical"])
+def test_mask_matches_remove(shape):
+    """
+    Test that an aperture that masks lost particles results in the same statistics and
+    screen image as one that removes them.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_x=torch.tensor(2e-4),
+        sigma_y=torch.tensor(2e-4),
+        total_charge=torch.tensor(1e-9),
+    )
+
+    def make_segment(loss_model):
+        return cheetah.Segment(
+            elements=[
+                cheetah.Drift(length=torch.tensor(0.1)),
+                cheetah.Aperture(
+                    x_max=torch.tensor(2e-4),
+                    y_max=torch.tensor(1e-4),
+                    shape=shape,
+                    loss_model=loss_model,
+                ),
+                cheetah.Drift(length=torch.tensor(0.1)),
+                cheetah.Screen(
+                    resolution=torch.tensor((100, 100)),
+                    pixel_size=torch.tensor((1e-5, 1e-5)),
+                    is_active=True,
+                    name="screen",
+                ),
+            ]
+        )
+
+    removing_segment = make_segment("remove")
+    masking_segment = make_segment("mask")
+    removing_segment.track(incoming)
+    masking_segment.track(incoming)
+    removed = removing_segment.screen.get_read_beam()
+    masked = masking_segment.screen.get_read_beam()
+
+    assert masked.num_particles == 10_000
+    assert removed.num_particles < 10_000
+    assert torch.isclose(
+        masked.survival_probabilities.sum(), torch.tensor(float(len(removed)))
+    )
+    assert torch.allclose(masked.mu_x, removed.mu_x, atol=1e-9)
+    assert torch.allclose(masked.sigma_x, removed.sigma_x)
+    assert torch.allclose(masked.sigma_y, removed.sigma_y)
+    assert torch.allclose(masked.emittance_x, removed.emittance_x)
+    assert torch.allclose(masked.total_charge, removed.total_charge)
+    assert torch.allclose(
+        masking_segment.screen.reading, removing_segment.screen.reading
+    )
+
+
+def test_mask_batched_apertures():
+    """Test that apertures with a loss model of `"mask"` support batching."""
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(2e-4), sigma_y=torch.tensor(2e-4)
+    )
+    aperture = cheetah.Aperture(
+        x_max=torch.tensor([1e-4, 2e-4, 1.0]),
+        y_max=torch.tensor(1.0),
+        loss_model="mask",
+    )
+
+    outgoing = aperture.track(incoming)
+
+    assert outgoing.survival_probabilities.shape == (3, 10_000)
+    assert outgoing.sigma_x.shape == (3,)
+    assert outgoing.sigma_x[0] < outgoing.sigma_x[1] < outgoing.sigma_x[2]
+    assert torch.all(outgoing.survival_probabilities[2] == 1.0)
+
+
+def test_soft_edge_is_differentiable():
+    """
+    Test that the survival probabilities behind an aperture with a soft edge are
+    differentiable with respect to the size of the aperture.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(2e-4), sigma_y=torch.tensor(2e-4)
+    )
+    x_max = torch.tensor(2e-4, requires_grad=True)
+    aperture = cheetah.Aperture(
+        x_max=x_max, loss_model="mask", edge_width=torch.tensor(1e-5)
+    )
+
+    outgoing = aperture.track(incoming)
+    outgoing.survival_probabilities.sum().backward()
+
+    assert torch.all(outgoing.survival_probabilities > 0.0)
+    # Widening the aperture lets more particles through
+    assert x_max.grad > 0.0
+
+
+@pytest.mark.parametrize("edge_width", [0.0, 1e-5])
+def test_mask_gradient_on_axis(edge_width):
+    """
+    Test that the survival probabilities behind an elliptical aperture have finite
+    gradients with respect to the particles, also for a particle on the axis and with
+    both hard and soft edges.
+    """
+    beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_x=torch.tensor(2e-4), sigma_y=torch.tensor(2e-4)
+    )
+    particles = beam.particles.clone()
+    particles[0, :6] = 0.0
+    particles.requires_grad_(True)
+    incoming = cheetah.ParticleBeam(particles, energy=beam.energy)
+    aperture = cheetah.Aperture(
+        x_max=torch.tensor(2e-4),
+        y_max=torch.tensor(1e-4),
+        shape="elliptical",
+        loss_model="mask",
+        edge_width=torch.tensor(edge_width),
+    )
+
+    outgoing = aperture.track(incoming)
+    outgoing.survival_probabilities.sum().backward()
+
+    assert torch.all(torch.isfinite(particles.grad))
@@ -1,9 +1,25 @@
+import os
+
 import numpy as np
 import torch
 
 import cheetah
 
 
+def write_astra_file(path, num_particles: int = 1_000) -> None:
+    """Write a random ASTRA distribution of 100 MeV/c electrons with lost particles."""
+    rng = np.random.default_rng(42)
+    rows = np.zeros((num_particles, 10))
+    rows[:, :2] = rng.normal(scale=1e-4, size=(num_particles, 2))
+    rows[:, 2] = rng.normal(scale=1e-5, size=num_particles)
+    rows[:, 3:5] = rng.normal(scale=1e3, size=(num_particles, 2))
+    rows[:, 5] = rng.normal(scale=1e4, size=num_particles)
+    rows[:, 7] = -1e-6
+    rows[:, 9] = np.where(rng.random(num_particles) < 0.1, -1, 5)
+    rows[0] = [0, 0, 1.5, 0, 0, 1e8, 0, -1e-6, 1, 5]
+    np.savetxt(path, rows)
+
+
 def test_astra_to_parameter_beam():
     """Test that Astra beams are correctly loaded into parameter beams."""
     beam = cheetah.ParameterBeam.from_astra("tests/resources/ACHIP_EA1_2021.1351.001")
@@ -59,3 +75,80 @@ def test_astra_to_parameter_beam_dtypes():
     assert beam.sigma_p.dtype == torch.float32
     assert beam.energy.dtype == torch.float32
     assert beam.total_charge.dtype == torch.float32
+
+
+def test_astra_cache(tmp_path):
+    """
+    Test that Astra beams are loaded identically from the binary cache, which is
+    rewritten when the Astra file changes.
+    """
+    path = str(tmp_path / "beam.astra")
+    write_astra_file(path)
+
+    beam = cheetah.ParticleBeam.from_astra(path)
+    cached_beam = cheetah.ParticleBeam.from_astra(path, cache=True)
+    assert os.path.exists(f"{path}.cheetah.npz")
+    assert torch.equal(cached_beam.particles, beam.particles)
+    assert torch.equal(cached_beam.particle_charges, beam.particle_charges)
+    assert torch.equal(
+        cheetah.ParticleBeam.from_astra(path, cache=True).particles, beam.particles
+    )
+    assert beam.num_particles < 1_000
+
+    write_astra_file(path, num_particles=500)
+    assert cheetah.ParticleBeam.from_astra(path, cache=True).num_particles < 500
+
+
+def test_astra_chunks(tmp_path):
+    """
+    Test that Astra beams loaded in chunks add up to the whole beam, and that they can
+    be tracked with `Segment.track_chunked`.
+    """
+    path = str(tmp_path / "beam.astra")
+    write_astra_file(path)
+    beam = cheetah.ParticleBeam.from_astra(path, dtype=torch.float64)
+
+    chunks = list(
+        cheetah.ParticleBeam.chunks_from_astra(
+            path, chunk_size=300, dtype=torch.float64
+        )
+    )
+    assert len(chunks) == 4
+    assert torch.equal(torch.cat([chunk.particles for chunk in chunks]), beam.particles)
+    assert all(torch.equal(chunk.energy, beam.energy) for chunk in chunks)
+
+    segment = cheetah.Segment(
+        [
+            cheetah.Drift(length=torch.tensor(1.0), dtype=torch.float64),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor(4.0), dtype=torch.float64
+            ),
+            cheetah.Drift(length=torch.tensor(1.0), dtype=torch.float64),
+        ]
+    )
+    outgoing = segment.track_chunked(
+        cheetah.ParticleBeam.chunks_from_astra(
+            path, chunk_size=300, dtype=torch.float64
+        )
+    )
+    assert torch.allclose(outgoing.particles, segment.track(beam).particles)
+
+
+def test_astra_chunks_with_trailing_blank_lines(tmp_path):
+    """
+    Test that Astra files ending in blank lines are loaded in chunks when their number
+    of particles is a multiple of the chunk size.
+    """
+    path = str(tmp_path / "beam.astra")
+    write_astra_file(path, num_particles=2_000)
+    with open(path, "a") as f:
+        f.write("\n\n")
+    beam = cheetah.ParticleBeam.from_astra(path, dtype=torch.float64)
+
+    chunks = list(
+        cheetah.ParticleBeam.chunks_from_astra(
+            path, chunk_size=1_000, dtype=torch.float64
+        )
+    )
+    assert len(chunks) == 2
+    assert torch.equal(torch.cat([chunk.particles for chunk in chunks]), beam.particles)
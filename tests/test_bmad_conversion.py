@@ -31,3 +31,48 @@ def test_bmad_tutorial():
     assert converted.b.e1 == correct.b.e1
     assert converted.q.length == correct.q.length
     assert converted.q.k1 == correct.q.k1
+
+
+def test_bmad_parse_cache(tmp_path, monkeypatch):
+    """
+    Test that a parsed Bmad lattice is loaded from the parse cache, and that the cache
+    is invalidated when a called lattice file changes.
+    """
+    (tmp_path / "elements.bmad").write_text("q: quadrupole, l = 0.6, k1 = 0.23\n")
+    (tmp_path / "lattice.bmad").write_text(
+        "call, file = elements.bmad\n"
+        "d: drift, l = 0.5\n"
+        "q[k1] = 2 * q[k1] ^ 2\n"
+        "lat: line = (d, q)\n"
+        "use, lat\n"
+    )
+    cache_dir = tmp_path / "cache"
+
+    parsed = cheetah.Segment.from_bmad(tmp_path / "lattice.bmad", cache_dir=cache_dir)
+
+    # Loading from the cache must not parse the lattice again
+    parse_lines = cheetah.converters.dontbmad.parse_lines
+    monkeypatch.setattr(cheetah.converters.dontbmad, "parse_lines", None)
+    cached = cheetah.Segment.from_bmad(tmp_path / "lattice.bmad", cache_dir=cache_dir)
+    monkeypatch.setattr(cheetah.converters.dontbmad, "parse_lines", parse_lines)
+
+    (tmp_path / "elements.bmad").write_text("q: quadrupole, l = 0.6, k1 = 0.4\n")
+    changed = cheetah.Segment.from_bmad(tmp_path / "lattice.bmad", cache_dir=cache_dir)
+
+    assert torch.isclose(parsed.q.k1, torch.tensor(2 * 0.23**2))
+    assert cached.q.k1 == parsed.q.k1
+    assert cached.d.length == parsed.d.length
+    assert torch.isclose(changed.q.k1, torch.tensor(2 * 0.4**2))
+
+
+def test_bmad_expression_prefers_context():
+    """
+    Test that an expression naming a variable in the context evaluates to the variable,
+    even if it would otherwise be read as a string.
+    """
+    from cheetah.converters.dontbmad import evaluate_expression
+
+    context = {"q1:k1": 4.2}
+
+    assert evaluate_expression("q1:k1", context) == 4.2
+    assert evaluate_expression("q1:k2", context) == "q1:k2"
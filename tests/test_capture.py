@@ -0,0 +1,127 @@
+import pytest
+import torch
+
+import cheetah
+
+
+def make_segment(device=None) -> cheetah.Segment:
+    """Create a segment with an element of every type that can be captured."""
+    return cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), device=device),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2),
+                k1=torch.tensor(4.2),
+                misalignment=torch.tensor([1e-5, 2e-5]),
+                name="Q1",
+                device=device,
+            ),
+            cheetah.Dipole(
+                length=torch.tensor(0.3),
+                angle=torch.tensor(0.01),
+                e1=torch.tensor(0.005),
+                fringe_integral=torch.tensor(0.1),
+                gap=torch.tensor(0.02),
+                device=device,
+            ),
+            cheetah.HorizontalCorrector(
+                length=torch.tensor(0.1), angle=torch.tensor(1e-3), device=device
+            ),
+            cheetah.VerticalCorrector(
+                length=torch.tensor(0.1), angle=torch.tensor(1e-3), device=device
+            ),
+            cheetah.Cavity(
+                length=torch.tensor(1.0377),
+                voltage=torch.tensor(1e7),
+                phase=torch.tensor(-20.0),
+                frequency=torch.tensor(1.3e9),
+                device=device,
+            ),
+            cheetah.Solenoid(
+                length=torch.tensor(0.2), k=torch.tensor(1.0), device=device
+            ),
+            cheetah.Undulator(length=torch.tensor(0.5), device=device),
+            cheetah.BPM(is_active=True, name="B1"),
+            cheetah.Drift(length=torch.tensor(0.5), device=device),
+        ]
+    )
+
+
+@pytest.mark.parametrize("BeamClass", [cheetah.ParameterBeam, cheetah.ParticleBeam])
+def test_captured_matches_track(BeamClass):
+    """
+    Test that captured tracking compiles into a single graph and gives the same result
+    as `Segment.track`, also after a parameter was reassigned.
+    """
+    segment = make_segment()
+    incoming = BeamClass.from_parameters(
+        sigma_x=torch.tensor(1e-4), sigma_xp=torch.tensor(2e-5)
+    )
+
+    captured = segment.capture(incoming, backend="eager")
+
+    outgoing = captured(incoming)
+    reading = segment.B1.reading.clone()
+    expected = segment.track(incoming)
+    assert torch.allclose(outgoing.sigma_x, expected.sigma_x)
+    assert torch.allclose(outgoing.energy, expected.energy)
+    assert torch.allclose(reading, segment.B1.reading)
+
+    segment.Q1.k1 = torch.tensor(-3.0)
+    outgoing = captured(incoming)
+    expected = segment.track(incoming)
+    assert torch.allclose(outgoing.sigma_x, expected.sigma_x)
+    assert torch.allclose(segment.Q1.k1, torch.tensor(-3.0))
+
+
+def test_capture_rejects_active_aperture():
+    """Test that capturing a segment with an active aperture raises an error."""
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Aperture(is_active=True),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters()
+
+    with pytest.raises(NotImplementedError):
+        segment.capture(incoming, backend="eager")
+
+
+def test_capture_masking_aperture():
+    """Test that an active aperture that masks lost particles can be captured."""
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Aperture(
+                x_max=torch.tensor(1e-4), y_max=torch.tensor(1e-4), loss_model="mask"
+            ),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        sigma_x=torch.tensor(1e-4), sigma_y=torch.tensor(1e-4)
+    )
+
+    outgoing = segment.capture(incoming, backend="eager")(incoming)
+    expected = segment.track(incoming)
+
+    assert torch.equal(outgoing.survival_probabilities, expected.survival_probabilities)
+    assert torch.allclose(outgoing.sigma_x, expected.sigma_x)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA not available")
+def test_cuda_graph_matches_track():
+    """Test that tracking replayed from a CUDA graph matches `Segment.track`."""
+    segment = make_segment(device="cuda")
+    incoming = cheetah.ParameterBeam.from_parameters(
+        sigma_x=torch.tensor(1e-4), device="cuda"
+    )
+
+    captured = segment.capture(incoming)
+
+    segment.Q1.k1 = torch.tensor(-3.0, device="cuda")
+    outgoing = captured(incoming)
+    expected = segment.track(incoming)
+
+    assert torch.allclose(outgoing.sigma_x, expected.sigma_x)
@@ -0,0 +1,148 @@
+import pytest
+import torch
+
+import cheetah
+
+from .resources import ARESlatticeStage3v1_9 as ares
+
+
+@pytest.fixture
+def segment() -> cheetah.Segment:
+    """ARES experimental area with an active screen at its end."""
+    segment = cheetah.Segment.from_ocelot(ares.cell).subcell("AREASOLA1", "AREABSCR1")
+    segment.AREABSCR1.resolution = torch.tensor((100, 80))
+    segment.AREABSCR1.pixel_size = torch.tensor((1e-4, 1e-4))
+    segment.AREABSCR1.is_active = True
+    return segment
+
+
+@pytest.fixture
+def incoming() -> cheetah.ParticleBeam:
+    """Particle beam to track through the segment."""
+    return cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-4), sigma_y=torch.tensor(1e-4)
+    )
+
+
+@pytest.mark.parametrize("stride", [1, 4])
+def test_checkpointed_matches_segment_track(segment, incoming, stride):
+    """
+    Test that checkpointed tracking gives the same result as `Segment.track` after
+    changing an element near the end of the segment, and that it resumes from the
+    nearest checkpoint upstream of that element.
+    """
+    tracker = segment.checkpointed(stride=stride)
+
+    _ = tracker(incoming)
+    assert tracker.resumed_from == 0
+
+    segment.AREAMQZM3.k1 = torch.tensor(5.0)
+    _ = tracker(incoming)
+    incremental_reading = segment.AREABSCR1.reading.clone()
+
+    changed_index = tracker.elements.index(segment.AREAMQZM3)
+    assert tracker.resumed_from == changed_index - changed_index % stride
+    assert tracker.resumed_from > 0
+
+    segment.track(incoming)
+    assert torch.allclose(incremental_reading, segment.AREABSCR1.reading)
+
+
+def test_checkpointed_detects_changes(segment, incoming):
+    """
+    Test that in-place modifications of elements and changes of the incoming beam are
+    detected, and that nothing is tracked if nothing has changed.
+    """
+    tracker = segment.checkpointed()
+
+    _ = tracker(incoming)
+    _ = tracker(incoming)
+    assert tracker.resumed_from == len(tracker.elements)
+
+    segment.AREAMCHM1.angle.add_(1e-3)
+    _ = tracker(incoming)
+    assert tracker.resumed_from == tracker.elements.index(segment.AREAMCHM1)
+
+    incoming.particles[:, 0] += 1e-5
+    _ = tracker(incoming)
+    assert tracker.resumed_from == 0
+
+
+def test_checkpointed_with_gradients(incoming):
+    """Test that checkpointed tracking supports gradients by tracking from the start."""
+    k1 = torch.tensor(4.2, requires_grad=True)
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=k1),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+    tracker = segment.checkpointed()
+
+    for _ in range(2):
+        outgoing = tracker(incoming)
+        outgoing.sigma_x.backward()
+
+        assert tracker.resumed_from == 0
+        assert k1.grad is not None
+
+
+def test_checkpointed_with_custom_transfer_map(incoming):
+    """
+    Test that checkpointed tracking supports `CustomTransferMap`s and detects in-place
+    changes of their transfer maps.
+    """
+    custom = cheetah.CustomTransferMap(
+        cheetah.Drift(length=torch.tensor(0.5)).transfer_map(incoming.energy)
+    )
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+            custom,
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+    tracker = segment.checkpointed()
+
+    _ = tracker(incoming)
+    _ = tracker(incoming)
+    assert tracker.resumed_from == len(tracker.elements)
+
+    custom.transfer_map(incoming.energy)[0, 1].add_(0.1)
+    outgoing = tracker(incoming)
+    assert tracker.resumed_from == 1
+    assert torch.allclose(outgoing.particles, segment.track(incoming).particles)
+
+
+def test_checkpointed_detects_wakefield_changes():
+    """
+    Test that checkpointed tracking detects in-place changes of the wakefield attached
+    to a cavity.
+    """
+    wakefield = cheetah.Wakefield.from_functions(
+        max_distance=0.01, longitudinal_wake=lambda s: torch.full_like(s, 1e13)
+    )
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Cavity(
+                length=torch.tensor(1.0),
+                voltage=torch.tensor(1e7),
+                frequency=torch.tensor(1.3e9),
+                wakefield=wakefield,
+            ),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_s=torch.tensor(1e-4), total_charge=torch.tensor(1e-9)
+    )
+    tracker = segment.checkpointed()
+
+    _ = tracker(incoming)
+    wakefield.longitudinal_wake.mul_(2.0)
+    outgoing = tracker(incoming)
+
+    assert tracker.resumed_from == 1
+    assert torch.allclose(outgoing.particles, segment.track(incoming).particles)
@@ -0,0 +1,70 @@
+import torch
+
+import cheetah
+
+
+def make_segment() -> cheetah.Segment:
+    """Create a segment with a BPM, an aperture and a screen."""
+    return cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+            cheetah.BPM(is_active=True, name="my_bpm"),
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Aperture(
+                x_max=torch.tensor(2e-4),
+                y_max=torch.tensor(2e-4),
+                is_active=True,
+                name="my_aperture",
+            ),
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Screen(
+                resolution=torch.tensor((100, 80)),
+                pixel_size=torch.tensor((1e-5, 1e-5)),
+                is_active=True,
+                name="my_screen",
+            ),
+        ]
+    )
+
+
+def test_chunked_matches_full_tracking():
+    """
+    Test that tracking a beam in chunks produces the same outgoing beam, BPM reading,
+    screen image and lost particles as tracking it at once.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_x=torch.tensor(1e-4),
+        sigma_y=torch.tensor(1e-4),
+        mu_x=torch.tensor(2e-5),
+    )
+    segment = make_segment()
+    segment.my_screen.is_active = False
+
+    outgoing = segment.track(incoming)
+    bpm_reading = segment.my_bpm.reading
+    lost_particles = segment.my_aperture.lost_particles
+
+    chunked_outgoing = segment.track_chunked(incoming, chunk_size=3_000)
+
+    assert chunked_outgoing.num_particles == outgoing.num_particles
+    assert torch.allclose(chunked_outgoing.particles, outgoing.particles)
+    assert torch.allclose(segment.my_bpm.reading, bpm_reading)
+    assert torch.allclose(segment.my_aperture.lost_particles, lost_particles)
+
+
+def test_chunked_screen_reading():
+    """Test that a screen accumulates its image across chunks."""
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-4), sigma_y=torch.tensor(1e-4)
+    )
+    segment = make_segment()
+
+    segment.track(incoming)
+    reading = segment.my_screen.reading
+
+    outgoing = segment.track_chunked(incoming, chunk_size=3_000)
+
+    assert outgoing is cheetah.Beam.empty
+    assert torch.allclose(segment.my_screen.reading, reading)
@@ -0,0 +1,93 @@
+import pytest
+import torch
+
+import cheetah
+
+
+def make_segment() -> cheetah.Segment:
+    """Create a segment with linear elements and a cavity."""
+    return cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2),
+                k1=torch.tensor(4.2),
+                misalignment=torch.tensor([1e-5, 2e-5]),
+            ),
+            cheetah.HorizontalCorrector(
+                length=torch.tensor(0.1), angle=torch.tensor(1e-4)
+            ),
+            cheetah.Cavity(
+                length=torch.tensor(1.0377),
+                voltage=torch.tensor(1e7),
+                phase=torch.tensor(-20.0),
+                frequency=torch.tensor(1.3e9),
+            ),
+            cheetah.Dipole(length=torch.tensor(0.3), angle=torch.tensor(0.01)),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+
+
+def test_compact_matches_particle_beam():
+    """
+    Test that tracking a `CompactParticleBeam` gives the same result as tracking the
+    equivalent `ParticleBeam`, and that the compact layout is kept.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-4), sigma_xp=torch.tensor(2e-5)
+    )
+    compact_incoming = cheetah.CompactParticleBeam.from_particle_beam(incoming)
+    segment = make_segment()
+
+    outgoing = segment.track(incoming)
+    compact_outgoing = segment.track(compact_incoming)
+
+    assert isinstance(compact_outgoing, cheetah.CompactParticleBeam)
+    assert compact_outgoing.coordinates.shape == (6, 10_000)
+    assert torch.allclose(compact_outgoing.particles, outgoing.particles, atol=1e-9)
+    assert torch.allclose(compact_outgoing.sigma_x, outgoing.sigma_x)
+    assert torch.allclose(compact_outgoing.energy, outgoing.energy)
+
+
+@pytest.mark.parametrize("storage_dtype", [torch.float16, torch.bfloat16])
+def test_reduced_precision_storage(storage_dtype):
+    """
+    Test that coordinates can be stored in reduced precision, while the beam's
+    properties are computed in full precision and stay close to the full precision
+    result.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-4), sigma_xp=torch.tensor(2e-5)
+    )
+    compact_incoming = cheetah.CompactParticleBeam.from_particle_beam(
+        incoming, storage_dtype=storage_dtype
+    )
+    segment = make_segment()
+
+    outgoing = segment.track(incoming)
+    compact_outgoing = segment.track(compact_incoming)
+
+    assert compact_outgoing.coordinates.dtype == storage_dtype
+    assert compact_outgoing.sigma_x.dtype == torch.float32
+    assert torch.allclose(compact_outgoing.sigma_x, outgoing.sigma_x, rtol=1e-2)
+    assert torch.allclose(compact_outgoing.sigma_y, outgoing.sigma_y, rtol=1e-2)
+
+
+def test_compact_from_parameters_and_aperture():
+    """
+    Test that a `CompactParticleBeam` can be generated from parameters and keeps its
+    layout when passing through an aperture.
+    """
+    incoming = cheetah.CompactParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-3), sigma_y=torch.tensor(1e-3)
+    )
+    aperture = cheetah.Aperture(
+        x_max=torch.tensor(1e-3), y_max=torch.tensor(1e-3), is_active=True
+    )
+
+    outgoing = aperture.track(incoming)
+
+    assert isinstance(outgoing, cheetah.CompactParticleBeam)
+    assert 0 < outgoing.num_particles < 10_000
+    assert torch.all(outgoing.xs.abs() < 1e-3)
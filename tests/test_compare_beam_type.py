@@ -295,3 +295,37 @@ def test_cavity_from_twiss():
     assert torch.isclose(
         outgoing_parameter_beam.sigma_yp, outgoing_particle_beam.sigma_yp, rtol=1e-2
     )
+
+
+def test_cavity_longitudinal_moments():
+    """
+    Test that the longitudinal moments of both beam types agree after an off-crest
+    cavity, which correlates the energy deviation with the longitudinal position.
+    """
+    cheetah_cavity = cheetah.Cavity(
+        length=torch.tensor(1.0377),
+        voltage=torch.tensor(0.01815975e9),
+        frequency=torch.tensor(1.3e9),
+        phase=torch.tensor(30.0),
+    )
+    parameters = dict(
+        sigma_s=torch.tensor(1e-3), sigma_p=torch.tensor(1e-2), energy=torch.tensor(6e6)
+    )
+
+    incoming_parameter_beam = cheetah.ParameterBeam.from_parameters(**parameters)
+    outgoing_parameter_beam = cheetah_cavity.track(incoming_parameter_beam)
+
+    incoming_particle_beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000, **parameters
+    )
+    outgoing_particle_beam = cheetah_cavity.track(incoming_particle_beam)
+
+    assert torch.isclose(
+        outgoing_parameter_beam.sigma_s, outgoing_particle_beam.sigma_s, rtol=1e-2
+    )
+    assert torch.isclose(
+        outgoing_parameter_beam.sigma_p, outgoing_particle_beam.sigma_p, rtol=1e-2
+    )
+    assert torch.isclose(
+        outgoing_parameter_beam.mu_p, outgoing_particle_beam.mu_p, atol=2e-4
+    )
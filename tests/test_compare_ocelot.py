@@ -3,6 +3,7 @@ from copy import deepcopy
 import numpy as np
 import ocelot
 import torch
+from ocelot.cpbd.transformations.second_order import SecondTM
 
 import cheetah
 
@@ -381,6 +382,90 @@ def test_quadrupole():
     )
 
 
+def test_second_order_quadrupole():
+    """
+    Test that second-order tracking through a misaligned Cheetah `Quadrupole` matches
+    Ocelot's second-order tracking.
+    """
+    p_array = ocelot.generate_parray(
+        sigma_x=1e-3,
+        sigma_px=1e-3,
+        sigma_y=1e-3,
+        sigma_py=1e-3,
+        sigma_p=1e-2,
+        nparticles=10_000,
+    )
+
+    # Cheetah
+    incoming_beam = cheetah.ParticleBeam.from_ocelot(p_array, dtype=torch.float64)
+    cheetah_quadrupole = cheetah.Quadrupole(
+        length=0.23, k1=5.0, misalignment=[1e-3, -2e-3], dtype=torch.float64
+    )
+    outgoing_beam = cheetah.Segment([cheetah_quadrupole]).compile(order=2)(
+        incoming_beam
+    )
+
+    # Ocelot
+    ocelot_quadrupole = ocelot.Quadrupole(l=0.23, k1=5.0, dx=1e-3, dy=-2e-3)
+    lattice = ocelot.MagneticLattice([ocelot_quadrupole], method={"global": SecondTM})
+    navigator = ocelot.Navigator(lattice)
+    _, outgoing_p_array = ocelot.track(
+        lattice, deepcopy(p_array), navigator, print_progress=False
+    )
+
+    assert np.allclose(
+        outgoing_beam.particles[:, :6].cpu().numpy(),
+        outgoing_p_array.rparticles.transpose(),
+    )
+
+
+def test_second_order_dipole_with_fringe_field():
+    """
+    Test that second-order tracking through a tilted Cheetah `Dipole` with fringe
+    fields matches Ocelot's second-order tracking. Ocelot applies the maps of the faces
+    one after another, so the results agree up to terms of third order.
+    """
+    p_array = ocelot.generate_parray(
+        sigma_x=1e-3,
+        sigma_px=1e-3,
+        sigma_y=1e-3,
+        sigma_py=1e-3,
+        sigma_p=1e-2,
+        nparticles=10_000,
+    )
+
+    # Cheetah
+    incoming_beam = cheetah.ParticleBeam.from_ocelot(p_array, dtype=torch.float64)
+    cheetah_dipole = cheetah.Dipole(
+        length=0.5,
+        angle=0.2,
+        e1=0.1,
+        e2=0.05,
+        tilt=0.4,
+        fringe_integral=0.5,
+        gap=0.02,
+        dtype=torch.float64,
+    )
+    outgoing_beam = cheetah.Segment([cheetah_dipole]).compile(order=2)(incoming_beam)
+    linear_beam = cheetah_dipole.track(incoming_beam)
+
+    # Ocelot
+    ocelot_bend = ocelot.SBend(
+        l=0.5, angle=0.2, e1=0.1, e2=0.05, tilt=0.4, fint=0.5, gap=0.02
+    )
+    lattice = ocelot.MagneticLattice([ocelot_bend], method={"global": SecondTM})
+    navigator = ocelot.Navigator(lattice)
+    _, outgoing_p_array = ocelot.track(
+        lattice, deepcopy(p_array), navigator, print_progress=False
+    )
+    expected = outgoing_p_array.rparticles.transpose()
+
+    second_order_error = np.abs(outgoing_beam.particles[:, :6].numpy() - expected)
+    linear_error = np.abs(linear_beam.particles[:, :6].numpy() - expected)
+    assert np.all(second_order_error.max(axis=0)[:5] < 1e-6)
+    assert np.all(linear_error.max(axis=0)[:5] > 1e-6)
+
+
 def test_tilted_quadrupole():
     """
     Test if the tracking results through a tilted Cheeath `Quadrupole` element match
@@ -0,0 +1,107 @@
+import math
+
+import pytest
+import torch
+from scipy import constants
+from torch import nn
+
+import cheetah
+
+
+def test_csr_energy_loss_of_gaussian_bunch():
+    """
+    Test that the mean energy loss and the energy spread induced by the steady-state CSR
+    wake of a Gaussian bunch in a dipole match the analytic results of Saldin et al.
+    """
+    torch.manual_seed(42)
+    charge, sigma_s, radius, length, energy = 1e-9, 50e-6, 10.0, 0.5, 1e9
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000,
+        sigma_x=torch.tensor(1e-5),
+        sigma_y=torch.tensor(1e-5),
+        sigma_xp=torch.tensor(1e-7),
+        sigma_yp=torch.tensor(1e-7),
+        sigma_s=torch.tensor(sigma_s),
+        sigma_p=torch.tensor(1e-7),
+        energy=torch.tensor(energy),
+        total_charge=torch.tensor(charge),
+        dtype=torch.float64,
+    )
+    dipole = cheetah.Dipole(
+        length=torch.tensor(length),
+        angle=torch.tensor(length / radius),
+        csr=True,
+        dtype=torch.float64,
+    )
+
+    outgoing = dipole.track(incoming)
+
+    unit = (
+        charge
+        * length
+        / (
+            4
+            * math.pi
+            * constants.epsilon_0
+            * radius ** (2 / 3)
+            * sigma_s ** (4 / 3)
+            * energy
+        )
+    )
+    assert (outgoing.mu_p - incoming.mu_p).item() == pytest.approx(
+        -0.3505 * unit, rel=0.02
+    )
+    assert outgoing.sigma_p.item() == pytest.approx(0.2459 * unit, rel=0.02)
+
+
+def test_csr_without_charge():
+    """
+    Test that a dipole with CSR tracks beams without charge and `ParameterBeam`s like a
+    dipole without CSR.
+    """
+    dipole = cheetah.Dipole(
+        length=torch.tensor(0.5), angle=torch.tensor(0.1), e1=torch.tensor(0.05)
+    )
+    csr_dipole = cheetah.Dipole(
+        length=torch.tensor(0.5),
+        angle=torch.tensor(0.1),
+        e1=torch.tensor(0.05),
+        csr=True,
+    )
+    particle_beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, total_charge=torch.tensor(0.0)
+    )
+    parameter_beam = cheetah.ParameterBeam.from_parameters()
+
+    assert not csr_dipole.is_skippable
+    assert torch.allclose(
+        csr_dipole.track(particle_beam).particles,
+        dipole.track(particle_beam).particles,
+        atol=1e-7,
+    )
+    assert torch.allclose(
+        csr_dipole.track(parameter_beam)._cov, dipole.track(parameter_beam)._cov
+    )
+
+
+def test_csr_is_differentiable():
+    """
+    Test that the energy loss due to CSR can be differentiated with respect to the
+    bending angle, and that the CSR kernel is only computed once.
+    """
+    cheetah.track_methods._csr_kernel_spectrum.cache_clear()
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_s=torch.tensor(50e-6),
+        total_charge=torch.tensor(1e-9),
+        energy=torch.tensor(1e9),
+    )
+    dipole = cheetah.Dipole(
+        length=torch.tensor(0.5), angle=nn.Parameter(torch.tensor(0.05)), csr=True
+    )
+
+    dipole.track(incoming).mu_p.backward()
+
+    # A stronger bend results in a larger energy loss
+    assert dipole.angle.grad < 0
+    assert cheetah.track_methods._csr_kernel_spectrum.cache_info().misses == 1
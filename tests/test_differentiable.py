@@ -1,3 +1,4 @@
+import pytest
 import torch
 from torch import nn
 
@@ -92,3 +93,45 @@ def test_ea_incoming_particle_beam():
     outgoing_beam = ea.track(incoming_beam)
 
     assert outgoing_beam.particles.grad_fn is not None
+
+
+def test_gradient_at_zero_k1():
+    """
+    Test that the gradient with respect to a quadrupole's k1 is finite and correct when
+    the quadrupole is switched off, i.e. at k1 = 0.
+    """
+    k1 = nn.Parameter(torch.tensor(0.0))
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=k1)
+
+    transfer_map = quadrupole.transfer_map(torch.tensor(1e8))
+    transfer_map[0, 0].backward()
+
+    # d/dk1 cos(sqrt(k1) * L) = -L**2 / 2 at k1 = 0
+    assert torch.isfinite(k1.grad)
+    assert torch.isclose(k1.grad, torch.tensor(-0.02))
+
+
+@pytest.mark.parametrize("BeamClass", [cheetah.ParameterBeam, cheetah.ParticleBeam])
+def test_gradient_at_zero_voltage(BeamClass):
+    """
+    Test that the gradients with respect to a cavity's voltage and length are finite
+    when the cavity is switched off, i.e. at voltage = 0, also next to a cavity in the
+    same batch that is switched on.
+    """
+    voltage = nn.Parameter(torch.tensor([0.0, 1e7]))
+    length = nn.Parameter(torch.tensor(1.0))
+    cavity = cheetah.Cavity(
+        length=length,
+        voltage=voltage,
+        phase=torch.tensor(0.0),
+        frequency=torch.tensor(1.3e9),
+    )
+    incoming = BeamClass.from_parameters(energy=torch.tensor(1e8))
+
+    outgoing = cavity.track(incoming)
+    (
+        outgoing.sigma_x + outgoing.mu_x + outgoing.sigma_y + outgoing.sigma_p
+    ).sum().backward()
+
+    assert torch.all(torch.isfinite(voltage.grad))
+    assert torch.isfinite(length.grad)
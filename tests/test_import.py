@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+import pytest
+from scipy import constants as scipy_constants
+
+import cheetah
+
+
+def test_import_does_not_load_heavy_dependencies():
+    """
+    Test that importing Cheetah does not import plotting, SciPy or the converters,
+    which are only needed once they are used.
+    """
+    deferred_modules = [
+        "matplotlib",
+        "scipy",
+        "cheetah.converters.astralavista",
+        "cheetah.converters.dontbmad",
+        "cheetah.converters.nocelot",
+        "cheetah.converters.nxtables",
+    ]
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, cheetah; "
+            f"print([m for m in {deferred_modules} if m in sys.modules])",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+    assert loaded == "[]"
+
+
+def test_constants_match_scipy():
+    """Test that Cheetah's physical constants are those of SciPy."""
+    assert cheetah.constants.speed_of_light == scipy_constants.speed_of_light
+    assert cheetah.constants.elementary_charge == scipy_constants.elementary_charge
+    assert cheetah.constants.electron_mass == pytest.approx(
+        scipy_constants.electron_mass, rel=1e-9
+    )
+    assert cheetah.constants.epsilon_0 == pytest.approx(
+        scipy_constants.epsilon_0, rel=1e-9
+    )
+    assert cheetah.constants.electron_mass_eV == pytest.approx(
+        scipy_constants.physical_constants["electron mass energy equivalent in MeV"][0]
+        * 1e6,
+        rel=1e-9,
+    )
@@ -1,4 +1,6 @@
-from cheetah.accelerator import Segment
+import torch
+
+from cheetah.accelerator import Drift, Quadrupole, Segment
 
 from .resources import ARESlatticeStage3v1_9 as ares
 
@@ -28,3 +30,30 @@ def test_save_and_reload(tmp_path):
     ):
         assert original_element.name == reloaded_element.name
         assert original_element.__class__ == reloaded_element.__class__
+
+
+def test_nested_segments(tmp_path):
+    """Test that nested segments are saved to and reloaded from LatticeJSON."""
+    original_segment = Segment(
+        [
+            Drift(length=torch.tensor(1.0), name="drift"),
+            Segment(
+                [
+                    Quadrupole(
+                        length=torch.tensor(0.2), k1=torch.tensor(4.2), name="quad"
+                    )
+                ],
+                name="inner",
+            ),
+        ],
+        name="outer",
+    )
+
+    original_segment.to_lattice_json(str(tmp_path / "nested.json"))
+    reloaded_segment = Segment.from_lattice_json(str(tmp_path / "nested.json"))
+
+    assert [element.name for element in reloaded_segment.elements] == [
+        "drift",
+        "inner",
+    ]
+    assert reloaded_segment.inner.quad.k1 == original_segment.inner.quad.k1
@@ -0,0 +1,73 @@
+import torch
+
+import cheetah
+
+
+def test_openpmd_round_trip(tmp_path):
+    """
+    Test that a `ParticleBeam` saved to an openPMD file with chunked, compressed
+    datasets is loaded unchanged, also in parts and after appending to its iteration.
+    """
+    path = str(tmp_path / "beam.h5")
+    beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        mu_x=torch.tensor(1e-4),
+        sigma_xp=torch.tensor(1e-4),
+        sigma_s=torch.tensor(1e-5),
+        sigma_p=torch.tensor(1e-3),
+        energy=torch.tensor(1e8),
+        dtype=torch.float64,
+    )
+
+    assert beam.to_openpmd(path, chunk_size=1_000, compression="gzip") == 0
+    loaded = cheetah.ParticleBeam.from_openpmd(path, dtype=torch.float64)
+    assert torch.allclose(loaded.particles, beam.particles, rtol=1e-12, atol=1e-15)
+    assert torch.allclose(loaded.particle_charges, beam.particle_charges)
+    assert loaded.energy == beam.energy
+
+    part = cheetah.ParticleBeam.from_openpmd(
+        path, particle_slice=slice(2_000, 3_000), dtype=torch.float64
+    )
+    assert torch.equal(part.particles, loaded.particles[2_000:3_000])
+
+    assert beam.to_openpmd(path, iteration=0) == 0
+    assert cheetah.ParticleBeam.from_openpmd(path).num_particles == 20_000
+
+
+def test_marker_writes_openpmd(tmp_path):
+    """
+    Test that active markers write the beams tracked through them to their openPMD
+    file, and that chunks tracked with `Segment.track_chunked` are written to the same
+    iteration.
+    """
+    path = str(tmp_path / "snapshots.h5")
+    segment = cheetah.Segment(
+        [
+            cheetah.Drift(length=torch.tensor(1.0), name="drift"),
+            cheetah.Marker(openpmd_file=path, name="first"),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor(4.0), name="quadrupole"
+            ),
+            cheetah.Marker(openpmd_file=path, name="second"),
+            cheetah.Marker(name="inactive"),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+
+    outgoing = segment.track(incoming)
+    segment.track_chunked(incoming, chunk_size=300)
+
+    for iteration in (1, 3):
+        snapshot = cheetah.ParticleBeam.from_openpmd(path, iteration=iteration)
+        assert torch.allclose(snapshot.particles, outgoing.particles, atol=1e-7)
+    assert [
+        element.name for element in segment.without_inactive_markers().elements
+    ] == ["drift", "first", "quadrupole", "second"]
+
+
+def test_marker_positional_name():
+    """Test that the first positional argument of a `Marker` is still its name."""
+    marker = cheetah.Marker("M1")
+
+    assert marker.name == "M1"
+    assert not marker.is_active
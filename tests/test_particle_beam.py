@@ -103,3 +103,66 @@ def test_from_twiss_to_twiss():
     assert np.isclose(beam.alpha_y.cpu().numpy(), 1.0, rtol=1e-2)
     assert np.isclose(beam.emittance_y.cpu().numpy(), 3.497810737006068e-09, rtol=1e-2)
     assert np.isclose(beam.energy.cpu().numpy(), 6e6)
+
+
+def test_moments_match_reference():
+    """
+    Test that the fused moments of a beam match the mean and covariance computed with
+    PyTorch, and that the statistical properties are derived from them.
+    """
+    beam = ParticleBeam.from_parameters(
+        num_particles=torch.tensor(100_000),
+        mu_x=torch.tensor(1e-3),
+        sigma_x=torch.tensor(1e-5),
+        sigma_xp=torch.tensor(2e-6),
+        cor_x=torch.tensor(1e-11),
+        total_charge=torch.tensor(1e-9),
+    )
+
+    mean, cov = beam.moments()
+    coordinates = beam.particles[:, :6].double()
+
+    assert torch.allclose(mean.double(), coordinates.mean(dim=0), rtol=1e-5)
+    assert torch.allclose(cov.double(), torch.cov(coordinates.T), rtol=1e-3, atol=1e-16)
+    assert torch.isclose(beam.sigma_x, coordinates[:, 0].std().float(), rtol=1e-4)
+    assert torch.isclose(beam.sigma_xxp, cov[0, 1])
+
+
+def test_moments_weighted_by_charge():
+    """Test that the moments of a beam are weighted by the charges of its particles."""
+    particles = torch.zeros(3, 7)
+    particles[:, 0] = torch.tensor([0.0, 1.0, 2.0])
+    particles[:, 6] = 1.0
+
+    uncharged = ParticleBeam(particles, energy=torch.tensor(1e8))
+    charged = ParticleBeam(
+        particles,
+        energy=torch.tensor(1e8),
+        particle_charges=torch.tensor([1e-12, 1e-12, 2e-12]),
+    )
+
+    assert torch.isclose(uncharged.mu_x, torch.tensor(1.0))
+    assert torch.isclose(charged.mu_x, torch.tensor(1.25))
+
+
+def test_moments_cache_invalidation():
+    """
+    Test that cached moments are recomputed after the particles of a beam have been
+    modified in place, and that they are not cached when gradients are needed.
+    """
+    beam = ParticleBeam.from_parameters(
+        num_particles=torch.tensor(10_000), sigma_x=torch.tensor(1e-5)
+    )
+
+    assert beam.moments() is beam.moments()
+    sigma_x = beam.sigma_x
+
+    beam.xs *= 2
+    assert torch.isclose(beam.sigma_x, 2 * sigma_x)
+
+    particles = beam.particles.clone().requires_grad_(True)
+    differentiable_beam = ParticleBeam(particles, energy=beam.energy)
+    differentiable_beam.sigma_x.backward()
+    differentiable_beam.sigma_y.backward()
+
+    assert particles.grad is not None
@@ -20,3 +20,15 @@ def test_quadrupole_off():
 
     assert torch.allclose(outbeam_quad.sigma_x, outbeam_drift.sigma_x)
     assert not torch.allclose(outbeam_quad_on.sigma_x, outbeam_drift.sigma_x)
+
+
+def test_quadrupole_off_transfer_map():
+    """
+    Test that the transfer map of a quadrupole with k1=0 is the same as that of a drift
+    of the same length.
+    """
+    quadrupole = Quadrupole(length=torch.tensor(0.5), k1=torch.tensor(0.0))
+    drift = Drift(length=torch.tensor(0.5))
+    energy = torch.tensor(1e8)
+
+    assert torch.allclose(quadrupole.transfer_map(energy), drift.transfer_map(energy))
@@ -1,5 +1,7 @@
 import numpy as np
+import pytest
 import torch
+from torch.distributions import MultivariateNormal
 
 import cheetah
 
@@ -95,3 +97,108 @@ def test_reading_shows_beam_ares():
     assert segment.AREABSCR1.reading.shape == (2040, 2448)
     assert torch.all(segment.AREABSCR1.reading >= 0.0)
     assert torch.any(segment.AREABSCR1.reading > 0.0)
+
+
+def test_ngp_reading_matches_histogram():
+    """
+    Test that the nearest-grid-point reading of a `ParticleBeam` equals a histogram of
+    the particle positions over the binned pixels.
+    """
+    screen = cheetah.Screen(
+        resolution=torch.tensor((100, 80)),
+        pixel_size=torch.tensor((1e-5, 1e-5)),
+        binning=torch.tensor(2),
+        is_active=True,
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(2e-4), sigma_y=torch.tensor(1e-4)
+    )
+
+    screen.track(incoming)
+    read_beam = screen.get_read_beam()
+    histogram = torch.histogramdd(
+        torch.stack((read_beam.xs, read_beam.ys)).T, bins=screen.pixel_bin_edges
+    )[0]
+    expected = torch.flip(histogram.T, dims=(-2,))
+
+    assert screen.reading.shape == (40, 50)
+    assert torch.equal(screen.reading, expected)
+
+
+@pytest.mark.parametrize("method", ["cic", "gaussian"])
+def test_smooth_reading_is_differentiable(method):
+    """
+    Test that the cloud-in-cell and Gaussian readings conserve the number of particles
+    on the screen, are centred on the beam and carry gradients to the beam.
+    """
+    screen = cheetah.Screen(
+        resolution=torch.tensor((100, 100)),
+        pixel_size=torch.tensor((1e-5, 1e-5)),
+        is_active=True,
+        method=method,
+    )
+    base = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(5e-5), sigma_y=torch.tensor(5e-5)
+    )
+    mu_x = torch.tensor(1e-4, requires_grad=True)
+    offset = torch.zeros(7)
+    offset[0] = 1.0
+    incoming = cheetah.ParticleBeam(base.particles + mu_x * offset, energy=base.energy)
+
+    screen.track(incoming)
+    image = screen.reading
+
+    assert torch.isclose(image.sum(), torch.tensor(10_000.0), rtol=1e-3)
+    # Horizontal centroid in pixels, with the screen centre at pixel 50
+    centroid = (image.sum(dim=0) * (torch.arange(100) + 0.5)).sum() / image.sum()
+    assert torch.isclose(centroid, torch.tensor(60.0), atol=0.2)
+
+    centroid.backward()
+    assert torch.isclose(mu_x.grad, torch.tensor(1e5), rtol=1e-2)
+
+
+def test_parameter_beam_reading_matches_density():
+    """
+    Test that the reading of a batch of correlated `ParameterBeam`s equals the mean
+    probability density of the beams in each pixel.
+    """
+    screen = cheetah.Screen(
+        resolution=torch.tensor((100, 80)),
+        pixel_size=torch.tensor((1e-5, 1e-5)),
+        is_active=True,
+    )
+    incoming = cheetah.ParameterBeam.from_parameters(
+        mu_x=torch.tensor([1e-5, -3e-5]),
+        mu_y=torch.tensor([-2e-5, 0.0]),
+        sigma_x=torch.tensor([2e-4, 1e-4]),
+        sigma_y=torch.tensor([1e-4, 1.5e-4]),
+    )
+    # Couple x and y, with a correlation coefficient of 0.6 and -0.3
+    cov = incoming._cov.clone()
+    rho = torch.tensor([0.6, -0.3])
+    cov[..., 0, 2] = cov[..., 2, 0] = (
+        rho * cov[..., 0, 0].sqrt() * cov[..., 2, 2].sqrt()
+    )
+    incoming = cheetah.ParameterBeam(incoming._mu, cov, incoming.energy)
+
+    screen.track(incoming)
+    image = screen.reading
+
+    # Reference from the density evaluated on a finer grid, averaged over each pixel
+    supersampling = 8
+    fine_pixel_size = 1e-5 / supersampling
+    xs = -5e-4 + (torch.arange(100 * supersampling).double() + 0.5) * fine_pixel_size
+    ys = -4e-4 + (torch.arange(80 * supersampling).double() + 0.5) * fine_pixel_size
+    positions = torch.stack(torch.meshgrid(xs, ys, indexing="ij"), dim=-1)
+    distribution = MultivariateNormal(
+        incoming._mu[..., [0, 2]].double(),
+        covariance_matrix=cov[..., [0, 2], :][..., [0, 2]].double(),
+    )
+    density = distribution.log_prob(positions.unsqueeze(-2)).exp()
+    expected = density.view(100, supersampling, 80, supersampling, 2).mean(dim=(1, 3))
+    expected = torch.flip(expected.permute(2, 1, 0), dims=(-2,))
+
+    assert image.shape == (2, 80, 100)
+    assert torch.allclose(
+        image.double(), expected, rtol=1e-3, atol=1e-3 * expected.max()
+    )
@@ -0,0 +1,215 @@
+import pytest
+import torch
+
+import cheetah
+from cheetah.track_methods import second_order_moments, second_order_terms
+
+
+def test_parameter_beam_second_order_moments():
+    """
+    Test that the moments of a `ParameterBeam` tracked through a second-order plan match
+    the moments of a Gaussian `ParticleBeam` tracked through the same second-order map,
+    including the chromatic growth of the beam size that linear tracking misses.
+    """
+    # The quadrupole focuses a wide beam to a waist, whose size is dominated by the
+    # chromatic aberration of the quadrupole
+    segment = cheetah.Segment(
+        [
+            cheetah.Solenoid(
+                length=torch.tensor(0.2), k=torch.tensor(0.2), dtype=torch.float64
+            ),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor(12.0), dtype=torch.float64
+            ),
+            cheetah.Drift(length=torch.tensor(0.25), dtype=torch.float64),
+            cheetah.Dipole(
+                length=torch.tensor(0.1),
+                angle=torch.tensor(0.01),
+                e1=torch.tensor(0.005),
+                dtype=torch.float64,
+            ),
+        ]
+    )
+    parameters = dict(
+        sigma_x=torch.tensor(1e-3),
+        sigma_xp=torch.tensor(1e-6),
+        sigma_y=torch.tensor(1e-4),
+        sigma_yp=torch.tensor(1e-6),
+        sigma_p=torch.tensor(1e-2),
+        dtype=torch.float64,
+    )
+    parameter_beam = cheetah.ParameterBeam.from_parameters(**parameters)
+    particle_beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000, **parameters
+    )
+
+    plan = segment.compile(order=2)
+    outgoing_parameter_beam = plan(parameter_beam)
+    outgoing_particle_beam = plan(particle_beam)
+    linear = segment.track(parameter_beam)
+
+    for name in ["sigma_x", "sigma_xp", "sigma_y", "sigma_yp"]:
+        assert torch.isclose(
+            getattr(outgoing_parameter_beam, name),
+            getattr(outgoing_particle_beam, name),
+            rtol=1e-2,
+        )
+    assert not torch.isclose(linear.sigma_x, outgoing_particle_beam.sigma_x, rtol=0.2)
+
+
+def test_second_order_moments_of_cold_beam():
+    """
+    Test that the mean of a beam without spread follows the second-order map of a single
+    particle and that its covariance stays zero.
+    """
+    R, T = cheetah.Quadrupole(
+        length=torch.tensor(0.2), k1=torch.tensor(4.2), dtype=torch.float64
+    ).second_order_map(torch.tensor(1e8, dtype=torch.float64))
+    mu = torch.tensor([1e-3, -2e-3, 5e-4, 1e-3, 0.0, 1e-2, 1.0], dtype=torch.float64)
+
+    outgoing_mu, outgoing_cov = second_order_moments(
+        R, T, mu, torch.zeros(7, 7, dtype=torch.float64)
+    )
+    expected = R @ mu + second_order_terms(T, mu.unsqueeze(0)).squeeze(0)
+
+    assert torch.allclose(outgoing_mu, expected, rtol=0, atol=1e-15)
+    assert torch.equal(outgoing_cov, torch.zeros(7, 7, dtype=torch.float64))
+
+
+@pytest.mark.parametrize("inplace", [False, True])
+def test_plan_concatenates_second_order_maps(inplace):
+    """
+    Test that tracking through the concatenated second-order map of a segment agrees
+    with tracking through the second-order maps of its elements one after another, up
+    to terms of third order.
+    """
+    elements = [
+        cheetah.Drift(length=torch.tensor(0.5), dtype=torch.float64),
+        cheetah.Quadrupole(
+            length=torch.tensor(0.2),
+            k1=torch.tensor(4.2),
+            misalignment=torch.tensor([1e-4, 0.0]),
+            dtype=torch.float64,
+        ),
+        cheetah.Dipole(
+            length=torch.tensor(0.3),
+            angle=torch.tensor(0.1),
+            e1=torch.tensor(0.05),
+            e2=torch.tensor(0.05),
+            dtype=torch.float64,
+        ),
+        cheetah.Drift(length=torch.tensor(0.5), dtype=torch.float64),
+    ]
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000,
+        sigma_x=torch.tensor(1e-4),
+        sigma_xp=torch.tensor(1e-4),
+        sigma_p=torch.tensor(1e-3),
+        dtype=torch.float64,
+    )
+
+    outgoing = cheetah.Segment(elements).compile(inplace=inplace, order=2)(incoming)
+
+    expected = incoming
+    for element in elements:
+        tm, ttensor = element.second_order_map(incoming.energy)
+        expected = cheetah.CustomTransferMap(
+            tm, second_order_tensor=ttensor, dtype=torch.float64
+        ).track(expected)
+    linear = cheetah.Segment(elements).track(incoming)
+
+    assert torch.allclose(outgoing.particles, expected.particles, rtol=0, atol=1e-8)
+    assert not torch.allclose(linear.particles, expected.particles, rtol=0, atol=1e-7)
+
+
+def test_solenoid_chromatic_terms():
+    """
+    Test that the second-order map of a `Solenoid` captures the dependence of its
+    focusing on the particle momentum, by comparing to the linear map of solenoids
+    whose lengths are scaled by the inverse of the momentum of each particle.
+    """
+    solenoid = cheetah.Solenoid(
+        length=torch.tensor(0.5), k=torch.tensor(2.0), dtype=torch.float64
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=100,
+        sigma_x=torch.tensor(1e-3),
+        sigma_xp=torch.tensor(1e-3),
+        sigma_y=torch.tensor(1e-3),
+        sigma_yp=torch.tensor(1e-3),
+        sigma_p=torch.tensor(1e-4),
+        energy=torch.tensor(1e10),
+        dtype=torch.float64,
+    )
+
+    outgoing = cheetah.Segment([solenoid]).compile(order=2)(incoming)
+
+    # Relative momentum deviation of each particle, for an ultrarelativistic beam
+    delta = incoming.particles[:, 5]
+    exact_solenoid = cheetah.Solenoid(
+        length=0.5 / (1 + delta), k=torch.tensor(2.0), dtype=torch.float64
+    )
+    exact_tm = exact_solenoid.transfer_map(incoming.energy)
+    expected = torch.einsum("nij,nj->ni", exact_tm, incoming.particles)
+    linear = solenoid.track(incoming)
+
+    second_order_error = (outgoing.particles[:, :4] - expected[:, :4]).abs().max()
+    linear_error = (linear.particles[:, :4] - expected[:, :4]).abs().max()
+    assert second_order_error < 1e-3 * linear_error
+
+
+def test_second_order_map_is_batched_and_differentiable():
+    """
+    Test that second-order tracking supports batched element parameters and carries
+    gradients to them.
+    """
+    k1 = torch.tensor([4.0, -2.0], requires_grad=True)
+    segment = cheetah.Segment(
+        [
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=k1),
+            cheetah.Drift(length=torch.tensor(1.0)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_x=torch.tensor(1e-4), sigma_p=torch.tensor(1e-2)
+    )
+
+    outgoing = segment.compile(order=2)(incoming)
+    outgoing.sigma_x.sum().backward()
+
+    assert outgoing.particles.shape == (2, 1_000, 7)
+    assert k1.grad is not None
+    assert torch.all(torch.isfinite(k1.grad))
+
+
+def test_custom_transfer_map_round_trip(tmp_path):
+    """
+    Test that a `CustomTransferMap` with a second-order tensor survives a round trip
+    through LatticeJSON and through a binary lattice snapshot.
+    """
+    quadrupole = cheetah.Quadrupole(
+        length=torch.tensor(0.2), k1=torch.tensor(4.2), dtype=torch.float64
+    )
+    energy = torch.tensor(1e8, dtype=torch.float64)
+    tm, ttensor = quadrupole.second_order_map(energy)
+    segment = cheetah.Segment(
+        [
+            cheetah.CustomTransferMap(
+                tm,
+                length=torch.tensor(0.2),
+                second_order_tensor=ttensor,
+                name="custom",
+                dtype=torch.float64,
+            )
+        ]
+    )
+    segment.to_lattice_json(str(tmp_path / "lattice.json"))
+    segment.to_snapshot(tmp_path / "lattice.snapshot")
+    for loaded in (
+        cheetah.Segment.from_lattice_json(str(tmp_path / "lattice.json")),
+        cheetah.Segment.from_snapshot(tmp_path / "lattice.snapshot"),
+    ):
+        loaded_tm, loaded_ttensor = loaded.custom.second_order_map(energy)
+        assert torch.allclose(loaded_tm.double(), tm)
+        assert torch.allclose(loaded_ttensor.double(), ttensor)
+        assert loaded.custom.length.item() == pytest.approx(0.2)
@@ -0,0 +1,78 @@
+import torch
+
+import cheetah
+
+
+def make_segment() -> cheetah.Segment:
+    """Create a segment with an element name that occurs twice."""
+    return cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="D1"),
+            cheetah.Quadrupole(length=torch.tensor(0.2), name="Q1"),
+            cheetah.Drift(length=torch.tensor(0.3), name="D2"),
+            cheetah.Quadrupole(length=torch.tensor(0.2), name="Q2"),
+            cheetah.Drift(length=torch.tensor(0.3), name="D2"),
+            cheetah.Screen(name="S1"),
+        ]
+    )
+
+
+def test_name_access_with_duplicates():
+    """
+    Test that elements are accessible by name, and that elements sharing a name are
+    accessible as a list in order of occurrence.
+    """
+    segment = make_segment()
+
+    assert segment.Q1 is segment.elements[1]
+    assert segment.D2 == [segment.elements[2], segment.elements[4]]
+
+
+def test_subcell_shares_elements():
+    """
+    Test that a subcell contains the elements from start to end, shares them with the
+    original segment and makes them accessible by name.
+    """
+    segment = make_segment()
+
+    subcell = segment.subcell("Q1", "Q2")
+
+    assert [element.name for element in subcell.elements] == ["Q1", "D2", "Q2"]
+    assert subcell.Q2 is segment.Q2
+    assert subcell.D2 is segment.elements[2]
+    assert not hasattr(subcell, "S1")
+
+    subcell.Q1.k1 = torch.tensor(4.2)
+    assert segment.Q1.k1 == 4.2
+
+    # Nested subcells and submodules work as for any other segment
+    assert [element.name for element in subcell.subcell("D2", "Q2").elements] == [
+        "D2",
+        "Q2",
+    ]
+    assert segment.Q2 in list(subcell.modules())
+
+
+def test_subcell_missing_names():
+    """
+    Test that a subcell with an unknown start is empty and that one with an unknown end
+    extends to the end of the segment.
+    """
+    segment = make_segment()
+
+    assert len(segment.subcell("unknown", "Q2").elements) == 0
+    assert len(segment.subcell("Q2", "unknown").elements) == 3
+    assert len(segment.subcell("Q2", "Q1").elements) == 0
+
+
+def test_subcell_after_modifying_elements():
+    """Test that subcells find elements that were added after creating the segment."""
+    segment = make_segment()
+
+    segment.elements.insert(0, cheetah.Marker(name="M1"))
+
+    assert [element.name for element in segment.subcell("M1", "Q1").elements] == [
+        "M1",
+        "D1",
+        "Q1",
+    ]
@@ -0,0 +1,104 @@
+import torch
+
+import cheetah
+
+from .resources import ARESlatticeStage3v1_9 as ares
+
+
+def assert_same_elements(original: cheetah.Element, loaded: cheetah.Element) -> None:
+    """Assert that two elements have the same class, name and defining features."""
+    assert original.__class__ == loaded.__class__
+    assert original.name == loaded.name
+    for feature in original.defining_features:
+        original_value = getattr(original, feature)
+        loaded_value = getattr(loaded, feature)
+        if isinstance(original_value, torch.Tensor):
+            assert original_value.dtype == loaded_value.dtype
+            assert torch.equal(original_value, loaded_value)
+        elif isinstance(original_value, cheetah.Element):
+            assert_same_elements(original_value, loaded_value)
+        else:
+            assert original_value == loaded_value
+
+
+def test_snapshot_round_trip(tmp_path):
+    """
+    Test that a lattice with nested segments, elements of different dtypes and an
+    attached wakefield is saved to a snapshot and loaded back exactly, and that the
+    loaded parameters point into the memory-mapped snapshot.
+    """
+    inner = cheetah.Segment(
+        [
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2),
+                k1=torch.tensor(4.2),
+                misalignment=torch.tensor([1e-4, 2e-4]),
+                name="quadrupole",
+                dtype=torch.float64,
+            ),
+            cheetah.Cavity(
+                length=torch.tensor(1.0377),
+                voltage=torch.tensor(0.01815975e9),
+                phase=torch.tensor(20.0),
+                frequency=torch.tensor(1.3e9),
+                wakefield=cheetah.Wakefield.from_functions(
+                    0.01, longitudinal_wake=lambda s: 1e13 * torch.exp(-s / 1e-3)
+                ),
+                name="cavity",
+            ),
+        ],
+        name="inner",
+    )
+    segment = cheetah.Segment(
+        [cheetah.Segment.from_ocelot(ares.cell, name="ares", warnings=False), inner],
+        name="outer",
+    )
+
+    segment.to_snapshot(tmp_path / "lattice.cheetah")
+    loaded = cheetah.Segment.from_snapshot(tmp_path / "lattice.cheetah")
+
+    assert [element.name for element in loaded.elements] == ["ares", "inner"]
+    original_elements = segment.flattened().elements
+    loaded_elements = loaded.flattened().elements
+    assert len(original_elements) == len(loaded_elements)
+    for original_element, loaded_element in zip(original_elements, loaded_elements):
+        assert_same_elements(original_element, loaded_element)
+
+    storages = {
+        element.length.untyped_storage().data_ptr()
+        for element in loaded_elements
+        if hasattr(element, "length")
+    }
+    assert len(storages) == 1
+
+
+def test_snapshot_parameters_change_independently(tmp_path):
+    """
+    Test that changing a parameter of a lattice loaded from a snapshot in place only
+    invalidates the cached transfer map of its element, and that checkpointed tracking
+    resumes from that element.
+    """
+    segment = cheetah.Segment(
+        [
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor(float(i)), name=f"Q{i}"
+            )
+            for i in range(20)
+        ]
+    )
+    segment.to_snapshot(tmp_path / "lattice.cheetah")
+    loaded = cheetah.Segment.from_snapshot(tmp_path / "lattice.cheetah")
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+
+    loaded.enable_transfer_map_cache()
+    tracker = loaded.checkpointed()
+    _ = tracker(incoming)
+    loaded.track(incoming)
+    assert loaded.transfer_map_cache_info().misses == 20
+
+    loaded.Q10.k1.add_(0.1)
+    loaded.track(incoming)
+    assert loaded.transfer_map_cache_info().misses == 21
+
+    _ = tracker(incoming)
+    assert tracker.resumed_from == 10
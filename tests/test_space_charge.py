@@ -0,0 +1,228 @@
+import math
+
+import pytest
+import torch
+from scipy import constants, integrate
+from torch import nn
+
+import cheetah
+
+
+def gaussian_bunch_field(position: list[float], sigmas: list[float], charge: float):
+    """
+    Electric field of a 3D Gaussian charge distribution centred on the origin, computed
+    by numerically integrating the potential's integral representation over `log(q)`.
+    """
+
+    def integrand(log_q: float, axis: int) -> float:
+        q = math.exp(log_q)
+        denominators = [2 * sigma**2 + q for sigma in sigmas]
+        exponent = sum(r**2 / d for r, d in zip(position, denominators))
+        return (
+            q
+            * 2
+            * position[axis]
+            / denominators[axis]
+            * math.exp(-exponent)
+            / math.sqrt(math.prod(denominators))
+        )
+
+    return [
+        charge
+        / (4 * math.pi * constants.epsilon_0 * math.sqrt(math.pi))
+        * integrate.quad(integrand, -40, 10, args=(axis,), limit=500)[0]
+        for axis in range(3)
+    ]
+
+
+def test_space_charge_kick_matches_gaussian_bunch():
+    """
+    Test that the space charge kicks of uncharged probe particles in a Gaussian bunch
+    match the analytic fields of a Gaussian charge distribution.
+    """
+    torch.manual_seed(42)
+    energy = torch.tensor(5e6, dtype=torch.float64)
+    sigma_x, sigma_y, sigma_s = 1e-3, 0.5e-3, 1e-3
+    beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=200_000,
+        sigma_x=torch.tensor(sigma_x),
+        sigma_y=torch.tensor(sigma_y),
+        sigma_xp=torch.tensor(1e-9),
+        sigma_yp=torch.tensor(1e-9),
+        sigma_s=torch.tensor(sigma_s),
+        sigma_p=torch.tensor(1e-9),
+        energy=energy,
+        total_charge=torch.tensor(1e-9),
+        dtype=torch.float64,
+    )
+
+    # Probe particles along each axis of the bunch
+    offsets = torch.linspace(-2.5, 2.5, 10, dtype=torch.float64)
+    probes = torch.zeros(30, 7, dtype=torch.float64)
+    probes[:10, 0] = offsets * sigma_x
+    probes[10:20, 2] = offsets * sigma_y
+    probes[20:, 4] = offsets * sigma_s
+    probes[:, 6] = 1.0
+    probed_beam = cheetah.ParticleBeam(
+        torch.cat([beam.particles, probes]),
+        energy,
+        particle_charges=torch.cat([beam.particle_charges, torch.zeros(30)]),
+        dtype=torch.float64,
+    )
+
+    kick = cheetah.SpaceChargeKick(effect_length=torch.tensor(0.1), dtype=torch.float64)
+    outgoing = kick.track(probed_beam)
+    kicks = (outgoing.particles - probed_beam.particles)[-30:]
+
+    gamma, _, beta = cheetah.track_methods.compute_relativistic_factors(energy)
+    gamma, beta = gamma.item(), beta.item()
+    momentum = beta * energy.item()
+    expected = []
+    for probe in probes:
+        # Fields in the rest frame of the bunch, which is longer by gamma
+        fields = gaussian_bunch_field(
+            [probe[0].item(), probe[2].item(), -gamma * beta * probe[4].item()],
+            [sigma_x, sigma_y, gamma * beta * sigma_s],
+            1e-9,
+        )
+        expected.append(
+            [
+                fields[0] * 0.1 / (gamma * beta * momentum),
+                fields[1] * 0.1 / (gamma * beta * momentum),
+                fields[2] * 0.1 / momentum,
+            ]
+        )
+    expected = torch.tensor(expected, dtype=torch.float64)
+
+    assert torch.allclose(kicks[:10, 1], expected[:10, 0], rtol=0.1)
+    assert torch.allclose(kicks[10:20, 3], expected[10:20, 1], rtol=0.1)
+    assert torch.allclose(kicks[20:, 5], expected[20:, 2], rtol=0.1)
+
+
+def test_space_charge_expansion_matches_envelope_equation():
+    """
+    Test that the rms size of the central slice of a long cold bunch expanding in a
+    drift under its own space charge follows the rms envelope equation of a round beam.
+    """
+    torch.manual_seed(42)
+    energy = torch.tensor(5e6, dtype=torch.float64)
+    charge, sigma_s, sigma_0, length = 1e-9, 5e-3, 1e-3, 0.5
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000,
+        sigma_x=torch.tensor(sigma_0),
+        sigma_y=torch.tensor(sigma_0),
+        sigma_xp=torch.tensor(1e-9),
+        sigma_yp=torch.tensor(1e-9),
+        sigma_s=torch.tensor(sigma_s),
+        sigma_p=torch.tensor(1e-9),
+        energy=energy,
+        total_charge=torch.tensor(charge),
+        dtype=torch.float64,
+    )
+    segment = cheetah.Segment(
+        [cheetah.Drift(length=torch.tensor(length), dtype=torch.float64)]
+    ).with_space_charge_kicks(
+        resolution=torch.tensor(0.1, dtype=torch.float64), dtype=torch.float64
+    )
+
+    outgoing = segment.track(incoming)
+    is_central = incoming.particles[:, 4].abs() < 0.1 * sigma_s
+    sigma_central = outgoing.particles[is_central, 0].std().item()
+
+    # Perveance of the peak current of the bunch
+    gamma, _, beta = cheetah.track_methods.compute_relativistic_factors(energy)
+    gamma, beta = gamma.item(), beta.item()
+    peak_current = charge * beta * constants.c / (math.sqrt(2 * math.pi) * sigma_s)
+    alfven_current = (
+        4 * math.pi * constants.epsilon_0 * constants.m_e * constants.c**3 / constants.e
+    )
+    perveance = 2 * peak_current / (alfven_current * (beta * gamma) ** 3)
+    envelope = integrate.solve_ivp(
+        lambda _, y: [y[1], perveance / (4 * y[0])],
+        (0, length),
+        [sigma_0, 0.0],
+        rtol=1e-10,
+    )
+    sigma_expected = envelope.y[0, -1]
+
+    assert sigma_expected > 1.05 * sigma_0
+    assert sigma_central - sigma_0 == pytest.approx(sigma_expected - sigma_0, rel=0.05)
+
+
+def test_space_charge_kick_is_differentiable():
+    """
+    Test that gradients of the beam after a space charge kick flow back to the charge
+    of the incoming beam and to the settings of the magnets before the kick.
+    """
+    total_charge = torch.tensor(1e-10, requires_grad=True)
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_s=torch.tensor(1e-4),
+        total_charge=total_charge,
+        energy=torch.tensor(1e7),
+    )
+    segment = cheetah.Segment(
+        [
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=nn.Parameter(torch.tensor(4.2))
+            ),
+            cheetah.SpaceChargeKick(
+                effect_length=torch.tensor(0.1),
+                num_grid_points_x=16,
+                num_grid_points_y=16,
+                num_grid_points_tau=16,
+            ),
+        ]
+    )
+
+    segment.track(incoming).sigma_yp.backward()
+
+    assert total_charge.grad > 0
+    assert segment.elements[0].k1.grad is not None
+    assert segment.elements[0].k1.grad != 0
+
+
+def test_with_space_charge_kicks():
+    """
+    Test that space charge kicks are inserted around all slices of a segment, that they
+    integrate over the full length of the segment, that they have no effect on beams
+    without charge and that such segments cannot be tracked in chunks.
+    """
+    segment = cheetah.Segment(
+        [
+            cheetah.Drift(length=torch.tensor(0.25), dtype=torch.float64),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.25), k1=torch.tensor(4.2), dtype=torch.float64
+            ),
+            cheetah.BPM(),
+        ]
+    )
+    space_charge_segment = segment.with_space_charge_kicks(
+        resolution=torch.tensor(0.125, dtype=torch.float64),
+        num_grid_points_x=16,
+        num_grid_points_y=16,
+        num_grid_points_tau=16,
+        dtype=torch.float64,
+    )
+    kicks = [
+        element
+        for element in space_charge_segment.elements
+        if isinstance(element, cheetah.SpaceChargeKick)
+    ]
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, total_charge=torch.tensor(0.0), dtype=torch.float64
+    )
+
+    assert len(space_charge_segment.elements) == 10
+    assert len(kicks) == 5
+    assert all(kick.num_grid_points_x == 16 for kick in kicks)
+    assert torch.isclose(
+        sum(kick.effect_length for kick in kicks),
+        torch.tensor(0.5, dtype=torch.float64),
+    )
+    assert torch.allclose(
+        space_charge_segment.track(incoming).particles,
+        segment.track(incoming).particles,
+    )
+    with pytest.raises(NotImplementedError):
+        space_charge_segment.track_chunked(incoming, chunk_size=100)
@@ -0,0 +1,140 @@
+import pytest
+import torch
+
+import cheetah
+
+
+def make_elements(**kwargs) -> list[cheetah.Element]:
+    """Create one element of every type that supports symplectic integration."""
+    return [
+        cheetah.Quadrupole(
+            length=torch.tensor(0.3),
+            k1=torch.tensor(4.2),
+            misalignment=torch.tensor([1e-4, 2e-4]),
+            tilt=torch.tensor(0.1),
+            dtype=torch.float64,
+            **kwargs,
+        ),
+        cheetah.Dipole(
+            length=torch.tensor(0.3),
+            angle=torch.tensor(0.2),
+            e1=torch.tensor(0.05),
+            fringe_integral=torch.tensor(0.1),
+            gap=torch.tensor(0.02),
+            tilt=torch.tensor(0.3),
+            dtype=torch.float64,
+            **kwargs,
+        ),
+        cheetah.Solenoid(
+            length=torch.tensor(0.3),
+            k=torch.tensor(2.0),
+            misalignment=torch.tensor([1e-4, 0.0]),
+            dtype=torch.float64,
+            **kwargs,
+        ),
+        cheetah.Cavity(
+            length=torch.tensor(1.0377),
+            voltage=torch.tensor(0.01815975e9),
+            phase=torch.tensor(20.0),
+            frequency=torch.tensor(1.3e9),
+            dtype=torch.float64,
+            **kwargs,
+        ),
+    ]
+
+
+@pytest.mark.parametrize(
+    "tracking_method, order", [("drift_kick_drift", 2), ("yoshida", 4)]
+)
+@pytest.mark.parametrize("index", range(4))
+def test_integrator_converges_to_transfer_map(tracking_method, order, index):
+    """
+    Test that the integrated transfer map of every element converges to its exact
+    transfer map with the order of the integrator.
+    """
+    energy = torch.tensor(1e7, dtype=torch.float64)
+    exact = make_elements()[index].transfer_map(energy)
+
+    errors = [
+        (
+            make_elements(num_steps=num_steps, tracking_method=tracking_method)[index]
+            .transfer_map(energy)
+            .sub(exact)
+            .abs()
+            .max()
+        )
+        for num_steps in (16, 32)
+    ]
+
+    assert errors[1] < 1e-3
+    assert 0.9 * 2**order < errors[0] / errors[1] < 1.1 * 2**order
+
+
+def test_integrated_transfer_map_is_symplectic():
+    """
+    Test that the transfer map of a dipole integrated in a few steps is symplectic,
+    even though it is still far from the exact transfer map.
+    """
+    dipole = cheetah.Dipole(
+        length=torch.tensor(0.3),
+        angle=torch.tensor(0.2),
+        e1=torch.tensor(0.05),
+        num_steps=2,
+        tracking_method="yoshida",
+        dtype=torch.float64,
+    )
+    R = dipole.transfer_map(torch.tensor(1e7, dtype=torch.float64))[:6, :6]
+
+    # Cheetah's longitudinal coordinates are conjugate with the opposite sign
+    J_2 = torch.tensor([[0.0, 1.0], [-1.0, 0.0]], dtype=torch.float64)
+    J = torch.block_diag(J_2, J_2, -J_2)
+
+    assert torch.allclose(R.T @ J @ R, J, rtol=0, atol=1e-14)
+
+
+def test_split_elements_track_like_original():
+    """
+    Test that tracking through the slices of an element gives the same result as
+    tracking through the element, with the faces of a dipole kept on its first and last
+    slice, and that the slices keep the integrator of the element.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000,
+        sigma_x=torch.tensor(1e-4),
+        sigma_xp=torch.tensor(1e-4),
+        sigma_p=torch.tensor(1e-3),
+        dtype=torch.float64,
+    )
+
+    for element in make_elements(num_steps=10, tracking_method="yoshida")[:3]:
+        slices = element.split(resolution=torch.tensor(0.07, dtype=torch.float64))
+
+        assert len(slices) == 5
+        assert all(s.tracking_method == "yoshida" for s in slices)
+        assert sum(s.num_steps for s in slices) == 13
+        assert torch.allclose(
+            cheetah.Segment(slices).track(incoming).particles,
+            element.track(incoming).particles,
+            rtol=0,
+            atol=1e-9,
+        )
+
+
+def test_changing_tracking_method_invalidates_cache():
+    """
+    Test that the cached transfer map of an element is rebuilt when its tracking
+    method or number of steps changes.
+    """
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.3), k1=torch.tensor(4.2))
+    quadrupole.enable_transfer_map_cache()
+    energy = torch.tensor(1e8)
+
+    exact = quadrupole.transfer_map(energy)
+    quadrupole.tracking_method = "drift_kick_drift"
+    integrated = quadrupole.transfer_map(energy)
+    quadrupole.num_steps = 10
+    refined = quadrupole.transfer_map(energy)
+
+    assert quadrupole.transfer_map_cache_info().misses == 3
+    assert not torch.allclose(integrated, exact)
+    assert (refined - exact).abs().max() < (integrated - exact).abs().max()
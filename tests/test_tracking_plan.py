@@ -0,0 +1,162 @@
+import torch
+from torch import nn
+
+import cheetah
+
+from .resources import ARESlatticeStage3v1_9 as ares
+
+
+def make_segment() -> cheetah.Segment:
+    """Create a segment with nested segments and a non-skippable element."""
+    return cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Segment(
+                elements=[
+                    cheetah.Quadrupole(
+                        length=torch.tensor(0.2), k1=torch.tensor(4.2), name="Q1"
+                    ),
+                    cheetah.Drift(length=torch.tensor(0.3)),
+                ],
+                name="inner",
+            ),
+            cheetah.Cavity(
+                length=torch.tensor(1.0377),
+                voltage=torch.tensor(1e7),
+                phase=torch.tensor(-20.0),
+                frequency=torch.tensor(1.3e9),
+                name="C1",
+            ),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor(-4.2), name="Q2"
+            ),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+
+
+def test_plan_matches_segment_track():
+    """Test that tracking with a compiled plan gives the same result as `track`."""
+    segment = make_segment()
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-4), sigma_xp=torch.tensor(2e-5)
+    )
+
+    plan = segment.compile()
+
+    expected = segment.track(incoming)
+    outgoing = plan(incoming)
+
+    assert len(plan.steps) == 3
+    assert torch.allclose(outgoing.particles, expected.particles)
+    assert torch.allclose(outgoing.energy, expected.energy)
+
+
+def test_plan_only_refuses_changed_groups():
+    """
+    Test that after changing an element, only the group containing that element is
+    fused again, and that the change is reflected in the result.
+    """
+    segment = make_segment()
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-4))
+    plan = segment.compile()
+
+    plan(incoming)
+    first_group, cavity, second_group = plan.steps
+
+    plan(incoming)
+    assert plan.steps[0] is first_group
+    assert plan.steps[2] is second_group
+
+    segment.Q2.k1 = torch.tensor(-2.0)
+    outgoing = plan(incoming)
+
+    assert plan.steps[0] is first_group
+    assert plan.steps[1] is cavity
+    assert plan.steps[2] is not second_group
+    assert torch.allclose(outgoing._cov, segment.track(incoming)._cov)
+
+
+def test_plan_regroups_when_skippability_changes():
+    """
+    Test that the plan picks up a screen being activated, which makes it non-skippable.
+    """
+    segment = cheetah.Segment.from_ocelot(ares.cell, warnings=False).subcell(
+        "AREASOLA1", "AREABSCR1"
+    )
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-4))
+    plan = segment.compile()
+
+    plan(incoming)
+    assert len(plan.steps) == 1
+
+    segment.AREABSCR1.is_active = True
+    plan(incoming)
+    plan_reading = segment.AREABSCR1.reading
+
+    segment.track(incoming)
+
+    assert len(plan.steps) == 2
+    assert torch.allclose(plan_reading, segment.AREABSCR1.reading)
+
+
+def test_plan_is_differentiable():
+    """Test that gradients flow through a plan over repeated calls."""
+    segment = make_segment()
+    segment.inner.Q1.k1 = nn.Parameter(segment.inner.Q1.k1)
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-4))
+    plan = segment.compile()
+
+    for _ in range(2):
+        plan(incoming).sigma_x.backward()
+
+    assert segment.inner.Q1.k1.grad is not None
+
+
+def test_inplace_plan_matches_segment_track():
+    """
+    Test that an in-place plan gives the same result as `track`, leaves the incoming
+    beam untouched and reuses its workspace buffers on subsequent calls.
+    """
+    segment = make_segment()
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(1e-4), sigma_xp=torch.tensor(2e-5)
+    )
+    original_particles = incoming.particles.clone()
+
+    plan = segment.compile(inplace=True)
+
+    expected = segment.track(incoming)
+    outgoing = plan(incoming)
+
+    assert torch.allclose(outgoing.particles, expected.particles)
+    assert torch.allclose(outgoing.energy, expected.energy)
+    assert torch.equal(incoming.particles, original_particles)
+    assert any(outgoing.particles is buffer for buffer in plan._workspace)
+
+    buffers = list(plan._workspace)
+    second_outgoing = plan(incoming)
+
+    assert second_outgoing is outgoing
+    assert all(a is b for a, b in zip(plan._workspace, buffers))
+    assert torch.allclose(second_outgoing.particles, expected.particles)
+
+
+def test_inplace_plan_batched_falls_back():
+    """Test that an in-place plan handles batched elements that change the shape."""
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor([4.2, -4.2, 0.0])
+            ),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_x=torch.tensor(1e-4)
+    )
+
+    outgoing = segment.compile(inplace=True)(incoming)
+
+    assert outgoing.particles.shape == (3, 1_000, 7)
+    assert torch.allclose(outgoing.particles, segment.track(incoming).particles)
@@ -0,0 +1,124 @@
+import torch
+
+import cheetah
+
+from .resources import ARESlatticeStage3v1_9 as ares
+
+
+def test_cache_hit_on_unchanged_element():
+    """
+    Test that the transfer map of an unchanged element is served from the cache and is
+    the same as the one computed without cache.
+    """
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2))
+    energy = torch.tensor(1e8)
+    expected = quadrupole.transfer_map(energy)
+
+    quadrupole.enable_transfer_map_cache()
+    first = quadrupole.transfer_map(energy)
+    second = quadrupole.transfer_map(energy)
+
+    assert second is first
+    assert torch.allclose(first, expected)
+    assert quadrupole.transfer_map_cache_info().hits == 1
+    assert quadrupole.transfer_map_cache_info().misses == 1
+
+
+def test_cache_invalidation():
+    """
+    Test that changing a parameter in place, assigning a new parameter or changing the
+    energy invalidates a cached transfer map.
+    """
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2))
+    energy = torch.tensor(1e8)
+    quadrupole.enable_transfer_map_cache()
+
+    original = quadrupole.transfer_map(energy)
+
+    quadrupole.k1.mul_(2.0)
+    in_place = quadrupole.transfer_map(energy)
+    assert not torch.allclose(in_place, original)
+
+    quadrupole.k1 = torch.tensor(4.2)
+    assigned = quadrupole.transfer_map(energy)
+    assert torch.allclose(assigned, original)
+
+    other_energy = quadrupole.transfer_map(torch.tensor(2e8))
+    assert not torch.allclose(other_energy, original)
+
+    assert quadrupole.transfer_map_cache_info().hits == 0
+    assert quadrupole.transfer_map_cache_info().misses == 4
+
+
+def test_cache_keys_energy_without_reading_it():
+    """
+    Test that energies are keyed by identity and version like element parameters, such
+    that an energy changed in place invalidates the cached transfer map.
+    """
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2))
+    energy = torch.tensor(1e8)
+    quadrupole.enable_transfer_map_cache()
+
+    original = quadrupole.transfer_map(energy)
+    assert quadrupole.transfer_map(energy) is original
+
+    energy.mul_(2.0)
+    assert not torch.allclose(quadrupole.transfer_map(energy), original)
+
+    assert quadrupole.transfer_map_cache_info().hits == 1
+    assert quadrupole.transfer_map_cache_info().misses == 2
+
+
+def test_cache_size_is_bounded():
+    """Test that the cache evicts least recently used entries beyond its size."""
+    drift = cheetah.Drift(length=torch.tensor(1.0))
+    drift.enable_transfer_map_cache(maxsize=2)
+
+    energies = [torch.tensor(1e8), torch.tensor(2e8), torch.tensor(3e8)]
+    for energy in energies:
+        drift.transfer_map(energy)
+    drift.transfer_map(energies[0])
+
+    assert drift.transfer_map_cache_info().currsize == 2
+    assert drift.transfer_map_cache_info().misses == 4
+
+
+def test_cache_is_autograd_safe():
+    """
+    Test that repeated backward passes work with the cache enabled when parameters
+    require grad.
+    """
+    k1 = torch.nn.Parameter(torch.tensor(4.2))
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=k1)
+    quadrupole.enable_transfer_map_cache()
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-4))
+
+    for _ in range(2):
+        quadrupole.track(incoming).sigma_x.backward()
+
+    assert k1.grad is not None
+
+
+def test_ares_steady_state_only_rebuilds_changed_elements():
+    """
+    Test that in steady-state tracking of the ARES experimental area only the transfer
+    maps of the elements that were changed are rebuilt.
+    """
+    segment = cheetah.Segment.from_ocelot(ares.cell, warnings=False).subcell(
+        "AREASOLA1", "AREABSCR1"
+    )
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-4))
+    segment.enable_transfer_map_cache()
+
+    segment.track(incoming)
+    warm_info = segment.transfer_map_cache_info()
+
+    segment.AREAMCVM1.angle = torch.tensor(1e-3)
+    segment.AREAMCHM1.angle = torch.tensor(-1e-3)
+    segment.track(incoming)
+
+    info = segment.transfer_map_cache_info()
+    assert info.misses - warm_info.misses == 2
+    assert info.hits - warm_info.hits == warm_info.misses - 2
+    assert segment.AREAMCVM1.transfer_map_cache_info().misses == 2
+    assert segment.AREAMCHM1.transfer_map_cache_info().misses == 2
@@ -0,0 +1,251 @@
+import pytest
+import torch
+
+import cheetah
+
+
+def test_segment_length_shape():
+    """Test that the shape of a segment's length matches the input."""
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor([0.6, 0.5])),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+            cheetah.Drift(length=torch.tensor(0.4)),
+        ]
+    )
+
+    assert segment.length.shape == (2,)
+    assert torch.allclose(segment.length, torch.tensor([1.2, 1.1]))
+
+
+def test_track_particle_single_element_shape():
+    """
+    Test that the shape of a beam tracked through a single element matches the input.
+    """
+    quadrupole = cheetah.Quadrupole(
+        length=torch.tensor([0.2, 0.25]), k1=torch.tensor([4.2, 4.2])
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000, sigma_x=torch.tensor(1e-5)
+    )
+
+    outgoing = quadrupole.track(incoming)
+
+    assert outgoing.particles.shape == (2, 100_000, 7)
+    assert outgoing.mu_x.shape == (2,)
+    assert outgoing.mu_xp.shape == (2,)
+    assert outgoing.sigma_x.shape == (2,)
+    assert outgoing.sigma_xxp.shape == (2,)
+    assert outgoing.emittance_x.shape == (2,)
+    assert outgoing.particle_charges.shape == (100_000,)
+    assert isinstance(outgoing.num_particles, int)
+
+
+def test_track_parameter_single_element_shape():
+    """
+    Test that the shape of a beam tracked through a single element matches the input.
+    """
+    quadrupole = cheetah.Quadrupole(
+        length=torch.tensor([0.2, 0.25]), k1=torch.tensor([4.2, 4.2])
+    )
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-5))
+
+    outgoing = quadrupole.track(incoming)
+
+    assert outgoing._mu.shape == (2, 7)
+    assert outgoing._cov.shape == (2, 7, 7)
+    assert outgoing.mu_x.shape == (2,)
+    assert outgoing.sigma_x.shape == (2,)
+    assert outgoing.beta_x.shape == (2,)
+
+
+@pytest.mark.parametrize("BeamClass", [cheetah.ParameterBeam, cheetah.ParticleBeam])
+def test_batched_matches_individual(BeamClass):
+    """
+    Test that tracking a beam through a batch of magnet settings gives the same result
+    as tracking it through each setting individually.
+    """
+    k1s = torch.tensor([-8.0, 0.0, 4.2, 10.0])
+    angles = torch.tensor([1e-3, -2e-3, 0.0, 5e-4])
+
+    incoming = BeamClass.from_parameters(
+        sigma_x=torch.tensor(1e-4),
+        sigma_xp=torch.tensor(2e-5),
+        sigma_y=torch.tensor(1e-4),
+        sigma_yp=torch.tensor(2e-5),
+    )
+    if BeamClass == cheetah.ParticleBeam:
+        incoming = BeamClass.from_parameters(
+            num_particles=10_000,
+            sigma_x=torch.tensor(1e-4),
+            sigma_xp=torch.tensor(2e-5),
+            sigma_y=torch.tensor(1e-4),
+            sigma_yp=torch.tensor(2e-5),
+        )
+
+    def make_segment(k1, angle):
+        return cheetah.Segment(
+            elements=[
+                cheetah.Drift(length=torch.tensor(0.5)),
+                cheetah.Quadrupole(
+                    length=torch.tensor(0.2),
+                    k1=k1,
+                    misalignment=torch.tensor([1e-5, -2e-5]),
+                ),
+                cheetah.HorizontalCorrector(length=torch.tensor(0.1), angle=angle),
+                cheetah.Dipole(length=torch.tensor(0.3), angle=angle),
+                cheetah.Drift(length=torch.tensor(0.5)),
+            ]
+        )
+
+    batched_outgoing = make_segment(k1s, angles).track(incoming)
+
+    for i, (k1, angle) in enumerate(zip(k1s, angles)):
+        outgoing = make_segment(k1, angle).track(incoming)
+
+        assert torch.allclose(batched_outgoing.mu_x[i], outgoing.mu_x, atol=1e-9)
+        assert torch.allclose(batched_outgoing.sigma_x[i], outgoing.sigma_x)
+        assert torch.allclose(batched_outgoing.sigma_y[i], outgoing.sigma_y)
+        assert torch.allclose(batched_outgoing.sigma_xp[i], outgoing.sigma_xp)
+
+
+def test_batched_cavity():
+    """
+    Test that a cavity with batched voltages tracks the same as individual cavities,
+    including the case where some cavities in the batch are switched off.
+    """
+    voltages = torch.tensor([0.0, 1e7, 5e7])
+    incoming = cheetah.ParameterBeam.from_parameters(
+        sigma_x=torch.tensor(1e-4), sigma_xp=torch.tensor(2e-5)
+    )
+
+    batched_cavity = cheetah.Cavity(
+        length=torch.tensor(1.0377),
+        voltage=voltages,
+        phase=torch.tensor(-20.0),
+        frequency=torch.tensor(1.3e9),
+    )
+    batched_outgoing = batched_cavity.track(incoming)
+
+    assert batched_outgoing.energy.shape == (3,)
+    assert batched_outgoing._mu.shape == (3, 7)
+
+    for i, voltage in enumerate(voltages):
+        cavity = cheetah.Cavity(
+            length=torch.tensor(1.0377),
+            voltage=voltage,
+            phase=torch.tensor(-20.0),
+            frequency=torch.tensor(1.3e9),
+        )
+        outgoing = cavity.track(incoming)
+
+        assert torch.allclose(batched_outgoing.energy[i], outgoing.energy)
+        assert torch.allclose(batched_outgoing._mu[i], outgoing._mu)
+        assert torch.allclose(batched_outgoing._cov[i], outgoing._cov)
+
+
+def test_batched_energy_beam():
+    """Test that a `ParameterBeam` with batched parameters can be tracked."""
+    incoming = cheetah.ParameterBeam.from_parameters(
+        sigma_x=torch.tensor([1e-4, 2e-4]), energy=torch.tensor([1e8, 2e8])
+    )
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+        ]
+    )
+
+    outgoing = segment.track(incoming)
+
+    assert outgoing.sigma_x.shape == (2,)
+    assert outgoing.energy.shape == (2,)
+
+
+def test_batched_particle_beam_parameters():
+    """
+    Test that `ParticleBeam`s can be generated from batched parameters and Twiss
+    parameters, as well as linspaced, and that they can be tracked.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_x=torch.tensor([1e-4, 2e-4]),
+        energy=torch.tensor([1e8, 2e8]),
+        total_charge=torch.tensor([1e-9, 2e-9]),
+    )
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+        ]
+    )
+
+    outgoing = segment.track(incoming)
+
+    assert incoming.particles.shape == (2, 10_000, 7)
+    assert torch.allclose(
+        incoming.sigma_x, torch.tensor([1e-4, 2e-4]), rtol=0.05, atol=0.0
+    )
+    assert torch.allclose(incoming.total_charge, torch.tensor([1e-9, 2e-9]))
+    assert outgoing.sigma_x.shape == (2,)
+
+    twiss_beam = cheetah.ParticleBeam.from_twiss(
+        num_particles=10_000,
+        beta_x=torch.tensor([[5.0], [10.0]]),
+        alpha_x=torch.tensor([0.0, 1.0, 2.0]),
+        emittance_x=torch.tensor(1e-8),
+        beta_y=torch.tensor(5.0),
+        emittance_y=torch.tensor(1e-8),
+    )
+
+    assert twiss_beam.particles.shape == (2, 3, 10_000, 7)
+    assert twiss_beam.beta_x.shape == (2, 3)
+
+    linspaced_beam = cheetah.ParticleBeam.make_linspaced(
+        num_particles=10, sigma_x=torch.tensor([1e-4, 2e-4])
+    )
+
+    assert linspaced_beam.particles.shape == (2, 10, 7)
+    assert torch.allclose(
+        linspaced_beam.particles[:, -1, 0], torch.tensor([1e-4, 2e-4])
+    )
+
+
+@pytest.mark.parametrize("BeamClass", [cheetah.ParameterBeam, cheetah.ParticleBeam])
+def test_screen_and_bpm_batched_reading(BeamClass):
+    """Test that screens and BPMs produce readings with a leading batch dimension."""
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor([4.2, 0.0, -4.2])
+            ),
+            cheetah.BPM(is_active=True, name="my_bpm"),
+            cheetah.Screen(
+                resolution=torch.tensor((100, 80)),
+                pixel_size=torch.tensor((1e-5, 1e-5)),
+                is_active=True,
+                name="my_screen",
+            ),
+        ]
+    )
+    incoming = BeamClass.from_parameters(sigma_x=torch.tensor(1e-4))
+
+    segment.track(incoming)
+
+    assert segment.my_bpm.reading.shape == (3, 2)
+    assert segment.my_screen.reading.shape == (3, 80, 100)
+    assert torch.all(segment.my_screen.reading >= 0.0)
+
+
+def test_quadrupole_gradient_batched():
+    """Test that gradients flow back to batched element parameters."""
+    k1 = torch.tensor([1.0, 2.0, 3.0], requires_grad=True)
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=k1)
+    incoming = cheetah.ParameterBeam.from_parameters(sigma_x=torch.tensor(1e-4))
+
+    outgoing = quadrupole.track(incoming)
+    outgoing.sigma_x.sum().backward()
+
+    assert k1.grad is not None
+    assert k1.grad.shape == (3,)
+    assert not torch.any(torch.isnan(k1.grad))
@@ -0,0 +1,133 @@
+import math
+
+import pytest
+import torch
+
+import cheetah
+
+
+def tesla_wakefield(**kwargs) -> cheetah.Wakefield:
+    """Short-range wakefield of a TESLA cavity after Weiland and Novokhatski."""
+    return cheetah.Wakefield.from_functions(
+        max_distance=0.05,
+        longitudinal_wake=lambda s: 344e12 * torch.exp(-torch.sqrt(s / 1.74e-3)),
+        transverse_wake=lambda s: (
+            1e15
+            * (1 - (1 + torch.sqrt(s / 0.92e-3)) * torch.exp(-torch.sqrt(s / 0.92e-3)))
+        ),
+        num_points=5_000,
+        bin_width=torch.tensor(5e-6),
+        **kwargs,
+    )
+
+
+def test_constant_wake_obeys_beam_loading_theorem():
+    """
+    Test that a constant longitudinal wake, of which every particle sees half of its own
+    contribution, decelerates a Gaussian bunch by half the wake of its total charge and
+    spreads its energy uniformly over the full wake.
+    """
+    torch.manual_seed(42)
+    charge, energy, wake = 1e-9, 1e9, 1e13
+    wakefield = cheetah.Wakefield.from_functions(
+        max_distance=0.01,
+        longitudinal_wake=lambda s: torch.full_like(s, wake),
+        dtype=torch.float64,
+    )
+    beam_kwargs = dict(
+        sigma_s=torch.tensor(300e-6),
+        sigma_p=torch.tensor(1e-7),
+        energy=torch.tensor(energy),
+        total_charge=torch.tensor(charge),
+        dtype=torch.float64,
+    )
+    particle_beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000, **beam_kwargs
+    )
+    parameter_beam = cheetah.ParameterBeam.from_parameters(**beam_kwargs)
+
+    _, _, beta = cheetah.track_methods.compute_relativistic_factors(
+        torch.tensor(energy, dtype=torch.float64)
+    )
+    total_kick = charge * wake / (beta.item() * energy)
+    for incoming in (particle_beam, parameter_beam):
+        outgoing = wakefield.track(incoming)
+
+        assert (outgoing.mu_p - incoming.mu_p).item() == pytest.approx(
+            -total_kick / 2, rel=0.01
+        )
+        assert outgoing.sigma_p.item() == pytest.approx(
+            total_kick / math.sqrt(12), rel=0.02
+        )
+
+
+def test_particle_and_parameter_beam_agree():
+    """
+    Test that the energy loss, the energy spread and the transverse kick of an offset
+    beam in the wakefield of a TESLA cavity agree between `ParticleBeam` and
+    `ParameterBeam`.
+    """
+    torch.manual_seed(42)
+    wakefield = tesla_wakefield(dtype=torch.float64)
+    beam_kwargs = dict(
+        mu_x=torch.tensor(1e-3),
+        sigma_s=torch.tensor(300e-6),
+        sigma_p=torch.tensor(1e-5),
+        energy=torch.tensor(1e9),
+        total_charge=torch.tensor(1e-9),
+        dtype=torch.float64,
+    )
+    particle_beam = wakefield.track(
+        cheetah.ParticleBeam.from_parameters(num_particles=200_000, **beam_kwargs)
+    )
+    parameter_beam = wakefield.track(
+        cheetah.ParameterBeam.from_parameters(**beam_kwargs)
+    )
+
+    assert parameter_beam.mu_p < 0
+    assert parameter_beam.mu_xp > 0
+    for name in ("mu_p", "sigma_p", "mu_xp", "sigma_xp"):
+        assert getattr(particle_beam, name).item() == pytest.approx(
+            getattr(parameter_beam, name).item(), rel=0.02
+        )
+
+
+def test_cavity_wakefield(tmp_path):
+    """
+    Test that a cavity applies its wakefield, keeps it as a separate element when it is
+    split, reuses the cached spectrum of the wakes and survives a round trip through
+    the lattice JSON format.
+    """
+    wakefield = tesla_wakefield()
+    cavity = cheetah.Cavity(
+        length=torch.tensor(1.0377),
+        voltage=torch.tensor(0.01815975e9),
+        phase=torch.tensor(0.0),
+        frequency=torch.tensor(1.3e9),
+        wakefield=wakefield,
+        name="cavity",
+    )
+    plain_cavity = cheetah.Cavity(
+        length=torch.tensor(1.0377),
+        voltage=torch.tensor(0.01815975e9),
+        phase=torch.tensor(0.0),
+        frequency=torch.tensor(1.3e9),
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_s=torch.tensor(300e-6),
+        energy=torch.tensor(1e9),
+        total_charge=torch.tensor(1e-9),
+    )
+
+    outgoing = cavity.track(incoming)
+    split_outgoing = cheetah.Segment(cavity.split(torch.tensor(0.5))).track(incoming)
+    assert outgoing.mu_p < plain_cavity.track(incoming).mu_p
+    assert cavity.split(torch.tensor(0.5))[-1] is wakefield
+    assert torch.allclose(split_outgoing.particles, outgoing.particles, atol=1e-6)
+    assert len(wakefield._wake_spectrum_cache) == 1
+
+    cheetah.Segment([cavity]).to_lattice_json(str(tmp_path / "cavity.json"))
+    loaded = cheetah.Segment.from_lattice_json(str(tmp_path / "cavity.json"))
+    assert isinstance(loaded.cavity.wakefield, cheetah.Wakefield)
+    assert torch.allclose(loaded.track(incoming).particles, outgoing.particles)